@@ -31,6 +31,9 @@ from modules.package_sizes import package_sizes_bp
 from modules.locations import locations_bp
 from modules.customers import customers_bp
 from modules.sku_outbound import sku_outbound_bp
+from modules.genealogy import genealogy_bp
+from modules.analytics import analytics_bp
+from modules.stock import stock_bp
 from transaction_management.tm_main import tm_bp
 
 # Create Flask app
@@ -115,6 +118,9 @@ app.register_blueprint(package_sizes_bp)
 app.register_blueprint(locations_bp)
 app.register_blueprint(customers_bp)
 app.register_blueprint(sku_outbound_bp)
+app.register_blueprint(genealogy_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(stock_bp)
 app.register_blueprint(tm_bp)
 
 # Configuration
@@ -167,6 +173,8 @@ def home():
             'sku_outbound': '/api/sku/outbound/*',
             'locations': '/api/locations/*',
             'customers': '/api/customers/*',
+            'analytics': '/api/analytics/timeseries',
+            'stock': '/api/stock/as_of',
             'system': '/api/sequence_status (NEW)'
         },
         'timestamp': datetime.now().isoformat(),
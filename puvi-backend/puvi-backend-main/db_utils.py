@@ -51,6 +51,7 @@ def synchronize_all_sequences():
         ('sku_material_consumption', 'consumption_id', 'sku_material_consumption_consumption_id_seq'),
         ('sku_cost_overrides', 'override_id', 'sku_cost_overrides_override_id_seq'),
         ('sku_inventory', 'inventory_id', 'sku_inventory_inventory_id_seq'),
+        ('sku_outbound_item_allocations', 'allocation_id', 'sku_outbound_item_allocations_allocation_id_seq'),
         
         # Blending and Production
         ('blend_batches', 'blend_id', 'blend_batches_blend_id_seq'),
@@ -60,6 +61,8 @@ def synchronize_all_sequences():
         ('oil_cake_sales', 'sale_id', 'oil_cake_sales_sale_id_seq'),
         ('oil_cake_sale_allocations', 'allocation_id', 'oil_cake_sale_allocations_allocation_id_seq'),
         ('oil_cake_inventory', 'cake_inventory_id', 'oil_cake_inventory_cake_inventory_id_seq'),
+        ('batch_cost_adjustments', 'adjustment_id', 'batch_cost_adjustments_adjustment_id_seq'),
+        ('writeoff_proposals', 'proposal_id', 'writeoff_proposals_proposal_id_seq'),
         ('material_writeoffs', 'writeoff_id', 'material_writeoffs_writeoff_id_seq'),
         
         # Cost Management
@@ -0,0 +1,10 @@
+-- =====================================================
+-- PUVI System - FEFO allocation index
+-- File: puvi-backend/migrations/001_fefo_allocation_index.sql
+-- Purpose: Support get_fefo_allocation_batch() candidate lookup
+--          (sku, location, expiry) over lots with stock remaining
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_sku_expiry_tracking_fefo
+    ON sku_expiry_tracking (sku_id, location_id, expiry_date, production_id)
+    WHERE quantity_remaining > 0;
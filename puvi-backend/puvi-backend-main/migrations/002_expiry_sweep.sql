@@ -0,0 +1,83 @@
+-- =====================================================
+-- PUVI System - Precomputed expiry buckets
+-- File: puvi-backend/migrations/002_expiry_sweep.sql
+-- Purpose: Store the expiry bucket on each tracking lot (kept current by
+--          run_expiry_sweep) and maintain a per-location/per-SKU summary
+-- =====================================================
+
+-- Bucket thresholds match get_expiry_status() in utils/expiry_utils.py
+CREATE OR REPLACE FUNCTION sku_expiry_bucket(p_expiry_date INTEGER, p_today INTEGER)
+RETURNS VARCHAR(20) AS $$
+    SELECT CASE
+        WHEN p_expiry_date - p_today <= 0 THEN 'expired'
+        WHEN p_expiry_date - p_today <= 30 THEN 'critical'
+        WHEN p_expiry_date - p_today <= 60 THEN 'warning'
+        WHEN p_expiry_date - p_today <= 90 THEN 'caution'
+        ELSE 'normal'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE sku_expiry_tracking
+    ADD COLUMN IF NOT EXISTS expiry_bucket VARCHAR(20);
+
+CREATE INDEX IF NOT EXISTS idx_sku_expiry_tracking_bucket
+    ON sku_expiry_tracking (expiry_bucket, location_id)
+    WHERE quantity_remaining > 0;
+
+CREATE INDEX IF NOT EXISTS idx_sku_expiry_tracking_expiry_date
+    ON sku_expiry_tracking (expiry_date)
+    WHERE quantity_remaining > 0;
+
+-- One row per location / SKU / bucket with lots that still hold stock
+CREATE TABLE IF NOT EXISTS sku_expiry_summary (
+    summary_id SERIAL PRIMARY KEY,
+    location_id INTEGER REFERENCES locations_master(location_id),
+    sku_id INTEGER NOT NULL REFERENCES sku_master(sku_id),
+    expiry_bucket VARCHAR(20) NOT NULL,
+    lot_count INTEGER NOT NULL DEFAULT 0,
+    total_quantity NUMERIC(12,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_sku_expiry_summary_key
+    ON sku_expiry_summary ((COALESCE(location_id, 0)), sku_id, expiry_bucket);
+
+-- Apply each lot change to the summary as a delta in the same transaction
+CREATE OR REPLACE FUNCTION sku_expiry_summary_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE')
+       AND OLD.quantity_remaining > 0 AND OLD.expiry_bucket IS NOT NULL THEN
+        UPDATE sku_expiry_summary
+        SET lot_count = lot_count - 1,
+            total_quantity = total_quantity - OLD.quantity_remaining,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE COALESCE(location_id, 0) = COALESCE(OLD.location_id, 0)
+          AND sku_id = OLD.sku_id
+          AND expiry_bucket = OLD.expiry_bucket;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE')
+       AND NEW.quantity_remaining > 0 AND NEW.expiry_bucket IS NOT NULL THEN
+        INSERT INTO sku_expiry_summary (location_id, sku_id, expiry_bucket, lot_count, total_quantity)
+        VALUES (NEW.location_id, NEW.sku_id, NEW.expiry_bucket, 1, NEW.quantity_remaining)
+        ON CONFLICT ((COALESCE(location_id, 0)), sku_id, expiry_bucket) DO UPDATE
+        SET lot_count = sku_expiry_summary.lot_count + 1,
+            total_quantity = sku_expiry_summary.total_quantity + EXCLUDED.total_quantity,
+            updated_at = CURRENT_TIMESTAMP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sku_expiry_summary ON sku_expiry_tracking;
+CREATE TRIGGER trg_sku_expiry_summary
+    AFTER INSERT OR DELETE OR UPDATE OF quantity_remaining, location_id, sku_id, expiry_bucket
+    ON sku_expiry_tracking
+    FOR EACH ROW EXECUTE FUNCTION sku_expiry_summary_apply();
+
+-- Initial bucket assignment; the summary fills through the trigger
+UPDATE sku_expiry_tracking
+SET expiry_bucket = sku_expiry_bucket(expiry_date, CURRENT_DATE - DATE '1970-01-01')
+WHERE quantity_remaining > 0;
@@ -0,0 +1,67 @@
+-- =====================================================
+-- PUVI System - Normalized outbound allocations
+-- File: puvi-backend/migrations/003_outbound_item_allocations.sql
+-- Purpose: One row per lot allocated to an outbound item, so batch
+--          traces and production dependency checks are index lookups
+--          instead of allocation_data::text LIKE scans
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS sku_outbound_item_allocations (
+    allocation_id SERIAL PRIMARY KEY,
+    item_id INTEGER NOT NULL REFERENCES sku_outbound_items(item_id) ON DELETE CASCADE,
+    outbound_id INTEGER NOT NULL REFERENCES sku_outbound(outbound_id),
+    sku_id INTEGER NOT NULL REFERENCES sku_master(sku_id),
+    tracking_id INTEGER,
+    production_id INTEGER,
+    production_code VARCHAR(50),
+    sku_traceable_code VARCHAR(50),
+    quantity NUMERIC(10,2) NOT NULL,
+    expiry_date INTEGER,
+    mrp NUMERIC(10,2),
+    production_cost NUMERIC(10,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbound_alloc_traceable_code
+    ON sku_outbound_item_allocations (sku_traceable_code);
+CREATE INDEX IF NOT EXISTS idx_outbound_alloc_production
+    ON sku_outbound_item_allocations (production_id);
+CREATE INDEX IF NOT EXISTS idx_outbound_alloc_tracking
+    ON sku_outbound_item_allocations (tracking_id);
+CREATE INDEX IF NOT EXISTS idx_outbound_alloc_item
+    ON sku_outbound_item_allocations (item_id);
+CREATE INDEX IF NOT EXISTS idx_outbound_alloc_outbound
+    ON sku_outbound_item_allocations (outbound_id);
+
+-- Backfill from existing allocation_data JSON (idempotent per item)
+INSERT INTO sku_outbound_item_allocations (
+    item_id, outbound_id, sku_id, tracking_id, production_id,
+    production_code, sku_traceable_code, quantity, expiry_date,
+    mrp, production_cost, created_at
+)
+SELECT
+    oi.item_id,
+    oi.outbound_id,
+    oi.sku_id,
+    NULLIF(a->>'tracking_id', '')::INTEGER,
+    NULLIF(a->>'production_id', '')::INTEGER,
+    a->>'production_code',
+    a->>'sku_traceable_code',
+    COALESCE(NULLIF(a->>'quantity', '')::NUMERIC, 0),
+    CASE
+        WHEN a->>'expiry_date' ~ '^\d{2}-\d{2}-\d{4}$'
+            THEN to_date(a->>'expiry_date', 'DD-MM-YYYY') - DATE '1970-01-01'
+        WHEN a->>'expiry_date' ~ '^\d{4}-\d{2}-\d{2}$'
+            THEN to_date(a->>'expiry_date', 'YYYY-MM-DD') - DATE '1970-01-01'
+        ELSE NULL
+    END,
+    NULLIF(a->>'mrp', '')::NUMERIC,
+    NULLIF(a->>'production_cost', '')::NUMERIC,
+    oi.created_at
+FROM sku_outbound_items oi
+CROSS JOIN LATERAL jsonb_array_elements(
+    COALESCE(oi.allocation_data->'allocations', '[]'::jsonb)
+) AS a
+WHERE NOT EXISTS (
+    SELECT 1 FROM sku_outbound_item_allocations x WHERE x.item_id = oi.item_id
+);
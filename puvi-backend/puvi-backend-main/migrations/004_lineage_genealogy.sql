@@ -0,0 +1,81 @@
+-- =====================================================
+-- PUVI System - Genealogy edges and transitive closure
+-- File: puvi-backend/migrations/004_lineage_genealogy.sql
+-- Purpose: purchase -> batch -> blend -> sku_production -> outbound
+--          lineage maintained by utils/lineage.py on each posting,
+--          with a closure table for one-lookup forward/backward traces
+-- Node types: 'purchase', 'batch', 'blend', 'sku_production', 'outbound'
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS lineage_edges (
+    edge_id SERIAL PRIMARY KEY,
+    parent_type VARCHAR(20) NOT NULL,
+    parent_id INTEGER NOT NULL,
+    child_type VARCHAR(20) NOT NULL,
+    child_id INTEGER NOT NULL,
+    quantity NUMERIC(12,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (parent_type, parent_id, child_type, child_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lineage_edges_child
+    ON lineage_edges (child_type, child_id);
+
+-- One row per ancestor/descendant pair at the shortest distance
+CREATE TABLE IF NOT EXISTS lineage_closure (
+    ancestor_type VARCHAR(20) NOT NULL,
+    ancestor_id INTEGER NOT NULL,
+    descendant_type VARCHAR(20) NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_type, ancestor_id, descendant_type, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lineage_closure_descendant
+    ON lineage_closure (descendant_type, descendant_id);
+
+-- Backfill edges from existing postings
+INSERT INTO lineage_edges (parent_type, parent_id, child_type, child_id, quantity)
+SELECT 'purchase', p.purchase_id, 'batch', b.batch_id, b.seed_quantity_before_drying
+FROM batch b
+JOIN purchases p ON p.traceable_code = b.seed_purchase_code
+ON CONFLICT DO NOTHING;
+
+INSERT INTO lineage_edges (parent_type, parent_id, child_type, child_id, quantity)
+SELECT CASE bc.source_type WHEN 'extraction' THEN 'batch' ELSE 'blend' END,
+       bc.source_batch_id, 'blend', bc.blend_id, SUM(bc.quantity_used)
+FROM blend_batch_components bc
+WHERE bc.source_type IN ('extraction', 'blended')
+  AND bc.source_batch_id IS NOT NULL
+GROUP BY 1, 2, 4
+ON CONFLICT DO NOTHING;
+
+INSERT INTO lineage_edges (parent_type, parent_id, child_type, child_id, quantity)
+SELECT oa.source_type, oa.source_id, 'sku_production', oa.production_id, SUM(oa.quantity_allocated)
+FROM sku_oil_allocation oa
+WHERE oa.source_type IN ('batch', 'blend')
+GROUP BY 1, 2, 4
+ON CONFLICT DO NOTHING;
+
+INSERT INTO lineage_edges (parent_type, parent_id, child_type, child_id, quantity)
+SELECT 'sku_production', a.production_id, 'outbound', a.outbound_id, SUM(a.quantity)
+FROM sku_outbound_item_allocations a
+WHERE a.production_id IS NOT NULL
+GROUP BY 2, 4
+ON CONFLICT DO NOTHING;
+
+-- Full closure from the edges
+INSERT INTO lineage_closure (ancestor_type, ancestor_id, descendant_type, descendant_id, depth)
+WITH RECURSIVE walk AS (
+    SELECT parent_type AS ancestor_type, parent_id AS ancestor_id,
+           child_type AS descendant_type, child_id AS descendant_id, 1 AS depth
+    FROM lineage_edges
+    UNION
+    SELECT w.ancestor_type, w.ancestor_id, e.child_type, e.child_id, w.depth + 1
+    FROM walk w
+    JOIN lineage_edges e ON e.parent_type = w.descendant_type AND e.parent_id = w.descendant_id
+)
+SELECT ancestor_type, ancestor_id, descendant_type, descendant_id, MIN(depth)
+FROM walk
+GROUP BY 1, 2, 3, 4
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,16 @@
+-- =====================================================
+-- PUVI System - By-product FIFO allocation indexes
+-- File: puvi-backend/migrations/005_byproduct_fifo_index.sql
+-- Purpose: Let the locking FIFO allocator for oil cake and sludge
+--          sales walk open lots in production order without scanning
+--          fully sold inventory
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_oil_cake_inventory_fifo
+    ON oil_cake_inventory (production_date, cake_inventory_id)
+    WHERE quantity_remaining > 0;
+
+CREATE INDEX IF NOT EXISTS idx_batch_sludge_fifo
+    ON batch (production_date, batch_id)
+    WHERE sludge_yield > 0
+      AND sludge_yield - COALESCE(sludge_sold_quantity, 0) > 0;
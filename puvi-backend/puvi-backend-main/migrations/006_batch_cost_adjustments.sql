@@ -0,0 +1,59 @@
+-- =====================================================
+-- PUVI System - By-product cost adjustment ledger
+-- File: puvi-backend/migrations/006_batch_cost_adjustments.sql
+-- Purpose: One row per batch per by-product sale with the oil cost
+--          adjustment (estimated vs actual rate x sold quantity),
+--          written by material_sales at posting time and read by
+--          /api/cost_reconciliation_report
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS batch_cost_adjustments (
+    adjustment_id SERIAL PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batch(batch_id),
+    sale_id INTEGER REFERENCES oil_cake_sales(sale_id),
+    byproduct_type VARCHAR(20) NOT NULL,
+    oil_type VARCHAR(50),
+    sale_date INTEGER NOT NULL,
+    quantity_sold NUMERIC(12,2) NOT NULL,
+    estimated_rate NUMERIC(10,2),
+    actual_rate NUMERIC(10,2),
+    adjustment_amount NUMERIC(12,2) NOT NULL,
+    net_oil_cost_before NUMERIC(12,2),
+    net_oil_cost_after NUMERIC(12,2),
+    oil_cost_per_kg_before NUMERIC(10,2),
+    oil_cost_per_kg_after NUMERIC(10,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_batch_cost_adjustments_date
+    ON batch_cost_adjustments (sale_date, batch_id);
+
+CREATE INDEX IF NOT EXISTS idx_batch_cost_adjustments_oil_type_date
+    ON batch_cost_adjustments (oil_type, sale_date);
+
+CREATE INDEX IF NOT EXISTS idx_batch_cost_adjustments_batch
+    ON batch_cost_adjustments (batch_id);
+
+-- Backfill from sales posted before the ledger existed; cost before/after
+-- were not recorded at the time and stay NULL
+INSERT INTO batch_cost_adjustments (
+    batch_id, sale_id, byproduct_type, oil_type, sale_date,
+    quantity_sold, estimated_rate, actual_rate, adjustment_amount
+)
+SELECT 
+    a.batch_id,
+    a.sale_id,
+    s.grade,
+    b.oil_type,
+    s.sale_date,
+    SUM(a.quantity_allocated),
+    MAX(a.original_estimate_rate),
+    MAX(a.actual_sale_rate),
+    SUM(a.oil_cost_adjustment)
+FROM oil_cake_sale_allocations a
+JOIN oil_cake_sales s ON a.sale_id = s.sale_id
+JOIN batch b ON a.batch_id = b.batch_id
+WHERE NOT EXISTS (
+    SELECT 1 FROM batch_cost_adjustments x WHERE x.sale_id = a.sale_id
+)
+GROUP BY a.batch_id, a.sale_id, s.grade, b.oil_type, s.sale_date;
@@ -0,0 +1,42 @@
+-- =====================================================
+-- PUVI System - Expiry writeoff proposals
+-- File: puvi-backend/migrations/007_writeoff_proposals.sql
+-- Purpose: Proposed writeoffs of expired SKU lots, one per location and
+--          SKU, built by utils/writeoff_proposals.py and approved through
+--          /api/writeoff_proposals/approve
+-- Status: 'pending' -> 'approved' | 'rejected' | 'superseded'
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS writeoff_proposals (
+    proposal_id SERIAL PRIMARY KEY,
+    location_id INTEGER REFERENCES locations_master(location_id),
+    sku_id INTEGER NOT NULL REFERENCES sku_master(sku_id),
+    lot_count INTEGER NOT NULL DEFAULT 0,
+    total_quantity NUMERIC(12,2) NOT NULL DEFAULT 0,
+    cost_per_unit NUMERIC(12,2) NOT NULL DEFAULT 0,
+    total_value NUMERIC(14,2) NOT NULL DEFAULT 0,
+    oldest_expiry_date INTEGER,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    decided_at TIMESTAMP,
+    decided_by VARCHAR(100),
+    writeoff_id INTEGER REFERENCES material_writeoffs(writeoff_id)
+);
+
+-- At most one open proposal per location / SKU
+CREATE UNIQUE INDEX IF NOT EXISTS uq_writeoff_proposals_pending
+    ON writeoff_proposals ((COALESCE(location_id, 0)), sku_id)
+    WHERE status = 'pending';
+
+CREATE INDEX IF NOT EXISTS idx_writeoff_proposals_status
+    ON writeoff_proposals (status, location_id);
+
+CREATE TABLE IF NOT EXISTS writeoff_proposal_lots (
+    proposal_id INTEGER NOT NULL REFERENCES writeoff_proposals(proposal_id) ON DELETE CASCADE,
+    tracking_id INTEGER NOT NULL REFERENCES sku_expiry_tracking(tracking_id),
+    production_id INTEGER,
+    expiry_date INTEGER,
+    quantity NUMERIC(12,2) NOT NULL,
+    cost_per_bottle NUMERIC(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (proposal_id, tracking_id)
+);
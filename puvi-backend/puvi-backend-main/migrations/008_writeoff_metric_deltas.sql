@@ -0,0 +1,265 @@
+-- =====================================================
+-- PUVI System - Incrementally maintained writeoff metrics
+-- File: puvi-backend/migrations/008_writeoff_metric_deltas.sql
+-- Purpose: Keep writeoff_monthly_summary and the latest
+--          writeoff_impact_tracking row current as writeoffs are
+--          inserted, adjusted, reversed or deleted, by applying deltas
+--          from a statement trigger in the posting transaction.
+--          writeoff_metric_buckets holds month x item type x reason
+--          totals; utils/writeoff_metrics.py reconciles them against
+--          material_writeoffs on a schedule.
+-- Counted rows: COALESCE(status, 'active') = 'active', valued at net_loss
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS writeoff_metric_buckets (
+    month_year INTEGER NOT NULL,
+    item_type VARCHAR(20) NOT NULL,
+    reason_code VARCHAR(50) NOT NULL DEFAULT '',
+    writeoff_count INTEGER NOT NULL DEFAULT 0,
+    total_quantity NUMERIC(14,2) NOT NULL DEFAULT 0,
+    total_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    net_loss NUMERIC(14,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (month_year, item_type, reason_code)
+);
+
+CREATE OR REPLACE FUNCTION writeoff_item_type(p_reference_type VARCHAR)
+RETURNS VARCHAR(20) AS $$
+    SELECT CASE
+        WHEN p_reference_type IN ('oil_cake', 'sludge', 'sku') THEN p_reference_type
+        ELSE 'material'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION writeoff_month_year(p_writeoff_date INTEGER)
+RETURNS INTEGER AS $$
+    SELECT TO_CHAR(DATE '1970-01-01' + p_writeoff_date, 'YYYYMM')::INTEGER
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Impact tracking reason columns: damage / expiry / quality / process_loss / other
+CREATE OR REPLACE FUNCTION writeoff_reason_bucket(p_reason_code VARCHAR)
+RETURNS VARCHAR(20) AS $$
+    SELECT CASE
+        WHEN LOWER(COALESCE(r.category, '')) LIKE '%damage%' THEN 'damage'
+        WHEN LOWER(COALESCE(r.category, '')) LIKE '%expir%' THEN 'expiry'
+        WHEN LOWER(COALESCE(r.category, '')) LIKE '%quality%' THEN 'quality'
+        WHEN LOWER(COALESCE(r.category, '')) LIKE '%process%' THEN 'process_loss'
+        ELSE 'other'
+    END
+    FROM (SELECT 1) one
+    LEFT JOIN writeoff_reasons r ON r.reason_code = p_reason_code
+$$ LANGUAGE sql STABLE;
+
+-- Apply one aggregated delta to the buckets, the month summary
+-- (with cumulative totals of later months) and the latest impact row
+CREATE OR REPLACE FUNCTION apply_writeoff_metric_delta(
+    p_month_year INTEGER,
+    p_item_type VARCHAR,
+    p_reason_code VARCHAR,
+    p_count INTEGER,
+    p_quantity NUMERIC,
+    p_cost NUMERIC,
+    p_loss NUMERIC
+) RETURNS VOID AS $$
+DECLARE
+    v_reason_bucket VARCHAR(20) := writeoff_reason_bucket(p_reason_code);
+BEGIN
+    INSERT INTO writeoff_metric_buckets (
+        month_year, item_type, reason_code,
+        writeoff_count, total_quantity, total_cost, net_loss
+    ) VALUES (
+        p_month_year, p_item_type, COALESCE(p_reason_code, ''),
+        p_count, p_quantity, p_cost, p_loss
+    )
+    ON CONFLICT (month_year, item_type, reason_code) DO UPDATE
+    SET writeoff_count = writeoff_metric_buckets.writeoff_count + EXCLUDED.writeoff_count,
+        total_quantity = writeoff_metric_buckets.total_quantity + EXCLUDED.total_quantity,
+        total_cost = writeoff_metric_buckets.total_cost + EXCLUDED.total_cost,
+        net_loss = writeoff_metric_buckets.net_loss + EXCLUDED.net_loss,
+        updated_at = CURRENT_TIMESTAMP;
+
+    -- New months start from the previous month's cumulative totals
+    INSERT INTO writeoff_monthly_summary (month_year, cumulative_writeoffs, cumulative_production)
+    SELECT p_month_year,
+           COALESCE((SELECT cumulative_writeoffs FROM writeoff_monthly_summary
+                     WHERE month_year < p_month_year ORDER BY month_year DESC LIMIT 1), 0),
+           COALESCE((SELECT cumulative_production FROM writeoff_monthly_summary
+                     WHERE month_year < p_month_year ORDER BY month_year DESC LIMIT 1), 0)
+    ON CONFLICT (month_year) DO NOTHING;
+
+    UPDATE writeoff_monthly_summary s
+    SET month_writeoffs = s.month_writeoffs + p_loss,
+        month_writeoff_count = s.month_writeoff_count + p_count,
+        month_material_writeoffs = s.month_material_writeoffs
+            + CASE WHEN p_item_type IN ('material', 'sku') THEN p_loss ELSE 0 END,
+        month_oilcake_writeoffs = s.month_oilcake_writeoffs
+            + CASE WHEN p_item_type = 'oil_cake' THEN p_loss ELSE 0 END,
+        month_sludge_writeoffs = s.month_sludge_writeoffs
+            + CASE WHEN p_item_type = 'sludge' THEN p_loss ELSE 0 END,
+        month_impact_per_kg = COALESCE((s.month_writeoffs + p_loss) / NULLIF(s.month_oil_production, 0), 0),
+        top_writeoff_reason = top.reason_code,
+        top_reason_count = top.writeoff_count,
+        top_reason_value = top.net_loss
+    FROM (
+        SELECT NULLIF(reason_code, '') as reason_code,
+               SUM(writeoff_count)::INTEGER as writeoff_count,
+               SUM(net_loss) as net_loss
+        FROM writeoff_metric_buckets
+        WHERE month_year = p_month_year
+        GROUP BY reason_code
+        HAVING SUM(writeoff_count) > 0
+        ORDER BY SUM(net_loss) DESC
+        LIMIT 1
+    ) top
+    WHERE s.month_year = p_month_year;
+
+    -- No counted writeoffs left in the month: the top reason is cleared
+    UPDATE writeoff_monthly_summary s
+    SET month_writeoffs = s.month_writeoffs + p_loss,
+        month_writeoff_count = s.month_writeoff_count + p_count,
+        month_material_writeoffs = s.month_material_writeoffs
+            + CASE WHEN p_item_type IN ('material', 'sku') THEN p_loss ELSE 0 END,
+        month_oilcake_writeoffs = s.month_oilcake_writeoffs
+            + CASE WHEN p_item_type = 'oil_cake' THEN p_loss ELSE 0 END,
+        month_sludge_writeoffs = s.month_sludge_writeoffs
+            + CASE WHEN p_item_type = 'sludge' THEN p_loss ELSE 0 END,
+        month_impact_per_kg = COALESCE((s.month_writeoffs + p_loss) / NULLIF(s.month_oil_production, 0), 0),
+        top_writeoff_reason = NULL,
+        top_reason_count = 0,
+        top_reason_value = 0
+    WHERE s.month_year = p_month_year
+      AND NOT EXISTS (
+          SELECT 1 FROM writeoff_metric_buckets
+          WHERE month_year = p_month_year AND writeoff_count > 0
+      );
+
+    UPDATE writeoff_monthly_summary s
+    SET cumulative_writeoffs = s.cumulative_writeoffs + p_loss,
+        cumulative_impact_per_kg = COALESCE((s.cumulative_writeoffs + p_loss) / NULLIF(s.cumulative_production, 0), 0)
+    WHERE s.month_year >= p_month_year;
+
+    UPDATE writeoff_impact_tracking t
+    SET total_writeoffs_value = t.total_writeoffs_value + p_loss,
+        impact_per_kg = COALESCE((t.total_writeoffs_value + p_loss) / NULLIF(t.total_oil_produced_kg, 0), 0),
+        material_writeoffs = t.material_writeoffs
+            + CASE WHEN p_item_type = 'material' THEN p_loss ELSE 0 END,
+        oilcake_writeoffs = t.oilcake_writeoffs
+            + CASE WHEN p_item_type = 'oil_cake' THEN p_loss ELSE 0 END,
+        sludge_writeoffs = t.sludge_writeoffs
+            + CASE WHEN p_item_type = 'sludge' THEN p_loss ELSE 0 END,
+        sku_writeoffs = t.sku_writeoffs
+            + CASE WHEN p_item_type = 'sku' THEN p_loss ELSE 0 END,
+        damage_writeoffs = t.damage_writeoffs
+            + CASE WHEN v_reason_bucket = 'damage' THEN p_loss ELSE 0 END,
+        expiry_writeoffs = t.expiry_writeoffs
+            + CASE WHEN v_reason_bucket = 'expiry' THEN p_loss ELSE 0 END,
+        quality_writeoffs = t.quality_writeoffs
+            + CASE WHEN v_reason_bucket = 'quality' THEN p_loss ELSE 0 END,
+        process_loss_writeoffs = t.process_loss_writeoffs
+            + CASE WHEN v_reason_bucket = 'process_loss' THEN p_loss ELSE 0 END,
+        other_writeoffs = t.other_writeoffs
+            + CASE WHEN v_reason_bucket = 'other' THEN p_loss ELSE 0 END
+    WHERE t.tracking_id = (SELECT MAX(tracking_id) FROM writeoff_impact_tracking);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement trigger: old rows leave their buckets, new rows enter theirs
+CREATE OR REPLACE FUNCTION writeoff_metrics_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR r IN
+            SELECT writeoff_month_year(writeoff_date) as month_year,
+                   writeoff_item_type(reference_type) as item_type,
+                   reason_code,
+                   COUNT(*)::INTEGER as cnt, SUM(quantity) as qty,
+                   SUM(total_cost) as cost, SUM(net_loss) as loss
+            FROM new_rows
+            WHERE COALESCE(status, 'active') = 'active'
+            GROUP BY 1, 2, 3
+        LOOP
+            PERFORM apply_writeoff_metric_delta(r.month_year, r.item_type, r.reason_code,
+                                                r.cnt, r.qty, r.cost, r.loss);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR r IN
+            SELECT writeoff_month_year(writeoff_date) as month_year,
+                   writeoff_item_type(reference_type) as item_type,
+                   reason_code,
+                   COUNT(*)::INTEGER as cnt, SUM(quantity) as qty,
+                   SUM(total_cost) as cost, SUM(net_loss) as loss
+            FROM old_rows
+            WHERE COALESCE(status, 'active') = 'active'
+            GROUP BY 1, 2, 3
+        LOOP
+            PERFORM apply_writeoff_metric_delta(r.month_year, r.item_type, r.reason_code,
+                                                -r.cnt, -r.qty, -r.cost, -r.loss);
+        END LOOP;
+    ELSE
+        FOR r IN
+            SELECT month_year, item_type, reason_code,
+                   SUM(cnt)::INTEGER as cnt, SUM(qty) as qty,
+                   SUM(cost) as cost, SUM(loss) as loss
+            FROM (
+                SELECT writeoff_month_year(writeoff_date) as month_year,
+                       writeoff_item_type(reference_type) as item_type,
+                       reason_code, -1 as cnt, -quantity as qty,
+                       -total_cost as cost, -net_loss as loss
+                FROM old_rows
+                WHERE COALESCE(status, 'active') = 'active'
+                UNION ALL
+                SELECT writeoff_month_year(writeoff_date),
+                       writeoff_item_type(reference_type),
+                       reason_code, 1, quantity, total_cost, net_loss
+                FROM new_rows
+                WHERE COALESCE(status, 'active') = 'active'
+            ) d
+            GROUP BY 1, 2, 3
+            HAVING SUM(cnt) <> 0 OR SUM(qty) <> 0 OR SUM(cost) <> 0 OR SUM(loss) <> 0
+        LOOP
+            PERFORM apply_writeoff_metric_delta(r.month_year, r.item_type, r.reason_code,
+                                                r.cnt, r.qty, r.cost, r.loss);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_writeoff_metrics_insert ON material_writeoffs;
+CREATE TRIGGER trg_writeoff_metrics_insert
+    AFTER INSERT ON material_writeoffs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_metrics_apply();
+
+DROP TRIGGER IF EXISTS trg_writeoff_metrics_update ON material_writeoffs;
+CREATE TRIGGER trg_writeoff_metrics_update
+    AFTER UPDATE ON material_writeoffs
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_metrics_apply();
+
+DROP TRIGGER IF EXISTS trg_writeoff_metrics_delete ON material_writeoffs;
+CREATE TRIGGER trg_writeoff_metrics_delete
+    AFTER DELETE ON material_writeoffs
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_metrics_apply();
+
+-- Backfill buckets; summaries and impact are recomputed once from source
+INSERT INTO writeoff_metric_buckets (
+    month_year, item_type, reason_code,
+    writeoff_count, total_quantity, total_cost, net_loss
+)
+SELECT writeoff_month_year(writeoff_date),
+       writeoff_item_type(reference_type),
+       COALESCE(reason_code, ''),
+       COUNT(*), SUM(quantity), SUM(total_cost), SUM(net_loss)
+FROM material_writeoffs
+WHERE COALESCE(status, 'active') = 'active'
+GROUP BY 1, 2, 3
+ON CONFLICT (month_year, item_type, reason_code) DO NOTHING;
+
+SELECT update_writeoff_monthly_summary(month_year)
+FROM (SELECT DISTINCT month_year FROM writeoff_metric_buckets ORDER BY month_year) m;
+
+SELECT update_writeoff_impact_tracking();
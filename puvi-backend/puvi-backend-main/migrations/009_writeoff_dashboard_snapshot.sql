@@ -0,0 +1,59 @@
+-- =====================================================
+-- PUVI System - Writeoff dashboard snapshot cache
+-- File: puvi-backend/migrations/009_writeoff_dashboard_snapshot.sql
+-- Purpose: A version counter bumped by any change to writeoffs or their
+--          summaries, and the last built dashboard JSON per endpoint.
+--          A snapshot is served while its version matches the counter;
+--          the version doubles as the dashboard ETag.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS writeoff_dashboard_version (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    version BIGINT NOT NULL DEFAULT 1,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO writeoff_dashboard_version (singleton, version)
+VALUES (TRUE, 1)
+ON CONFLICT (singleton) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS writeoff_dashboard_snapshots (
+    snapshot_key VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL,
+    payload JSONB NOT NULL,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION writeoff_dashboard_bump()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE writeoff_dashboard_version
+    SET version = version + 1,
+        changed_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_writeoff_dashboard_writeoffs ON material_writeoffs;
+CREATE TRIGGER trg_writeoff_dashboard_writeoffs
+    AFTER INSERT OR UPDATE OR DELETE ON material_writeoffs
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_dashboard_bump();
+
+DROP TRIGGER IF EXISTS trg_writeoff_dashboard_impact ON writeoff_impact_tracking;
+CREATE TRIGGER trg_writeoff_dashboard_impact
+    AFTER INSERT OR UPDATE OR DELETE ON writeoff_impact_tracking
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_dashboard_bump();
+
+DROP TRIGGER IF EXISTS trg_writeoff_dashboard_monthly ON writeoff_monthly_summary;
+CREATE TRIGGER trg_writeoff_dashboard_monthly
+    AFTER INSERT OR UPDATE OR DELETE ON writeoff_monthly_summary
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_dashboard_bump();
+
+DROP TRIGGER IF EXISTS trg_writeoff_dashboard_reasons ON writeoff_reasons;
+CREATE TRIGGER trg_writeoff_dashboard_reasons
+    AFTER INSERT OR UPDATE OR DELETE ON writeoff_reasons
+    FOR EACH STATEMENT EXECUTE FUNCTION writeoff_dashboard_bump();
+
+-- Recent writeoffs and first/last dates for the snapshot build
+CREATE INDEX IF NOT EXISTS idx_material_writeoffs_date
+    ON material_writeoffs (writeoff_date DESC, writeoff_id DESC);
@@ -0,0 +1,245 @@
+-- =====================================================
+-- PUVI System - Writeoffable stock snapshot
+-- File: puvi-backend/migrations/010_writeoffable_stock.sql
+-- Purpose: One row per stock lot that can be written off (material
+--          inventory rows, SKU inventory per location, oil cake lots,
+--          batch sludge), kept current by row triggers on the source
+--          tables so /api/unified_writeoff_inventory is one indexed read
+-- Item types: 'material', 'sku', 'oilcake', 'sludge'
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS writeoffable_stock (
+    item_type VARCHAR(20) NOT NULL,
+    item_key INTEGER NOT NULL,
+    category_group VARCHAR(30) NOT NULL,
+    category_key VARCHAR(150) NOT NULL,
+    category_display VARCHAR(150),
+    ref_id INTEGER,
+    item_name VARCHAR(255),
+    item_code VARCHAR(100),
+    batch_code VARCHAR(100),
+    oil_type VARCHAR(50),
+    traceable_code VARCHAR(100),
+    location_id INTEGER,
+    quantity_produced NUMERIC(12,2),
+    quantity_available NUMERIC(12,2) NOT NULL,
+    unit VARCHAR(20),
+    unit_cost NUMERIC(12,2),
+    mrp NUMERIC(10,2),
+    expiry_date INTEGER,
+    production_date INTEGER,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (item_type, item_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_writeoffable_stock_category
+    ON writeoffable_stock (category_key, location_id);
+
+CREATE INDEX IF NOT EXISTS idx_writeoffable_stock_type_location
+    ON writeoffable_stock (item_type, location_id);
+
+-- Source definition of the snapshot; only lots with stock left
+CREATE OR REPLACE VIEW v_writeoffable_stock AS
+SELECT
+    'material'::VARCHAR(20) as item_type,
+    i.inventory_id as item_key,
+    'materials'::VARCHAR(30) as category_group,
+    m.category as category_key,
+    m.category as category_display,
+    m.material_id as ref_id,
+    m.material_name as item_name,
+    NULL::VARCHAR as item_code,
+    NULL::VARCHAR as batch_code,
+    NULL::VARCHAR as oil_type,
+    NULL::VARCHAR as traceable_code,
+    NULL::INTEGER as location_id,
+    NULL::NUMERIC as quantity_produced,
+    i.closing_stock as quantity_available,
+    m.unit,
+    i.weighted_avg_cost as unit_cost,
+    NULL::NUMERIC as mrp,
+    NULL::INTEGER as expiry_date,
+    NULL::INTEGER as production_date
+FROM inventory i
+JOIN materials m ON i.material_id = m.material_id
+WHERE i.closing_stock > 0
+  AND m.category IS NOT NULL
+  AND m.is_active = true
+UNION ALL
+SELECT
+    'sku',
+    si.inventory_id,
+    'finished_products',
+    CONCAT('sku_', sm.oil_type, '_', sm.package_size),
+    CONCAT(sm.oil_type, ' Oil - ', sm.package_size),
+    si.sku_id,
+    sm.product_name,
+    sm.sku_code,
+    si.batch_code,
+    sm.oil_type,
+    NULL,
+    si.location_id,
+    NULL,
+    si.quantity_available,
+    'bottles',
+    p.cost_per_bottle,
+    si.mrp,
+    si.expiry_date,
+    NULL
+FROM sku_inventory si
+JOIN sku_master sm ON si.sku_id = sm.sku_id
+LEFT JOIN sku_production p ON si.production_id = p.production_id
+WHERE si.quantity_available > 0
+  AND si.status = 'active'
+  AND sm.is_active = true
+UNION ALL
+SELECT
+    'oilcake',
+    oci.cake_inventory_id,
+    'byproducts',
+    CONCAT('oilcake_', oci.oil_type),
+    CONCAT('Oil Cake - ', oci.oil_type),
+    oci.batch_id,
+    CONCAT('Oil Cake - ', oci.oil_type),
+    b.batch_code,
+    b.batch_code,
+    oci.oil_type,
+    b.traceable_code,
+    NULL,
+    oci.quantity_produced,
+    oci.quantity_remaining,
+    'kg',
+    oci.estimated_rate,
+    NULL,
+    NULL,
+    oci.production_date
+FROM oil_cake_inventory oci
+JOIN batch b ON oci.batch_id = b.batch_id
+WHERE oci.quantity_remaining > 0
+UNION ALL
+SELECT
+    'sludge',
+    b.batch_id,
+    'byproducts',
+    CONCAT('sludge_', b.oil_type),
+    CONCAT('Sludge - ', b.oil_type),
+    b.batch_id,
+    CONCAT('Sludge - ', b.oil_type),
+    b.batch_code,
+    b.batch_code,
+    b.oil_type,
+    b.traceable_code,
+    NULL,
+    b.sludge_yield,
+    b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0),
+    'kg',
+    b.sludge_estimated_rate,
+    NULL,
+    NULL,
+    b.production_date
+FROM batch b
+WHERE b.sludge_yield > 0
+  AND (b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) > 0;
+
+CREATE OR REPLACE FUNCTION refresh_writeoffable_stock(p_item_type VARCHAR, p_item_keys INTEGER[])
+RETURNS VOID AS $$
+    DELETE FROM writeoffable_stock
+    WHERE item_type = p_item_type AND item_key = ANY(p_item_keys);
+
+    INSERT INTO writeoffable_stock (
+        item_type, item_key, category_group, category_key, category_display,
+        ref_id, item_name, item_code, batch_code, oil_type, traceable_code,
+        location_id, quantity_produced, quantity_available, unit, unit_cost,
+        mrp, expiry_date, production_date
+    )
+    SELECT * FROM v_writeoffable_stock
+    WHERE item_type = p_item_type AND item_key = ANY(p_item_keys);
+$$ LANGUAGE sql;
+
+-- Row trigger for a stock table: TG_ARGV[0] = item type, TG_ARGV[1] = key column
+CREATE OR REPLACE FUNCTION writeoffable_stock_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_keys INTEGER[] := ARRAY[]::INTEGER[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        v_keys := v_keys || (to_jsonb(OLD) ->> TG_ARGV[1])::INTEGER;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        v_keys := v_keys || (to_jsonb(NEW) ->> TG_ARGV[1])::INTEGER;
+    END IF;
+    PERFORM refresh_writeoffable_stock(TG_ARGV[0], v_keys);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_inventory ON inventory;
+CREATE TRIGGER trg_writeoffable_stock_inventory
+    AFTER INSERT OR DELETE OR UPDATE OF closing_stock, weighted_avg_cost, material_id
+    ON inventory
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_apply('material', 'inventory_id');
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_sku ON sku_inventory;
+CREATE TRIGGER trg_writeoffable_stock_sku
+    AFTER INSERT OR DELETE OR UPDATE
+    ON sku_inventory
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_apply('sku', 'inventory_id');
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_oilcake ON oil_cake_inventory;
+CREATE TRIGGER trg_writeoffable_stock_oilcake
+    AFTER INSERT OR DELETE OR UPDATE
+    ON oil_cake_inventory
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_apply('oilcake', 'cake_inventory_id');
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_sludge ON batch;
+CREATE TRIGGER trg_writeoffable_stock_sludge
+    AFTER INSERT OR DELETE OR UPDATE OF sludge_yield, sludge_sold_quantity,
+        sludge_estimated_rate, oil_type, batch_code, traceable_code
+    ON batch
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_apply('sludge', 'batch_id');
+
+-- Master data and production cost changes refresh the lots they describe
+CREATE OR REPLACE FUNCTION writeoffable_stock_masters_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'materials' THEN
+        PERFORM refresh_writeoffable_stock('material',
+            ARRAY(SELECT inventory_id FROM inventory WHERE material_id = NEW.material_id));
+    ELSIF TG_TABLE_NAME = 'sku_master' THEN
+        PERFORM refresh_writeoffable_stock('sku',
+            ARRAY(SELECT inventory_id FROM sku_inventory WHERE sku_id = NEW.sku_id));
+    ELSIF TG_TABLE_NAME = 'sku_production' THEN
+        PERFORM refresh_writeoffable_stock('sku',
+            ARRAY(SELECT inventory_id FROM sku_inventory WHERE production_id = NEW.production_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_materials ON materials;
+CREATE TRIGGER trg_writeoffable_stock_materials
+    AFTER UPDATE OF material_name, category, unit, is_active
+    ON materials
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_masters_apply();
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_sku_master ON sku_master;
+CREATE TRIGGER trg_writeoffable_stock_sku_master
+    AFTER UPDATE OF product_name, sku_code, oil_type, package_size, is_active
+    ON sku_master
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_masters_apply();
+
+DROP TRIGGER IF EXISTS trg_writeoffable_stock_sku_production ON sku_production;
+CREATE TRIGGER trg_writeoffable_stock_sku_production
+    AFTER UPDATE OF cost_per_bottle
+    ON sku_production
+    FOR EACH ROW EXECUTE FUNCTION writeoffable_stock_masters_apply();
+
+-- Initial fill
+TRUNCATE writeoffable_stock;
+INSERT INTO writeoffable_stock (
+    item_type, item_key, category_group, category_key, category_display,
+    ref_id, item_name, item_code, batch_code, oil_type, traceable_code,
+    location_id, quantity_produced, quantity_available, unit, unit_cost,
+    mrp, expiry_date, production_date
+)
+SELECT * FROM v_writeoffable_stock;
@@ -0,0 +1,281 @@
+-- =====================================================
+-- PUVI System - Time-bucketed analytics rollups
+-- File: puvi-backend/migrations/011_analytics_rollups.sql
+-- Purpose: Daily / weekly / monthly totals per stream and dimension
+--          (oil type, material, SKU, location, customer), maintained by
+--          row triggers on the posting tables so trend charts read the
+--          rollups instead of grouping the raw transactions
+-- Streams: 'purchase', 'batch', 'blend', 'sku_production', 'outbound'
+-- Backfill: python -m utils.analytics_rollups [stream ...]
+-- =====================================================
+
+-- Current contribution of every source row; lets a change be applied
+-- as (new - old) without re-reading history
+CREATE TABLE IF NOT EXISTS analytics_fact_rows (
+    stream VARCHAR(20) NOT NULL,
+    source_key INTEGER NOT NULL,
+    fact_date INTEGER NOT NULL,
+    oil_type VARCHAR(50) NOT NULL DEFAULT '',
+    material_id INTEGER NOT NULL DEFAULT 0,
+    sku_id INTEGER NOT NULL DEFAULT 0,
+    location_id INTEGER NOT NULL DEFAULT 0,
+    customer_id INTEGER NOT NULL DEFAULT 0,
+    txn_count INTEGER NOT NULL DEFAULT 0,
+    quantity NUMERIC(14,3) NOT NULL DEFAULT 0,
+    weight_kg NUMERIC(14,3) NOT NULL DEFAULT 0,
+    amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (stream, source_key)
+);
+
+-- Dimensions that do not apply to a stream are stored as 0 / ''
+CREATE TABLE IF NOT EXISTS analytics_rollups (
+    stream VARCHAR(20) NOT NULL,
+    grain VARCHAR(10) NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    oil_type VARCHAR(50) NOT NULL DEFAULT '',
+    material_id INTEGER NOT NULL DEFAULT 0,
+    sku_id INTEGER NOT NULL DEFAULT 0,
+    location_id INTEGER NOT NULL DEFAULT 0,
+    customer_id INTEGER NOT NULL DEFAULT 0,
+    txn_count INTEGER NOT NULL DEFAULT 0,
+    quantity NUMERIC(14,3) NOT NULL DEFAULT 0,
+    weight_kg NUMERIC(14,3) NOT NULL DEFAULT 0,
+    amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (stream, grain, bucket_start, oil_type, material_id,
+                 sku_id, location_id, customer_id),
+    CONSTRAINT chk_analytics_rollups_grain CHECK (grain IN ('day', 'week', 'month'))
+);
+
+-- Start of the bucket (day number) holding a day; weeks start on Monday
+CREATE OR REPLACE FUNCTION analytics_bucket_start(p_day INTEGER, p_grain VARCHAR)
+RETURNS INTEGER AS $$
+    SELECT CASE p_grain
+        WHEN 'day' THEN p_day
+        WHEN 'week' THEN p_day - ((p_day + 3) % 7)
+        ELSE (date_trunc('month', DATE '1970-01-01' + p_day)::date - DATE '1970-01-01')
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- What each counted source row contributes
+CREATE OR REPLACE VIEW v_analytics_facts AS
+SELECT
+    'purchase'::VARCHAR(20) as stream,
+    pi.item_id as source_key,
+    p.purchase_date as fact_date,
+    ''::VARCHAR(50) as oil_type,
+    COALESCE(pi.material_id, 0) as material_id,
+    0 as sku_id,
+    0 as location_id,
+    0 as customer_id,
+    1 as txn_count,
+    COALESCE(pi.quantity, 0)::NUMERIC as quantity,
+    0::NUMERIC as weight_kg,
+    COALESCE(pi.total_amount, 0)::NUMERIC as amount
+FROM purchase_items pi
+JOIN purchases p ON pi.purchase_id = p.purchase_id
+WHERE p.purchase_date IS NOT NULL
+  AND COALESCE(p.status, 'active') = 'active'
+  AND COALESCE(p.reversal_status, '') <> 'reversal_entry'
+  AND COALESCE(pi.status, 'active') = 'active'
+UNION ALL
+SELECT
+    'batch', b.batch_id, b.production_date, COALESCE(b.oil_type, ''),
+    COALESCE(b.seed_material_id, 0), 0, 0, 0, 1,
+    COALESCE(b.oil_yield, 0), COALESCE(b.seed_quantity_before_drying, 0),
+    COALESCE(b.total_production_cost, 0)
+FROM batch b
+WHERE b.production_date IS NOT NULL
+  AND COALESCE(b.status, 'active') = 'active'
+UNION ALL
+SELECT
+    'blend', bl.blend_id, bl.blend_date, COALESCE(bl.result_oil_type, ''),
+    0, 0, 0, 0, 1,
+    bl.total_quantity, bl.total_quantity,
+    bl.total_quantity * bl.weighted_avg_cost
+FROM blend_batches bl
+WHERE COALESCE(bl.status, 'active') = 'active'
+UNION ALL
+SELECT
+    'sku_production', sp.production_id, sp.production_date, COALESCE(sm.oil_type, ''),
+    0, sp.sku_id, 0, 0, 1,
+    sp.bottles_produced, sp.total_oil_quantity, sp.total_production_cost
+FROM sku_production sp
+JOIN sku_master sm ON sp.sku_id = sm.sku_id
+WHERE COALESCE(sp.status, 'active') = 'active'
+UNION ALL
+SELECT
+    'outbound', oi.item_id, o.outbound_date, COALESCE(sm.oil_type, ''),
+    0, oi.sku_id, o.from_location_id, COALESCE(o.customer_id, 0), 1,
+    COALESCE(oi.quantity_shipped, oi.quantity_ordered),
+    COALESCE(oi.item_weight_kg, 0),
+    COALESCE(oi.line_total, 0)
+FROM sku_outbound_items oi
+JOIN sku_outbound o ON oi.outbound_id = o.outbound_id
+JOIN sku_master sm ON oi.sku_id = sm.sku_id
+WHERE o.status NOT IN ('cancelled', 'deleted')
+  AND COALESCE(oi.status, 'active') = 'active';
+
+-- Re-derive the facts of some source rows and move the rollups by the difference
+CREATE OR REPLACE FUNCTION refresh_analytics_facts(p_stream VARCHAR, p_keys INTEGER[])
+RETURNS VOID AS $$
+DECLARE
+    v_old analytics_fact_rows[];
+    v_new analytics_fact_rows[];
+BEGIN
+    SELECT array_agg(f) INTO v_old
+    FROM analytics_fact_rows f
+    WHERE f.stream = p_stream AND f.source_key = ANY(p_keys);
+
+    DELETE FROM analytics_fact_rows
+    WHERE stream = p_stream AND source_key = ANY(p_keys);
+
+    INSERT INTO analytics_fact_rows
+    SELECT * FROM v_analytics_facts
+    WHERE stream = p_stream AND source_key = ANY(p_keys);
+
+    SELECT array_agg(f) INTO v_new
+    FROM analytics_fact_rows f
+    WHERE f.stream = p_stream AND f.source_key = ANY(p_keys);
+
+    IF v_old IS NULL AND v_new IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO analytics_rollups (
+        stream, grain, bucket_start, oil_type, material_id, sku_id,
+        location_id, customer_id, txn_count, quantity, weight_kg, amount
+    )
+    SELECT
+        d.stream, g.grain, analytics_bucket_start(d.fact_date, g.grain),
+        d.oil_type, d.material_id, d.sku_id, d.location_id, d.customer_id,
+        SUM(d.sign * d.txn_count), SUM(d.sign * d.quantity),
+        SUM(d.sign * d.weight_kg), SUM(d.sign * d.amount)
+    FROM (
+        SELECT o.*, -1 as sign FROM unnest(v_old) o
+        UNION ALL
+        SELECT n.*, 1 FROM unnest(v_new) n
+    ) d
+    CROSS JOIN (VALUES ('day'), ('week'), ('month')) g(grain)
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+    ON CONFLICT (stream, grain, bucket_start, oil_type, material_id,
+                 sku_id, location_id, customer_id) DO UPDATE
+    SET txn_count = analytics_rollups.txn_count + EXCLUDED.txn_count,
+        quantity = analytics_rollups.quantity + EXCLUDED.quantity,
+        weight_kg = analytics_rollups.weight_kg + EXCLUDED.weight_kg,
+        amount = analytics_rollups.amount + EXCLUDED.amount,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuild one stream from scratch (backfill / repair)
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups(p_stream VARCHAR)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    DELETE FROM analytics_rollups WHERE stream = p_stream;
+    DELETE FROM analytics_fact_rows WHERE stream = p_stream;
+
+    INSERT INTO analytics_fact_rows
+    SELECT * FROM v_analytics_facts WHERE stream = p_stream;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    INSERT INTO analytics_rollups (
+        stream, grain, bucket_start, oil_type, material_id, sku_id,
+        location_id, customer_id, txn_count, quantity, weight_kg, amount
+    )
+    SELECT
+        f.stream, g.grain, analytics_bucket_start(f.fact_date, g.grain),
+        f.oil_type, f.material_id, f.sku_id, f.location_id, f.customer_id,
+        SUM(f.txn_count), SUM(f.quantity), SUM(f.weight_kg), SUM(f.amount)
+    FROM analytics_fact_rows f
+    CROSS JOIN (VALUES ('day'), ('week'), ('month')) g(grain)
+    WHERE f.stream = p_stream
+    GROUP BY 1, 2, 3, 4, 5, 6, 7, 8;
+
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row trigger for a posting table: TG_ARGV[0] = stream, TG_ARGV[1] = key column
+CREATE OR REPLACE FUNCTION analytics_facts_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_keys INTEGER[] := ARRAY[]::INTEGER[];
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        v_keys := v_keys || (to_jsonb(OLD) ->> TG_ARGV[1])::INTEGER;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        v_keys := v_keys || (to_jsonb(NEW) ->> TG_ARGV[1])::INTEGER;
+    END IF;
+    PERFORM refresh_analytics_facts(TG_ARGV[0], v_keys);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Header changes (date, status, customer, location) move every line
+CREATE OR REPLACE FUNCTION analytics_facts_header_apply()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'purchases' THEN
+        PERFORM refresh_analytics_facts('purchase',
+            ARRAY(SELECT item_id FROM purchase_items WHERE purchase_id = NEW.purchase_id));
+    ELSIF TG_TABLE_NAME = 'sku_outbound' THEN
+        PERFORM refresh_analytics_facts('outbound',
+            ARRAY(SELECT item_id FROM sku_outbound_items WHERE outbound_id = NEW.outbound_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_analytics_purchase_items ON purchase_items;
+CREATE TRIGGER trg_analytics_purchase_items
+    AFTER INSERT OR DELETE OR UPDATE OF material_id, quantity, total_amount, status
+    ON purchase_items
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_apply('purchase', 'item_id');
+
+DROP TRIGGER IF EXISTS trg_analytics_purchases ON purchases;
+CREATE TRIGGER trg_analytics_purchases
+    AFTER UPDATE OF purchase_date, status, reversal_status
+    ON purchases
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_header_apply();
+
+DROP TRIGGER IF EXISTS trg_analytics_batch ON batch;
+CREATE TRIGGER trg_analytics_batch
+    AFTER INSERT OR DELETE OR UPDATE OF production_date, oil_type, seed_material_id,
+        oil_yield, seed_quantity_before_drying, total_production_cost, status
+    ON batch
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_apply('batch', 'batch_id');
+
+DROP TRIGGER IF EXISTS trg_analytics_blend ON blend_batches;
+CREATE TRIGGER trg_analytics_blend
+    AFTER INSERT OR DELETE OR UPDATE OF blend_date, result_oil_type, total_quantity,
+        weighted_avg_cost, status
+    ON blend_batches
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_apply('blend', 'blend_id');
+
+DROP TRIGGER IF EXISTS trg_analytics_sku_production ON sku_production;
+CREATE TRIGGER trg_analytics_sku_production
+    AFTER INSERT OR DELETE OR UPDATE OF production_date, sku_id, bottles_produced,
+        total_oil_quantity, total_production_cost, status
+    ON sku_production
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_apply('sku_production', 'production_id');
+
+DROP TRIGGER IF EXISTS trg_analytics_outbound_items ON sku_outbound_items;
+CREATE TRIGGER trg_analytics_outbound_items
+    AFTER INSERT OR DELETE OR UPDATE OF sku_id, quantity_ordered, quantity_shipped,
+        item_weight_kg, line_total, status
+    ON sku_outbound_items
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_apply('outbound', 'item_id');
+
+DROP TRIGGER IF EXISTS trg_analytics_outbound ON sku_outbound;
+CREATE TRIGGER trg_analytics_outbound
+    AFTER UPDATE OF outbound_date, status, customer_id, from_location_id
+    ON sku_outbound
+    FOR EACH ROW EXECUTE FUNCTION analytics_facts_header_apply();
+
+-- Initial backfill
+SELECT rebuild_analytics_rollups(stream)
+FROM (VALUES ('purchase'), ('batch'), ('blend'), ('sku_production'), ('outbound')) s(stream);
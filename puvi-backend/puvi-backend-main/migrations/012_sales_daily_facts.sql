@@ -0,0 +1,135 @@
+-- =====================================================
+-- PUVI System - Daily sales facts
+-- File: puvi-backend/migrations/012_sales_daily_facts.sql
+-- Purpose: Sales totals per (customer, SKU, location, day) so sales
+--          summaries and margin analysis read compact aggregates instead
+--          of joining sku_outbound / sku_outbound_items on every call.
+--          Outbound create posts +1 deltas; cancel posts -1 deltas
+--          (modules/sku_outbound.post_sales_fact_deltas)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS sales_daily_facts (
+    customer_id INTEGER NOT NULL,
+    sku_id INTEGER NOT NULL,
+    location_id INTEGER NOT NULL,
+    sale_date INTEGER NOT NULL,
+    -- One fact row per outbound carries its count (the lowest SKU), so
+    -- SUM(outbound_count) is exact unless filtered or grouped by SKU;
+    -- sku_outbound_count counts the outbound on every SKU it sold
+    outbound_count INTEGER NOT NULL DEFAULT 0,
+    sku_outbound_count INTEGER NOT NULL DEFAULT 0,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    units NUMERIC(14,2) NOT NULL DEFAULT 0,
+    weight_kg NUMERIC(14,3) NOT NULL DEFAULT 0,
+    revenue NUMERIC(14,2) NOT NULL DEFAULT 0,
+    gst_amount NUMERIC(14,2) NOT NULL DEFAULT 0,
+    sales_value NUMERIC(14,2) NOT NULL DEFAULT 0,
+    transport_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    handling_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    production_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (customer_id, sku_id, location_id, sale_date)
+);
+
+ALTER TABLE sales_daily_facts
+    ADD COLUMN IF NOT EXISTS sku_outbound_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_facts_date
+    ON sales_daily_facts (sale_date);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_facts_sku_date
+    ON sales_daily_facts (sku_id, sale_date);
+
+-- Add (p_sign = 1) or reverse (p_sign = -1) the facts of sales outbounds.
+-- Reversals must run before the outbound / items are marked cancelled.
+CREATE OR REPLACE FUNCTION post_sales_fact_deltas(p_outbound_ids INTEGER[], p_sign INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    WITH lines AS (
+        SELECT
+            o.outbound_id,
+            o.customer_id,
+            oi.sku_id,
+            o.from_location_id as location_id,
+            o.outbound_date as sale_date,
+            COALESCE(oi.quantity_shipped, oi.quantity_ordered) as units,
+            oi.item_weight_kg,
+            oi.base_price,
+            oi.gst_amount,
+            oi.line_total,
+            oi.transport_cost_per_unit,
+            oi.handling_cost_per_unit,
+            (
+                SELECT SUM(a.quantity * COALESCE(a.production_cost, sp.cost_per_bottle, 0))
+                FROM sku_outbound_item_allocations a
+                LEFT JOIN sku_production sp ON a.production_id = sp.production_id
+                WHERE a.item_id = oi.item_id
+            ) as production_cost
+        FROM sku_outbound o
+        JOIN sku_outbound_items oi ON o.outbound_id = oi.outbound_id
+        WHERE o.outbound_id = ANY(p_outbound_ids)
+            AND o.transaction_type = 'sales'
+            AND o.customer_id IS NOT NULL
+            AND o.status NOT IN ('cancelled', 'deleted')
+            AND COALESCE(oi.status, 'active') = 'active'
+    ),
+    per_sku AS (
+        SELECT
+            outbound_id, customer_id, sku_id, location_id, sale_date,
+            COUNT(*) as line_count,
+            SUM(units) as units,
+            SUM(COALESCE(item_weight_kg, 0)) as weight_kg,
+            SUM(COALESCE(base_price, 0) * units) as revenue,
+            SUM(COALESCE(gst_amount, 0) * units) as gst_amount,
+            SUM(COALESCE(line_total, 0)) as sales_value,
+            SUM(COALESCE(transport_cost_per_unit, 0) * units) as transport_cost,
+            SUM(COALESCE(handling_cost_per_unit, 0) * units) as handling_cost,
+            SUM(COALESCE(production_cost, 0)) as production_cost,
+            CASE WHEN sku_id = MIN(sku_id) OVER (PARTITION BY outbound_id)
+                THEN 1 ELSE 0 END as outbound_count,
+            1 as sku_outbound_count
+        FROM lines
+        GROUP BY outbound_id, customer_id, sku_id, location_id, sale_date
+    )
+    INSERT INTO sales_daily_facts (
+        customer_id, sku_id, location_id, sale_date,
+        outbound_count, sku_outbound_count, line_count, units, weight_kg, revenue, gst_amount,
+        sales_value, transport_cost, handling_cost, production_cost
+    )
+    SELECT
+        customer_id, sku_id, location_id, sale_date,
+        p_sign * SUM(outbound_count), p_sign * SUM(sku_outbound_count),
+        p_sign * SUM(line_count),
+        p_sign * SUM(units), p_sign * SUM(weight_kg),
+        p_sign * SUM(revenue), p_sign * SUM(gst_amount),
+        p_sign * SUM(sales_value), p_sign * SUM(transport_cost),
+        p_sign * SUM(handling_cost), p_sign * SUM(production_cost)
+    FROM per_sku
+    GROUP BY customer_id, sku_id, location_id, sale_date
+    ON CONFLICT (customer_id, sku_id, location_id, sale_date) DO UPDATE
+    SET outbound_count = sales_daily_facts.outbound_count + EXCLUDED.outbound_count,
+        sku_outbound_count = sales_daily_facts.sku_outbound_count + EXCLUDED.sku_outbound_count,
+        line_count = sales_daily_facts.line_count + EXCLUDED.line_count,
+        units = sales_daily_facts.units + EXCLUDED.units,
+        weight_kg = sales_daily_facts.weight_kg + EXCLUDED.weight_kg,
+        revenue = sales_daily_facts.revenue + EXCLUDED.revenue,
+        gst_amount = sales_daily_facts.gst_amount + EXCLUDED.gst_amount,
+        sales_value = sales_daily_facts.sales_value + EXCLUDED.sales_value,
+        transport_cost = sales_daily_facts.transport_cost + EXCLUDED.transport_cost,
+        handling_cost = sales_daily_facts.handling_cost + EXCLUDED.handling_cost,
+        production_cost = sales_daily_facts.production_cost + EXCLUDED.production_cost,
+        updated_at = CURRENT_TIMESTAMP;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill from existing sales
+TRUNCATE sales_daily_facts;
+SELECT post_sales_fact_deltas(
+    ARRAY(SELECT outbound_id FROM sku_outbound WHERE transaction_type = 'sales'),
+    1
+);
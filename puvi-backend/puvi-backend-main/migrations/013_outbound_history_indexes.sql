@@ -0,0 +1,29 @@
+-- =====================================================
+-- PUVI System - Outbound history keyset indexes
+-- File: puvi-backend/migrations/013_outbound_history_indexes.sql
+-- Purpose: Composite indexes behind the (outbound_date, outbound_id)
+--          cursor pagination of /api/sku/outbound/history and the
+--          transaction manager outbound list, one per filter column
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_history
+    ON sku_outbound (outbound_date DESC, outbound_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_customer_history
+    ON sku_outbound (customer_id, outbound_date DESC, outbound_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_from_location_history
+    ON sku_outbound (from_location_id, outbound_date DESC, outbound_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_to_location_history
+    ON sku_outbound (to_location_id, outbound_date DESC, outbound_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_type_status_history
+    ON sku_outbound (transaction_type, status, outbound_date DESC, outbound_id DESC);
+
+-- SKU filter (EXISTS on items) and the per-outbound item rollup
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_items_sku_outbound
+    ON sku_outbound_items (sku_id, outbound_id);
+
+CREATE INDEX IF NOT EXISTS idx_sku_outbound_items_outbound
+    ON sku_outbound_items (outbound_id);
@@ -0,0 +1,16 @@
+-- =====================================================
+-- PUVI System - Boundary crossing closure indexes
+-- File: puvi-backend/migrations/014_boundary_closure_indexes.sql
+-- Purpose: Child-side indexes for each hop of the recursive upstream
+--          closure used by bulk invoice boundary crossing
+--          (outbound -> production -> blend / batch -> purchase)
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_sku_oil_allocation_production
+    ON sku_oil_allocation (production_id);
+
+CREATE INDEX IF NOT EXISTS idx_blend_batch_components_blend
+    ON blend_batch_components (blend_id);
+
+CREATE INDEX IF NOT EXISTS idx_batch_seed_purchase_code
+    ON batch (seed_purchase_code);
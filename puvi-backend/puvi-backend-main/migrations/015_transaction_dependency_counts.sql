@@ -0,0 +1,204 @@
+-- =====================================================
+-- PUVI System - Materialized transaction dependency counts
+-- File: puvi-backend/migrations/015_transaction_dependency_counts.sql
+-- Purpose: Downstream dependency counts per purchase, batch, blend and
+--          SKU production, kept current by row triggers on the tables
+--          that consume them, so transaction manager listings derive
+--          edit_status from one indexed join instead of correlated EXISTS
+-- Record types: 'purchase', 'batch', 'blend', 'sku_production'
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS transaction_dependency_counts (
+    record_type VARCHAR(20) NOT NULL,
+    record_id INTEGER NOT NULL,
+    sku_allocations INTEGER NOT NULL DEFAULT 0,       -- batch / blend oil packed into SKUs
+    blend_components INTEGER NOT NULL DEFAULT 0,      -- batch / blend oil used in blends
+    cake_sales INTEGER NOT NULL DEFAULT 0,            -- batch oil cake sold
+    outbound_allocations INTEGER NOT NULL DEFAULT 0,  -- SKU production lots shipped
+    seed_batches INTEGER NOT NULL DEFAULT 0,          -- purchase seed crushed in batches
+    return_count INTEGER NOT NULL DEFAULT 0,          -- purchase returns (not cancelled)
+    return_value NUMERIC(14,2) NOT NULL DEFAULT 0,
+    has_dependencies BOOLEAN GENERATED ALWAYS AS (
+        sku_allocations + blend_components + cake_sales
+            + outbound_allocations + seed_batches > 0
+    ) STORED,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (record_type, record_id)
+);
+
+-- What one row of a consuming table contributes, and to which record
+CREATE OR REPLACE FUNCTION transaction_dependency_contribution(p_table TEXT, p_row JSONB)
+RETURNS TABLE (record_type VARCHAR, record_id INTEGER, dependency VARCHAR, amount NUMERIC) AS $$
+    SELECT (CASE WHEN p_row->>'source_type' = 'batch' THEN 'batch' ELSE 'blend' END)::VARCHAR,
+           (p_row->>'source_id')::INTEGER, 'sku_allocations'::VARCHAR, 1::NUMERIC
+    WHERE p_table = 'sku_oil_allocation'
+        AND p_row->>'source_type' IN ('batch', 'blend')
+    UNION ALL
+    SELECT (CASE WHEN p_row->>'source_type' = 'extraction' THEN 'batch' ELSE 'blend' END)::VARCHAR,
+           (p_row->>'source_batch_id')::INTEGER, 'blend_components', 1
+    WHERE p_table = 'blend_batch_components'
+        AND p_row->>'source_type' IN ('extraction', 'blended')
+        AND COALESCE(p_row->>'status', 'active') = 'active'
+    UNION ALL
+    SELECT 'batch', (p_row->>'batch_id')::INTEGER, 'cake_sales', 1
+    WHERE p_table = 'oil_cake_sale_allocations'
+        AND p_row->>'batch_id' IS NOT NULL
+    UNION ALL
+    SELECT 'sku_production', (p_row->>'production_id')::INTEGER, 'outbound_allocations', 1
+    WHERE p_table = 'sku_outbound_item_allocations'
+        AND p_row->>'production_id' IS NOT NULL
+    UNION ALL
+    SELECT 'purchase', p.purchase_id, 'seed_batches', 1
+    FROM purchases p
+    WHERE p_table = 'batch'
+        AND p.traceable_code = p_row->>'seed_purchase_code'
+        -- Reversal / correction entries copy the original's traceable code
+        AND COALESCE(p.reversal_status, '') NOT IN ('reversal_entry', 'correction_entry')
+    UNION ALL
+    SELECT 'purchase', (p_row->>'original_purchase_id')::INTEGER, d.dependency, d.amount
+    FROM (VALUES
+        ('return_count'::VARCHAR, 1::NUMERIC),
+        ('return_value', COALESCE((p_row->>'total_return_value')::NUMERIC, 0))
+    ) d(dependency, amount)
+    WHERE p_table = 'purchase_returns'
+        AND p_row->>'original_purchase_id' IS NOT NULL
+        AND COALESCE(p_row->>'status', 'draft') <> 'cancelled';
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION transaction_dependency_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old JSONB;
+    v_new JSONB;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        v_old := to_jsonb(OLD);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        v_new := to_jsonb(NEW);
+    END IF;
+
+    INSERT INTO transaction_dependency_counts (
+        record_type, record_id, sku_allocations, blend_components, cake_sales,
+        outbound_allocations, seed_batches, return_count, return_value
+    )
+    SELECT
+        d.record_type,
+        d.record_id,
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'sku_allocations'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'blend_components'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'cake_sales'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'outbound_allocations'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'seed_batches'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'return_count'), 0),
+        COALESCE(SUM(d.amount) FILTER (WHERE d.dependency = 'return_value'), 0)
+    FROM (
+        SELECT c.record_type, c.record_id, c.dependency, -c.amount as amount
+        FROM transaction_dependency_contribution(TG_TABLE_NAME, v_old) c
+        UNION ALL
+        SELECT c.record_type, c.record_id, c.dependency, c.amount
+        FROM transaction_dependency_contribution(TG_TABLE_NAME, v_new) c
+    ) d
+    WHERE d.record_id IS NOT NULL
+    GROUP BY d.record_type, d.record_id
+    ON CONFLICT (record_type, record_id) DO UPDATE
+    SET sku_allocations = transaction_dependency_counts.sku_allocations + EXCLUDED.sku_allocations,
+        blend_components = transaction_dependency_counts.blend_components + EXCLUDED.blend_components,
+        cake_sales = transaction_dependency_counts.cake_sales + EXCLUDED.cake_sales,
+        outbound_allocations = transaction_dependency_counts.outbound_allocations + EXCLUDED.outbound_allocations,
+        seed_batches = transaction_dependency_counts.seed_batches + EXCLUDED.seed_batches,
+        return_count = transaction_dependency_counts.return_count + EXCLUDED.return_count,
+        return_value = transaction_dependency_counts.return_value + EXCLUDED.return_value,
+        updated_at = CURRENT_TIMESTAMP;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_dependency_sku_oil_allocation ON sku_oil_allocation;
+CREATE TRIGGER trg_dependency_sku_oil_allocation
+    AFTER INSERT OR DELETE OR UPDATE OF source_type, source_id
+    ON sku_oil_allocation
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+DROP TRIGGER IF EXISTS trg_dependency_blend_components ON blend_batch_components;
+CREATE TRIGGER trg_dependency_blend_components
+    AFTER INSERT OR DELETE OR UPDATE OF source_type, source_batch_id, status
+    ON blend_batch_components
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+DROP TRIGGER IF EXISTS trg_dependency_cake_sale_allocations ON oil_cake_sale_allocations;
+CREATE TRIGGER trg_dependency_cake_sale_allocations
+    AFTER INSERT OR DELETE OR UPDATE OF batch_id
+    ON oil_cake_sale_allocations
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+DROP TRIGGER IF EXISTS trg_dependency_outbound_allocations ON sku_outbound_item_allocations;
+CREATE TRIGGER trg_dependency_outbound_allocations
+    AFTER INSERT OR DELETE OR UPDATE OF production_id
+    ON sku_outbound_item_allocations
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+DROP TRIGGER IF EXISTS trg_dependency_seed_batches ON batch;
+CREATE TRIGGER trg_dependency_seed_batches
+    AFTER INSERT OR DELETE OR UPDATE OF seed_purchase_code
+    ON batch
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+DROP TRIGGER IF EXISTS trg_dependency_purchase_returns ON purchase_returns;
+CREATE TRIGGER trg_dependency_purchase_returns
+    AFTER INSERT OR DELETE OR UPDATE OF original_purchase_id, status, total_return_value
+    ON purchase_returns
+    FOR EACH ROW EXECUTE FUNCTION transaction_dependency_apply();
+
+-- Keyset listing indexes (newest first)
+CREATE INDEX IF NOT EXISTS idx_batch_tm_listing
+    ON batch (production_date DESC, batch_id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_blend_batches_tm_listing
+    ON blend_batches (blend_date DESC, blend_id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_sku_production_tm_listing
+    ON sku_production (production_date DESC, production_id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_oil_cake_sales_tm_listing
+    ON oil_cake_sales (sale_date DESC, sale_id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_purchases_tm_listing
+    ON purchases (purchase_date DESC, purchase_id DESC);
+CREATE INDEX IF NOT EXISTS idx_material_writeoffs_tm_listing
+    ON material_writeoffs (writeoff_date DESC, writeoff_id DESC) WHERE status = 'active';
+
+-- Backfill
+TRUNCATE transaction_dependency_counts;
+INSERT INTO transaction_dependency_counts (
+    record_type, record_id, sku_allocations, blend_components, cake_sales,
+    outbound_allocations, seed_batches, return_count, return_value
+)
+SELECT
+    c.record_type,
+    c.record_id,
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'sku_allocations'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'blend_components'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'cake_sales'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'outbound_allocations'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'seed_batches'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'return_count'), 0),
+    COALESCE(SUM(c.amount) FILTER (WHERE c.dependency = 'return_value'), 0)
+FROM (
+    SELECT c.* FROM sku_oil_allocation t,
+        LATERAL transaction_dependency_contribution('sku_oil_allocation', to_jsonb(t)) c
+    UNION ALL
+    SELECT c.* FROM blend_batch_components t,
+        LATERAL transaction_dependency_contribution('blend_batch_components', to_jsonb(t)) c
+    UNION ALL
+    SELECT c.* FROM oil_cake_sale_allocations t,
+        LATERAL transaction_dependency_contribution('oil_cake_sale_allocations', to_jsonb(t)) c
+    UNION ALL
+    SELECT c.* FROM sku_outbound_item_allocations t,
+        LATERAL transaction_dependency_contribution('sku_outbound_item_allocations', to_jsonb(t)) c
+    UNION ALL
+    SELECT c.* FROM batch t,
+        LATERAL transaction_dependency_contribution('batch', to_jsonb(t)) c
+    UNION ALL
+    SELECT c.* FROM purchase_returns t,
+        LATERAL transaction_dependency_contribution('purchase_returns', to_jsonb(t)) c
+) c
+WHERE c.record_id IS NOT NULL
+GROUP BY c.record_type, c.record_id;
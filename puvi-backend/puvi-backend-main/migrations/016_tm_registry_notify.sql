@@ -0,0 +1,41 @@
+-- =====================================================
+-- PUVI System - Transaction manager registry refresh
+-- File: puvi-backend/migrations/016_tm_registry_notify.sql
+-- Purpose: NOTIFY 'tm_registry_refresh' whenever field_edit_rules or the
+--          table schema changes, so each worker reloads its cached
+--          columns / field rules (transaction_management/tm_registry.py)
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION tm_registry_notify()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('tm_registry_refresh', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_field_edit_rules_registry ON field_edit_rules;
+CREATE TRIGGER trg_field_edit_rules_registry
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON field_edit_rules
+    FOR EACH STATEMENT EXECUTE FUNCTION tm_registry_notify();
+
+CREATE OR REPLACE FUNCTION tm_registry_notify_ddl()
+RETURNS event_trigger AS $$
+BEGIN
+    PERFORM pg_notify('tm_registry_refresh', TG_TAG);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Event triggers need superuser; where that is unavailable, migrations
+-- that change transaction tables should end with the NOTIFY below
+DO $$
+BEGIN
+    DROP EVENT TRIGGER IF EXISTS evt_tm_registry_ddl;
+    CREATE EVENT TRIGGER evt_tm_registry_ddl ON ddl_command_end
+        WHEN TAG IN ('CREATE TABLE', 'ALTER TABLE', 'DROP TABLE')
+        EXECUTE FUNCTION tm_registry_notify_ddl();
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Skipping evt_tm_registry_ddl: %', SQLERRM;
+END $$;
+
+NOTIFY tm_registry_refresh;
@@ -0,0 +1,243 @@
+-- =====================================================
+-- PUVI System - Material valuation ledger
+-- File: puvi-backend/migrations/017_material_valuation_ledger.sql
+-- Purpose: Per-material stock movement ledger with replayed moving
+--          weighted average cost and checkpoints every N movements, so a
+--          back-dated correction (purchase reversal / return) re-values
+--          only the movements after it (utils/material_valuation.py)
+-- Movements mirror what the posting paths do to inventory for materials:
+--   purchase / purchase_reversal  purchase_items rows (reversals are negative)
+--   purchase_return               purchase_return_items
+--   batch_consumption             batch seed (compensated on batch delete)
+--   writeoff                      material_writeoffs with a material_id
+--   opening                       opening stock at migration time
+-- Priced movements carry their own unit cost into the average; the others
+-- leave the average unchanged and are valued at it.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS material_movements (
+    movement_id BIGSERIAL PRIMARY KEY,
+    material_id INTEGER NOT NULL,
+    movement_date INTEGER NOT NULL,
+    movement_type VARCHAR(30) NOT NULL,
+    source_table VARCHAR(50),
+    source_id INTEGER,
+    quantity NUMERIC(14,4) NOT NULL,            -- signed: + into stock, - out
+    priced BOOLEAN NOT NULL,
+    unit_cost NUMERIC(14,4),                    -- priced: cost in; else average at posting
+    -- Filled by replay
+    valued_cost NUMERIC(14,4),                  -- cost this movement was valued at
+    running_quantity NUMERIC(14,4),
+    running_avg_cost NUMERIC(14,4),
+    replayed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_material_movements_replay
+    ON material_movements (material_id, movement_date, movement_id);
+
+CREATE INDEX IF NOT EXISTS idx_material_movements_source
+    ON material_movements (source_table, source_id);
+
+-- Replay state after a movement, written every N movements
+CREATE TABLE IF NOT EXISTS material_valuation_checkpoints (
+    material_id INTEGER NOT NULL,
+    movement_date INTEGER NOT NULL,
+    movement_id BIGINT NOT NULL,
+    movement_count INTEGER NOT NULL,
+    running_quantity NUMERIC(14,4) NOT NULL,
+    running_avg_cost NUMERIC(14,4) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (material_id, movement_date, movement_id)
+);
+
+CREATE OR REPLACE FUNCTION material_current_avg_cost(p_material_id INTEGER)
+RETURNS NUMERIC AS $$
+    SELECT weighted_avg_cost
+    FROM inventory
+    WHERE material_id = p_material_id
+    ORDER BY inventory_id DESC
+    LIMIT 1;
+$$ LANGUAGE sql STABLE;
+
+-- Append a movement and drop checkpoints it invalidates
+CREATE OR REPLACE FUNCTION post_material_movement(
+    p_material_id INTEGER, p_date INTEGER, p_type VARCHAR, p_table VARCHAR,
+    p_source_id INTEGER, p_quantity NUMERIC, p_priced BOOLEAN, p_unit_cost NUMERIC
+) RETURNS VOID AS $$
+BEGIN
+    IF p_material_id IS NULL OR COALESCE(p_quantity, 0) = 0 THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO material_movements (
+        material_id, movement_date, movement_type, source_table, source_id,
+        quantity, priced, unit_cost
+    ) VALUES (
+        p_material_id, COALESCE(p_date, 0), p_type, p_table, p_source_id,
+        p_quantity, p_priced, p_unit_cost
+    );
+
+    DELETE FROM material_valuation_checkpoints
+    WHERE material_id = p_material_id
+        AND movement_date >= COALESCE(p_date, 0);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION material_movement_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_date INTEGER;
+    v_type VARCHAR;
+BEGIN
+    IF TG_TABLE_NAME = 'purchase_items' THEN
+        SELECT purchase_date,
+               CASE WHEN reversal_status = 'reversal_entry' THEN 'purchase_reversal'
+                    ELSE 'purchase' END
+        INTO v_date, v_type
+        FROM purchases
+        WHERE purchase_id = COALESCE(NEW.purchase_id, OLD.purchase_id);
+
+        IF TG_OP = 'INSERT' THEN
+            PERFORM post_material_movement(
+                NEW.material_id, v_date, v_type, TG_TABLE_NAME, NEW.item_id,
+                NEW.quantity, true, NEW.landed_cost_per_unit);
+        ELSE
+            PERFORM post_material_movement(
+                OLD.material_id, v_date, v_type, TG_TABLE_NAME, OLD.item_id,
+                -OLD.quantity, true, OLD.landed_cost_per_unit);
+        END IF;
+
+    ELSIF TG_TABLE_NAME = 'purchase_return_items' THEN
+        SELECT return_date INTO v_date
+        FROM purchase_returns
+        WHERE return_id = COALESCE(NEW.return_id, OLD.return_id);
+
+        -- Returns leave stock at the landed cost they came in at
+        IF TG_OP = 'INSERT' THEN
+            PERFORM post_material_movement(
+                NEW.material_id, v_date, 'purchase_return', TG_TABLE_NAME, NEW.return_item_id,
+                -NEW.quantity_returned, true,
+                COALESCE(NEW.landed_cost_reversed / NULLIF(NEW.quantity_returned, 0), NEW.rate));
+        ELSE
+            PERFORM post_material_movement(
+                OLD.material_id, v_date, 'purchase_return', TG_TABLE_NAME, OLD.return_item_id,
+                OLD.quantity_returned, true,
+                COALESCE(OLD.landed_cost_reversed / NULLIF(OLD.quantity_returned, 0), OLD.rate));
+        END IF;
+
+    ELSIF TG_TABLE_NAME = 'batch' THEN
+        IF TG_OP = 'INSERT' AND COALESCE(NEW.status, 'active') = 'active' THEN
+            PERFORM post_material_movement(
+                NEW.seed_material_id, NEW.production_date, 'batch_consumption', TG_TABLE_NAME,
+                NEW.batch_id, -NEW.seed_quantity_before_drying, false,
+                material_current_avg_cost(NEW.seed_material_id));
+        ELSIF TG_OP = 'UPDATE' AND NEW.status = 'deleted' AND COALESCE(OLD.status, 'active') = 'active' THEN
+            -- soft_delete_batch puts the seed back into stock
+            PERFORM post_material_movement(
+                OLD.seed_material_id, (CURRENT_DATE - DATE '1970-01-01'), 'batch_consumption',
+                TG_TABLE_NAME, OLD.batch_id, OLD.seed_quantity_before_drying, false,
+                material_current_avg_cost(OLD.seed_material_id));
+        END IF;
+
+    ELSIF TG_TABLE_NAME = 'material_writeoffs' THEN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM post_material_movement(
+                NEW.material_id, NEW.writeoff_date, 'writeoff', TG_TABLE_NAME,
+                NEW.writeoff_id, -NEW.quantity, false, NEW.weighted_avg_cost);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_material_movements_purchase_items ON purchase_items;
+CREATE TRIGGER trg_material_movements_purchase_items
+    AFTER INSERT OR DELETE ON purchase_items
+    FOR EACH ROW EXECUTE FUNCTION material_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_material_movements_return_items ON purchase_return_items;
+CREATE TRIGGER trg_material_movements_return_items
+    AFTER INSERT OR DELETE ON purchase_return_items
+    FOR EACH ROW EXECUTE FUNCTION material_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_material_movements_batch ON batch;
+CREATE TRIGGER trg_material_movements_batch
+    AFTER INSERT OR UPDATE OF status ON batch
+    FOR EACH ROW EXECUTE FUNCTION material_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_material_movements_writeoffs ON material_writeoffs;
+CREATE TRIGGER trg_material_movements_writeoffs
+    AFTER INSERT ON material_writeoffs
+    FOR EACH ROW EXECUTE FUNCTION material_movement_apply();
+
+-- Backfill from posting history. Stock that history does not explain
+-- (opening balances, manual fixes) becomes one 'opening' movement per
+-- material at its current average. Run
+--   python -m utils.material_valuation
+-- afterwards to replay every material and write the first checkpoints.
+TRUNCATE material_movements, material_valuation_checkpoints;
+
+INSERT INTO material_movements (
+    material_id, movement_date, movement_type, source_table, source_id,
+    quantity, priced, unit_cost
+)
+SELECT pi.material_id, COALESCE(p.purchase_date, 0),
+       CASE WHEN p.reversal_status = 'reversal_entry' THEN 'purchase_reversal' ELSE 'purchase' END,
+       'purchase_items', pi.item_id, pi.quantity, true, pi.landed_cost_per_unit
+FROM purchase_items pi
+JOIN purchases p ON pi.purchase_id = p.purchase_id
+WHERE pi.material_id IS NOT NULL AND pi.quantity <> 0
+UNION ALL
+SELECT pri.material_id, pr.return_date, 'purchase_return', 'purchase_return_items',
+       pri.return_item_id, -pri.quantity_returned, true,
+       COALESCE(pri.landed_cost_reversed / NULLIF(pri.quantity_returned, 0), pri.rate)
+FROM purchase_return_items pri
+JOIN purchase_returns pr ON pri.return_id = pr.return_id
+WHERE pri.material_id IS NOT NULL AND pri.quantity_returned <> 0
+UNION ALL
+-- Seed cost per kg recorded on the batch: total_production_cost is the
+-- seed cost (quantity x average at posting) plus the cost elements
+SELECT b.seed_material_id, COALESCE(b.production_date, 0), 'batch_consumption', 'batch',
+       b.batch_id, -b.seed_quantity_before_drying, false,
+       (b.total_production_cost - COALESCE((SELECT SUM(ec.total_cost) FROM batch_extended_costs ec
+                                            WHERE ec.batch_id = b.batch_id), 0))
+           / b.seed_quantity_before_drying
+FROM batch b
+WHERE b.seed_material_id IS NOT NULL
+    AND COALESCE(b.seed_quantity_before_drying, 0) <> 0
+    AND COALESCE(b.status, 'active') = 'active'
+UNION ALL
+SELECT w.material_id, w.writeoff_date, 'writeoff', 'material_writeoffs',
+       w.writeoff_id, -w.quantity, false, w.weighted_avg_cost
+FROM material_writeoffs w
+WHERE w.material_id IS NOT NULL AND w.quantity <> 0;
+
+INSERT INTO material_movements (
+    material_id, movement_date, movement_type, source_table, source_id,
+    quantity, priced, unit_cost
+)
+SELECT s.material_id,
+       -- The day before the first movement, so it replays first
+       COALESCE(h.first_date - 1, 0),
+       'opening', 'inventory', s.inventory_id,
+       s.closing_stock - COALESCE(h.quantity, 0),
+       true, s.weighted_avg_cost
+FROM (
+    -- One row per material however many inventory rows it has
+    SELECT material_id,
+           MIN(inventory_id) as inventory_id,
+           SUM(closing_stock) as closing_stock,
+           COALESCE(SUM(closing_stock * weighted_avg_cost) / NULLIF(SUM(closing_stock), 0),
+                    MAX(weighted_avg_cost)) as weighted_avg_cost
+    FROM inventory
+    WHERE material_id IS NOT NULL
+    GROUP BY material_id
+) s
+LEFT JOIN (
+    SELECT material_id, MIN(movement_date) as first_date, SUM(quantity) as quantity
+    FROM material_movements
+    GROUP BY material_id
+) h ON h.material_id = s.material_id
+WHERE s.closing_stock <> COALESCE(h.quantity, 0);
@@ -0,0 +1,313 @@
+-- =====================================================
+-- PUVI System - Stock movement ledger
+-- File: puvi-backend/migrations/018_stock_movements.sql
+-- Purpose: Append-only ledger of every change to material / oil stock
+--          (inventory) and SKU stock per location (sku_inventory), with
+--          periodic balance snapshots, so a balance on any past date is
+--          one snapshot plus a bounded delta scan (/api/stock/as_of)
+-- Items: 'material' (material_id), 'oil' (inventory_id of the oil source
+--        row), 'sku' (sku_id at location_id)
+-- Posting paths tag their movements with the business date and source
+-- via utils/stock_ledger.set_stock_movement_context; untagged changes
+-- are dated the day they are posted.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS stock_movements (
+    movement_id BIGSERIAL PRIMARY KEY,
+    item_type VARCHAR(10) NOT NULL,
+    item_key INTEGER NOT NULL,
+    location_id INTEGER NOT NULL DEFAULT 0,     -- 0 for material / oil
+    movement_date INTEGER NOT NULL,
+    quantity NUMERIC(14,4) NOT NULL,            -- signed change
+    balance_after NUMERIC(14,4),
+    unit_cost NUMERIC(14,4),
+    source_table VARCHAR(50),
+    source_id INTEGER,
+    recorded_table VARCHAR(50) NOT NULL,        -- inventory / sku_inventory
+    recorded_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_date
+    ON stock_movements (movement_date, item_type);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_item_date
+    ON stock_movements (item_type, item_key, location_id, movement_date);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_source
+    ON stock_movements (source_table, source_id);
+
+-- Closing balances at the end of snapshot_date
+CREATE TABLE IF NOT EXISTS stock_balance_snapshots (
+    snapshot_date INTEGER NOT NULL,
+    item_type VARCHAR(10) NOT NULL,
+    item_key INTEGER NOT NULL,
+    location_id INTEGER NOT NULL DEFAULT 0,
+    quantity NUMERIC(14,4) NOT NULL,
+    PRIMARY KEY (snapshot_date, item_type, item_key, location_id)
+);
+
+CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+    snapshot_date INTEGER PRIMARY KEY,
+    is_valid BOOLEAN NOT NULL DEFAULT true,
+    item_count INTEGER,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION post_stock_movement(
+    p_item_type VARCHAR, p_item_key INTEGER, p_location_id INTEGER,
+    p_quantity NUMERIC, p_balance_after NUMERIC, p_unit_cost NUMERIC,
+    p_recorded_table VARCHAR, p_recorded_id INTEGER
+) RETURNS VOID AS $$
+DECLARE
+    v_date INTEGER;
+BEGIN
+    IF p_item_key IS NULL OR COALESCE(p_quantity, 0) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Shared with other postings, exclusive with build_stock_snapshot:
+    -- a snapshot build waits for postings in flight and postings wait for
+    -- the build, so a back-dated movement is either in the snapshot or
+    -- invalidates it once it exists
+    PERFORM pg_advisory_xact_lock_shared(hashtext('stock_snapshot_build'));
+
+    v_date := COALESCE(
+        NULLIF(current_setting('puvi.movement_date', true), '')::INTEGER,
+        CURRENT_DATE - DATE '1970-01-01'
+    );
+
+    INSERT INTO stock_movements (
+        item_type, item_key, location_id, movement_date, quantity,
+        balance_after, unit_cost, source_table, source_id,
+        recorded_table, recorded_id
+    ) VALUES (
+        p_item_type, p_item_key, COALESCE(p_location_id, 0), v_date, p_quantity,
+        p_balance_after, p_unit_cost,
+        NULLIF(current_setting('puvi.movement_source_table', true), ''),
+        NULLIF(current_setting('puvi.movement_source_id', true), '')::INTEGER,
+        p_recorded_table, p_recorded_id
+    );
+
+    -- Back-dated movements make later snapshots stale
+    UPDATE stock_snapshot_runs
+    SET is_valid = false
+    WHERE snapshot_date >= v_date AND is_valid;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stock_movement_apply()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old_type VARCHAR;
+    v_new_type VARCHAR;
+    v_old_key INTEGER;
+    v_new_key INTEGER;
+    v_old_location INTEGER := 0;
+    v_new_location INTEGER := 0;
+    v_old_qty NUMERIC := 0;
+    v_new_qty NUMERIC := 0;
+    v_old_id INTEGER;
+    v_new_id INTEGER;
+    v_unit_cost NUMERIC;
+BEGIN
+    IF TG_TABLE_NAME = 'inventory' THEN
+        IF TG_OP <> 'INSERT' THEN
+            v_old_type := CASE WHEN OLD.material_id IS NOT NULL THEN 'material' ELSE 'oil' END;
+            v_old_key := COALESCE(OLD.material_id, OLD.inventory_id);
+            v_old_qty := COALESCE(OLD.closing_stock, 0);
+            v_old_id := OLD.inventory_id;
+            v_unit_cost := OLD.weighted_avg_cost;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            v_new_type := CASE WHEN NEW.material_id IS NOT NULL THEN 'material' ELSE 'oil' END;
+            v_new_key := COALESCE(NEW.material_id, NEW.inventory_id);
+            v_new_qty := COALESCE(NEW.closing_stock, 0);
+            v_new_id := NEW.inventory_id;
+            v_unit_cost := NEW.weighted_avg_cost;
+        END IF;
+    ELSE
+        -- sku_inventory: one row per (sku, location); deleted rows hold no stock
+        IF TG_OP <> 'INSERT' THEN
+            v_old_type := 'sku';
+            v_old_key := OLD.sku_id;
+            v_old_location := COALESCE(OLD.location_id, 0);
+            v_old_qty := CASE WHEN COALESCE(OLD.status, 'active') = 'deleted' THEN 0
+                              ELSE COALESCE(OLD.quantity_available, 0) END;
+            v_old_id := OLD.inventory_id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            v_new_type := 'sku';
+            v_new_key := NEW.sku_id;
+            v_new_location := COALESCE(NEW.location_id, 0);
+            v_new_qty := CASE WHEN COALESCE(NEW.status, 'active') = 'deleted' THEN 0
+                              ELSE COALESCE(NEW.quantity_available, 0) END;
+            v_new_id := NEW.inventory_id;
+        END IF;
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+        AND v_old_type = v_new_type
+        AND v_old_key = v_new_key
+        AND v_old_location = v_new_location THEN
+        -- Same item: one net movement
+        PERFORM post_stock_movement(
+            v_new_type, v_new_key, v_new_location, v_new_qty - v_old_qty,
+            v_new_qty, v_unit_cost, TG_TABLE_NAME, v_new_id);
+    ELSE
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM post_stock_movement(
+                v_old_type, v_old_key, v_old_location, -v_old_qty,
+                NULL, v_unit_cost, TG_TABLE_NAME, v_old_id);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM post_stock_movement(
+                v_new_type, v_new_key, v_new_location, v_new_qty,
+                v_new_qty, v_unit_cost, TG_TABLE_NAME, v_new_id);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stock_movements_inventory ON inventory;
+CREATE TRIGGER trg_stock_movements_inventory
+    AFTER INSERT OR DELETE ON inventory
+    FOR EACH ROW EXECUTE FUNCTION stock_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_stock_movements_inventory_update ON inventory;
+CREATE TRIGGER trg_stock_movements_inventory_update
+    AFTER UPDATE OF closing_stock, material_id ON inventory
+    FOR EACH ROW
+    WHEN (OLD.closing_stock IS DISTINCT FROM NEW.closing_stock
+          OR OLD.material_id IS DISTINCT FROM NEW.material_id)
+    EXECUTE FUNCTION stock_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_stock_movements_sku_inventory ON sku_inventory;
+CREATE TRIGGER trg_stock_movements_sku_inventory
+    AFTER INSERT OR DELETE ON sku_inventory
+    FOR EACH ROW EXECUTE FUNCTION stock_movement_apply();
+
+DROP TRIGGER IF EXISTS trg_stock_movements_sku_inventory_update ON sku_inventory;
+CREATE TRIGGER trg_stock_movements_sku_inventory_update
+    AFTER UPDATE OF quantity_available, status, sku_id, location_id ON sku_inventory
+    FOR EACH ROW
+    WHEN (OLD.quantity_available IS DISTINCT FROM NEW.quantity_available
+          OR OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.sku_id IS DISTINCT FROM NEW.sku_id
+          OR OLD.location_id IS DISTINCT FROM NEW.location_id)
+    EXECUTE FUNCTION stock_movement_apply();
+
+-- Build (or rebuild) the snapshot of one date from the previous valid
+-- snapshot plus the movements in between
+CREATE OR REPLACE FUNCTION build_stock_snapshot(p_date INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_base INTEGER;
+    v_rows INTEGER;
+    v_attempt INTEGER := 0;
+BEGIN
+    -- Exclusive against post_stock_movement. Polled rather than queued:
+    -- a queued exclusive request would also hold up new postings behind
+    -- it and can deadlock with postings waiting on each other's rows
+    WHILE NOT pg_try_advisory_xact_lock(hashtext('stock_snapshot_build')) LOOP
+        v_attempt := v_attempt + 1;
+        IF v_attempt >= 200 THEN
+            RAISE EXCEPTION 'Stock movements still posting, snapshot % not built', p_date;
+        END IF;
+        PERFORM pg_sleep(0.05);
+    END LOOP;
+
+    SELECT MAX(snapshot_date) INTO v_base
+    FROM stock_snapshot_runs
+    WHERE snapshot_date < p_date AND is_valid;
+
+    DELETE FROM stock_balance_snapshots WHERE snapshot_date = p_date;
+
+    INSERT INTO stock_balance_snapshots (snapshot_date, item_type, item_key, location_id, quantity)
+    SELECT p_date, item_type, item_key, location_id, SUM(quantity)
+    FROM (
+        SELECT item_type, item_key, location_id, quantity
+        FROM stock_balance_snapshots
+        WHERE snapshot_date = v_base
+        UNION ALL
+        SELECT item_type, item_key, location_id, quantity
+        FROM stock_movements
+        WHERE movement_date <= p_date
+            AND (v_base IS NULL OR movement_date > v_base)
+    ) s
+    GROUP BY item_type, item_key, location_id
+    HAVING SUM(quantity) <> 0;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    INSERT INTO stock_snapshot_runs (snapshot_date, is_valid, item_count, built_at)
+    VALUES (p_date, true, v_rows, CURRENT_TIMESTAMP)
+    ON CONFLICT (snapshot_date) DO UPDATE
+    SET is_valid = true, item_count = EXCLUDED.item_count, built_at = EXCLUDED.built_at;
+
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill. Material history comes from the valuation ledger
+-- (migration 017); oil and SKU stock start as an opening movement of the
+-- current balance dated today. Differences between the material history
+-- and current inventory are posted as an adjustment dated today.
+TRUNCATE stock_movements, stock_balance_snapshots, stock_snapshot_runs;
+
+INSERT INTO stock_movements (
+    item_type, item_key, location_id, movement_date, quantity, unit_cost,
+    source_table, source_id, recorded_table, recorded_id
+)
+SELECT 'material', m.material_id, 0, m.movement_date, m.quantity, m.unit_cost,
+       m.source_table, m.source_id, 'material_movements', m.movement_id
+FROM material_movements m
+ORDER BY m.movement_date, m.movement_id;
+
+INSERT INTO stock_movements (
+    item_type, item_key, location_id, movement_date, quantity, balance_after,
+    unit_cost, source_table, recorded_table, recorded_id
+)
+-- Materials: one adjustment per material however many inventory rows it has
+SELECT 'material', s.material_id, 0,
+       CURRENT_DATE - DATE '1970-01-01',
+       s.closing_stock - COALESCE(h.quantity, 0),
+       s.closing_stock, s.weighted_avg_cost, 'opening', 'inventory', s.inventory_id
+FROM (
+    SELECT material_id,
+           MIN(inventory_id) as inventory_id,
+           SUM(COALESCE(closing_stock, 0)) as closing_stock,
+           COALESCE(SUM(closing_stock * weighted_avg_cost) / NULLIF(SUM(closing_stock), 0),
+                    MAX(weighted_avg_cost)) as weighted_avg_cost
+    FROM inventory
+    WHERE material_id IS NOT NULL
+    GROUP BY material_id
+) s
+LEFT JOIN (
+    SELECT material_id, SUM(quantity) as quantity
+    FROM material_movements
+    GROUP BY material_id
+) h ON h.material_id = s.material_id
+WHERE s.closing_stock <> COALESCE(h.quantity, 0)
+UNION ALL
+-- Oil inventory rows are keyed by inventory_id and have no history
+SELECT 'oil', i.inventory_id, 0,
+       CURRENT_DATE - DATE '1970-01-01',
+       i.closing_stock, i.closing_stock, i.weighted_avg_cost,
+       'opening', 'inventory', i.inventory_id
+FROM inventory i
+WHERE i.material_id IS NULL
+    AND COALESCE(i.closing_stock, 0) <> 0;
+
+INSERT INTO stock_movements (
+    item_type, item_key, location_id, movement_date, quantity, balance_after,
+    source_table, recorded_table, recorded_id
+)
+SELECT 'sku', si.sku_id, COALESCE(si.location_id, 0),
+       CURRENT_DATE - DATE '1970-01-01',
+       si.quantity_available, si.quantity_available, 'opening', 'sku_inventory', si.inventory_id
+FROM sku_inventory si
+WHERE COALESCE(si.status, 'active') <> 'deleted'
+    AND COALESCE(si.quantity_available, 0) <> 0;
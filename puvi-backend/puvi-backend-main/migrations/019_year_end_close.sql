@@ -0,0 +1,125 @@
+-- =====================================================
+-- PUVI System - Set-based year-end close
+-- File: puvi-backend/migrations/019_year_end_close.sql
+-- Purpose: Year-end close as a few INSERT ... SELECT steps over one stock
+--          view (materials, oil sources, SKU stock per location, oil cake
+--          and sludge), run as a resumable background job with progress
+--          in year_end_close_runs (utils/year_end_close.py)
+-- =====================================================
+
+ALTER TABLE year_end_closing ADD COLUMN IF NOT EXISTS item_type VARCHAR(20) DEFAULT 'material';
+ALTER TABLE year_end_closing ADD COLUMN IF NOT EXISTS item_key INTEGER;
+ALTER TABLE year_end_closing ADD COLUMN IF NOT EXISTS location_id INTEGER;
+ALTER TABLE year_end_closing ADD COLUMN IF NOT EXISTS run_id INTEGER;
+
+UPDATE year_end_closing
+SET item_type = 'material', item_key = material_id
+WHERE item_key IS NULL;
+
+-- One closing row per item and year; lets a resumed step skip what an
+-- earlier attempt already wrote
+CREATE UNIQUE INDEX IF NOT EXISTS idx_year_end_closing_item
+    ON year_end_closing (financial_year, item_type, item_key, (COALESCE(location_id, 0)))
+    WHERE status = 'closed';
+
+CREATE TABLE IF NOT EXISTS year_end_close_runs (
+    run_id SERIAL PRIMARY KEY,
+    financial_year VARCHAR(7) NOT NULL,
+    year_end_date INTEGER NOT NULL,
+    new_financial_year VARCHAR(7) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',   -- queued, running, completed, failed
+    steps_total INTEGER NOT NULL,
+    steps_done INTEGER NOT NULL DEFAULT 0,
+    current_step VARCHAR(30),
+    summary JSONB NOT NULL DEFAULT '{}'::jsonb,     -- per-step results
+    error TEXT,
+    closed_by VARCHAR(100),
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- At most one unfinished run per year
+CREATE UNIQUE INDEX IF NOT EXISTS idx_year_end_close_runs_open
+    ON year_end_close_runs (financial_year)
+    WHERE status <> 'completed';
+
+-- Everything the close carries forward, one row per item with stock
+CREATE OR REPLACE VIEW v_year_end_closing_stock AS
+SELECT
+    'material'::VARCHAR(20) as item_type,
+    i.material_id as item_key,
+    NULL::INTEGER as location_id,
+    i.material_id,
+    m.material_name as item_name,
+    m.category,
+    m.unit,
+    SUM(i.closing_stock) as quantity,
+    SUM(i.closing_stock * i.weighted_avg_cost) / SUM(i.closing_stock) as unit_cost
+FROM inventory i
+JOIN materials m ON i.material_id = m.material_id
+WHERE i.closing_stock > 0
+-- One row per material however many inventory rows it has
+GROUP BY i.material_id, m.material_name, m.category, m.unit
+UNION ALL
+SELECT
+    'oil',
+    i.inventory_id,
+    NULL,
+    NULL,
+    CONCAT(i.oil_type, ' Oil'),
+    COALESCE(i.source_type, 'oil'),
+    'kg',
+    i.closing_stock,
+    i.weighted_avg_cost
+FROM inventory i
+WHERE i.material_id IS NULL
+    AND i.closing_stock > 0
+UNION ALL
+SELECT
+    'sku',
+    si.sku_id,
+    si.location_id,
+    NULL,
+    MAX(sm.product_name),
+    CONCAT('sku_', MAX(sm.oil_type)),
+    'bottles',
+    SUM(si.quantity_available),
+    -- Lots valued at their production cost per bottle
+    SUM(si.quantity_available * COALESCE(p.cost_per_bottle, 0)) / SUM(si.quantity_available)
+FROM sku_inventory si
+JOIN sku_master sm ON si.sku_id = sm.sku_id
+LEFT JOIN sku_production p ON si.production_id = p.production_id
+WHERE si.quantity_available > 0
+    AND COALESCE(si.status, 'active') = 'active'
+GROUP BY si.sku_id, si.location_id
+UNION ALL
+SELECT
+    'oilcake',
+    oci.cake_inventory_id,
+    NULL,
+    NULL,
+    CONCAT('Oil Cake - ', oci.oil_type),
+    'byproducts',
+    'kg',
+    oci.quantity_remaining,
+    oci.estimated_rate
+FROM oil_cake_inventory oci
+WHERE oci.quantity_remaining > 0
+UNION ALL
+SELECT
+    'sludge',
+    b.batch_id,
+    NULL,
+    NULL,
+    CONCAT('Sludge - ', b.oil_type),
+    'byproducts',
+    'kg',
+    b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0),
+    b.sludge_estimated_rate
+FROM batch b
+WHERE b.sludge_yield > 0
+    AND b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0) > 0
+    AND COALESCE(b.status, 'active') = 'active';
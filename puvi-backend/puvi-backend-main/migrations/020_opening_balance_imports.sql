@@ -0,0 +1,36 @@
+-- =====================================================
+-- PUVI System - Opening balance imports
+-- File: puvi-backend/migrations/020_opening_balance_imports.sql
+-- Purpose: Record each opening balance import / save and the rows it
+--          rejected, so the error report can be downloaded after the
+--          request (utils/opening_balance_import.py)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS opening_balance_imports (
+    import_id SERIAL PRIMARY KEY,
+    source VARCHAR(10) NOT NULL,                -- csv / json
+    file_name VARCHAR(255),
+    cutoff_date INTEGER NOT NULL,
+    financial_year VARCHAR(7),
+    total_rows INTEGER NOT NULL DEFAULT 0,
+    inserted_count INTEGER NOT NULL DEFAULT 0,
+    updated_count INTEGER NOT NULL DEFAULT 0,
+    skipped_count INTEGER NOT NULL DEFAULT 0,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    total_value NUMERIC(14,2) NOT NULL DEFAULT 0,
+    entered_by VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS opening_balance_import_errors (
+    import_id INTEGER NOT NULL REFERENCES opening_balance_imports(import_id) ON DELETE CASCADE,
+    row_num INTEGER NOT NULL,
+    material_id TEXT,
+    unit TEXT,
+    quantity TEXT,
+    rate_per_unit TEXT,
+    error VARCHAR(255) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_opening_balance_import_errors_import
+    ON opening_balance_import_errors (import_id, row_num);
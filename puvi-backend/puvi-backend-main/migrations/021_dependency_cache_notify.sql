@@ -0,0 +1,46 @@
+-- =====================================================
+-- PUVI System - Dependency check cache invalidation
+-- File: puvi-backend/migrations/021_dependency_cache_notify.sql
+-- Purpose: NOTIFY 'dependency_cache_invalidate' with the table name after
+--          any write to a table the master / location / customer
+--          dependency checks read, so each worker drops the records it
+--          cached as dependency-free (utils/dependency_checks.py)
+-- One notification per table per transaction (NOTIFY de-duplicates).
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION dependency_cache_notify()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('dependency_cache_invalidate', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY[
+        -- Masters (system protection and reference columns)
+        'suppliers', 'materials', 'uom_master', 'categories_master',
+        'subcategories_master', 'bom_category_mapping', 'tags',
+        'writeoff_reasons', 'cost_elements_master',
+        -- Dependents of masters
+        'purchases', 'purchase_items', 'inventory', 'material_writeoffs',
+        'material_tags', 'batch_extended_costs', 'cost_override_log',
+        -- Dependents of locations and customers
+        'sku_inventory', 'sku_expiry_tracking', 'sku_outbound',
+        'customers', 'locations_master'
+    ]
+    LOOP
+        IF to_regclass(v_table) IS NULL THEN
+            CONTINUE;
+        END IF;
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_dependency_cache ON %I', v_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_dependency_cache
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+                FOR EACH STATEMENT EXECUTE FUNCTION dependency_cache_notify()',
+            v_table);
+    END LOOP;
+END $$;
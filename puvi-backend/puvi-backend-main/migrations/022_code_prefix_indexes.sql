@@ -0,0 +1,21 @@
+-- =====================================================
+-- PUVI System - Code prefix indexes
+-- File: puvi-backend/migrations/022_code_prefix_indexes.sql
+-- Purpose: Let the code allocator (utils/code_allocator.py) read every
+--          existing customer, ship-to and location code sharing a prefix
+--          with one index scan. LIKE 'prefix%' only uses a btree built
+--          with varchar_pattern_ops unless the database collation is C.
+-- Equality lookups keep using the UNIQUE constraint indexes, so the plain
+-- idx_customers_code duplicate is replaced.
+-- =====================================================
+
+DROP INDEX IF EXISTS idx_customers_code;
+
+CREATE INDEX IF NOT EXISTS idx_customers_code_prefix
+    ON customers (customer_code varchar_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_ship_to_location_code_prefix
+    ON customer_ship_to_locations (location_code varchar_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_locations_code_prefix
+    ON locations_master (location_code varchar_pattern_ops);
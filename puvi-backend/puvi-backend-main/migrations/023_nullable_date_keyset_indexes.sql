@@ -0,0 +1,13 @@
+-- =====================================================
+-- PUVI System - Keyset indexes for nullable dates
+-- File: puvi-backend/migrations/023_nullable_date_keyset_indexes.sql
+-- Purpose: purchases.purchase_date and batch.production_date allow NULL,
+--          so their lists page on (COALESCE(date, 0), id) to match the
+--          cursor encoding (utils/pagination.py); index that expression
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_purchases_keyset
+    ON purchases ((COALESCE(purchase_date, 0)) DESC, purchase_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_batch_keyset
+    ON batch ((COALESCE(production_date, 0)) DESC, batch_id DESC);
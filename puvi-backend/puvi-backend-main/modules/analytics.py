@@ -0,0 +1,156 @@
+"""
+Analytics Module for PUVI Oil Manufacturing System
+Trend queries over the time-bucketed rollups of purchases, batches,
+blends, SKU production and outbound (see migrations/011)
+File Path: puvi-backend/puvi-backend-main/modules/analytics.py
+"""
+
+from flask import Blueprint, request, jsonify
+from db_utils import get_db_connection, close_connection
+from utils.date_utils import parse_date, integer_to_date
+from utils.analytics_rollups import (
+    ANALYTICS_STREAMS, ANALYTICS_GRAINS, ANALYTICS_DIMENSIONS, ANALYTICS_MEASURES
+)
+
+# Create Blueprint
+analytics_bp = Blueprint('analytics', __name__)
+
+
+def parse_list_arg(name, allowed, default):
+    """
+    Parse a comma separated query argument against an allowed set.
+
+    Returns:
+        Tuple of (values, invalid values)
+    """
+    raw = request.args.get(name)
+    if not raw:
+        return list(default), []
+    values = [value.strip() for value in raw.split(',') if value.strip()]
+    return values, [value for value in values if value not in allowed]
+
+
+# ============================================
+# TIMESERIES
+# ============================================
+
+@analytics_bp.route('/api/analytics/timeseries', methods=['GET'])
+def get_timeseries():
+    """
+    Time series of one stream, grouped by bucket and the selected dimensions.
+
+    Query params:
+        stream: purchase, batch, blend, sku_production, outbound (required)
+        grain: day, week, month (default month)
+        measures: Comma list of txn_count, quantity, weight_kg, amount (default all)
+        dimensions: Comma list of oil_type, material_id, sku_id, location_id,
+                    customer_id (default none - totals per bucket)
+        start_date, end_date: Date range
+        oil_type, material_id, sku_id, location_id, customer_id: Filters
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        stream = request.args.get('stream')
+        grain = request.args.get('grain', 'month')
+
+        if stream not in ANALYTICS_STREAMS:
+            return jsonify({
+                'success': False,
+                'error': f"stream must be one of: {', '.join(ANALYTICS_STREAMS)}"
+            }), 400
+
+        if grain not in ANALYTICS_GRAINS:
+            return jsonify({
+                'success': False,
+                'error': f"grain must be one of: {', '.join(ANALYTICS_GRAINS)}"
+            }), 400
+
+        measures, invalid_measures = parse_list_arg('measures', ANALYTICS_MEASURES, ANALYTICS_MEASURES)
+        dimensions, invalid_dimensions = parse_list_arg('dimensions', ANALYTICS_DIMENSIONS, [])
+
+        if invalid_measures or invalid_dimensions or not measures:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid measures/dimensions: {', '.join(invalid_measures + invalid_dimensions) or 'none selected'}"
+            }), 400
+
+        conditions = ["r.stream = %s", "r.grain = %s"]
+        params = [stream, grain]
+
+        start_date = request.args.get('start_date')
+        if start_date:
+            conditions.append("r.bucket_start >= analytics_bucket_start(%s, %s)")
+            params.extend([parse_date(start_date), grain])
+
+        end_date = request.args.get('end_date')
+        if end_date:
+            conditions.append("r.bucket_start <= %s")
+            params.append(parse_date(end_date))
+
+        for dimension in ANALYTICS_DIMENSIONS:
+            value = request.args.get(dimension)
+            if value:
+                conditions.append(f"r.{dimension} = %s")
+                params.append(value if dimension == 'oil_type' else int(value))
+
+        select_columns = ["r.bucket_start"]
+        group_columns = ["r.bucket_start"]
+        joins = []
+        for dimension in dimensions:
+            select_columns.append(f"r.{dimension}")
+            group_columns.append(f"r.{dimension}")
+            lookup = ANALYTICS_DIMENSIONS[dimension]
+            if lookup:
+                table, key_column, label_column = lookup
+                alias = f"d_{dimension}"
+                joins.append(
+                    f"LEFT JOIN {table} {alias} ON {alias}.{key_column} = r.{dimension}"
+                )
+                select_columns.append(f"MAX({alias}.{label_column})")
+        select_columns.extend(f"SUM(r.{measure})" for measure in measures)
+
+        cur.execute(f"""
+            SELECT {', '.join(select_columns)}
+            FROM analytics_rollups r
+            {' '.join(joins)}
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {', '.join(group_columns)}
+            ORDER BY {', '.join(group_columns)}
+        """, params)
+
+        series = []
+        for row in cur.fetchall():
+            values = iter(row)
+            bucket_start = next(values)
+            point = {
+                'bucket_start': integer_to_date(bucket_start, '%Y-%m-%d'),
+                'bucket_day': bucket_start
+            }
+            for dimension in dimensions:
+                value = next(values)
+                # Dimensions not carried by a stream are stored as 0 / ''
+                point[dimension] = value if value not in (0, '') else None
+                if ANALYTICS_DIMENSIONS[dimension]:
+                    label_column = ANALYTICS_DIMENSIONS[dimension][2]
+                    point[label_column] = next(values)
+            for measure in measures:
+                value = next(values)
+                point[measure] = int(value) if measure == 'txn_count' else float(value)
+            series.append(point)
+
+        return jsonify({
+            'success': True,
+            'stream': stream,
+            'grain': grain,
+            'dimensions': dimensions,
+            'measures': measures,
+            'series': series,
+            'count': len(series)
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
@@ -11,6 +11,8 @@ from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date
 from utils.validation import safe_decimal, safe_float, validate_positive_number
 from utils.traceability import generate_batch_traceable_code, generate_batch_code
+from utils.lineage import record_batch_lineage
+from utils.stock_ledger import set_stock_movement_context
 import json
 
 # Create Blueprint
@@ -575,6 +577,10 @@ def add_batch():
         ))
         
         batch_id = cur.fetchone()[0]
+        set_stock_movement_context(production_date, 'batch', batch_id, cur)
+        
+        # Link the batch to its seed purchase for genealogy traces
+        record_batch_lineage(batch_id, seed_purchase_code, float(seed_qty_before), cur)
         
         # Process cost details with element_id support
         total_production_cost = safe_decimal(data.get('seed_cost_total', 0))
@@ -12,6 +12,8 @@ from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date
 from utils.validation import safe_decimal, safe_float, validate_required_fields
 from utils.traceability import generate_blend_traceable_code
+from utils.lineage import record_lineage_edges
+from utils.stock_ledger import set_stock_movement_context
 
 # Create Blueprint
 blending_bp = Blueprint('blending', __name__)
@@ -477,8 +479,10 @@ def create_blend():
         ))
         
         blend_id = cur.fetchone()[0]
+        set_stock_movement_context(blend_date, 'blend_batches', blend_id, cur)
         
         # Insert blend components and update source inventory
+        lineage_edges = []
         for component in components:
             actual_oil_type = component.get('actual_oil_type', component['oil_type'])
             source_type = component['source_type']
@@ -507,6 +511,12 @@ def create_blend():
                 component.get('traceable_code')
             ))
             
+            # Outsourced oil points at an inventory row, not a lineage node
+            if source_type == 'extraction':
+                lineage_edges.append(('batch', source_batch_id, 'blend', blend_id, float(quantity_used)))
+            elif source_type == 'blended':
+                lineage_edges.append(('blend', source_batch_id, 'blend', blend_id, float(quantity_used)))
+            
             # Update source inventory (deduct quantity)
             if source_type == 'extraction':
                 # Update inventory for batch production
@@ -581,6 +591,9 @@ def create_blend():
             float(total_quantity)
         ))
         
+        # Link the blend to its source batches/blends for genealogy traces
+        record_lineage_edges(lineage_edges, cur)
+        
         # Commit transaction
         conn.commit()
         
@@ -5,9 +5,17 @@ Supports sales transactions and third-party location management
 File Path: puvi-backend/puvi-backend-main/modules/customers.py
 """
 
+import csv
+import io
 from flask import Blueprint, request, jsonify
+from psycopg2.extras import execute_values
 from db_utils import get_db_connection, close_connection
 from utils.validation import validate_required_fields
+from utils.dependency_checks import find_dependencies
+from modules.locations import validate_gst_number
+from utils.code_allocator import (
+    fetch_existing_codes, first_free, allocate_sequence_codes, insert_with_code
+)
 
 # Create Blueprint
 customers_bp = Blueprint('customers', __name__)
@@ -16,17 +24,10 @@ customers_bp = Blueprint('customers', __name__)
 # HELPER FUNCTIONS
 # ============================================
 
-def generate_customer_code(customer_name, cur):
+def customer_code_base(customer_name):
     """
-    Generate unique 3-letter customer code
+    3-letter code derived from the customer name
     Examples: Amazon -> AMZ, Walmart -> WMT, Big Bazaar -> BIG
-    
-    Args:
-        customer_name: Name of the customer
-        cur: Database cursor
-    
-    Returns:
-        str: Generated 3-letter code
     """
     # Remove common suffixes and clean name
     name = customer_name.upper()
@@ -50,36 +51,71 @@ def generate_customer_code(customer_name, cur):
         code = words[0][:3]
     
     # Ensure code is exactly 3 characters
-    code = code[:3].ljust(3, 'X')
+    return code[:3].ljust(3, 'X')
+
+
+def customer_code_candidates(base_code):
+    """
+    Candidate codes in order of preference; all share the first letter
+    Example: SRI, SR1..SR9, S0I..S9I, S00..S99
+    """
+    yield base_code
     
-    # Check uniqueness and adjust if needed
-    original_code = code
-    counter = 1
+    # Last char becomes a number
+    for counter in range(1, 10):
+        yield base_code[:2] + str(counter)
     
-    while True:
-        cur.execute("""
-            SELECT customer_id FROM customers 
-            WHERE customer_code = %s
-        """, (code,))
-        
-        if not cur.fetchone():
-            break
-        
-        # Try variations: last char becomes a number
-        if counter <= 9:
-            code = original_code[:2] + str(counter)
-        else:
-            # Use middle variations
-            code = original_code[0] + str(counter % 10) + original_code[2]
-        
-        counter += 1
-        
-        if counter > 99:
-            # Fallback to random-ish code
-            import random
-            code = original_code[0] + ''.join(random.choices('0123456789', k=2))
+    # Middle char becomes a number
+    for digit in range(10):
+        yield base_code[0] + str(digit) + base_code[2]
     
-    return code
+    for number in range(100):
+        yield f"{base_code[0]}{number:02d}"
+
+
+def generate_customer_codes(customer_names, cur, reserved=()):
+    """
+    Generate unique 3-letter codes for many customers with one lookup
+    
+    Args:
+        customer_names: List of customer names
+        cur: Database cursor
+        reserved: Codes to avoid besides those in the database
+    
+    Returns:
+        list: Codes in the order of the names, unique within the batch
+    
+    Raises:
+        ValueError: If every candidate for a name is in use
+    """
+    base_codes = [customer_code_base(name) for name in customer_names]
+    taken = fetch_existing_codes(
+        'customers', 'customer_code', {code[0] for code in base_codes}, cur
+    ) | set(reserved)
+    
+    codes = []
+    for name, base_code in zip(customer_names, base_codes):
+        code = first_free(customer_code_candidates(base_code), taken)
+        if not code:
+            raise ValueError(f"No free customer code for '{name}'")
+        codes.append(code)
+    
+    return codes
+
+
+def generate_customer_code(customer_name, cur):
+    """
+    Generate unique 3-letter customer code
+    Examples: Amazon -> AMZ, Walmart -> WMT, Big Bazaar -> BIG
+    
+    Args:
+        customer_name: Name of the customer
+        cur: Database cursor
+    
+    Returns:
+        str: Generated 3-letter code
+    """
+    return generate_customer_codes([customer_name], cur)[0]
 
 
 def validate_customer_data(data, is_update=False):
@@ -133,6 +169,25 @@ def validate_customer_data(data, is_update=False):
     return len(errors) == 0, errors
 
 
+def generate_ship_to_codes(counts_by_customer_code, cur):
+    """
+    Generate ship-to location codes for many customers with one lookup
+    Format: CUST-ST-001 (e.g., AMZ-ST-001)
+    
+    Args:
+        counts_by_customer_code: dict customer code -> number of codes wanted
+        cur: Database cursor
+    
+    Returns:
+        dict: customer code -> list of ship-to codes
+    """
+    codes = allocate_sequence_codes(
+        {f"{customer_code}-ST-": count for customer_code, count in counts_by_customer_code.items()},
+        'customer_ship_to_locations', 'location_code', cur
+    )
+    return {prefix[:-len('-ST-')]: prefix_codes for prefix, prefix_codes in codes.items()}
+
+
 def generate_ship_to_code(customer_code, cur):
     """
     Generate ship-to location code
@@ -145,16 +200,53 @@ def generate_ship_to_code(customer_code, cur):
     Returns:
         str: Generated ship-to code
     """
-    # Get count of ship-to locations for this customer
-    cur.execute("""
-        SELECT COUNT(*) FROM customer_ship_to_locations
-        WHERE customer_id IN (
-            SELECT customer_id FROM customers WHERE customer_code = %s
-        )
-    """, (customer_code,))
+    return generate_ship_to_codes({customer_code: 1}, cur)[customer_code][0]
+
+
+CUSTOMER_DEPENDENCY_SPECS = [
+    {
+        'name': 'outbound_transactions',
+        'table': 'sku_outbound',
+        'condition': 'd.customer_id = k.key'
+    },
+    {
+        'name': 'linked_locations',
+        'table': 'locations_master',
+        'condition': 'd.customer_id = k.key'
+    }
+]
+
+
+def check_customers_dependencies(customer_ids, cur, use_cache=True):
+    """
+    Check what references many customers in one query
+    
+    Args:
+        customer_ids: Customer IDs to check
+        cur: Database cursor
+        use_cache: Reuse cached "no dependencies" results; pass False when
+                   the result decides a hard delete
     
-    count = cur.fetchone()[0]
-    return f"{customer_code}-ST-{count + 1:03d}"
+    Returns:
+        dict: customer_id -> {'has_dependencies', 'transaction_count',
+              'linked_locations', 'details'}
+    """
+    found = find_dependencies(
+        'customers', CUSTOMER_DEPENDENCY_SPECS, [int(i) for i in customer_ids], cur,
+        use_cache=use_cache
+    )
+    
+    results = {}
+    for customer_id, matches in found.items():
+        counts = {match['name']: match['count'] for match in matches}
+        results[customer_id] = {
+            'has_dependencies': bool(matches),
+            'transaction_count': counts.get('outbound_transactions', 0),
+            'linked_locations': counts.get('linked_locations', 0),
+            'details': matches
+        }
+    
+    return results
 
 
 # ============================================
@@ -356,9 +448,40 @@ def create_customer():
         if not is_valid:
             return jsonify({'success': False, 'errors': errors}), 400
         
-        # Generate customer code if not provided
+        def insert_customer(customer_code):
+            cur.execute("""
+                INSERT INTO customers (
+                    customer_code, customer_name, customer_type,
+                    gst_number, pan_number,
+                    contact_person, contact_phone, contact_email,
+                    is_active, created_by, created_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
+                ) RETURNING customer_id
+            """, (
+                customer_code,
+                data['customer_name'],
+                data.get('customer_type'),
+                data.get('gst_number'),
+                data.get('pan_number'),
+                data.get('contact_person'),
+                data.get('contact_phone'),
+                data.get('contact_email'),
+                data.get('is_active', True),
+                data.get('created_by', 'System')
+            ))
+        
+            return cur.fetchone()[0]
+        
+        # Generate customer code if not provided; a code taken by a
+        # concurrent request is replaced and the insert retried
         if not data.get('customer_code'):
-            data['customer_code'] = generate_customer_code(data['customer_name'], cur)
+            data['customer_code'], customer_id = insert_with_code(
+                lambda: generate_customer_code(data['customer_name'], cur),
+                insert_customer,
+                'customers_customer_code_key',
+                cur
+            )
         else:
             # Check uniqueness
             cur.execute("""
@@ -371,31 +494,8 @@ def create_customer():
                     'success': False,
                     'error': f"Customer code '{data['customer_code']}' already exists"
                 }), 400
-        
-        # Insert customer
-        cur.execute("""
-            INSERT INTO customers (
-                customer_code, customer_name, customer_type,
-                gst_number, pan_number,
-                contact_person, contact_phone, contact_email,
-                is_active, created_by, created_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
-            ) RETURNING customer_id
-        """, (
-            data['customer_code'],
-            data['customer_name'],
-            data.get('customer_type'),
-            data.get('gst_number'),
-            data.get('pan_number'),
-            data.get('contact_person'),
-            data.get('contact_phone'),
-            data.get('contact_email'),
-            data.get('is_active', True),
-            data.get('created_by', 'System')
-        ))
-        
-        customer_id = cur.fetchone()[0]
+            
+            customer_id = insert_customer(data['customer_code'])
         
         conn.commit()
         
@@ -483,15 +583,11 @@ def delete_customer(customer_id):
     cur = conn.cursor()
     
     try:
-        # Check for dependencies
-        cur.execute("""
-            SELECT COUNT(*) FROM sku_outbound 
-            WHERE customer_id = %s
-        """, (customer_id,))
-        
-        transaction_count = cur.fetchone()[0]
+        # Check for dependencies (fresh - the answer decides a hard delete)
+        dependencies = check_customers_dependencies([customer_id], cur, use_cache=False)[customer_id]
+        transaction_count = dependencies['transaction_count']
         
-        if transaction_count > 0:
+        if dependencies['has_dependencies']:
             # Soft delete only
             cur.execute("""
                 UPDATE customers 
@@ -508,8 +604,11 @@ def delete_customer(customer_id):
             
             return jsonify({
                 'success': True,
-                'message': f"Customer '{result[0]}' deactivated (has {transaction_count} transactions)",
-                'soft_delete': True
+                'message': f"Customer '{result[0]}' deactivated (has {transaction_count} transactions)"
+                if transaction_count else
+                f"Customer '{result[0]}' deactivated (linked to {dependencies['linked_locations']} locations)",
+                'soft_delete': True,
+                'dependencies': dependencies
             })
         else:
             # Hard delete
@@ -543,6 +642,37 @@ def delete_customer(customer_id):
         close_connection(conn, cur)
 
 
+@customers_bp.route('/api/customers/check-dependencies', methods=['POST'])
+def check_customer_dependencies():
+    """Check dependencies of many customers at once (bulk delete screens)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        customer_ids = (request.get_json(silent=True) or {}).get('customer_ids') or []
+        if not isinstance(customer_ids, list):
+            return jsonify({
+                'success': False,
+                'error': 'customer_ids must be a list'
+            }), 400
+        
+        results = check_customers_dependencies(customer_ids, cur)
+        
+        return jsonify({
+            'success': True,
+            'dependencies': {str(key): result for key, result in results.items()},
+            'deletable': [key for key, result in results.items() if not result['has_dependencies']],
+            'count': len(results)
+        })
+        
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid customer id'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
 # ============================================
 # SHIP-TO LOCATION ENDPOINTS
 # ============================================
@@ -634,35 +764,41 @@ def create_ship_to_location(customer_id):
         
         customer_code = result[0]
         
-        # Generate location code
-        location_code = generate_ship_to_code(customer_code, cur)
+        def insert_ship_to(location_code):
+            cur.execute("""
+                INSERT INTO customer_ship_to_locations (
+                    customer_id, location_code, location_name,
+                    address_line1, address_line2, city, state, pincode,
+                    contact_person, contact_phone,
+                    is_active, is_default, created_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
+                ) RETURNING ship_to_id
+            """, (
+                customer_id,
+                location_code,
+                data['location_name'],
+                data.get('address_line1'),
+                data.get('address_line2'),
+                data['city'],
+                data['state'],
+                data.get('pincode'),
+                data.get('contact_person'),
+                data.get('contact_phone'),
+                data.get('is_active', True),
+                data.get('is_default', False)
+            ))
         
-        # Insert ship-to location
-        cur.execute("""
-            INSERT INTO customer_ship_to_locations (
-                customer_id, location_code, location_name,
-                address_line1, address_line2, city, state, pincode,
-                contact_person, contact_phone,
-                is_active, is_default, created_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
-            ) RETURNING ship_to_id
-        """, (
-            customer_id,
-            location_code,
-            data['location_name'],
-            data.get('address_line1'),
-            data.get('address_line2'),
-            data['city'],
-            data['state'],
-            data.get('pincode'),
-            data.get('contact_person'),
-            data.get('contact_phone'),
-            data.get('is_active', True),
-            data.get('is_default', False)
-        ))
-        
-        ship_to_id = cur.fetchone()[0]
+            return cur.fetchone()[0]
+        
+        # Generate location code and insert, retrying if a concurrent
+        # request took the same code
+        location_code, ship_to_id = insert_with_code(
+            lambda: generate_ship_to_code(customer_code, cur),
+            insert_ship_to,
+            'customer_ship_to_locations_location_code_key',
+            cur
+        )
         
         # If set as default, unset other defaults
         if data.get('is_default'):
@@ -761,3 +897,450 @@ def restore_customer(customer_id):
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         close_connection(conn, cur)
+
+
+# ============================================
+# BULK IMPORT
+# ============================================
+
+# CSV header -> import field
+CUSTOMER_IMPORT_COLUMNS = {
+    'Customer Code': 'customer_code',
+    'Customer Name': 'customer_name',
+    'Customer Type': 'customer_type',
+    'GST Number': 'gst_number',
+    'PAN Number': 'pan_number',
+    'Contact Person': 'contact_person',
+    'Contact Phone': 'contact_phone',
+    'Contact Email': 'contact_email',
+    'Ship-To Name': 'location_name',
+    'Address Line 1': 'address_line1',
+    'Address Line 2': 'address_line2',
+    'City': 'city',
+    'State': 'state',
+    'Pincode': 'pincode',
+    'Ship-To Contact Person': 'ship_to_contact_person',
+    'Ship-To Contact Phone': 'ship_to_contact_phone',
+    'Default Ship-To': 'is_default'
+}
+
+CUSTOMER_IMPORT_FIELDS = (
+    'customer_code', 'customer_name', 'customer_type', 'gst_number', 'pan_number',
+    'contact_person', 'contact_phone', 'contact_email'
+)
+
+SHIP_TO_IMPORT_FIELDS = (
+    'location_name', 'address_line1', 'address_line2', 'city', 'state', 'pincode',
+    'ship_to_contact_person', 'ship_to_contact_phone'
+)
+
+# Column widths in customers / customer_ship_to_locations
+IMPORT_FIELD_LENGTHS = {
+    'customer_code': 10,
+    'customer_name': 255,
+    'customer_type': 50,
+    'contact_person': 100,
+    'contact_phone': 15,
+    'contact_email': 100,
+    'location_name': 255,
+    'address_line1': 255,
+    'address_line2': 255,
+    'city': 100,
+    'state': 50,
+    'pincode': 10,
+    'ship_to_contact_person': 100,
+    'ship_to_contact_phone': 15
+}
+
+IMPORT_PAGE_SIZE = 1000
+
+
+def read_customer_import_csv(stream):
+    """
+    Rows of an uploaded customer import CSV; columns are matched by
+    template header name and rows are numbered as in the file (header is
+    row 1). Blank lines are skipped.
+    
+    Args:
+        stream: Binary file stream (werkzeug FileStorage.stream)
+    
+    Returns:
+        list: (row_num, row dict) tuples
+    
+    Raises:
+        ValueError: If neither Customer Name nor Customer Code is a column
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = [name.strip() for name in next(reader, [])]
+    
+    if 'Customer Name' not in header and 'Customer Code' not in header:
+        raise ValueError('Missing CSV columns: Customer Name or Customer Code')
+    
+    columns = [
+        (index, CUSTOMER_IMPORT_COLUMNS[name])
+        for index, name in enumerate(header) if name in CUSTOMER_IMPORT_COLUMNS
+    ]
+    
+    rows = []
+    for row_num, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        rows.append((row_num, {
+            field: values[index] for index, field in columns if index < len(values)
+        }))
+    
+    return rows
+
+
+def clean_import_row(row):
+    """Trimmed import row with blanks as None and codes upper-cased"""
+    if not isinstance(row, dict):
+        row = {}
+    
+    cleaned = {}
+    for field in CUSTOMER_IMPORT_FIELDS + SHIP_TO_IMPORT_FIELDS:
+        value = row.get(field)
+        value = str(value).strip() if value is not None else ''
+        cleaned[field] = value or None
+    
+    for field in ('customer_code', 'gst_number', 'pan_number'):
+        if cleaned[field]:
+            cleaned[field] = cleaned[field].upper()
+    
+    cleaned['is_default'] = str(row.get('is_default') or '').strip().lower() in ('1', 'true', 'yes', 'y')
+    return cleaned
+
+
+def import_length_errors(row, fields):
+    """Values longer than their column"""
+    return [
+        f"{field} exceeds {IMPORT_FIELD_LENGTHS[field]} characters"
+        for field in fields
+        if row.get(field) and field in IMPORT_FIELD_LENGTHS
+        and len(row[field]) > IMPORT_FIELD_LENGTHS[field]
+    ]
+
+
+def validate_customer_import(rows, cur):
+    """
+    Validate import rows in one pass and group them by customer.
+    
+    Rows sharing a customer code, or a name when no code is given, are
+    one customer; its first row supplies the customer details and every
+    row with ship-to fields adds a ship-to location. Rows naming an
+    existing customer code only add ship-to locations. A customer that
+    fails validation rejects all of its rows; a bad ship-to rejects only
+    its row. Only the first default ship-to per customer is kept.
+    
+    Args:
+        rows: List of (row_num, row dict)
+        cur: Database cursor
+    
+    Returns:
+        tuple: (customers, errors) - customers to write, each with its
+               valid ship-to rows; errors as one entry per rejected row
+    """
+    rows = [(row_num, clean_import_row(row)) for row_num, row in rows]
+    row_errors = {}
+    
+    def reject(row_num, messages):
+        row_errors.setdefault(row_num, []).extend(messages)
+    
+    # GST numbers are validated once per distinct value
+    gst_errors = {}
+    for gst_number in {row['gst_number'] for _, row in rows if row['gst_number']}:
+        is_valid, error = validate_gst_number(gst_number)
+        if not is_valid:
+            gst_errors[gst_number] = error
+    
+    # Rows giving only a name join the customer given a code elsewhere in the file
+    code_by_name = {}
+    for _, row in rows:
+        if row['customer_code'] and row['customer_name']:
+            code_by_name.setdefault(row['customer_name'].lower(), row['customer_code'])
+    
+    groups = {}
+    for row_num, row in rows:
+        customer_code = row['customer_code'] or code_by_name.get((row['customer_name'] or '').lower())
+        if customer_code:
+            key = f"code:{customer_code}"
+        elif row['customer_name']:
+            key = f"name:{row['customer_name'].lower()}"
+        else:
+            reject(row_num, ['Customer name or code is required'])
+            continue
+        groups.setdefault(key, {'customer_code': customer_code, 'rows': []})['rows'].append((row_num, row))
+    
+    # Existing customers, one query each for codes and names
+    cur.execute("""
+        SELECT customer_code, customer_id, is_active
+        FROM customers
+        WHERE customer_code = ANY(%s)
+    """, ([group['customer_code'] for group in groups.values() if group['customer_code']],))
+    existing_codes = {code: (customer_id, is_active) for code, customer_id, is_active in cur.fetchall()}
+    
+    cur.execute("""
+        SELECT lower(customer_name), MIN(customer_code)
+        FROM customers
+        WHERE lower(customer_name) = ANY(%s)
+        GROUP BY lower(customer_name)
+    """, ([key[len('name:'):] for key in groups if key.startswith('name:')],))
+    existing_names = dict(cur.fetchall())
+    
+    customers = []
+    for key, group in groups.items():
+        group_rows = group['rows']
+        data = dict(group_rows[0][1], customer_code=group['customer_code'])
+        customer = {
+            'customer_id': None,
+            'customer_code': group['customer_code'],
+            'data': data,
+            'ship_tos': []
+        }
+        
+        if group['customer_code'] in existing_codes:
+            customer['customer_id'], is_active = existing_codes[group['customer_code']]
+            customer_errors = [] if is_active else [f"Customer {group['customer_code']} is inactive"]
+        else:
+            is_valid, customer_errors = validate_customer_data(data)
+            if data['gst_number'] in gst_errors:
+                customer_errors.append(gst_errors[data['gst_number']])
+            customer_errors += import_length_errors(data, CUSTOMER_IMPORT_FIELDS)
+            existing_code = existing_names.get(key[len('name:'):]) if key.startswith('name:') else None
+            if existing_code:
+                customer_errors.append(
+                    f"Customer '{data['customer_name']}' already exists as {existing_code}; "
+                    f"give its Customer Code to add ship-to locations"
+                )
+            customer_errors = list(dict.fromkeys(customer_errors))
+        
+        if customer_errors:
+            for row_num, _ in group_rows:
+                reject(row_num, customer_errors)
+            continue
+        
+        has_default = False
+        for row_num, row in group_rows:
+            if not any(row[field] for field in SHIP_TO_IMPORT_FIELDS):
+                continue
+            
+            is_valid, missing = validate_required_fields(row, ['location_name', 'city', 'state'])
+            ship_to_errors = [] if is_valid else [f"Missing ship-to fields: {', '.join(missing)}"]
+            ship_to_errors += import_length_errors(row, SHIP_TO_IMPORT_FIELDS)
+            if ship_to_errors:
+                reject(row_num, ship_to_errors)
+                continue
+            
+            row['is_default'] = row['is_default'] and not has_default
+            has_default = has_default or row['is_default']
+            customer['ship_tos'].append((row_num, row))
+        
+        # Existing customer with nothing to add
+        if customer['customer_id'] and not customer['ship_tos']:
+            continue
+        
+        customers.append(customer)
+    
+    labels = {row_num: row['customer_code'] or row['customer_name'] for row_num, row in rows}
+    errors = [
+        {'row': row_num, 'customer': labels.get(row_num), 'errors': messages}
+        for row_num, messages in sorted(row_errors.items())
+    ]
+    
+    return customers, errors
+
+
+def write_customer_import(customers, created_by, cur):
+    """
+    Insert validated customers and ship-to locations with execute_values.
+    Codes are allocated in bulk and allocated again if a concurrent
+    request took one first. Sets customer_id and customer_code on each
+    new customer.
+    
+    Args:
+        customers: Customers returned by validate_customer_import
+        created_by: User recorded on the new rows
+        cur: Database cursor
+    
+    Returns:
+        int: Ship-to locations inserted
+    """
+    new_customers = [customer for customer in customers if not customer['customer_id']]
+    generated = [customer for customer in new_customers if not customer['customer_code']]
+    given_codes = [customer['customer_code'] for customer in new_customers if customer['customer_code']]
+    
+    def insert_customers(codes):
+        for customer, code in zip(generated, codes):
+            customer['customer_code'] = code
+        
+        return execute_values(cur, """
+            INSERT INTO customers (
+                customer_code, customer_name, customer_type,
+                gst_number, pan_number,
+                contact_person, contact_phone, contact_email,
+                is_active, created_by
+            ) VALUES %s
+            RETURNING customer_code, customer_id
+        """, [
+            (
+                customer['customer_code'],
+                customer['data']['customer_name'],
+                customer['data']['customer_type'],
+                customer['data']['gst_number'],
+                customer['data']['pan_number'],
+                customer['data']['contact_person'],
+                customer['data']['contact_phone'],
+                customer['data']['contact_email'],
+                True,
+                created_by
+            )
+            for customer in new_customers
+        ], page_size=IMPORT_PAGE_SIZE, fetch=True)
+    
+    if new_customers:
+        _, inserted = insert_with_code(
+            lambda: generate_customer_codes(
+                [customer['data']['customer_name'] for customer in generated], cur,
+                reserved=given_codes
+            ),
+            insert_customers,
+            'customers_customer_code_key',
+            cur
+        )
+        customer_ids = dict(inserted)
+        for customer in new_customers:
+            customer['customer_id'] = customer_ids[customer['customer_code']]
+    
+    with_ship_tos = [customer for customer in customers if customer['ship_tos']]
+    if not with_ship_tos:
+        return 0
+    
+    # A new default replaces the customer's existing one
+    default_customer_ids = [
+        customer['customer_id'] for customer in with_ship_tos
+        if any(row['is_default'] for _, row in customer['ship_tos'])
+    ]
+    if default_customer_ids:
+        cur.execute("""
+            UPDATE customer_ship_to_locations
+            SET is_default = false
+            WHERE customer_id = ANY(%s) AND is_default = true
+        """, (default_customer_ids,))
+    
+    def insert_ship_tos(codes_by_customer):
+        values = []
+        for customer in with_ship_tos:
+            codes = codes_by_customer[customer['customer_code']]
+            for location_code, (_, row) in zip(codes, customer['ship_tos']):
+                values.append((
+                    customer['customer_id'],
+                    location_code,
+                    row['location_name'],
+                    row['address_line1'],
+                    row['address_line2'],
+                    row['city'],
+                    row['state'],
+                    row['pincode'],
+                    row['ship_to_contact_person'],
+                    row['ship_to_contact_phone'],
+                    True,
+                    row['is_default'],
+                    created_by
+                ))
+        
+        execute_values(cur, """
+            INSERT INTO customer_ship_to_locations (
+                customer_id, location_code, location_name,
+                address_line1, address_line2, city, state, pincode,
+                contact_person, contact_phone,
+                is_active, is_default, created_by
+            ) VALUES %s
+        """, values, page_size=IMPORT_PAGE_SIZE)
+        return len(values)
+    
+    _, ship_to_count = insert_with_code(
+        lambda: generate_ship_to_codes(
+            {customer['customer_code']: len(customer['ship_tos']) for customer in with_ship_tos}, cur
+        ),
+        insert_ship_tos,
+        'customer_ship_to_locations_location_code_key',
+        cur
+    )
+    
+    return ship_to_count
+
+
+@customers_bp.route('/api/customers/import', methods=['POST'])
+def import_customers():
+    """
+    Bulk import customers and ship-to locations from a CSV upload (file)
+    or JSON ({"rows": [...]} with the import field names). Valid rows are
+    written in one transaction; rejected rows are reported by row number.
+    dry_run validates without writing.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        if 'file' in request.files:
+            created_by = request.form.get('created_by', 'Import')
+            dry_run = str(request.form.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+            try:
+                rows = read_customer_import_csv(request.files['file'].stream)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid CSV file: {str(e)}'
+                }), 400
+        else:
+            data = request.get_json(silent=True) or {}
+            created_by = data.get('created_by', 'Import')
+            dry_run = bool(data.get('dry_run'))
+            rows = list(enumerate(data.get('rows') or [], start=1))
+        
+        if not rows:
+            return jsonify({'success': False, 'error': 'No rows to import'}), 400
+        
+        customers, errors = validate_customer_import(rows, cur)
+        
+        new_customers = [customer for customer in customers if not customer['customer_id']]
+        ship_to_count = sum(len(customer['ship_tos']) for customer in customers)
+        
+        if not dry_run:
+            try:
+                ship_to_count = write_customer_import(customers, created_by, cur)
+            except ValueError as e:
+                conn.rollback()
+                return jsonify({'success': False, 'error': str(e)}), 400
+            conn.commit()
+        else:
+            conn.rollback()
+        
+        return jsonify({
+            'success': True,
+            'dry_run': dry_run,
+            'message': 'Validation completed' if dry_run else 'Import completed',
+            'summary': {
+                'total_rows': len(rows),
+                'customers_created': len(new_customers),
+                'customers_extended': len(customers) - len(new_customers),
+                'ship_to_created': ship_to_count,
+                'rejected_rows': len(errors)
+            },
+            'customers': [
+                {
+                    'customer_id': customer['customer_id'],
+                    'customer_code': customer['customer_code'],
+                    'customer_name': customer['data']['customer_name'],
+                    'ship_to_count': len(customer['ship_tos'])
+                }
+                for customer in new_customers
+            ],
+            'errors': errors
+        })
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
@@ -0,0 +1,161 @@
+"""
+Genealogy Module for PUVI Oil Manufacturing System
+Forward and backward traces over the lineage closure table:
+purchase -> batch -> blend -> SKU production -> outbound -> customer
+File Path: puvi-backend/puvi-backend-main/modules/genealogy.py
+"""
+
+from flask import Blueprint, jsonify
+from db_utils import get_db_connection, close_connection
+from utils.date_utils import integer_to_date
+from utils.lineage import resolve_lineage_nodes
+
+# Create Blueprint
+genealogy_bp = Blueprint('genealogy', __name__)
+
+# ============================================
+# HELPER FUNCTIONS
+# ============================================
+
+# Node details for any lineage node type in one pass
+NODE_DETAILS_SQL = """
+    SELECT
+        n.node_type,
+        n.node_id,
+        n.depth,
+        COALESCE(p.traceable_code, b.traceable_code, bl.traceable_code,
+                 sp.traceable_code, o.outbound_code) as code,
+        COALESCE(p.invoice_ref, b.batch_code, bl.blend_code,
+                 sp.production_code, o.invoice_number) as reference,
+        COALESCE(p.purchase_date, b.production_date, bl.blend_date,
+                 sp.production_date, o.outbound_date) as node_date,
+        COALESCE(p.supplier_name, b.oil_type, bl.result_oil_type,
+                 sm.product_name, o.transaction_type) as description,
+        COALESCE(p.status, b.status, bl.status, sp.status, o.status) as status,
+        o.customer_id,
+        c.customer_name,
+        c.customer_code
+    FROM nodes n
+    LEFT JOIN purchases p ON n.node_type = 'purchase' AND p.purchase_id = n.node_id
+    LEFT JOIN batch b ON n.node_type = 'batch' AND b.batch_id = n.node_id
+    LEFT JOIN blend_batches bl ON n.node_type = 'blend' AND bl.blend_id = n.node_id
+    LEFT JOIN sku_production sp ON n.node_type = 'sku_production' AND sp.production_id = n.node_id
+    LEFT JOIN sku_master sm ON sm.sku_id = sp.sku_id
+    LEFT JOIN sku_outbound o ON n.node_type = 'outbound' AND o.outbound_id = n.node_id
+    LEFT JOIN customers c ON c.customer_id = o.customer_id
+    ORDER BY n.depth, n.node_type, n.node_id
+"""
+
+
+def fetch_lineage(roots, direction, cur):
+    """
+    Fetch every node reachable from the roots through lineage_closure.
+    
+    Args:
+        roots: List of (node_type, node_id) tuples
+        direction: 'forward' (descendants) or 'backward' (ancestors)
+        cur: Database cursor
+    
+    Returns:
+        list: Node dictionaries ordered by depth
+    """
+    if direction == 'forward':
+        match_cols, node_cols = ('ancestor_type', 'ancestor_id'), ('descendant_type', 'descendant_id')
+    else:
+        match_cols, node_cols = ('descendant_type', 'descendant_id'), ('ancestor_type', 'ancestor_id')
+    
+    cur.execute(f"""
+        WITH nodes AS (
+            SELECT c.{node_cols[0]} as node_type, c.{node_cols[1]} as node_id, MIN(c.depth) as depth
+            FROM lineage_closure c
+            JOIN unnest(%s::varchar[], %s::int[]) AS r(node_type, node_id)
+                ON c.{match_cols[0]} = r.node_type AND c.{match_cols[1]} = r.node_id
+            GROUP BY 1, 2
+        )
+        {NODE_DETAILS_SQL}
+    """, ([root[0] for root in roots], [root[1] for root in roots]))
+    
+    nodes = []
+    for row in cur.fetchall():
+        nodes.append({
+            'node_type': row[0],
+            'node_id': row[1],
+            'depth': row[2],
+            'code': row[3],
+            'reference': row[4],
+            'date': integer_to_date(row[5], '%d-%m-%Y') if row[5] else None,
+            'description': row[6],
+            'status': row[7],
+            'customer_id': row[8],
+            'customer_name': row[9],
+            'customer_code': row[10]
+        })
+    
+    return nodes
+
+
+def trace_response(code, direction):
+    """Build the trace response for a code in either direction"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        roots = resolve_lineage_nodes(code, cur)
+        if not roots:
+            return jsonify({
+                'success': False,
+                'error': f'No purchase, batch, blend, production or outbound found for {code}'
+            }), 404
+        
+        nodes = fetch_lineage(roots, direction, cur)
+        
+        grouped = {}
+        for node in nodes:
+            grouped.setdefault(node['node_type'], []).append(node)
+        
+        response = {
+            'success': True,
+            'code': code,
+            'direction': direction,
+            'roots': [{'node_type': t, 'node_id': i} for t, i in roots],
+            'nodes': grouped,
+            'node_count': len(nodes)
+        }
+        
+        if direction == 'forward':
+            # Recall view: customers who received product from this code
+            customers = {}
+            for node in grouped.get('outbound', []):
+                if node['customer_id'] and node['status'] != 'cancelled':
+                    customer = customers.setdefault(node['customer_id'], {
+                        'customer_id': node['customer_id'],
+                        'customer_name': node['customer_name'],
+                        'customer_code': node['customer_code'],
+                        'outbounds': []
+                    })
+                    customer['outbounds'].append(node['code'])
+            response['customers'] = list(customers.values())
+            response['customer_count'] = len(customers)
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+# ============================================
+# TRACE ENDPOINTS
+# ============================================
+
+@genealogy_bp.route('/api/trace/forward/<code>', methods=['GET'])
+def trace_forward(code):
+    """Everything produced from a code, down to the customers who received it"""
+    return trace_response(code, 'forward')
+
+
+@genealogy_bp.route('/api/trace/backward/<code>', methods=['GET'])
+def trace_backward(code):
+    """Every upstream blend, batch and purchase a code was made from"""
+    return trace_response(code, 'backward')
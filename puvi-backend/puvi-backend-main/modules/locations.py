@@ -11,6 +11,8 @@ from decimal import Decimal
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import get_current_day_number, integer_to_date, format_date_indian
 from utils.validation import validate_required_fields, safe_int
+from utils.dependency_checks import find_dependencies
+from utils.code_allocator import allocate_sequence_codes, insert_with_code
 import re
 
 # Create Blueprint
@@ -50,6 +52,46 @@ def validate_gst_number(gst_number):
     return True, None
 
 
+LOCATION_CODE_PREFIXES = {
+    'factory': 'FAC',
+    'warehouse': 'WH',
+    'customer': 'CUST'
+}
+
+
+def generate_location_codes(counts_by_type, cur):
+    """
+    Generate location codes for any number of locations with one lookup
+    Format: TYPE-XXX (e.g., FAC-001, WH-002, CUST-003)
+    
+    Args:
+        counts_by_type: dict location type -> number of codes wanted
+        cur: Database cursor
+    
+    Returns:
+        dict: location type -> list of codes
+    """
+    prefixes = {
+        location_type: f"{LOCATION_CODE_PREFIXES.get(location_type, 'LOC')}-"
+        for location_type in counts_by_type
+    }
+    
+    # Types sharing the fallback prefix share one sequence
+    counts_by_prefix = {}
+    for location_type, count in counts_by_type.items():
+        counts_by_prefix[prefixes[location_type]] = counts_by_prefix.get(prefixes[location_type], 0) + count
+    
+    codes = allocate_sequence_codes(counts_by_prefix, 'locations_master', 'location_code', cur)
+    
+    result = {}
+    for location_type, count in counts_by_type.items():
+        prefix_codes = codes[prefixes[location_type]]
+        result[location_type] = prefix_codes[:count]
+        del prefix_codes[:count]
+    
+    return result
+
+
 def generate_location_code(location_name, location_type, cur):
     """
     Generate unique location code
@@ -63,132 +105,103 @@ def generate_location_code(location_name, location_type, cur):
     Returns:
         str: Generated location code
     """
-    # Determine prefix based on type
-    prefix_map = {
-        'factory': 'FAC',
-        'warehouse': 'WH',
-        'customer': 'CUST'
+    return generate_location_codes({location_type: 1}, cur)[location_type][0]
+
+
+LOCATION_DEPENDENCY_SPECS = [
+    {
+        'name': 'sku_inventory',
+        'table': 'sku_inventory',
+        'condition': 'd.location_id = k.key AND d.quantity_available > 0',
+        'quantity': 'SUM(d.quantity_available)'
+    },
+    {
+        'name': 'expiry_tracking',
+        'table': 'sku_expiry_tracking',
+        'condition': 'd.location_id = k.key AND d.quantity_remaining > 0'
+    },
+    {
+        'name': 'outbound_transactions',
+        'table': 'sku_outbound',
+        'condition': 'd.from_location_id = k.key OR d.to_location_id = k.key'
+    },
+    {
+        # Reported, but does not block deletion
+        'name': 'customer_link',
+        'table': 'customers',
+        'condition': 'd.customer_id = r.customer_id'
     }
-    prefix = prefix_map.get(location_type, 'LOC')
-    
-    # Get count of locations with same type
-    cur.execute("""
-        SELECT COUNT(*) FROM locations_master
-        WHERE location_type = %s
-    """, (location_type,))
-    
-    count = cur.fetchone()[0]
-    
-    # Generate code with sequential number
-    code = f"{prefix}-{count + 1:03d}"
+]
+
+
+def check_locations_dependencies(location_ids, cur, use_cache=True):
+    """
+    Check dependencies of many locations in one query
     
-    # Ensure uniqueness
-    cur.execute("""
-        SELECT location_id FROM locations_master
-        WHERE location_code = %s
-    """, (code,))
+    Args:
+        location_ids: Location IDs to check
+        cur: Database cursor
+        use_cache: Reuse cached "no dependencies" results; pass False when
+                   the result decides a hard delete
     
-    if cur.fetchone():
-        # If exists, find the next available number
-        cur.execute("""
-            SELECT MAX(CAST(SUBSTRING(location_code FROM '[0-9]+$') AS INTEGER))
-            FROM locations_master
-            WHERE location_code LIKE %s
-        """, (f"{prefix}-%",))
+    Returns:
+        dict: location_id -> dependencies information
+    """
+    found = find_dependencies(
+        'locations', LOCATION_DEPENDENCY_SPECS, [int(i) for i in location_ids], cur,
+        reference=('locations_master', 'location_id'), use_cache=use_cache
+    )
+    
+    results = {}
+    for location_id, matches in found.items():
+        dependencies = {
+            'has_dependencies': False,
+            'dependency_count': 0,
+            'details': []
+        }
+        
+        for match in matches:
+            count = match['count']
+            if match['name'] == 'sku_inventory':
+                quantity = match['quantity'] or 0
+                message = f'{count} SKUs with {quantity} units in inventory'
+            elif match['name'] == 'expiry_tracking':
+                message = f'{count} active expiry tracking records'
+            elif match['name'] == 'outbound_transactions':
+                message = f'{count} outbound transactions reference this location'
+            else:
+                dependencies['details'].append({
+                    'type': match['name'],
+                    'count': count,
+                    'message': 'Location is linked to a customer'
+                })
+                continue
+            
+            dependencies['has_dependencies'] = True
+            dependencies['dependency_count'] += count
+            detail = {'type': match['name'], 'count': count, 'message': message}
+            if match['name'] == 'sku_inventory':
+                detail['quantity'] = quantity
+            dependencies['details'].append(detail)
         
-        max_num = cur.fetchone()[0] or 0
-        code = f"{prefix}-{max_num + 1:03d}"
+        results[location_id] = dependencies
     
-    return code
+    return results
 
 
-def check_location_dependencies(location_id, cur):
+def check_location_dependencies(location_id, cur, use_cache=True):
     """
     Check if location has dependencies that prevent deletion
     
     Args:
         location_id: Location ID to check
         cur: Database cursor
+        use_cache: Reuse a cached "no dependencies" result
     
     Returns:
         dict: Dependencies information
     """
-    dependencies = {
-        'has_dependencies': False,
-        'dependency_count': 0,
-        'details': []
-    }
-    
-    # Check SKU inventory
-    cur.execute("""
-        SELECT COUNT(*), SUM(quantity_available) 
-        FROM sku_inventory 
-        WHERE location_id = %s AND quantity_available > 0
-    """, (location_id,))
-    
-    sku_count, sku_quantity = cur.fetchone()
-    if sku_count and sku_count > 0:
-        dependencies['has_dependencies'] = True
-        dependencies['dependency_count'] += sku_count
-        dependencies['details'].append({
-            'type': 'sku_inventory',
-            'count': sku_count,
-            'quantity': float(sku_quantity) if sku_quantity else 0,
-            'message': f'{sku_count} SKUs with {sku_quantity or 0} units in inventory'
-        })
-    
-    # Check expiry tracking
-    cur.execute("""
-        SELECT COUNT(*) 
-        FROM sku_expiry_tracking 
-        WHERE location_id = %s AND quantity_remaining > 0
-    """, (location_id,))
-    
-    expiry_count = cur.fetchone()[0]
-    if expiry_count > 0:
-        dependencies['has_dependencies'] = True
-        dependencies['dependency_count'] += expiry_count
-        dependencies['details'].append({
-            'type': 'expiry_tracking',
-            'count': expiry_count,
-            'message': f'{expiry_count} active expiry tracking records'
-        })
-    
-    # Check outbound transactions (from location)
-    cur.execute("""
-        SELECT COUNT(*) 
-        FROM sku_outbound 
-        WHERE from_location_id = %s OR to_location_id = %s
-    """, (location_id, location_id))
-    
-    outbound_count = cur.fetchone()[0]
-    if outbound_count > 0:
-        dependencies['has_dependencies'] = True
-        dependencies['dependency_count'] += outbound_count
-        dependencies['details'].append({
-            'type': 'outbound_transactions',
-            'count': outbound_count,
-            'message': f'{outbound_count} outbound transactions reference this location'
-        })
-    
-    # Check if location is linked to customers (for third-party locations)
-    cur.execute("""
-        SELECT COUNT(*) 
-        FROM customers 
-        WHERE customer_id IN (
-            SELECT customer_id FROM locations_master WHERE location_id = %s
-        )
-    """, (location_id,))
-    
-    customer_count = cur.fetchone()[0]
-    if customer_count > 0:
-        dependencies['details'].append({
-            'type': 'customer_link',
-            'count': customer_count,
-            'message': 'Location is linked to a customer'
-        })
-    
-    return dependencies
+    return check_locations_dependencies([location_id], cur, use_cache)[int(location_id)]
 
 
 def validate_location_data(data, is_update=False):
@@ -487,11 +500,55 @@ def create_location():
                     'error': 'Invalid or inactive customer_id'
                 }), 400
         
-        # Generate location code if not provided
-        if not data.get('location_code'):
-            data['location_code'] = generate_location_code(
+        def insert_location(location_code):
+            cur.execute("""
+                INSERT INTO locations_master (
+                    location_code, location_name, location_type,
+                    ownership, customer_id,
+                    address_line1, address_line2, city, state, pincode,
+                    contact_person, contact_phone, contact_email,
+                    is_production_unit, is_sales_point, is_default,
+                    is_active, notes, gst_number, created_by, created_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
+                ) RETURNING location_id
+            """, (
+                location_code,
                 data['location_name'],
                 data['location_type'],
+                data['ownership'],
+                data.get('customer_id'),
+                data.get('address_line1'),
+                data.get('address_line2'),
+                data.get('city'),
+                data.get('state'),
+                data.get('pincode'),
+                data.get('contact_person'),
+                data.get('contact_phone'),
+                data.get('contact_email'),
+                data.get('is_production_unit', False),
+                data.get('is_sales_point', False),
+                data.get('is_default', False),
+                data.get('is_active', True),
+                data.get('notes'),
+                data.get('gst_number'),
+                data.get('created_by', 'System')
+            ))
+        
+            return cur.fetchone()[0]
+        
+        # Generate location code if not provided; a code taken by a
+        # concurrent request is replaced and the insert retried
+        if not data.get('location_code'):
+            data['location_code'], location_id = insert_with_code(
+                lambda: generate_location_code(
+                    data['location_name'],
+                    data['location_type'],
+                    cur
+                ),
+                insert_location,
+                'locations_master_location_code_key',
                 cur
             )
         else:
@@ -507,43 +564,8 @@ def create_location():
                     'error': f"Location code '{data['location_code']}' already exists"
                 }), 400
         
-        # Insert location
-        cur.execute("""
-            INSERT INTO locations_master (
-                location_code, location_name, location_type,
-                ownership, customer_id,
-                address_line1, address_line2, city, state, pincode,
-                contact_person, contact_phone, contact_email,
-                is_production_unit, is_sales_point, is_default,
-                is_active, notes, gst_number, created_by, created_at
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP
-            ) RETURNING location_id
-        """, (
-            data['location_code'],
-            data['location_name'],
-            data['location_type'],
-            data['ownership'],
-            data.get('customer_id'),
-            data.get('address_line1'),
-            data.get('address_line2'),
-            data.get('city'),
-            data.get('state'),
-            data.get('pincode'),
-            data.get('contact_person'),
-            data.get('contact_phone'),
-            data.get('contact_email'),
-            data.get('is_production_unit', False),
-            data.get('is_sales_point', False),
-            data.get('is_default', False),
-            data.get('is_active', True),
-            data.get('notes'),
-            data.get('gst_number'),
-            data.get('created_by', 'System')
-        ))
-        
-        location_id = cur.fetchone()[0]
+            
+            location_id = insert_location(data['location_code'])
         
         # If this is set as default, unset other defaults of same type
         if data.get('is_default'):
@@ -609,7 +631,7 @@ def update_location(location_id):
         # Check if ownership is being changed
         if 'ownership' in data and data['ownership'] != current_ownership:
             # Check for inventory before allowing ownership change
-            dependencies = check_location_dependencies(location_id, cur)
+            dependencies = check_location_dependencies(location_id, cur, use_cache=False)
             if dependencies['has_dependencies']:
                 return jsonify({
                     'success': False,
@@ -685,8 +707,8 @@ def delete_location(location_id):
     cur = conn.cursor()
     
     try:
-        # Check dependencies
-        dependencies = check_location_dependencies(location_id, cur)
+        # Check dependencies (fresh - the answer decides a hard delete)
+        dependencies = check_location_dependencies(location_id, cur, use_cache=False)
         
         if dependencies['has_dependencies']:
             # Soft delete only - deactivate
@@ -757,6 +779,37 @@ def check_dependencies(location_id):
         close_connection(conn, cur)
 
 
+@locations_bp.route('/api/locations/check-dependencies', methods=['POST'])
+def check_dependencies_bulk():
+    """Check dependencies of many locations at once (bulk delete screens)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        location_ids = (request.get_json(silent=True) or {}).get('location_ids') or []
+        if not isinstance(location_ids, list):
+            return jsonify({
+                'success': False,
+                'error': 'location_ids must be a list'
+            }), 400
+        
+        results = check_locations_dependencies(location_ids, cur)
+        
+        return jsonify({
+            'success': True,
+            'dependencies': {str(key): result for key, result in results.items()},
+            'deletable': [key for key, result in results.items() if not result['has_dependencies']],
+            'count': len(results)
+        })
+        
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid location id'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
 @locations_bp.route('/api/locations/for-transfer', methods=['GET'])
 def get_locations_for_transfer():
     """Get locations available for transfer operations"""
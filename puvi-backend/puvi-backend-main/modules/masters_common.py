@@ -11,6 +11,7 @@ import json
 from decimal import Decimal
 from datetime import datetime
 from db_utils import get_db_connection, close_connection
+from utils.dependency_checks import find_dependencies
 
 # =====================================================
 # JSON SERIALIZATION HANDLER - FIXES DECIMAL BUG
@@ -457,6 +458,8 @@ MASTERS_CONFIG = {
             'materials': {
                 'table': 'materials',
                 'foreign_key': 'category',
+                'foreign_key_type': 'varchar',
+                'reference_field': 'category_name',
                 'display_field': 'material_name',
                 'message': 'Category has {count} associated materials'
             }
@@ -905,40 +908,97 @@ def log_audit(conn, cur, table_name, record_id, action, old_values=None,
 # DEPENDENCY CHECKING - ENHANCED FOR UOM
 # =====================================================
 
-def check_dependencies(conn, cur, master_type, record_id):
+def get_master_dependency_specs(master_type):
     """
-    Check if a record can be deleted by checking dependencies
-    Enhanced to handle UOM special cases
+    Dependency specs of a master type for utils.dependency_checks: one per
+    configured dependency, plus the system protection flag of the record
+    itself. Dependencies with a reference_field match the record's
+    reference column (e.g. UOM code) instead of its key.
+    """
+    config = MASTERS_CONFIG[master_type]
+    specs = []
+    
+    for dep_name, dep_config in config.get('dependencies', {}).items():
+        foreign_key = dep_config['foreign_key']
+        if dep_config.get('reference_field'):
+            condition = f"d.{foreign_key} = r.{dep_config['reference_field']}"
+        else:
+            condition = f"d.{foreign_key} = k.key"
+        specs.append({
+            'name': dep_name,
+            'table': dep_config['table'],
+            'condition': condition,
+            'field': foreign_key,
+            'message': dep_config['message']
+        })
+    
+    protection = config.get('special_validations', {}).get('system_protection')
+    if protection:
+        specs.append({
+            'name': 'system_protection',
+            'table': config['table'],
+            'condition': f"d.{config['primary_key']} = k.key AND d.{protection['field']} = true",
+            'field': protection['field']
+        })
+    
+    return specs
+
+
+def check_dependencies_bulk(conn, cur, master_type, record_ids, use_cache=True):
+    """
+    Check many records of a master type in one query
+    
+    Args:
+        record_ids: Record keys
+        use_cache: Reuse cached "no dependencies" results; pass False when
+                   the result decides a hard delete
     
     Returns:
-        dict: {
-            'can_delete': bool,
-            'can_soft_delete': bool,
-            'has_dependencies': bool,
-            'dependencies': list of dependency details,
-            'message': string message
-        }
+        dict: record_id -> same result as check_dependencies, or None for
+              an invalid master type
     """
     config = MASTERS_CONFIG.get(master_type)
     if not config:
-        return {
-            'can_delete': False,
-            'can_soft_delete': False,
-            'has_dependencies': False,
-            'message': f'Invalid master type: {master_type}'
-        }
+        return None
     
-    # Special handling for UOM master with system protection
-    if master_type == 'uom':
-        # Check if it's a system UOM
-        cur.execute("""
-            SELECT is_system FROM uom_master 
-            WHERE uom_id = %s
-        """, (int(record_id),))
+    is_varchar = config.get('primary_key_type') == 'varchar'
+    keys = [str(record_id) if is_varchar else int(record_id) for record_id in record_ids]
+    
+    specs = get_master_dependency_specs(master_type)
+    spec_by_name = {spec['name']: spec for spec in specs}
+    found = find_dependencies(
+        f'masters:{master_type}', specs, keys, cur,
+        key_type='varchar' if is_varchar else 'integer',
+        reference=(config['table'], config['primary_key']),
+        use_cache=use_cache
+    )
+    
+    protection = config.get('special_validations', {}).get('system_protection', {})
+    results = {}
+    
+    for key, matches in found.items():
+        dependencies = []
+        total_dependent_records = 0
+        protected = False
         
-        result = cur.fetchone()
-        if result and result[0]:  # is_system = True
-            return {
+        for match in matches:
+            if match['name'] == 'system_protection':
+                protected = True
+                continue
+            spec = spec_by_name[match['name']]
+            dependencies.append({
+                'table': match['table'],
+                'field': spec['field'],
+                'count': match['count'],
+                'message': spec['message'].format(count=match['count'])
+            })
+            total_dependent_records += match['count']
+        
+        has_dependencies = total_dependent_records > 0
+        
+        if protected and master_type == 'uom':
+            # System UOMs keep their dedicated message
+            results[key] = {
                 'can_delete': False,
                 'can_soft_delete': False,
                 'has_dependencies': True,
@@ -951,75 +1011,8 @@ def check_dependencies(conn, cur, master_type, record_id):
                 'total_dependent_records': 1,
                 'message': 'This is a system UOM and cannot be deleted'
             }
-    
-    dependencies = []
-    total_dependent_records = 0
-    
-    # Check each dependency
-    for dep_name, dep_config in config.get('dependencies', {}).items():
-        table = dep_config['table']
-        foreign_key = dep_config['foreign_key']
-        
-        # Special handling for different foreign key types
-        if dep_config.get('foreign_key_type') == 'varchar':
-            # For UOM, we need to get the uom_code first
-            if master_type == 'uom':
-                cur.execute("""
-                    SELECT uom_code FROM uom_master 
-                    WHERE uom_id = %s
-                """, (int(record_id),))
-                uom_result = cur.fetchone()
-                if uom_result:
-                    cur.execute(f"""
-                        SELECT COUNT(*) FROM {table} 
-                        WHERE {foreign_key} = %s
-                    """, (uom_result[0],))
-                else:
-                    continue
-            else:
-                cur.execute(f"""
-                    SELECT COUNT(*) FROM {table} 
-                    WHERE {foreign_key} = %s
-                """, (record_id,))
-        elif config.get('primary_key_type') == 'varchar':
-            cur.execute(f"""
-                SELECT COUNT(*) FROM {table} 
-                WHERE {foreign_key} = %s
-            """, (record_id,))
-        else:
-            cur.execute(f"""
-                SELECT COUNT(*) FROM {table} 
-                WHERE {foreign_key} = %s
-            """, (int(record_id),))
-        
-        count = cur.fetchone()[0]
-        
-        if count > 0:
-            dependencies.append({
-                'table': table,
-                'field': foreign_key,
-                'count': count,
-                'message': dep_config['message'].format(count=count)
-            })
-            total_dependent_records += count
-    
-    has_dependencies = total_dependent_records > 0
-    
-    # Check special validations
-    special_validations = config.get('special_validations', {})
-    if 'system_protection' in special_validations:
-        protection = special_validations['system_protection']
-        field = protection['field']
-        
-        # Check if record has system protection
-        cur.execute(f"""
-            SELECT {field} FROM {config['table']} 
-            WHERE {config['primary_key']} = %s
-        """, (record_id,))
-        
-        result = cur.fetchone()
-        if result and result[0]:  # Protected record
-            return {
+        elif protected:
+            results[key] = {
                 'can_delete': False,
                 'can_soft_delete': protection.get('allow_soft_delete', False),
                 'has_dependencies': True,
@@ -1027,16 +1020,44 @@ def check_dependencies(conn, cur, master_type, record_id):
                 'total_dependent_records': total_dependent_records,
                 'message': protection.get('message', 'Protected record cannot be deleted')
             }
+        else:
+            results[key] = {
+                'can_delete': not has_dependencies,
+                'can_soft_delete': True,  # Always allow soft delete unless protected
+                'has_dependencies': has_dependencies,
+                'dependencies': dependencies,
+                'total_dependent_records': total_dependent_records,
+                'message': f'Record has {total_dependent_records} dependent records' if has_dependencies 
+                           else 'Record can be safely deleted'
+            }
     
-    return {
-        'can_delete': not has_dependencies,
-        'can_soft_delete': True,  # Always allow soft delete unless protected
-        'has_dependencies': has_dependencies,
-        'dependencies': dependencies,
-        'total_dependent_records': total_dependent_records,
-        'message': f'Record has {total_dependent_records} dependent records' if has_dependencies 
-                   else 'Record can be safely deleted'
-    }
+    return results
+
+
+def check_dependencies(conn, cur, master_type, record_id, use_cache=True):
+    """
+    Check if a record can be deleted by checking dependencies
+    Enhanced to handle UOM special cases
+    
+    Returns:
+        dict: {
+            'can_delete': bool,
+            'can_soft_delete': bool,
+            'has_dependencies': bool,
+            'dependencies': list of dependency details,
+            'message': string message
+        }
+    """
+    results = check_dependencies_bulk(conn, cur, master_type, [record_id], use_cache)
+    if results is None:
+        return {
+            'can_delete': False,
+            'can_soft_delete': False,
+            'has_dependencies': False,
+            'message': f'Invalid master type: {master_type}'
+        }
+    
+    return next(iter(results.values()))
 
 
 # =====================================================
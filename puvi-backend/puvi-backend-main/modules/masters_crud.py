@@ -23,6 +23,7 @@ from modules.masters_common import (
     MASTERS_CONFIG,
     log_audit,
     check_dependencies,
+    check_dependencies_bulk,
     validate_field,
     validate_master_data,
     soft_delete_record,
@@ -1354,8 +1355,8 @@ def delete_record(master_type, record_id):
                 'error': f'Invalid master type: {master_type}'
             }), 400
         
-        # Check dependencies
-        dep_result = check_dependencies(conn, cur, master_type, record_id)
+        # Check dependencies (fresh - the answer decides a hard delete)
+        dep_result = check_dependencies(conn, cur, master_type, record_id, use_cache=False)
         
         if dep_result['has_dependencies']:
             # Soft delete only
@@ -1474,6 +1475,49 @@ def check_record_dependencies(master_type, record_id):
         close_connection(conn, cur)
 
 
+@masters_crud_bp.route('/api/masters/<master_type>/dependencies', methods=['POST'])
+def check_records_dependencies(master_type):
+    """
+    Check dependencies of many records at once (bulk delete screens)
+    
+    Body:
+        record_ids: List of record keys
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        config = get_master_config(master_type)
+        if not config:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid master type: {master_type}'
+            }), 400
+        
+        record_ids = (request.get_json(silent=True) or {}).get('record_ids') or []
+        if not isinstance(record_ids, list):
+            return jsonify({
+                'success': False,
+                'error': 'record_ids must be a list'
+            }), 400
+        
+        results = check_dependencies_bulk(conn, cur, master_type, record_ids)
+        
+        return jsonify({
+            'success': True,
+            'dependencies': {str(key): result for key, result in results.items()},
+            'deletable': [key for key, result in results.items() if result['can_delete']],
+            'count': len(results)
+        })
+        
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid record id'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
 # =====================================================
 # EXPORT TO CSV
 # =====================================================
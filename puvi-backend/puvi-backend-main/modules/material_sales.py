@@ -5,9 +5,11 @@ Handles sales of by-products (oil cake, sludge, etc.) with FIFO allocation and r
 
 from flask import Blueprint, request, jsonify
 from decimal import Decimal
+from psycopg2.extras import execute_values
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number
 from utils.validation import safe_decimal, safe_float, validate_required_fields
+from utils.oil_cost_propagation import propagate_oil_cost_deltas
 
 # Create Blueprint
 material_sales_bp = Blueprint('material_sales', __name__)
@@ -34,6 +36,270 @@ BYPRODUCT_TYPES = {
     }
 }
 
+# Lot sources for the FIFO allocator; oil cake lots are inventory rows,
+# sludge lots are the batches themselves
+BYPRODUCT_LOTS = {
+    'oil_cake': {
+        'select': """
+            SELECT 
+                oci.cake_inventory_id as lot_id,
+                oci.batch_id,
+                oci.quantity_remaining,
+                oci.estimated_rate,
+                b.oil_type,
+                oci.production_date
+            FROM oil_cake_inventory oci
+            JOIN batch b ON oci.batch_id = b.batch_id
+            WHERE oci.quantity_remaining > 0
+        """,
+        'lot_id': 'oci.cake_inventory_id',
+        'order_by': 'oci.production_date, oci.cake_inventory_id',
+        'lock_of': 'oci'
+    },
+    'sludge': {
+        'select': """
+            SELECT 
+                b.batch_id as lot_id,
+                b.batch_id,
+                b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0) as quantity_remaining,
+                COALESCE(b.sludge_estimated_rate, 0) as estimated_rate,
+                b.oil_type,
+                b.production_date
+            FROM batch b
+            WHERE b.sludge_yield > 0 
+                AND (b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) > 0
+        """,
+        'lot_id': 'b.batch_id',
+        'order_by': 'b.production_date, b.batch_id',
+        'lock_of': 'b'
+    }
+}
+
+
+def lock_byproduct_lots_fifo(byproduct_type, quantity_needed, oil_type, cur, max_rounds=5):
+    """
+    Lock the oldest by-product lots needed to cover a quantity.
+    A running-sum window picks the FIFO prefix of lots that covers the
+    remaining need, and only that prefix is locked with
+    FOR UPDATE SKIP LOCKED. Lots held by a concurrent sale are skipped and
+    excluded from the next round's prefix, so the next lots are tried and
+    two sales never allocate the same cake. If the free lots cannot cover
+    the quantity, the skipped lots are waited for with a blocking lock
+    rather than failing the sale as insufficient.
+    
+    Args:
+        byproduct_type: 'oil_cake' or 'sludge'
+        quantity_needed: Decimal quantity to cover
+        oil_type: Optional oil type filter
+        cur: Database cursor
+        max_rounds: Attempts to replace skipped or shrunk lots
+    
+    Returns:
+        list: Locked lots in FIFO order (dicts with Decimal quantities)
+    """
+    source = BYPRODUCT_LOTS[byproduct_type]
+    lots = []
+    seen_ids = []
+    skipped_ids = []
+    remaining = quantity_needed
+    
+    for _ in range(max_rounds):
+        if remaining <= 0:
+            break
+        
+        cur.execute(f"""
+            WITH candidates AS (
+                {source['select']}
+                    AND (%(oil_type)s IS NULL OR b.oil_type = %(oil_type)s)
+                    AND NOT ({source['lot_id']} = ANY(%(seen)s))
+            )
+            SELECT lot_id
+            FROM (
+                SELECT lot_id,
+                       SUM(quantity_remaining) OVER (ORDER BY production_date, lot_id)
+                           - quantity_remaining as quantity_before
+                FROM candidates
+            ) running
+            WHERE quantity_before < %(needed)s
+        """, {'oil_type': oil_type, 'seen': seen_ids, 'needed': remaining})
+        
+        prefix_ids = [row[0] for row in cur.fetchall()]
+        if not prefix_ids:
+            break
+        
+        # Lock only the prefix; lots another sale holds are left out and
+        # excluded from the next round's running sum
+        cur.execute(f"""
+            {source['select']}
+                AND {source['lot_id']} = ANY(%s)
+            ORDER BY {source['order_by']}
+            FOR UPDATE OF {source['lock_of']} SKIP LOCKED
+        """, (prefix_ids,))
+        
+        rows = cur.fetchall()
+        locked_ids = {row[0] for row in rows}
+        skipped = [lot_id for lot_id in prefix_ids if lot_id not in locked_ids]
+        seen_ids.extend(skipped)
+        skipped_ids.extend(skipped)
+        
+        for row in rows:
+            seen_ids.append(row[0])
+            lots.append(row)
+            remaining -= Decimal(row[2])
+    
+    if remaining > 0 and skipped_ids:
+        # Stock exists but a concurrent sale holds it: wait for those lots.
+        # The lot filter is re-checked once the other sale commits, so lots
+        # it emptied drop out
+        cur.execute(f"""
+            {source['select']}
+                AND {source['lot_id']} = ANY(%s)
+            ORDER BY {source['order_by']}
+            FOR UPDATE OF {source['lock_of']}
+        """, (skipped_ids,))
+        
+        for row in cur.fetchall():
+            if remaining <= 0:
+                break
+            lots.append(row)
+            remaining -= Decimal(row[2])
+        
+        # Back into FIFO order (production dates sort last when missing)
+        lots.sort(key=lambda row: (row[5] is None, row[5] or 0, row[0]))
+    
+    return [
+        {
+            'inventory_id': lot_id,
+            'batch_id': batch_id,
+            'quantity_remaining': Decimal(qty_remaining),
+            'estimated_rate': Decimal(estimated_rate) if estimated_rate else Decimal('0'),
+            'oil_type': lot_oil_type
+        }
+        for lot_id, batch_id, qty_remaining, estimated_rate, lot_oil_type, _ in lots
+    ]
+
+
+def post_byproduct_allocations(byproduct_type, sale_id, sale_date, sale_rate, allocations, cur):
+    """
+    Post FIFO allocations of a by-product sale as set-based statements:
+    allocation rows, lot decrements, and batch sold quantity / actual rate
+    with the retroactive net oil cost adjustment. Each batch adjustment is
+    recorded in batch_cost_adjustments and the new oil cost per kg is
+    pushed into downstream blends and SKU productions.
+    
+    Args:
+        byproduct_type: 'oil_cake' or 'sludge'
+        sale_id: Sale ID
+        sale_date: Sale date (integer days)
+        sale_rate: Decimal sale rate per kg
+        allocations: List of (lot dict, allocated Decimal quantity)
+        cur: Database cursor
+    
+    Returns:
+        dict: Downstream propagation counts
+    """
+    if not allocations:
+        return {'blends_updated': 0, 'productions_updated': 0}
+    
+    execute_values(cur, """
+        INSERT INTO oil_cake_sale_allocations (
+            sale_id, batch_id, quantity_allocated,
+            original_estimate_rate, actual_sale_rate,
+            cost_adjustment_per_kg, oil_cost_adjustment
+        ) VALUES %s
+    """, [
+        (
+            sale_id,
+            lot['batch_id'],
+            float(qty),
+            float(lot['estimated_rate']),
+            float(sale_rate),
+            float(lot['estimated_rate'] - sale_rate),
+            float(qty * lot['estimated_rate'] - qty * sale_rate)
+        )
+        for lot, qty in allocations
+    ])
+    
+    if byproduct_type == 'oil_cake':
+        cur.execute("""
+            UPDATE oil_cake_inventory oci
+            SET quantity_remaining = oci.quantity_remaining - d.quantity
+            FROM unnest(%s::int[], %s::numeric[]) AS d(lot_id, quantity)
+            WHERE oci.cake_inventory_id = d.lot_id
+        """, (
+            [lot['inventory_id'] for lot, _ in allocations],
+            [qty for _, qty in allocations]
+        ))
+        sold_col, actual_rate_col, estimated_rate_col = 'cake_sold_quantity', 'cake_actual_rate', 'cake_estimated_rate'
+    else:
+        sold_col, actual_rate_col, estimated_rate_col = 'sludge_sold_quantity', 'sludge_actual_rate', 'sludge_estimated_rate'
+    
+    # Several cake lots can belong to one batch
+    qty_by_batch = {}
+    for lot, qty in allocations:
+        qty_by_batch[lot['batch_id']] = qty_by_batch.get(lot['batch_id'], Decimal('0')) + qty
+    
+    # Net oil cost moves by sold quantity x (estimated rate - actual rate),
+    # on top of earlier sales; batches never adjusted start from
+    # total cost - estimated by-product revenue
+    cur.execute(f"""
+        WITH d AS (
+            SELECT * FROM unnest(%(batch_ids)s::int[], %(quantities)s::numeric[]) AS t(batch_id, quantity)
+        ),
+        previous AS (
+            SELECT 
+                b.batch_id,
+                COALESCE(
+                    b.net_oil_cost,
+                    COALESCE(b.total_production_cost, 0)
+                        - COALESCE(b.oil_cake_yield, 0) * COALESCE(b.cake_estimated_rate, 0)
+                        - COALESCE(b.sludge_yield, 0) * COALESCE(b.sludge_estimated_rate, 0)
+                ) as net_oil_cost,
+                b.oil_cost_per_kg,
+                d.quantity * (COALESCE(b.{estimated_rate_col}, 0) - %(rate)s) as adjustment
+            FROM batch b
+            JOIN d ON b.batch_id = d.batch_id
+        )
+        UPDATE batch b
+        SET {sold_col} = COALESCE(b.{sold_col}, 0) + d.quantity,
+            {actual_rate_col} = %(rate)s,
+            net_oil_cost = p.net_oil_cost + p.adjustment,
+            oil_cost_per_kg = CASE WHEN b.oil_yield > 0 
+                THEN (p.net_oil_cost + p.adjustment) / b.oil_yield ELSE 0 END
+        FROM d
+        JOIN previous p ON p.batch_id = d.batch_id
+        WHERE b.batch_id = d.batch_id
+        RETURNING 
+            b.batch_id, b.oil_type, d.quantity, COALESCE(b.{estimated_rate_col}, 0),
+            p.adjustment, p.net_oil_cost, b.net_oil_cost,
+            COALESCE(p.oil_cost_per_kg, 0), b.oil_cost_per_kg
+    """, {
+        'batch_ids': list(qty_by_batch.keys()),
+        'quantities': list(qty_by_batch.values()),
+        'rate': sale_rate
+    })
+    adjusted_batches = cur.fetchall()
+    
+    execute_values(cur, """
+        INSERT INTO batch_cost_adjustments (
+            batch_id, sale_id, byproduct_type, oil_type, sale_date,
+            quantity_sold, estimated_rate, actual_rate, adjustment_amount,
+            net_oil_cost_before, net_oil_cost_after,
+            oil_cost_per_kg_before, oil_cost_per_kg_after
+        ) VALUES %s
+    """, [
+        (batch_id, sale_id, byproduct_type, oil_type, sale_date,
+         quantity, estimated_rate, sale_rate, adjustment,
+         net_before, net_after, per_kg_before, per_kg_after)
+        for (batch_id, oil_type, quantity, estimated_rate, adjustment,
+             net_before, net_after, per_kg_before, per_kg_after) in adjusted_batches
+    ])
+    
+    return propagate_oil_cost_deltas({
+        row[0]: Decimal(row[8]) - Decimal(row[7]) for row in adjusted_batches
+    }, cur)
+
+
 @material_sales_bp.route('/api/byproduct_types', methods=['GET'])
 def get_byproduct_types():
     """Get available by-product types for sale"""
@@ -219,55 +485,17 @@ def add_material_sale():
         # Begin transaction
         cur.execute("BEGIN")
         
-        # Get available inventory based on type (FIFO order)
-        available_batches = []
+        if byproduct_type not in BYPRODUCT_LOTS:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Unsupported by-product type: {byproduct_type}'
+            }), 400
         
-        if byproduct_type == 'oil_cake':
-            cur.execute("""
-                SELECT 
-                    oci.cake_inventory_id,
-                    oci.batch_id,
-                    oci.quantity_remaining,
-                    oci.estimated_rate,
-                    b.oil_type
-                FROM oil_cake_inventory oci
-                JOIN batch b ON oci.batch_id = b.batch_id
-                WHERE oci.quantity_remaining > 0
-                    AND (%s IS NULL OR b.oil_type = %s)
-                ORDER BY oci.production_date ASC
-            """, (data.get('oil_type'), data.get('oil_type')))
-            
-            for row in cur.fetchall():
-                available_batches.append({
-                    'inventory_id': row[0],
-                    'batch_id': row[1],
-                    'quantity_remaining': Decimal(str(row[2])),
-                    'estimated_rate': Decimal(str(row[3])),
-                    'oil_type': row[4]
-                })
-                
-        elif byproduct_type == 'sludge':
-            cur.execute("""
-                SELECT 
-                    b.batch_id,
-                    b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0) as quantity_remaining,
-                    b.sludge_estimated_rate,
-                    b.oil_type
-                FROM batch b
-                WHERE b.sludge_yield > 0 
-                    AND (b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) > 0
-                    AND (%s IS NULL OR b.oil_type = %s)
-                ORDER BY b.production_date ASC
-            """, (data.get('oil_type'), data.get('oil_type')))
-            
-            for row in cur.fetchall():
-                available_batches.append({
-                    'inventory_id': row[0],  # batch_id for sludge
-                    'batch_id': row[0],
-                    'quantity_remaining': Decimal(str(row[1])),
-                    'estimated_rate': Decimal(str(row[2])) if row[2] else Decimal('0'),
-                    'oil_type': row[3]
-                })
+        # Lock just the oldest lots needed (FIFO order)
+        available_batches = lock_byproduct_lots_fifo(
+            byproduct_type, quantity_to_sell, data.get('oil_type'), cur
+        )
         
         # Check if enough inventory available
         total_available = sum(batch['quantity_remaining'] for batch in available_batches)
@@ -302,8 +530,9 @@ def add_material_sale():
         
         sale_id = cur.fetchone()[0]
         
-        # FIFO allocation
+        # FIFO allocation in memory
         remaining_quantity = quantity_to_sell
+        lot_allocations = []
         allocations = []
         total_adjustment = Decimal('0')
         
@@ -319,89 +548,7 @@ def add_material_sale():
             actual_revenue = allocation_qty * sale_rate
             cost_adjustment = estimated_revenue - actual_revenue  # Negative if sold for less
             
-            # Insert allocation record
-            cur.execute("""
-                INSERT INTO oil_cake_sale_allocations (
-                    sale_id, batch_id, quantity_allocated,
-                    original_estimate_rate, actual_sale_rate,
-                    cost_adjustment_per_kg, oil_cost_adjustment
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                sale_id,
-                batch['batch_id'],
-                float(allocation_qty),
-                float(batch['estimated_rate']),
-                float(sale_rate),
-                float(batch['estimated_rate'] - sale_rate),
-                float(cost_adjustment)
-            ))
-            
-            # Update inventory based on type
-            if byproduct_type == 'oil_cake':
-                cur.execute("""
-                    UPDATE oil_cake_inventory
-                    SET quantity_remaining = quantity_remaining - %s
-                    WHERE cake_inventory_id = %s
-                """, (float(allocation_qty), batch['inventory_id']))
-                
-                # Update batch cake sold quantity
-                cur.execute("""
-                    UPDATE batch
-                    SET cake_sold_quantity = COALESCE(cake_sold_quantity, 0) + %s,
-                        cake_actual_rate = %s
-                    WHERE batch_id = %s
-                """, (float(allocation_qty), float(sale_rate), batch['batch_id']))
-                
-            elif byproduct_type == 'sludge':
-                cur.execute("""
-                    UPDATE batch
-                    SET sludge_sold_quantity = COALESCE(sludge_sold_quantity, 0) + %s,
-                        sludge_actual_rate = %s
-                    WHERE batch_id = %s
-                """, (float(allocation_qty), float(sale_rate), batch['batch_id']))
-            
-            # Retroactively adjust batch oil cost
-            if byproduct_type in ['oil_cake', 'sludge']:
-                # Get current batch details
-                cur.execute("""
-                    SELECT oil_yield, total_production_cost, 
-                           oil_cake_yield, cake_estimated_rate,
-                           sludge_yield, sludge_estimated_rate
-                    FROM batch
-                    WHERE batch_id = %s
-                """, (batch['batch_id'],))
-                
-                batch_details = cur.fetchone()
-                if batch_details:
-                    oil_yield = Decimal(str(batch_details[0]))
-                    total_cost = Decimal(str(batch_details[1]))
-                    cake_yield = Decimal(str(batch_details[2])) if batch_details[2] else Decimal('0')
-                    cake_est_rate = Decimal(str(batch_details[3])) if batch_details[3] else Decimal('0')
-                    sludge_yield = Decimal(str(batch_details[4])) if batch_details[4] else Decimal('0')
-                    sludge_est_rate = Decimal(str(batch_details[5])) if batch_details[5] else Decimal('0')
-                    
-                    # Recalculate net oil cost with adjustment
-                    if byproduct_type == 'oil_cake':
-                        # Replace estimated cake revenue with actual for sold portion
-                        estimated_cake_revenue = cake_yield * cake_est_rate
-                        actual_cake_revenue = allocation_qty * sale_rate + (cake_yield - allocation_qty) * cake_est_rate
-                        adjustment = estimated_cake_revenue - actual_cake_revenue
-                    else:  # sludge
-                        estimated_sludge_revenue = sludge_yield * sludge_est_rate
-                        actual_sludge_revenue = allocation_qty * sale_rate + (sludge_yield - allocation_qty) * sludge_est_rate
-                        adjustment = estimated_sludge_revenue - actual_sludge_revenue
-                    
-                    # Update net oil cost
-                    new_net_oil_cost = total_cost - (cake_yield * cake_est_rate) - (sludge_yield * sludge_est_rate) + adjustment
-                    new_oil_cost_per_kg = new_net_oil_cost / oil_yield if oil_yield > 0 else Decimal('0')
-                    
-                    cur.execute("""
-                        UPDATE batch
-                        SET net_oil_cost = %s,
-                            oil_cost_per_kg = %s
-                        WHERE batch_id = %s
-                    """, (float(new_net_oil_cost), float(new_oil_cost_per_kg), batch['batch_id']))
-            
+            lot_allocations.append((batch, allocation_qty))
             allocations.append({
                 'batch_id': batch['batch_id'],
                 'quantity': float(allocation_qty),
@@ -411,6 +558,11 @@ def add_material_sale():
             total_adjustment += cost_adjustment
             remaining_quantity -= allocation_qty
         
+        # Post allocations, lot decrements and batch cost adjustments
+        propagation = post_byproduct_allocations(
+            byproduct_type, sale_id, sale_date, sale_rate, lot_allocations, cur
+        )
+        
         # Commit transaction
         conn.commit()
         
@@ -422,6 +574,7 @@ def add_material_sale():
             'total_amount': float(quantity_to_sell * sale_rate),
             'allocations': allocations,
             'total_cost_adjustment': float(total_adjustment),
+            'cost_propagation': propagation,
             'message': f'Sale recorded successfully with {len(allocations)} batch allocations'
         }), 201
         
@@ -578,13 +731,59 @@ def get_material_sales_history():
 
 @material_sales_bp.route('/api/cost_reconciliation_report', methods=['GET'])
 def get_cost_reconciliation_report():
-    """Get detailed cost reconciliation report showing impact of by-product sales"""
+    """
+    Get cost reconciliation report showing impact of by-product sales.
+    Reads the adjustments recorded at sale posting; filterable by sale
+    date range, oil type and by-product type, paginated per batch, with
+    monthly totals for the filtered range.
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        # Get batches with reconciliation details
-        cur.execute("""
+        # Get filter parameters
+        start_date = parse_date(request.args.get('start_date'))
+        end_date = parse_date(request.args.get('end_date'))
+        oil_type = request.args.get('oil_type')
+        byproduct_type = request.args.get('byproduct_type')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+        
+        where = " WHERE 1=1"
+        params = []
+        
+        if start_date is not None:
+            where += " AND a.sale_date >= %s"
+            params.append(start_date)
+        
+        if end_date is not None:
+            where += " AND a.sale_date <= %s"
+            params.append(end_date)
+        
+        if oil_type:
+            where += " AND a.oil_type = %s"
+            params.append(oil_type)
+        
+        if byproduct_type:
+            where += " AND a.byproduct_type = %s"
+            params.append(byproduct_type)
+        
+        # Per-batch adjustments within the filter
+        cur.execute(f"""
+            WITH per_batch AS (
+                SELECT 
+                    a.batch_id,
+                    SUM(CASE WHEN a.byproduct_type = 'oil_cake' THEN a.quantity_sold ELSE 0 END) as cake_sold,
+                    SUM(CASE WHEN a.byproduct_type = 'oil_cake' THEN a.adjustment_amount ELSE 0 END) as cake_adjustment,
+                    SUM(CASE WHEN a.byproduct_type = 'sludge' THEN a.quantity_sold ELSE 0 END) as sludge_sold,
+                    SUM(CASE WHEN a.byproduct_type = 'sludge' THEN a.adjustment_amount ELSE 0 END) as sludge_adjustment,
+                    MAX(a.sale_date) as last_sale_date
+                FROM batch_cost_adjustments a
+                {where}
+                GROUP BY a.batch_id
+                ORDER BY MAX(a.sale_date) DESC, a.batch_id DESC
+                LIMIT %s OFFSET %s
+            )
             SELECT 
                 b.batch_id,
                 b.batch_code,
@@ -595,30 +794,25 @@ def get_cost_reconciliation_report():
                 b.oil_cake_yield,
                 b.cake_estimated_rate,
                 b.cake_actual_rate,
-                COALESCE(b.cake_sold_quantity, 0) as cake_sold,
+                pb.cake_sold,
                 b.sludge_yield,
                 b.sludge_estimated_rate,
                 b.sludge_actual_rate,
-                COALESCE(b.sludge_sold_quantity, 0) as sludge_sold,
+                pb.sludge_sold,
                 b.total_production_cost,
-                b.net_oil_cost
-            FROM batch b
-            WHERE (b.cake_sold_quantity > 0 OR b.sludge_sold_quantity > 0)
-            ORDER BY b.production_date DESC
-        """)
+                b.net_oil_cost,
+                pb.cake_adjustment,
+                pb.sludge_adjustment,
+                pb.last_sale_date
+            FROM per_batch pb
+            JOIN batch b ON pb.batch_id = b.batch_id
+            ORDER BY pb.last_sale_date DESC, b.batch_id DESC
+        """, params + [per_page, (page - 1) * per_page])
         
         reconciliation_data = []
         for row in cur.fetchall():
-            # Calculate adjustments
-            cake_adjustment = 0
-            if row[9] > 0:  # cake sold
-                cake_adjustment = float(row[9]) * (float(row[7] or 0) - float(row[8] or 0))
-            
-            sludge_adjustment = 0
-            if row[13] > 0:  # sludge sold
-                sludge_adjustment = float(row[13]) * (float(row[11] or 0) - float(row[12] or 0))
-            
-            total_adjustment = cake_adjustment + sludge_adjustment
+            cake_adjustment = float(row[16])
+            sludge_adjustment = float(row[17])
             
             reconciliation_data.append({
                 'batch_id': row[0],
@@ -641,15 +835,60 @@ def get_cost_reconciliation_report():
                     'sold_quantity': float(row[13]),
                     'adjustment': sludge_adjustment
                 },
-                'total_adjustment': total_adjustment,
+                'total_adjustment': cake_adjustment + sludge_adjustment,
                 'total_production_cost': float(row[14]),
-                'net_oil_cost': float(row[15])
+                'net_oil_cost': float(row[15]),
+                'last_sale_date': integer_to_date(row[18])
             })
         
+        # Monthly totals and batch count for the whole filtered range
+        cur.execute(f"""
+            SELECT 
+                TO_CHAR(DATE '1970-01-01' + a.sale_date, 'YYYY-MM') as period,
+                a.byproduct_type,
+                SUM(a.quantity_sold),
+                SUM(a.adjustment_amount),
+                COUNT(DISTINCT a.batch_id)
+            FROM batch_cost_adjustments a
+            {where}
+            GROUP BY 1, 2
+            ORDER BY 1 DESC, 2
+        """, params)
+        
+        period_totals = {}
+        for period, row_type, quantity, adjustment, batches in cur.fetchall():
+            totals = period_totals.setdefault(period, {
+                'period': period,
+                'quantity_sold': 0,
+                'total_adjustment': 0,
+                'by_type': {}
+            })
+            totals['quantity_sold'] += float(quantity)
+            totals['total_adjustment'] += float(adjustment)
+            totals['by_type'][row_type] = {
+                'quantity_sold': float(quantity),
+                'adjustment': float(adjustment),
+                'batches': batches
+            }
+        
+        cur.execute(f"""
+            SELECT COUNT(DISTINCT a.batch_id)
+            FROM batch_cost_adjustments a
+            {where}
+        """, params)
+        total_count = cur.fetchone()[0]
+        
         return jsonify({
             'success': True,
             'reconciliation_data': reconciliation_data,
-            'count': len(reconciliation_data)
+            'count': len(reconciliation_data),
+            'period_totals': list(period_totals.values()),
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total_count,
+                'pages': (total_count + per_page - 1) // per_page
+            }
         })
         
     except Exception as e:
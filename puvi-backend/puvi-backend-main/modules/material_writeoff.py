@@ -5,10 +5,15 @@ File Path: puvi-backend/puvi-backend-main/modules/material_writeoff.py
 Version: 3.0 - Unified writeoff with dynamic categories
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
+from psycopg2.extras import execute_values
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number
 from utils.validation import safe_float, validate_required_fields
+from utils.writeoff_proposals import generate_expiry_writeoff_proposals
+from utils.writeoff_metrics import reconcile_writeoff_metrics, get_dashboard_snapshot
+from utils.stock_ledger import set_stock_movement_context
+from modules.sku_outbound import update_expiry_tracking_bulk
 
 # Create Blueprint
 writeoff_bp = Blueprint('writeoff', __name__)
@@ -147,307 +152,178 @@ def get_inventory_for_writeoff():
 
 @writeoff_bp.route('/api/unified_writeoff_inventory', methods=['GET'])
 def get_unified_writeoff_inventory():
-    """Get all writeoff-able items dynamically from database"""
+    """
+    Get writeoff-able stock from the writeoffable_stock snapshot.
+    Categories are always returned; items are returned for the selected
+    category / type / location, one page at a time.
+    
+    Query params:
+        category: Category key (material category, sku_<oil>_<size>,
+                  oilcake_<oil>, sludge_<oil>)
+        type: Item type (material, sku, oilcake, sludge)
+        location_id: Only stock held at this location
+        search: Match on item name, code or batch code
+        page, per_page: Pagination (default 1, 50; max 500 per page)
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        result = {
-            'success': True,
-            'categories': [],
-            'inventory_items': []
-        }
-        
-        # 1. DYNAMICALLY get all material categories from categories_master
-        cur.execute("""
-            SELECT 
-                cm.category_name,
-                COUNT(DISTINCT CASE WHEN i.closing_stock > 0 THEN m.material_id END) as item_count
-            FROM categories_master cm
-            LEFT JOIN materials m ON (
-                m.category = cm.category_name                
-            ) AND m.is_active = true
-            LEFT JOIN inventory i ON i.material_id = m.material_id
-            WHERE cm.is_active = true
-            GROUP BY cm.category_name
-            ORDER BY cm.category_name
-        """)
+        selected_category = request.args.get('category')
+        item_type = request.args.get('type')
+        location_id = request.args.get('location_id', type=int)
+        search = request.args.get('search', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
         
-        material_categories = []
-        for row in cur.fetchall():
-            material_categories.append({
-                'type': 'material',
-                'category': row[0],
-                'display_name': row[0],
-                'count': row[1] or 0,
-                'unit': 'items'
-            })
+        if item_type and item_type not in ('material', 'sku', 'oilcake', 'sludge'):
+            return jsonify({
+                'success': False,
+                'error': f'Invalid type: {item_type}'
+            }), 400
         
-        # 2. DYNAMICALLY get all SKU products from sku_master
+        # Category counts; master categories are listed even without stock
         cur.execute("""
-            SELECT 
-                CONCAT('sku_', sm.oil_type, '_', sm.package_size) as category_key,
-                CONCAT(sm.oil_type, ' Oil - ', sm.package_size) as display_name,
-                COUNT(DISTINCT si.inventory_id) as item_count,
-                COALESCE(SUM(si.quantity_available), 0) as total_quantity
-            FROM sku_master sm
-            LEFT JOIN sku_inventory si ON sm.sku_id = si.sku_id 
-                AND si.quantity_available > 0 
-                AND si.status = 'active'
-            WHERE sm.is_active = true
-            GROUP BY sm.oil_type, sm.package_size
-            ORDER BY sm.oil_type, sm.package_size
-        """)
-        
-        sku_categories = []
-        for row in cur.fetchall():
-            sku_categories.append({
-                'type': 'sku',
-                'category': row[0],
-                'display_name': row[1],
-                'count': float(row[3]) if row[3] else 0,
-                'unit': 'bottles'
+            WITH stock AS (
+                SELECT
+                    category_group,
+                    item_type,
+                    category_key,
+                    MAX(category_display) as display_name,
+                    COUNT(DISTINCT ref_id) as item_count,
+                    SUM(quantity_available) as total_quantity
+                FROM writeoffable_stock
+                WHERE (%s::int IS NULL OR location_id = %s::int)
+                GROUP BY category_group, item_type, category_key
+            ),
+            masters AS (
+                SELECT 'materials' as category_group, 'material' as item_type,
+                       category_name as category_key, category_name as display_name
+                FROM categories_master
+                WHERE is_active = true
+                UNION
+                SELECT 'finished_products', 'sku',
+                       CONCAT('sku_', oil_type, '_', package_size),
+                       CONCAT(oil_type, ' Oil - ', package_size)
+                FROM sku_master
+                WHERE is_active = true
+            )
+            SELECT
+                COALESCE(m.category_group, s.category_group),
+                COALESCE(m.item_type, s.item_type),
+                COALESCE(m.category_key, s.category_key),
+                COALESCE(m.display_name, s.display_name),
+                COALESCE(s.item_count, 0),
+                COALESCE(s.total_quantity, 0)
+            FROM masters m
+            FULL OUTER JOIN stock s
+                ON s.item_type = m.item_type AND s.category_key = m.category_key
+            WHERE m.category_key IS NOT NULL OR s.item_type <> 'material'
+            ORDER BY 2, 3
+        """, (location_id, location_id))
+        
+        categories = {'materials': [], 'finished_products': [], 'byproducts': []}
+        units = {'material': 'items', 'sku': 'bottles', 'oilcake': 'kg', 'sludge': 'kg'}
+        for group, row_type, category_key, display_name, item_count, total_quantity in cur.fetchall():
+            categories[group].append({
+                'type': row_type,
+                'category': category_key,
+                'display_name': display_name,
+                # Materials count items, everything else counts stock
+                'count': item_count if row_type == 'material' else float(total_quantity),
+                'unit': units[row_type]
             })
         
-        # 3. DYNAMICALLY get oil cake types from actual inventory
-        cur.execute("""
-            SELECT DISTINCT 
-                oci.oil_type,
-                COUNT(DISTINCT oci.cake_inventory_id) as batch_count,
-                SUM(oci.quantity_remaining) as total_quantity
-            FROM oil_cake_inventory oci
-            WHERE oci.quantity_remaining > 0
-            GROUP BY oci.oil_type
-            ORDER BY oci.oil_type
-        """)
+        result = {
+            'success': True,
+            'categories': categories,
+            'inventory_items': []
+        }
         
-        oilcake_categories = []
-        for row in cur.fetchall():
-            oilcake_categories.append({
-                'type': 'oilcake',
-                'category': f'oilcake_{row[0]}',
-                'display_name': f'Oil Cake - {row[0]}',
-                'count': float(row[2]) if row[2] else 0,
-                'unit': 'kg'
-            })
+        if not (selected_category or item_type or location_id):
+            return jsonify(result)
         
-        # 4. DYNAMICALLY get sludge types from batch table
-        cur.execute("""
-            SELECT DISTINCT 
-                b.oil_type,
-                COUNT(DISTINCT b.batch_id) as batch_count,
-                SUM(b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) as total_quantity
-            FROM batch b
-            WHERE b.sludge_yield > 0 
-                AND (b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) > 0
-            GROUP BY b.oil_type
-            ORDER BY b.oil_type
-        """)
+        category_keys = [selected_category] if selected_category else None
+        if selected_category == 'Packing Material':
+            category_keys.append('Packaging')
         
-        sludge_categories = []
-        for row in cur.fetchall():
-            sludge_categories.append({
-                'type': 'sludge',
-                'category': f'sludge_{row[0]}',
-                'display_name': f'Sludge - {row[0]}',
-                'count': float(row[2]) if row[2] else 0,
-                'unit': 'kg'
-            })
-        
-        # 5. Also check for oil cake with zero inventory but exists in batch history
         cur.execute("""
-            SELECT DISTINCT b.oil_type
-            FROM batch b
-            WHERE b.oil_cake_yield > 0
-                AND b.oil_type NOT IN (
-                    SELECT DISTINCT oil_type 
-                    FROM oil_cake_inventory 
-                    WHERE quantity_remaining > 0
-                )
-            ORDER BY b.oil_type
-        """)
+            SELECT
+                item_type, item_key, ref_id, item_name, item_code, batch_code,
+                oil_type, traceable_code, location_id, quantity_produced,
+                quantity_available, unit, unit_cost, mrp, expiry_date,
+                production_date, COUNT(*) OVER() as total_count
+            FROM writeoffable_stock
+            WHERE (%s::varchar[] IS NULL OR category_key = ANY(%s::varchar[]))
+                AND (%s::varchar IS NULL OR item_type = %s::varchar)
+                AND (%s::int IS NULL OR location_id = %s::int)
+                AND (%s = '' OR item_name ILIKE %s OR item_code ILIKE %s OR batch_code ILIKE %s)
+            ORDER BY item_type, expiry_date NULLS LAST, production_date DESC NULLS LAST,
+                     item_name, item_key
+            LIMIT %s OFFSET %s
+        """, (
+            category_keys, category_keys,
+            item_type, item_type,
+            location_id, location_id,
+            search, f'%{search}%', f'%{search}%', f'%{search}%',
+            per_page, (page - 1) * per_page
+        ))
         
-        for row in cur.fetchall():
-            # Check if not already added
-            exists = any(cat['category'] == f'oilcake_{row[0]}' for cat in oilcake_categories)
-            if not exists:
-                oilcake_categories.append({
-                    'type': 'oilcake',
-                    'category': f'oilcake_{row[0]}',
-                    'display_name': f'Oil Cake - {row[0]}',
-                    'count': 0,
-                    'unit': 'kg'
+        rows = cur.fetchall()
+        total = rows[0][16] if rows else 0
+        
+        for (row_type, item_key, ref_id, item_name, item_code, batch_code,
+             oil_type, traceable_code, row_location_id, quantity_produced,
+             quantity_available, unit, unit_cost, mrp, expiry_date,
+             production_date, _) in rows:
+            if row_type == 'sku':
+                result['inventory_items'].append({
+                    'inventory_id': item_key,
+                    'sku_id': ref_id,
+                    'sku_code': item_code,
+                    'product_name': item_name,
+                    'location_id': row_location_id,
+                    'quantity_available': float(quantity_available),
+                    'expiry_date': integer_to_date(expiry_date) if expiry_date else None,
+                    'batch_code': batch_code,
+                    'mrp': float(mrp) if mrp else 0,
+                    'production_cost': float(unit_cost) if unit_cost else 0,
+                    'type': 'sku',
+                    'unit': 'bottles'
+                })
+            elif row_type in ('oilcake', 'sludge'):
+                result['inventory_items'].append({
+                    'inventory_id': item_key,
+                    'batch_id': ref_id,
+                    'batch_code': batch_code,
+                    'oil_type': oil_type,
+                    'quantity_produced': float(quantity_produced) if quantity_produced else 0,
+                    'quantity_remaining': float(quantity_available),
+                    'estimated_rate': float(unit_cost) if unit_cost else 0,
+                    'production_date': integer_to_date(production_date) if production_date else None,
+                    'traceable_code': traceable_code,
+                    'type': row_type,
+                    'unit': 'kg',
+                    'available_quantity': float(quantity_available)
+                })
+            else:
+                result['inventory_items'].append({
+                    'inventory_id': item_key,
+                    'material_id': ref_id,
+                    'material_name': item_name,
+                    'unit': unit,
+                    'available_quantity': float(quantity_available),
+                    'weighted_avg_cost': float(unit_cost) if unit_cost else 0,
+                    'type': 'material'
                 })
         
-        # Combine all dynamically fetched categories
-        result['categories'] = {
-            'materials': material_categories,
-            'finished_products': sku_categories,
-            'byproducts': oilcake_categories + sludge_categories
+        result['pagination'] = {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page
         }
         
-        # If specific category requested, fetch its items
-        selected_category = request.args.get('category')
-        if selected_category:
-            if selected_category.startswith('sku_'):
-                # Parse dynamically - handle any oil type and package size
-                parts = selected_category.replace('sku_', '').rsplit('_', 1)
-                if len(parts) == 2:
-                    oil_type, package_size = parts
-                    
-                    # Fetch SKU inventory for this combination
-                    cur.execute("""
-                        SELECT 
-                            si.inventory_id,
-                            si.sku_id,
-                            sm.sku_code,
-                            sm.product_name,
-                            si.quantity_available,
-                            si.expiry_date,
-                            si.batch_code,
-                            si.mrp,
-                            si.production_id
-                        FROM sku_inventory si
-                        JOIN sku_master sm ON si.sku_id = sm.sku_id
-                        WHERE sm.oil_type = %s 
-                            AND sm.package_size = %s
-                            AND si.quantity_available > 0
-                            AND si.status = 'active'
-                        ORDER BY si.expiry_date
-                    """, (oil_type, package_size))
-                    
-                    for row in cur.fetchall():
-                        # Get production cost if available
-                        production_cost = 0
-                        if row[8]:  # production_id
-                            cur.execute("""
-                                SELECT cost_per_bottle 
-                                FROM sku_production 
-                                WHERE production_id = %s
-                            """, (row[8],))
-                            cost_row = cur.fetchone()
-                            if cost_row:
-                                production_cost = float(cost_row[0])
-                        
-                        result['inventory_items'].append({
-                            'inventory_id': row[0],
-                            'sku_id': row[1],
-                            'sku_code': row[2],
-                            'product_name': row[3],
-                            'quantity_available': float(row[4]),
-                            'expiry_date': integer_to_date(row[5]) if row[5] else None,
-                            'batch_code': row[6],
-                            'mrp': float(row[7]) if row[7] else 0,
-                            'production_cost': production_cost,
-                            'type': 'sku',
-                            'unit': 'bottles'
-                        })
-                        
-            elif selected_category.startswith('oilcake_'):
-                oil_type = selected_category.replace('oilcake_', '')
-                
-                # Existing oil cake logic
-                cur.execute("""
-                    SELECT 
-                        oci.cake_inventory_id,
-                        oci.batch_id,
-                        b.batch_code,
-                        oci.oil_type,
-                        oci.quantity_produced,
-                        oci.quantity_remaining,
-                        oci.estimated_rate,
-                        oci.production_date,
-                        b.traceable_code
-                    FROM oil_cake_inventory oci
-                    JOIN batch b ON oci.batch_id = b.batch_id
-                    WHERE oci.quantity_remaining > 0
-                        AND oci.oil_type = %s
-                    ORDER BY oci.production_date DESC
-                """, (oil_type,))
-                
-                for row in cur.fetchall():
-                    result['inventory_items'].append({
-                        'inventory_id': row[0],
-                        'batch_id': row[1],
-                        'batch_code': row[2],
-                        'oil_type': row[3],
-                        'quantity_produced': float(row[4]),
-                        'quantity_remaining': float(row[5]),
-                        'estimated_rate': float(row[6]),
-                        'production_date': integer_to_date(row[7]),
-                        'traceable_code': row[8],
-                        'type': 'oilcake',
-                        'unit': 'kg',
-                        'available_quantity': float(row[5])
-                    })
-                    
-            elif selected_category.startswith('sludge_'):
-                oil_type = selected_category.replace('sludge_', '')
-                
-                # Existing sludge logic
-                cur.execute("""
-                    SELECT 
-                        b.batch_id,
-                        b.batch_code,
-                        b.oil_type,
-                        b.sludge_yield as quantity_produced,
-                        b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0) as quantity_remaining,
-                        b.sludge_estimated_rate as estimated_rate,
-                        b.production_date,
-                        b.traceable_code
-                    FROM batch b
-                    WHERE b.sludge_yield > 0 
-                        AND (b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0)) > 0
-                        AND b.oil_type = %s
-                    ORDER BY b.production_date DESC
-                """, (oil_type,))
-                
-                for row in cur.fetchall():
-                    quantity_remaining = float(row[4]) if row[4] else 0
-                    result['inventory_items'].append({
-                        'inventory_id': row[0],  # batch_id for sludge
-                        'batch_id': row[0],
-                        'batch_code': row[1],
-                        'oil_type': row[2],
-                        'quantity_produced': float(row[3]) if row[3] else 0,
-                        'quantity_remaining': quantity_remaining,
-                        'estimated_rate': float(row[5]) if row[5] else 0,
-                        'production_date': integer_to_date(row[6]),
-                        'traceable_code': row[7],
-                        'type': 'sludge',
-                        'unit': 'kg',
-                        'available_quantity': quantity_remaining
-                    })
-                    
-            else:
-                # Material category - fetch dynamically
-                cur.execute("""
-                    SELECT 
-                        i.inventory_id,
-                        i.material_id,
-                        m.material_name,
-                        m.unit,
-                        i.closing_stock,
-                        i.weighted_avg_cost
-                    FROM inventory i
-                    JOIN materials m ON i.material_id = m.material_id
-                    WHERE (m.category = %s 
-                        OR (%s = 'Packing Material' AND m.category = 'Packaging'))
-                        AND i.closing_stock > 0
-                    ORDER BY m.material_name
-                """, (selected_category, selected_category))
-                
-                for row in cur.fetchall():
-                    result['inventory_items'].append({
-                        'inventory_id': row[0],
-                        'material_id': row[1],
-                        'material_name': row[2],
-                        'unit': row[3],
-                        'available_quantity': float(row[4]),
-                        'weighted_avg_cost': float(row[5]),
-                        'type': 'material'
-                    })
-        
         return jsonify(result)
         
     except Exception as e:
@@ -698,6 +574,7 @@ def add_sku_writeoff():
         ))
         
         writeoff_id = cur.fetchone()[0]
+        set_stock_movement_context(writeoff_date_int, 'material_writeoffs', writeoff_id, cur)
         
         # Update SKU inventory
         new_quantity = quantity_available - writeoff_qty
@@ -718,13 +595,6 @@ def add_sku_writeoff():
                 WHERE inventory_id = %s
             """, (new_quantity, sku_inventory_id))
         
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update monthly summary
-        month_year = int(integer_to_date(writeoff_date_int, '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
-        
         # Commit transaction
         conn.commit()
         
@@ -850,6 +720,7 @@ def add_writeoff():
         ))
         
         writeoff_id = cur.fetchone()[0]
+        set_stock_movement_context(writeoff_date_int, 'material_writeoffs', writeoff_id, cur)
         
         # Update inventory
         new_closing_stock = current_stock - writeoff_qty
@@ -873,13 +744,6 @@ def add_writeoff():
             data['material_id']
         ))
         
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update monthly summary
-        month_year = int(integer_to_date(writeoff_date_int, '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
-        
         # Commit transaction
         conn.commit()
         
@@ -1289,13 +1153,6 @@ def add_oilcake_writeoff():
             WHERE batch_id = %s
         """, (writeoff_qty, batch_id))
         
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update monthly summary
-        month_year = int(integer_to_date(writeoff_date_int, '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
-        
         # Commit transaction
         conn.commit()
         
@@ -1543,13 +1400,6 @@ def add_sludge_writeoff():
             WHERE batch_id = %s
         """, (writeoff_qty, batch_id))
         
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update monthly summary
-        month_year = int(integer_to_date(writeoff_date_int, '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
-        
         # Commit transaction
         conn.commit()
         
@@ -1578,6 +1428,715 @@ def add_sludge_writeoff():
         close_connection(conn, cur)
 
 
+# ============================================
+# BULK WRITEOFF
+# ============================================
+
+# Identifier field each writeoff item type is keyed by
+WRITEOFF_ITEM_KEYS = {
+    'material': 'material_id',
+    'sku': 'sku_inventory_id',
+    'oil_cake': 'cake_inventory_id',
+    'sludge': 'batch_id'
+}
+
+
+def lock_writeoff_sources(item_type, source_ids, cur):
+    """
+    Read and lock the stock rows behind a set of writeoff items of one type.
+    
+    Args:
+        item_type: 'material', 'sku', 'oil_cake' or 'sludge'
+        source_ids: List of identifiers (see WRITEOFF_ITEM_KEYS)
+        cur: Database cursor
+    
+    Returns:
+        dict: source_id -> {row_id, available, unit_cost, unit, label,
+              reference_type, reference_id, batch_id, default_notes}
+    """
+    sources = {}
+    
+    if item_type == 'material':
+        # Latest inventory row per material carries the balance
+        cur.execute("""
+            SELECT i.inventory_id, i.material_id, i.closing_stock,
+                   i.weighted_avg_cost, m.material_name, m.unit
+            FROM inventory i
+            JOIN materials m ON i.material_id = m.material_id
+            WHERE i.inventory_id IN (
+                SELECT MAX(inventory_id)
+                FROM inventory
+                WHERE material_id = ANY(%s)
+                GROUP BY material_id
+            )
+            FOR UPDATE OF i
+        """, (source_ids,))
+        for inventory_id, material_id, stock, cost, name, unit in cur.fetchall():
+            sources[material_id] = {
+                'row_id': inventory_id,
+                'available': float(stock),
+                'unit_cost': float(cost),
+                'unit': unit,
+                'label': name,
+                'reference_type': None,
+                'reference_id': None,
+                'batch_id': None,
+                'default_notes': ''
+            }
+    
+    elif item_type == 'sku':
+        cur.execute("""
+            SELECT 
+                si.inventory_id,
+                si.quantity_available,
+                si.mrp,
+                si.batch_code,
+                sm.product_name,
+                p.cost_per_bottle
+            FROM sku_inventory si
+            JOIN sku_master sm ON si.sku_id = sm.sku_id
+            LEFT JOIN sku_production p ON si.production_id = p.production_id
+            WHERE si.inventory_id = ANY(%s)
+            FOR UPDATE OF si
+        """, (source_ids,))
+        for inventory_id, available, mrp, batch_code, product_name, cost_per_bottle in cur.fetchall():
+            production_cost = float(cost_per_bottle) if cost_per_bottle else 0
+            mrp = float(mrp) if mrp else 0
+            sources[inventory_id] = {
+                'row_id': inventory_id,
+                'available': float(available),
+                # Use production cost if available, else MRP * 0.7 as estimate
+                'unit_cost': production_cost if production_cost > 0 else mrp * 0.7,
+                'unit': 'bottles',
+                'label': product_name,
+                'reference_type': 'sku',
+                'reference_id': inventory_id,
+                'batch_id': None,
+                'default_notes': f'SKU writeoff: {product_name} from batch {batch_code}'
+            }
+    
+    elif item_type == 'oil_cake':
+        cur.execute("""
+            SELECT 
+                oci.cake_inventory_id,
+                oci.batch_id,
+                oci.quantity_remaining,
+                oci.estimated_rate,
+                b.batch_code
+            FROM oil_cake_inventory oci
+            JOIN batch b ON oci.batch_id = b.batch_id
+            WHERE oci.cake_inventory_id = ANY(%s)
+            FOR UPDATE OF oci
+        """, (source_ids,))
+        for cake_inventory_id, batch_id, remaining, rate, batch_code in cur.fetchall():
+            sources[cake_inventory_id] = {
+                'row_id': cake_inventory_id,
+                'available': float(remaining),
+                'unit_cost': float(rate),
+                'unit': 'kg',
+                'label': f'Oil cake {batch_code}',
+                'reference_type': 'oil_cake',
+                'reference_id': batch_id,
+                'batch_id': batch_id,
+                'default_notes': f'Oil cake writeoff from batch {batch_code}'
+            }
+    
+    elif item_type == 'sludge':
+        cur.execute("""
+            SELECT 
+                b.batch_id,
+                b.sludge_yield - COALESCE(b.sludge_sold_quantity, 0) as quantity_remaining,
+                b.sludge_estimated_rate,
+                b.batch_code
+            FROM batch b
+            WHERE b.batch_id = ANY(%s)
+            FOR UPDATE OF b
+        """, (source_ids,))
+        for batch_id, remaining, rate, batch_code in cur.fetchall():
+            sources[batch_id] = {
+                'row_id': batch_id,
+                'available': float(remaining) if remaining else 0,
+                'unit_cost': float(rate) if rate else 0,
+                'unit': 'kg',
+                'label': f'Sludge {batch_code}',
+                'reference_type': 'sludge',
+                'reference_id': batch_id,
+                'batch_id': batch_id,
+                'default_notes': f'Sludge writeoff from batch {batch_code}'
+            }
+    
+    return sources
+
+
+def post_writeoff_decrements(item_type, posted, cur):
+    """
+    Apply the stock decrements of posted writeoffs of one type in bulk.
+    
+    Args:
+        item_type: 'material', 'sku', 'oil_cake' or 'sludge'
+        posted: List of (source dict, quantity, writeoff_date_int, writeoff_id)
+        cur: Database cursor
+    """
+    # One decrement per stock row and writeoff date, so each date's
+    # stock movements carry that date and as-of balances stay exact
+    qty_by_date = {}
+    writeoffs_by_date = {}
+    qty_by_batch = {}
+    for source, quantity, writeoff_date_int, writeoff_id in posted:
+        qty_by_row = qty_by_date.setdefault(writeoff_date_int, {})
+        qty_by_row[source['row_id']] = qty_by_row.get(source['row_id'], 0) + quantity
+        writeoffs_by_date.setdefault(writeoff_date_int, set()).add(writeoff_id)
+        if source['batch_id']:
+            qty_by_batch[source['batch_id']] = qty_by_batch.get(source['batch_id'], 0) + quantity
+    
+    for writeoff_date_int in sorted(qty_by_date):
+        qty_by_row = qty_by_date[writeoff_date_int]
+        row_ids = list(qty_by_row.keys())
+        quantities = [qty_by_row[row_id] for row_id in row_ids]
+        
+        if item_type in ('material', 'sku'):
+            # A group of several writeoffs has no single source record
+            writeoff_ids = writeoffs_by_date[writeoff_date_int]
+            set_stock_movement_context(
+                writeoff_date_int, 'material_writeoffs',
+                next(iter(writeoff_ids)) if len(writeoff_ids) == 1 else None, cur
+            )
+        
+        if item_type == 'material':
+            cur.execute("""
+                UPDATE inventory i
+                SET closing_stock = i.closing_stock - d.quantity,
+                    consumption = i.consumption + d.quantity,
+                    last_updated = %s
+                FROM unnest(%s::int[], %s::numeric[]) AS d(inventory_id, quantity)
+                WHERE i.inventory_id = d.inventory_id
+            """, (writeoff_date_int, row_ids, quantities))
+        
+        elif item_type == 'sku':
+            cur.execute("""
+                UPDATE sku_inventory si
+                SET quantity_available = si.quantity_available - d.quantity,
+                    status = CASE WHEN si.quantity_available - d.quantity = 0
+                                  THEN 'consumed' ELSE si.status END
+                FROM unnest(%s::int[], %s::numeric[]) AS d(inventory_id, quantity)
+                WHERE si.inventory_id = d.inventory_id
+            """, (row_ids, quantities))
+        
+        elif item_type == 'oil_cake':
+            cur.execute("""
+                UPDATE oil_cake_inventory oci
+                SET quantity_remaining = oci.quantity_remaining - d.quantity
+                FROM unnest(%s::int[], %s::numeric[]) AS d(cake_inventory_id, quantity)
+                WHERE oci.cake_inventory_id = d.cake_inventory_id
+            """, (row_ids, quantities))
+    
+    # By-product writeoffs count towards total disposed on the batch
+    if item_type in ('oil_cake', 'sludge') and qty_by_batch:
+        sold_col = 'cake_sold_quantity' if item_type == 'oil_cake' else 'sludge_sold_quantity'
+        cur.execute(f"""
+            UPDATE batch b
+            SET {sold_col} = COALESCE(b.{sold_col}, 0) + d.quantity
+            FROM unnest(%s::int[], %s::numeric[]) AS d(batch_id, quantity)
+            WHERE b.batch_id = d.batch_id
+        """, (list(qty_by_batch.keys()), list(qty_by_batch.values())))
+
+
+def post_writeoffs_bulk(items, defaults, cur, lot_overrides=None):
+    """
+    Validate and post a list of mixed-type writeoff items in the caller's
+    transaction: one locking read per item type, one insert of all
+    material_writeoffs rows and bulk stock decrements. Impact and monthly
+    summaries follow through the writeoff metrics trigger.
+    Nothing is posted if any item fails validation.
+    
+    Args:
+        items: List of dicts with 'type', the type's identifier field
+               (see WRITEOFF_ITEM_KEYS), 'quantity' and optional
+               reason_code, reason_description, scrap_value, notes,
+               writeoff_date, reference_type, reference_id
+        defaults: Dict of fallback writeoff_date, reason_code,
+                  reason_description and created_by
+        cur: Database cursor
+        lot_overrides: Internal, for proposal approval only: list parallel
+                       to items of None or {unit_cost, expiry_lots
+                       ([{tracking_id, quantity}])} valuing a SKU item at
+                       the lots it consumes. Never taken from a request.
+    
+    Returns:
+        tuple: (posted results list, errors list); errors is empty on success
+    """
+    errors = []
+    ids_by_type = {}
+    
+    for index, item in enumerate(items):
+        item_type = item.get('type')
+        key = WRITEOFF_ITEM_KEYS.get(item_type)
+        if not key:
+            errors.append({'index': index, 'error': f'Unknown writeoff type: {item_type}'})
+            continue
+        if item.get(key) is None:
+            errors.append({'index': index, 'error': f'Missing required field: {key}'})
+            continue
+        if not (item.get('reason_code') or defaults.get('reason_code')):
+            errors.append({'index': index, 'error': 'Missing required field: reason_code'})
+            continue
+        if not parse_date(item.get('writeoff_date') or defaults.get('writeoff_date')):
+            errors.append({'index': index, 'error': 'Missing required field: writeoff_date'})
+            continue
+        if safe_float(item.get('quantity')) <= 0:
+            errors.append({'index': index, 'error': 'Writeoff quantity must be greater than 0'})
+            continue
+        ids_by_type.setdefault(item_type, set()).add(int(item[key]))
+    
+    if errors:
+        return [], errors
+    
+    # One locking read per item type
+    sources_by_type = {
+        item_type: lock_writeoff_sources(item_type, sorted(source_ids), cur)
+        for item_type, source_ids in ids_by_type.items()
+    }
+    
+    # Validate requested totals per stock row
+    requested = {}
+    for item in items:
+        source_key = (item['type'], int(item[WRITEOFF_ITEM_KEYS[item['type']]]))
+        requested[source_key] = requested.get(source_key, 0) + safe_float(item['quantity'])
+    
+    for index, item in enumerate(items):
+        source_key = (item['type'], int(item[WRITEOFF_ITEM_KEYS[item['type']]]))
+        source = sources_by_type[item['type']].get(source_key[1])
+        if not source:
+            errors.append({'index': index, 'error': f'{item["type"]} {source_key[1]} not found in inventory'})
+        elif requested[source_key] > source['available']:
+            errors.append({
+                'index': index,
+                'error': f'Insufficient stock. Available: {source["available"]} {source["unit"]}'
+            })
+    
+    if errors:
+        return [], errors
+    
+    rows = []
+    posted = []
+    lot_quantities = {}
+    results = []
+    for index, item in enumerate(items):
+        item_type = item['type']
+        source_id = int(item[WRITEOFF_ITEM_KEYS[item_type]])
+        source = sources_by_type[item_type][source_id]
+        quantity = safe_float(item['quantity'])
+        writeoff_date_int = parse_date(item.get('writeoff_date') or defaults.get('writeoff_date'))
+        override = lot_overrides[index] if lot_overrides else None
+        unit_cost = source['unit_cost']
+        if item_type == 'sku' and override:
+            unit_cost = override['unit_cost']
+        total_cost = quantity * unit_cost
+        scrap_value = safe_float(item.get('scrap_value', 0))
+        net_loss = total_cost - scrap_value
+        
+        rows.append((
+            source_id if item_type == 'material' else None,
+            writeoff_date_int,
+            quantity,
+            unit_cost,
+            total_cost,
+            scrap_value,
+            net_loss,
+            item.get('reason_code') or defaults.get('reason_code'),
+            item.get('reason_description') or defaults.get('reason_description', ''),
+            source['reference_type'] or item.get('reference_type', 'manual'),
+            source['reference_id'] if source['reference_type'] else item.get('reference_id'),
+            item.get('notes') or source['default_notes'],
+            defaults.get('created_by', 'System')
+        ))
+        posted.append((item_type, source, quantity, writeoff_date_int))
+        if item_type == 'sku' and override:
+            for lot in override['expiry_lots']:
+                tracking_id = lot['tracking_id']
+                lot_quantities[tracking_id] = lot_quantities.get(tracking_id, 0) + lot['quantity']
+        results.append({
+            'type': item_type,
+            WRITEOFF_ITEM_KEYS[item_type]: source_id,
+            'name': source['label'],
+            'quantity_written_off': quantity,
+            'unit': source['unit'],
+            'total_cost': total_cost,
+            'scrap_value': scrap_value,
+            'net_loss': net_loss
+        })
+    
+    writeoff_ids = execute_values(cur, """
+        INSERT INTO material_writeoffs (
+            material_id, writeoff_date, quantity, weighted_avg_cost,
+            total_cost, scrap_value, net_loss, reason_code,
+            reason_description, reference_type, reference_id,
+            notes, created_by
+        ) VALUES %s
+        RETURNING writeoff_id
+    """, rows, fetch=True)
+    
+    posted_by_type = {}
+    for result, (item_type, source, quantity, writeoff_date_int), (writeoff_id,) in zip(
+            results, posted, writeoff_ids):
+        result['writeoff_id'] = writeoff_id
+        posted_by_type.setdefault(item_type, []).append(
+            (source, quantity, writeoff_date_int, writeoff_id)
+        )
+    
+    for item_type, type_posted in posted_by_type.items():
+        post_writeoff_decrements(item_type, type_posted, cur)
+    
+    # Expired lots written off leave expiry tracking too
+    update_expiry_tracking_bulk(lot_quantities, None, cur)
+    
+    return results, []
+
+
+@writeoff_bp.route('/api/writeoffs/bulk', methods=['POST'])
+def add_writeoffs_bulk():
+    """Record many material, SKU, oil cake and sludge writeoffs in one transaction"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        data = request.json or {}
+        items = data.get('items') or []
+        
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'No writeoff items provided'
+            }), 400
+        
+        # Begin transaction
+        cur.execute("BEGIN")
+        
+        results, errors = post_writeoffs_bulk(items, data, cur)
+        
+        if errors:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'{len(errors)} writeoff item(s) failed validation',
+                'errors': errors
+            }), 400
+        
+        # Commit transaction
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'writeoffs': results,
+            'count': len(results),
+            'total_cost': sum(result['total_cost'] for result in results),
+            'total_net_loss': sum(result['net_loss'] for result in results),
+            'message': f'{len(results)} writeoffs recorded successfully'
+        }), 201
+        
+    except Exception as e:
+        conn.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+# ============================================
+# EXPIRY WRITEOFF PROPOSALS
+# ============================================
+
+@writeoff_bp.route('/api/writeoff_proposals', methods=['GET'])
+def get_writeoff_proposals():
+    """Get writeoff proposals for expired SKU lots grouped by location"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        status = request.args.get('status', 'pending')
+        location_id = request.args.get('location_id', type=int)
+        
+        query = """
+            SELECT 
+                wp.proposal_id,
+                wp.location_id,
+                lm.location_name,
+                wp.sku_id,
+                sm.sku_code,
+                sm.product_name,
+                wp.lot_count,
+                wp.total_quantity,
+                wp.cost_per_unit,
+                wp.total_value,
+                wp.oldest_expiry_date,
+                wp.status,
+                wp.generated_at,
+                COALESCE(
+                    json_agg(json_build_object(
+                        'tracking_id', pl.tracking_id,
+                        'production_id', pl.production_id,
+                        'expiry_date', pl.expiry_date,
+                        'quantity', pl.quantity,
+                        'cost_per_bottle', pl.cost_per_bottle
+                    ) ORDER BY pl.expiry_date) FILTER (WHERE pl.tracking_id IS NOT NULL),
+                    '[]'
+                ) as lots
+            FROM writeoff_proposals wp
+            JOIN sku_master sm ON wp.sku_id = sm.sku_id
+            LEFT JOIN locations_master lm ON wp.location_id = lm.location_id
+            LEFT JOIN writeoff_proposal_lots pl ON wp.proposal_id = pl.proposal_id
+            WHERE wp.status = %s
+        """
+        params = [status]
+        
+        if location_id:
+            query += " AND wp.location_id = %s"
+            params.append(location_id)
+        
+        query += """
+            GROUP BY wp.proposal_id, lm.location_name, sm.sku_code, sm.product_name
+            ORDER BY lm.location_name, sm.sku_code
+        """
+        
+        cur.execute(query, params)
+        
+        locations = {}
+        total_value = 0
+        for row in cur.fetchall():
+            location = locations.setdefault(row[1], {
+                'location_id': row[1],
+                'location_name': row[2] or 'Unassigned',
+                'proposals': [],
+                'total_value': 0
+            })
+            location['proposals'].append({
+                'proposal_id': row[0],
+                'sku_id': row[3],
+                'sku_code': row[4],
+                'product_name': row[5],
+                'lot_count': row[6],
+                'total_quantity': float(row[7]),
+                'cost_per_unit': float(row[8]),
+                'total_value': float(row[9]),
+                'oldest_expiry_date': integer_to_date(row[10]) if row[10] else None,
+                'status': row[11],
+                'generated_at': row[12].isoformat() if row[12] else None,
+                'lots': [
+                    dict(lot, expiry_date=integer_to_date(lot['expiry_date']) if lot['expiry_date'] else None)
+                    for lot in row[13]
+                ]
+            })
+            location['total_value'] += float(row[9])
+            total_value += float(row[9])
+        
+        return jsonify({
+            'success': True,
+            'locations': list(locations.values()),
+            'proposal_count': sum(len(loc['proposals']) for loc in locations.values()),
+            'total_value': total_value
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+@writeoff_bp.route('/api/writeoff_proposals/generate', methods=['POST'])
+def generate_writeoff_proposals():
+    """Rebuild pending proposals now instead of waiting for the scheduled run"""
+    conn = get_db_connection()
+    
+    try:
+        data = request.json or {}
+        result = generate_expiry_writeoff_proposals(conn, data.get('location_ids'))
+        return jsonify(result), 200 if result.get('success') else 500
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, None)
+
+
+@writeoff_bp.route('/api/writeoff_proposals/approve', methods=['POST'])
+def approve_writeoff_proposals():
+    """Approve pending proposals and post them as SKU writeoffs in one transaction"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        data = request.json or {}
+        
+        is_valid, missing_fields = validate_required_fields(data, ['proposal_ids', 'reason_code'])
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'error': f'Missing required fields: {", ".join(missing_fields)}'
+            }), 400
+        
+        # Begin transaction
+        cur.execute("BEGIN")
+        
+        cur.execute("""
+            SELECT wp.proposal_id, wp.sku_id, wp.location_id, si.inventory_id
+            FROM writeoff_proposals wp
+            LEFT JOIN sku_inventory si 
+                ON si.sku_id = wp.sku_id 
+                AND si.location_id IS NOT DISTINCT FROM wp.location_id
+            WHERE wp.proposal_id = ANY(%s)
+                AND wp.status = 'pending'
+            ORDER BY wp.proposal_id
+            FOR UPDATE OF wp
+        """, (data['proposal_ids'],))
+        proposals = cur.fetchall()
+        
+        if not proposals:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'No pending proposals found'
+            }), 404
+        
+        # Write off what is still on each lot, not what was proposed
+        cur.execute("""
+            SELECT pl.proposal_id, pl.tracking_id,
+                   LEAST(pl.quantity, et.quantity_remaining), pl.cost_per_bottle
+            FROM writeoff_proposal_lots pl
+            JOIN sku_expiry_tracking et ON pl.tracking_id = et.tracking_id
+            WHERE pl.proposal_id = ANY(%s)
+                AND et.quantity_remaining > 0
+            ORDER BY pl.proposal_id, pl.tracking_id
+            FOR UPDATE OF et
+        """, ([proposal[0] for proposal in proposals],))
+        
+        lots_by_proposal = {}
+        for proposal_id, tracking_id, quantity, cost_per_bottle in cur.fetchall():
+            lots_by_proposal.setdefault(proposal_id, []).append(
+                (tracking_id, float(quantity), float(cost_per_bottle))
+            )
+        
+        items = []
+        lot_overrides = []
+        approved_ids = []
+        superseded_ids = []
+        for proposal_id, sku_id, location_id, sku_inventory_id in proposals:
+            lots = lots_by_proposal.get(proposal_id)
+            if not lots or not sku_inventory_id:
+                superseded_ids.append(proposal_id)
+                continue
+            
+            quantity = sum(lot[1] for lot in lots)
+            items.append({
+                'type': 'sku',
+                'sku_inventory_id': sku_inventory_id,
+                'quantity': quantity,
+                'notes': data.get('notes') or f'Expiry writeoff (proposal {proposal_id})'
+            })
+            lot_overrides.append({
+                'unit_cost': sum(lot[1] * lot[2] for lot in lots) / quantity,
+                'expiry_lots': [
+                    {'tracking_id': tracking_id, 'quantity': lot_quantity}
+                    for tracking_id, lot_quantity, _ in lots
+                ]
+            })
+            approved_ids.append(proposal_id)
+        
+        results, errors = post_writeoffs_bulk(items, {
+            'writeoff_date': data.get('writeoff_date') or get_current_day_number(),
+            'reason_code': data['reason_code'],
+            'reason_description': data.get('reason_description', 'Expired or unsellable stock'),
+            'created_by': data.get('approved_by', 'System')
+        }, cur, lot_overrides) if items else ([], [])
+        
+        if errors:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'{len(errors)} proposal(s) could not be posted',
+                'errors': [
+                    dict(error, proposal_id=approved_ids[error['index']])
+                    for error in errors if 'index' in error
+                ]
+            }), 400
+        
+        cur.execute("""
+            UPDATE writeoff_proposals wp
+            SET status = d.status,
+                writeoff_id = d.writeoff_id,
+                decided_at = CURRENT_TIMESTAMP,
+                decided_by = %s
+            FROM unnest(%s::int[], %s::varchar[], %s::int[]) AS d(proposal_id, status, writeoff_id)
+            WHERE wp.proposal_id = d.proposal_id
+        """, (
+            data.get('approved_by', 'System'),
+            approved_ids + superseded_ids,
+            ['approved'] * len(approved_ids) + ['superseded'] * len(superseded_ids),
+            [result['writeoff_id'] for result in results] + [None] * len(superseded_ids)
+        ))
+        
+        # Commit transaction
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'approved': approved_ids,
+            'superseded': superseded_ids,
+            'writeoffs': results,
+            'total_net_loss': sum(result['net_loss'] for result in results),
+            'message': f'{len(approved_ids)} proposals approved and written off'
+        })
+        
+    except Exception as e:
+        conn.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+@writeoff_bp.route('/api/writeoff_proposals/reject', methods=['POST'])
+def reject_writeoff_proposals():
+    """Reject pending proposals; their lots are not proposed again"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        data = request.json or {}
+        
+        if not data.get('proposal_ids'):
+            return jsonify({
+                'success': False,
+                'error': 'Missing required fields: proposal_ids'
+            }), 400
+        
+        cur.execute("""
+            UPDATE writeoff_proposals
+            SET status = 'rejected',
+                decided_at = CURRENT_TIMESTAMP,
+                decided_by = %s
+            WHERE proposal_id = ANY(%s)
+                AND status = 'pending'
+            RETURNING proposal_id
+        """, (data.get('rejected_by', 'System'), data['proposal_ids']))
+        
+        rejected = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'rejected': rejected,
+            'message': f'{len(rejected)} proposals rejected'
+        })
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
 # ============================================
 # IMPACT ANALYTICS ENDPOINTS - FIXED
 # ============================================
@@ -1655,125 +2214,146 @@ def get_writeoff_impact():
         close_connection(conn, cur)
 
 
+def build_writeoff_dashboard(cur):
+    """
+    Assemble the writeoff dashboard in one query over the writeoff metric
+    buckets, the latest impact row and the ten most recent writeoffs.
+    
+    Args:
+        cur: Database cursor
+    
+    Returns:
+        dict: Response body for /api/writeoff_dashboard
+    """
+    cur.execute("""
+        SELECT json_build_object(
+            'recent_writeoffs', COALESCE((
+                SELECT json_agg(r ORDER BY r.writeoff_date DESC, r.writeoff_id DESC)
+                FROM (
+                    SELECT 
+                        w.writeoff_id,
+                        w.writeoff_date,
+                        COALESCE(m.material_name, 
+                            CASE 
+                                WHEN w.reference_type = 'oil_cake' THEN 'Oil Cake'
+                                WHEN w.reference_type = 'sludge' THEN 'Sludge'
+                                WHEN w.reference_type = 'sku' THEN 'SKU Product'
+                                ELSE 'Unknown'
+                            END
+                        ) as item_name,
+                        w.quantity,
+                        COALESCE(m.unit, 'kg') as unit,
+                        w.net_loss,
+                        w.reason_description
+                    FROM material_writeoffs w
+                    LEFT JOIN materials m ON w.material_id = m.material_id
+                    ORDER BY w.writeoff_date DESC, w.writeoff_id DESC
+                    LIMIT 10
+                ) r
+            ), '[]'),
+            'top_reasons', COALESCE((
+                SELECT json_agg(t ORDER BY t.total_loss DESC)
+                FROM (
+                    SELECT 
+                        NULLIF(b.reason_code, '') as reason_code,
+                        COALESCE(wr.reason_description, NULLIF(b.reason_code, '')) as reason,
+                        wr.category,
+                        SUM(b.writeoff_count) as count,
+                        SUM(b.net_loss) as total_loss
+                    FROM writeoff_metric_buckets b
+                    LEFT JOIN writeoff_reasons wr ON b.reason_code = wr.reason_code
+                    GROUP BY b.reason_code, wr.reason_description, wr.category
+                    HAVING SUM(b.writeoff_count) > 0
+                    ORDER BY total_loss DESC
+                    LIMIT 5
+                ) t
+            ), '[]'),
+            'impact', (
+                SELECT json_build_object(
+                    'impact_per_kg', impact_per_kg,
+                    'writeoff_percentage', writeoff_percentage
+                )
+                FROM writeoff_impact_tracking
+                ORDER BY tracking_id DESC
+                LIMIT 1
+            )
+        )
+    """)
+    data = cur.fetchone()[0]
+    
+    dashboard = {}
+    
+    dashboard['recent_writeoffs'] = [
+        {
+            'writeoff_id': row['writeoff_id'],
+            'date': integer_to_date(row['writeoff_date']),
+            'item_name': row['item_name'],
+            'quantity': float(row['quantity']),
+            'unit': row['unit'],
+            'net_loss': float(row['net_loss']),
+            'reason': row['reason_description']
+        }
+        for row in data['recent_writeoffs']
+    ]
+    
+    dashboard['top_reasons'] = [
+        {
+            'reason_code': row['reason_code'],
+            'reason': row['reason'],
+            'category': row['category'] or 'Other',
+            'count': row['count'],
+            'total_loss': float(row['total_loss'])
+        }
+        for row in data['top_reasons']
+    ]
+    
+    # Alerts based on impact metrics
+    alerts = []
+    if data['impact']:
+        impact_per_kg = float(data['impact']['impact_per_kg'] or 0)
+        writeoff_percentage = float(data['impact']['writeoff_percentage'] or 0)
+        
+        if impact_per_kg > 10:
+            alerts.append({
+                'level': 'critical',
+                'message': f'CRITICAL: Writeoff impact at ₹{impact_per_kg:.2f}/kg oil ({writeoff_percentage:.2f}% of production value)'
+            })
+        elif impact_per_kg > 5:
+            alerts.append({
+                'level': 'warning',
+                'message': f'HIGH: Writeoff impact at ₹{impact_per_kg:.2f}/kg oil ({writeoff_percentage:.2f}% of production value)'
+            })
+    
+    dashboard['alerts'] = alerts
+    
+    return {
+        'success': True,
+        'dashboard': dashboard
+    }
+
+
 @writeoff_bp.route('/api/writeoff_dashboard', methods=['GET'])
 def get_writeoff_dashboard():
-    """Get combined dashboard data"""
+    """Get combined dashboard data from the cached snapshot (ETag aware)"""
     conn = get_db_connection()
-    cur = conn.cursor()
     
     try:
-        dashboard = {}
-        
-        # Get recent writeoffs
-        cur.execute("""
-            SELECT 
-                w.writeoff_id,
-                w.writeoff_date,
-                COALESCE(m.material_name, 
-                    CASE 
-                        WHEN w.reference_type = 'oil_cake' THEN 'Oil Cake'
-                        WHEN w.reference_type = 'sludge' THEN 'Sludge'
-                        WHEN w.reference_type = 'sku' THEN 'SKU Product'
-                        ELSE 'Unknown'
-                    END
-                ) as item_name,
-                w.quantity,
-                COALESCE(m.unit, 'kg') as unit,
-                w.net_loss,
-                w.reason_description
-            FROM material_writeoffs w
-            LEFT JOIN materials m ON w.material_id = m.material_id
-            ORDER BY w.writeoff_date DESC, w.writeoff_id DESC
-            LIMIT 10
-        """)
+        version, payload = get_dashboard_snapshot('material_writeoff', build_writeoff_dashboard, conn)
+        etag = f'writeoff-dashboard-{version}'
         
-        recent_writeoffs = []
-        for row in cur.fetchall():
-            recent_writeoffs.append({
-                'writeoff_id': row[0],
-                'date': integer_to_date(row[1]),
-                'item_name': row[2],
-                'quantity': float(row[3]),
-                'unit': row[4],
-                'net_loss': float(row[5]),
-                'reason': row[6]
-            })
-        
-        dashboard['recent_writeoffs'] = recent_writeoffs
-        
-        # Get top reasons
-        cur.execute("""
-            SELECT 
-                w.reason_code,
-                COALESCE(wr.reason_description, w.reason_description) as reason,
-                wr.category,
-                COUNT(*) as count,
-                SUM(w.net_loss) as total_loss
-            FROM material_writeoffs w
-            LEFT JOIN writeoff_reasons wr ON w.reason_code = wr.reason_code
-            GROUP BY w.reason_code, wr.reason_description, w.reason_description, wr.category
-            ORDER BY total_loss DESC
-            LIMIT 5
-        """)
-        
-        top_reasons = []
-        for row in cur.fetchall():
-            top_reasons.append({
-                'reason_code': row[0],
-                'reason': row[1],
-                'category': row[2] or 'Other',
-                'count': row[3],
-                'total_loss': float(row[4])
-            })
-        
-        dashboard['top_reasons'] = top_reasons
-        
-        # Get alerts based on impact metrics
-        cur.execute("""
-            SELECT 
-                impact_per_kg, 
-                writeoff_percentage
-            FROM writeoff_impact_tracking
-            ORDER BY tracking_id DESC
-            LIMIT 1
-        """)
-        
-        alerts = []
-        impact_row = cur.fetchone()
-        if impact_row:
-            impact_per_kg = float(impact_row[0])
-            writeoff_percentage = float(impact_row[1])
-            
-            # Calculate impact level
-            if impact_per_kg > 10:
-                impact_level = 'critical'
-            elif impact_per_kg > 5:
-                impact_level = 'high'
-            else:
-                impact_level = None
-            
-            if impact_level == 'critical':
-                alerts.append({
-                    'level': 'critical',
-                    'message': f'CRITICAL: Writeoff impact at ₹{impact_per_kg:.2f}/kg oil ({writeoff_percentage:.2f}% of production value)'
-                })
-            elif impact_level == 'high':
-                alerts.append({
-                    'level': 'warning',
-                    'message': f'HIGH: Writeoff impact at ₹{impact_per_kg:.2f}/kg oil ({writeoff_percentage:.2f}% of production value)'
-                })
-        
-        dashboard['alerts'] = alerts
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = jsonify(payload)
         
-        return jsonify({
-            'success': True,
-            'dashboard': dashboard
-        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        close_connection(conn, cur)
+        close_connection(conn, None)
 
 
 @writeoff_bp.route('/api/writeoff_trends', methods=['GET'])
@@ -1825,31 +2405,24 @@ def get_writeoff_trends():
 
 @writeoff_bp.route('/api/refresh_writeoff_metrics', methods=['POST'])
 def refresh_writeoff_metrics():
-    """Manually refresh writeoff metrics"""
+    """Reconcile writeoff metrics now instead of waiting for the scheduled run"""
     conn = get_db_connection()
-    cur = conn.cursor()
     
     try:
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update monthly summary for current month
-        current_month = get_current_day_number()
-        month_year = int(integer_to_date(current_month, '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
-        
-        conn.commit()
+        result = reconcile_writeoff_metrics(conn)
+        if not result.get('success'):
+            return jsonify(result), 500
         
         return jsonify({
             'success': True,
+            'drifted_months': result.get('drifted_months', []),
             'message': 'Metrics refreshed successfully'
         })
         
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        close_connection(conn, cur)
+        close_connection(conn, None)
 
 
 @writeoff_bp.route('/api/writeoff_report/<int:writeoff_id>', methods=['GET'])
@@ -11,9 +11,17 @@ from datetime import datetime, date, timedelta
 import csv
 import io
 import json
+import psycopg2
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_financial_year, get_current_day_number
-from utils.validation import safe_decimal, safe_float, safe_int, validate_required_fields
+from utils.validation import safe_float, validate_required_fields
+from utils.stock_ledger import set_stock_movement_context
+from utils.opening_balance_import import (
+    create_staging_table, stage_csv, stage_entries, merge_staged_balances, write_error_report
+)
+from utils.year_end_close import (
+    preview_year_end_close, queue_year_end_close, start_year_end_close, get_close_run
+)
 
 # Create Blueprint
 opening_balance_bp = Blueprint('opening_balance', __name__)
@@ -310,68 +318,12 @@ def save_opening_balances():
         
         cur.execute("BEGIN")
         
-        saved_count = 0
-        updated_count = 0
-        total_value = Decimal('0')
-        
-        for entry in entries:
-            material_id = entry['material_id']
-            quantity = safe_decimal(entry.get('quantity', 0))
-            rate = safe_decimal(entry.get('rate_per_unit', 0))
-            
-            # Skip if quantity is zero
-            if quantity <= 0:
-                continue
-            
-            # Check if opening balance already exists
-            cur.execute("""
-                SELECT balance_id 
-                FROM opening_balances 
-                WHERE material_id = %s AND entry_type = 'initial'
-            """, (material_id,))
-            
-            existing = cur.fetchone()
-            
-            if existing:
-                # Update existing
-                cur.execute("""
-                    UPDATE opening_balances
-                    SET quantity = %s,
-                        rate_per_unit = %s,
-                        balance_date = %s,
-                        financial_year = %s,
-                        entered_by = %s,
-                        entered_at = CURRENT_TIMESTAMP
-                    WHERE balance_id = %s
-                """, (
-                    float(quantity),
-                    float(rate),
-                    cutoff_date,
-                    financial_year,
-                    data.get('entered_by', 'System'),
-                    existing[0]
-                ))
-                updated_count += 1
-            else:
-                # Insert new
-                cur.execute("""
-                    INSERT INTO opening_balances (
-                        material_id, balance_date, quantity, rate_per_unit,
-                        entry_type, financial_year, notes, entered_by
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    material_id,
-                    cutoff_date,
-                    float(quantity),
-                    float(rate),
-                    'initial',
-                    financial_year,
-                    'Initial opening balance',
-                    data.get('entered_by', 'System')
-                ))
-                saved_count += 1
-            
-            total_value += quantity * rate
+        create_staging_table(cur)
+        stage_entries(entries, cur)
+        result = merge_staged_balances(
+            cutoff_date, financial_year, 'json',
+            data.get('entered_by', 'System'), 'Initial opening balance', cur
+        )
         
         conn.commit()
         
@@ -379,12 +331,18 @@ def save_opening_balances():
             'success': True,
             'message': 'Opening balances saved successfully',
             'summary': {
-                'saved_count': saved_count,
-                'updated_count': updated_count,
-                'total_entries': saved_count + updated_count,
-                'total_value': float(total_value),
+                'saved_count': result['inserted_count'],
+                'updated_count': result['updated_count'],
+                'total_entries': result['inserted_count'] + result['updated_count'],
+                'skipped_count': result['skipped_count'],
+                'errors': result['error_count'],
+                'error_details': result['error_details'],
+                'total_value': result['total_value'],
                 'cutoff_date': data['cutoff_date'],
-                'financial_year': financial_year
+                'financial_year': financial_year,
+                'import_id': result['import_id'],
+                'error_report_url': f"/api/opening_balance/import/{result['import_id']}/errors"
+                if result['error_count'] else None
             }
         })
         
@@ -451,6 +409,14 @@ def initialize_system():
         
         cur.execute("BEGIN")
         
+        # Opening stock enters the stock ledger on the opening balance date
+        cur.execute("""
+            SELECT MIN(balance_date)
+            FROM opening_balances
+            WHERE entry_type = 'initial' AND is_processed = false
+        """)
+        set_stock_movement_context(cur.fetchone()[0], 'opening_balances', None, cur)
+        
         # Process opening balances into inventory
         cur.execute("""
             INSERT INTO inventory (
@@ -545,7 +511,19 @@ def initialize_system():
 
 @opening_balance_bp.route('/api/opening_balance/year_end_close', methods=['POST'])
 def close_financial_year():
-    """Close financial year and carry forward balances"""
+    """
+    Close financial year and carry forward balances.
+    
+    Materials, oil sources, SKU stock per location, oil cake and sludge
+    are closed set-based in a background run; poll
+    /api/opening_balance/year_end_close/<run_id> for progress. Posting
+    again for a year with a failed run resumes it.
+    
+    Body:
+        year_end_date, financial_year: Required
+        dry_run: Return the closing totals without writing
+        closed_by, notes: Optional
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
@@ -566,157 +544,41 @@ def close_financial_year():
         new_year_date = year_end_date + 1  # Next day is new financial year
         new_financial_year = get_financial_year(new_year_date)
         
-        cur.execute("BEGIN")
+        if data.get('dry_run'):
+            return jsonify({
+                'success': True,
+                'dry_run': True,
+                'financial_year': data['financial_year'],
+                'new_financial_year': new_financial_year,
+                'preview': preview_year_end_close(cur)
+            })
         
-        # Check if year already closed
-        cur.execute("""
-            SELECT closing_id 
-            FROM year_end_closing 
-            WHERE financial_year = %s AND status = 'closed'
-        """, (data['financial_year'],))
+        run_id, resumed = queue_year_end_close(
+            data['financial_year'],
+            year_end_date,
+            new_financial_year,
+            data.get('closed_by', 'System'),
+            data.get('notes', f'Year-end closing for {data["financial_year"]}'),
+            cur
+        )
         
-        if cur.fetchone():
+        if not run_id:
+            conn.rollback()
             return jsonify({
                 'success': False,
                 'error': f'Financial year {data["financial_year"]} is already closed'
             }), 400
         
-        # Get current closing balances
-        cur.execute("""
-            SELECT 
-                i.material_id,
-                m.material_name,
-                m.category,
-                m.unit,
-                i.closing_stock,
-                i.weighted_avg_cost,
-                i.closing_stock * i.weighted_avg_cost as value
-            FROM inventory i
-            JOIN materials m ON i.material_id = m.material_id
-            WHERE i.closing_stock > 0
-            ORDER BY m.category, m.material_name
-        """)
-        
-        materials_closed = 0
-        total_closing_value = Decimal('0')
-        
-        for row in cur.fetchall():
-            material_id, material_name, category, unit, quantity, rate, value = row
-            
-            # Save to year_end_closing table
-            cur.execute("""
-                INSERT INTO year_end_closing (
-                    financial_year, closing_date, material_id,
-                    material_name, category, unit,
-                    closing_quantity, weighted_avg_cost, closing_value,
-                    closed_by, notes
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING closing_id
-            """, (
-                data['financial_year'],
-                year_end_date,
-                material_id,
-                material_name,
-                category,
-                unit,
-                float(quantity),
-                float(rate),
-                float(value),
-                data.get('closed_by', 'System'),
-                data.get('notes', f'Year-end closing for {data["financial_year"]}')
-            ))
-            
-            closing_id = cur.fetchone()[0]
-            
-            # Create opening balance for new year
-            cur.execute("""
-                INSERT INTO opening_balances (
-                    material_id, balance_date, quantity, rate_per_unit,
-                    entry_type, financial_year, notes, entered_by, is_processed
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, true)
-                RETURNING balance_id
-            """, (
-                material_id,
-                new_year_date,
-                float(quantity),
-                float(rate),
-                'yearend_carryforward',
-                new_financial_year,
-                f'Carried forward from {data["financial_year"]}',
-                data.get('closed_by', 'System')
-            ))
-            
-            new_opening_id = cur.fetchone()[0]
-            
-            # Update year_end_closing with new opening reference
-            cur.execute("""
-                UPDATE year_end_closing
-                SET carried_forward = true,
-                    new_year_opening_id = %s
-                WHERE closing_id = %s
-            """, (new_opening_id, closing_id))
-            
-            materials_closed += 1
-            total_closing_value += value
-        
-        # Reset serial numbers for new financial year
-        cur.execute("""
-            INSERT INTO serial_number_tracking (
-                material_id, supplier_id, financial_year, current_serial
-            )
-            SELECT DISTINCT 
-                material_id, 
-                supplier_id, 
-                %s, 
-                0
-            FROM serial_number_tracking
-            WHERE financial_year = %s
-            ON CONFLICT (material_id, supplier_id, financial_year) DO NOTHING
-        """, (new_financial_year, data['financial_year']))
-        
-        # Update system configuration
-        cur.execute("""
-            UPDATE system_configuration
-            SET config_value = %s,
-                updated_at = CURRENT_TIMESTAMP,
-                updated_by = %s
-            WHERE config_key = 'current_financial_year'
-        """, (new_financial_year, data.get('closed_by', 'System')))
-        
-        # FIXED: Log the year-end closing with decimal_handler
-        cur.execute("""
-            INSERT INTO masters_audit_log (
-                table_name, record_id, action, new_values,
-                changed_by, reason
-            ) VALUES (
-                'year_end_closing', 0, 'YEAR_END_CLOSE',
-                %s, %s, %s
-            )
-        """, (
-            json.dumps({
-                'financial_year': data['financial_year'],
-                'materials_closed': materials_closed,
-                'total_closing_value': total_closing_value,  # Let decimal_handler convert it
-                'new_financial_year': new_financial_year
-            }, default=decimal_handler),  # Use decimal_handler
-            data.get('closed_by', 'System'),
-            f'Year-end closing for {data["financial_year"]}'
-        ))
-        
         conn.commit()
+        start_year_end_close(run_id)
         
         return jsonify({
             'success': True,
-            'message': f'Financial year {data["financial_year"]} closed successfully',
-            'summary': {
-                'financial_year_closed': data['financial_year'],
-                'new_financial_year': new_financial_year,
-                'materials_processed': materials_closed,
-                'total_closing_value': float(total_closing_value),
-                'closed_by': data.get('closed_by', 'System'),
-                'closed_at': datetime.now().isoformat()
-            }
-        })
+            'message': f'Year-end close for {data["financial_year"]} {"resumed" if resumed else "started"}',
+            'run_id': run_id,
+            'resumed': resumed,
+            'status_url': f'/api/opening_balance/year_end_close/{run_id}'
+        }), 202
         
     except Exception as e:
         conn.rollback()
@@ -725,6 +587,26 @@ def close_financial_year():
         close_connection(conn, cur)
 
 
+@opening_balance_bp.route('/api/opening_balance/year_end_close/<int:run_id>', methods=['GET'])
+def get_year_end_close_status(run_id):
+    """Progress and results of a year-end close run"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        run = get_close_run(run_id, cur)
+        if not run:
+            return jsonify({'success': False, 'error': 'Close run not found'}), 404
+        
+        run['year_end_date'] = integer_to_date(run['year_end_date'], '%Y-%m-%d')
+        return jsonify({'success': True, 'run': run})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
 # =====================================================
 # CSV IMPORT/EXPORT
 # =====================================================
@@ -843,90 +725,23 @@ def import_opening_balances():
         
         financial_year = get_financial_year(cutoff_date)
         
-        # Read CSV file
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
         cur.execute("BEGIN")
         
-        imported_count = 0
-        skipped_count = 0
-        error_rows = []
-        
-        for row_num, row in enumerate(csv_reader, start=2):  # Start from 2 (header is row 1)
-            try:
-                material_id = safe_int(row.get('Material ID'))
-                quantity = safe_decimal(row.get('Opening Quantity', 0))
-                rate = safe_decimal(row.get('Opening Rate', 0))
-                notes = row.get('Notes', '')
-                
-                # Skip if quantity is zero
-                if quantity <= 0:
-                    skipped_count += 1
-                    continue
-                
-                # Validate material exists
-                cur.execute("""
-                    SELECT material_name 
-                    FROM materials 
-                    WHERE material_id = %s AND is_active = true
-                """, (material_id,))
-                
-                if not cur.fetchone():
-                    error_rows.append(f"Row {row_num}: Material ID {material_id} not found")
-                    continue
-                
-                # Check if opening balance already exists
-                cur.execute("""
-                    SELECT balance_id 
-                    FROM opening_balances 
-                    WHERE material_id = %s AND entry_type = 'initial'
-                """, (material_id,))
-                
-                existing = cur.fetchone()
-                
-                if existing:
-                    # Update existing
-                    cur.execute("""
-                        UPDATE opening_balances
-                        SET quantity = %s,
-                            rate_per_unit = %s,
-                            balance_date = %s,
-                            financial_year = %s,
-                            notes = %s,
-                            entered_at = CURRENT_TIMESTAMP
-                        WHERE balance_id = %s
-                    """, (
-                        float(quantity),
-                        float(rate),
-                        cutoff_date,
-                        financial_year,
-                        notes or 'Imported from CSV',
-                        existing[0]
-                    ))
-                else:
-                    # Insert new
-                    cur.execute("""
-                        INSERT INTO opening_balances (
-                            material_id, balance_date, quantity, rate_per_unit,
-                            entry_type, financial_year, notes, entered_by
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        material_id,
-                        cutoff_date,
-                        float(quantity),
-                        float(rate),
-                        'initial',
-                        financial_year,
-                        notes or 'Imported from CSV',
-                        'Import'
-                    ))
-                
-                imported_count += 1
-                
-            except Exception as e:
-                error_rows.append(f"Row {row_num}: {str(e)}")
-                continue
+        # Stage the upload with COPY; nothing is decoded into memory
+        create_staging_table(cur)
+        try:
+            stage_csv(file.stream, cur)
+        except (ValueError, psycopg2.DataError) as e:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Invalid CSV file: {str(e)}'
+            }), 400
+        
+        result = merge_staged_balances(
+            cutoff_date, financial_year, 'csv', 'Import', 'Imported from CSV', cur,
+            file_name=file.filename
+        )
         
         conn.commit()
         
@@ -934,10 +749,16 @@ def import_opening_balances():
             'success': True,
             'message': 'Import completed',
             'summary': {
-                'imported': imported_count,
-                'skipped': skipped_count,
-                'errors': len(error_rows),
-                'error_details': error_rows[:10]  # Show first 10 errors
+                'imported': result['inserted_count'] + result['updated_count'],
+                'inserted': result['inserted_count'],
+                'updated': result['updated_count'],
+                'skipped': result['skipped_count'],
+                'errors': result['error_count'],
+                'error_details': result['error_details'],  # First 10 errors
+                'total_value': result['total_value'],
+                'import_id': result['import_id'],
+                'error_report_url': f"/api/opening_balance/import/{result['import_id']}/errors"
+                if result['error_count'] else None
             }
         })
         
@@ -946,3 +767,27 @@ def import_opening_balances():
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         close_connection(conn, cur)
+
+
+@opening_balance_bp.route('/api/opening_balance/import/<int:import_id>/errors', methods=['GET'])
+def download_import_errors(import_id):
+    """Download the rows an opening balance import or save rejected"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        report = write_error_report(import_id, cur)
+        if report is None:
+            return jsonify({'success': False, 'error': 'Import not found'}), 404
+        
+        return send_file(
+            report,
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=f'opening_balance_import_{import_id}_errors.csv'
+        )
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
@@ -12,6 +12,7 @@ from inventory_utils import update_inventory
 from utils.date_utils import date_to_day_number, integer_to_date
 from utils.validation import safe_decimal, validate_required_fields
 from utils.traceability import generate_purchase_traceable_code
+from utils.stock_ledger import set_stock_movement_context
 
 # Create Blueprint
 purchase_bp = Blueprint('purchase', __name__)
@@ -367,6 +368,7 @@ def add_purchase():
         ))
         
         purchase_id = cur.fetchone()[0]
+        set_stock_movement_context(purchase_date, 'purchases', purchase_id, cur)
         
         # Insert purchase items with traceable codes
         traceable_codes = []
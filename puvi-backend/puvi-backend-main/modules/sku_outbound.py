@@ -5,16 +5,22 @@ Handles Internal Transfers, Third Party Transfers, and Sales transactions
 Version: 4.0 - ENHANCED: Unified customer locations (warehouse + ship-to)
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from decimal import Decimal
 from datetime import datetime, date, timedelta
+import csv
+import io
 import json
 import time
 import psycopg2
+from psycopg2.extras import execute_values
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number, format_date_indian
 from utils.validation import validate_required_fields, safe_decimal
-from utils.expiry_utils import get_fefo_allocation, get_days_to_expiry, get_expiry_status
+from utils.expiry_utils import get_fefo_allocation_batch, get_days_to_expiry, get_expiry_status
+from utils.lineage import record_lineage_edges
+from utils.pagination import keyset_condition, split_keyset_page
+from utils.stock_ledger import set_stock_movement_context
 
 # Create Blueprint
 sku_outbound_bp = Blueprint('sku_outbound', __name__)
@@ -154,6 +160,81 @@ def get_gst_rate_for_sku(sku_id, cur):
         raise ValueError(f"Error retrieving GST rate for SKU {sku_id}: {str(e)}")
 
 
+def get_gst_rates_for_skus(sku_ids, cur):
+    """
+    Get GST rates for many SKUs in one query.
+    Same lookup as get_gst_rate_for_sku: Oil category subcategory by
+    oil_type, falling back to category_id 8.
+    
+    NO FALLBACK VERSION: Raises for the first SKU without a GST rate
+    
+    Args:
+        sku_ids: List of SKU IDs
+        cur: Database cursor
+    
+    Returns:
+        dict: sku_id -> GST rate (float)
+    
+    Raises:
+        ValueError: If any SKU is missing or has no GST rate configured
+    """
+    sku_ids = list({int(sku_id) for sku_id in sku_ids})
+    if not sku_ids:
+        return {}
+    
+    cur.execute("""
+        SELECT 
+            s.sku_id,
+            s.sku_code,
+            s.product_name,
+            s.oil_type,
+            COALESCE(oil_cat.gst_rate, fallback.gst_rate) as gst_rate
+        FROM sku_master s
+        LEFT JOIN LATERAL (
+            SELECT sc.gst_rate
+            FROM subcategories_master sc
+            INNER JOIN categories_master c ON sc.category_id = c.category_id
+            WHERE sc.oil_type = s.oil_type
+                AND c.category_name = 'Oil'
+                AND sc.gst_rate IS NOT NULL
+                AND sc.is_active = true
+            ORDER BY sc.subcategory_id
+            LIMIT 1
+        ) oil_cat ON true
+        LEFT JOIN LATERAL (
+            SELECT sc.gst_rate
+            FROM subcategories_master sc
+            WHERE sc.oil_type = s.oil_type
+                AND sc.category_id = 8
+                AND sc.gst_rate IS NOT NULL
+            ORDER BY sc.subcategory_id
+            LIMIT 1
+        ) fallback ON true
+        WHERE s.sku_id = ANY(%s)
+    """, (sku_ids,))
+    
+    rates = {}
+    for sku_id, sku_code, product_name, oil_type, gst_rate in cur.fetchall():
+        if not oil_type:
+            raise ValueError(
+                f"Oil type not configured for SKU: {sku_code} - {product_name}. "
+                f"Please configure oil_type in SKU master."
+            )
+        if gst_rate is None:
+            raise ValueError(
+                f"GST rate not configured for oil type '{oil_type}' "
+                f"(SKU: {sku_code} - {product_name}). "
+                f"Please configure GST rate in subcategories master for {oil_type} oil."
+            )
+        rates[sku_id] = float(gst_rate)
+    
+    for sku_id in sku_ids:
+        if sku_id not in rates:
+            raise ValueError(f"SKU with ID {sku_id} not found")
+    
+    return rates
+
+
 def calculate_weight_based_costs(items, transport_cost, handling_cost, cur):
     """
     Calculate cost allocation based on weight
@@ -170,20 +251,22 @@ def calculate_weight_based_costs(items, transport_cost, handling_cost, cur):
     total_weight = Decimal('0')
     item_weights = []
     
+    # Fetch unit weights for all SKUs at once
+    cur.execute("""
+        SELECT sku_id, packaged_weight_kg
+        FROM sku_master
+        WHERE sku_id = ANY(%s)
+    """, (list({int(item['sku_id']) for item in items}),))
+    weight_map = {row[0]: row[1] for row in cur.fetchall()}
+    
     # Calculate total weight
     for item in items:
-        cur.execute("""
-            SELECT packaged_weight_kg
-            FROM sku_master
-            WHERE sku_id = %s
-        """, (item['sku_id'],))
-        
-        result = cur.fetchone()
-        if not result or result[0] is None:
+        weight = weight_map.get(int(item['sku_id']))
+        if weight is None:
             # Default weight if not set
             unit_weight = Decimal('1.0')
         else:
-            unit_weight = Decimal(str(result[0]))
+            unit_weight = Decimal(str(weight))
         
         item_weight = unit_weight * Decimal(str(item['quantity_ordered']))
         item_weights.append({
@@ -458,6 +541,288 @@ def update_expiry_tracking_quantity(tracking_id, quantity_used, cur):
     return result[0]
 
 
+def deplete_inventory_bulk(location_id, quantities_by_sku, cur):
+    """
+    Deplete several SKUs at one location in a single UPDATE.
+    Same guarantee as deplete_inventory_atomic: a SKU row is only
+    touched when it holds enough stock, otherwise the whole call fails.
+    
+    Args:
+        location_id: Source location ID
+        quantities_by_sku: dict of sku_id -> quantity to deplete
+        cur: Database cursor
+    
+    Raises:
+        InsufficientInventoryError: If any SKU lacks inventory
+    """
+    if not quantities_by_sku:
+        return
+    
+    sku_ids = list(quantities_by_sku.keys())
+    quantities = [quantities_by_sku[sku_id] for sku_id in sku_ids]
+    
+    cur.execute("""
+        UPDATE sku_inventory si
+        SET quantity_available = si.quantity_available - d.quantity,
+            last_updated = CURRENT_TIMESTAMP
+        FROM unnest(%s::int[], %s::numeric[]) AS d(sku_id, quantity)
+        WHERE si.sku_id = d.sku_id
+            AND si.location_id = %s
+            AND si.quantity_available >= d.quantity
+        RETURNING si.sku_id
+    """, (sku_ids, quantities, location_id))
+    
+    depleted = {row[0] for row in cur.fetchall()}
+    if len(depleted) == len(sku_ids):
+        return
+    
+    # Report the first SKU that failed, matching deplete_inventory_atomic
+    sku_id = next(sku_id for sku_id in sku_ids if sku_id not in depleted)
+    cur.execute("""
+        SELECT quantity_available 
+        FROM sku_inventory 
+        WHERE sku_id = %s AND location_id = %s
+    """, (sku_id, location_id))
+    
+    existing = cur.fetchone()
+    if existing:
+        raise InsufficientInventoryError(
+            f"Insufficient inventory. Available: {existing[0]}, Required: {quantities_by_sku[sku_id]}"
+        )
+    raise InsufficientInventoryError(
+        f"No inventory record found for SKU {sku_id} at location {location_id}"
+    )
+
+
+def add_inventory_bulk(location_id, additions, cur):
+    """
+    Add several SKUs to a destination location in a single upsert.
+    
+    Args:
+        location_id: Destination location ID
+        additions: dict of sku_id -> dict(quantity, production_id, mrp, expiry_date)
+        cur: Database cursor
+    """
+    if not additions:
+        return
+    
+    execute_values(cur, """
+        INSERT INTO sku_inventory (
+            sku_id, location_id, production_id,
+            quantity_available, mrp, expiry_date,
+            status, created_at, updated_at
+        )
+        VALUES %s
+        ON CONFLICT (sku_id, location_id) 
+        DO UPDATE SET 
+            quantity_available = sku_inventory.quantity_available + EXCLUDED.quantity_available,
+            last_updated = CURRENT_TIMESTAMP
+    """, [
+        (sku_id, location_id, add['production_id'], add['quantity'], add['mrp'], add['expiry_date'])
+        for sku_id, add in additions.items()
+    ], template="(%s, %s, %s, %s, %s, %s, 'active', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)")
+
+
+def update_expiry_tracking_bulk(quantities_by_tracking, new_location_id, cur):
+    """
+    Consume quantities from several expiry tracking lots in a single UPDATE,
+    optionally moving them to a new location (internal transfers).
+    
+    Args:
+        quantities_by_tracking: dict of tracking_id -> quantity consumed
+        new_location_id: New location ID, or None to keep the current one
+        cur: Database cursor
+    
+    Raises:
+        InsufficientInventoryError: If any lot lacks the quantity
+    """
+    if not quantities_by_tracking:
+        return
+    
+    tracking_ids = list(quantities_by_tracking.keys())
+    quantities = [quantities_by_tracking[tracking_id] for tracking_id in tracking_ids]
+    
+    cur.execute("""
+        UPDATE sku_expiry_tracking et
+        SET quantity_remaining = et.quantity_remaining - d.quantity,
+            status = CASE 
+                WHEN et.quantity_remaining - d.quantity <= 0 THEN 'consumed'
+                ELSE et.status
+            END,
+            location_id = COALESCE(%s, et.location_id),
+            updated_at = CURRENT_TIMESTAMP
+        FROM unnest(%s::int[], %s::numeric[]) AS d(tracking_id, quantity)
+        WHERE et.tracking_id = d.tracking_id
+            AND et.quantity_remaining >= d.quantity
+        RETURNING et.tracking_id
+    """, (new_location_id, tracking_ids, quantities))
+    
+    updated = {row[0] for row in cur.fetchall()}
+    for tracking_id in tracking_ids:
+        if tracking_id not in updated:
+            raise InsufficientInventoryError(
+                f"Insufficient quantity in expiry tracking {tracking_id}"
+            )
+
+
+def insert_outbound_items_bulk(outbound_id, item_rows, cur):
+    """
+    Insert all outbound line items in one statement.
+    
+    Args:
+        outbound_id: Parent outbound ID
+        item_rows: List of tuples in sku_outbound_items column order
+                   (sku_id through notes)
+        cur: Database cursor
+    
+    Returns:
+        list: item_ids in the same order as item_rows
+    """
+    if not item_rows:
+        return []
+    
+    rows = execute_values(cur, """
+        INSERT INTO sku_outbound_items (
+            outbound_id, sku_id,
+            quantity_ordered, quantity_shipped,
+            allocation_data,
+            item_weight_kg,
+            transport_cost_per_unit, transport_cost_per_kg,
+            handling_cost_per_unit, handling_cost_per_kg,
+            unit_price, base_price, gst_rate, gst_amount, line_total,
+            notes
+        ) VALUES %s
+        RETURNING item_id
+    """, [(outbound_id,) + tuple(row) for row in item_rows], fetch=True)
+    
+    return [row[0] for row in rows]
+
+
+def insert_outbound_allocations_bulk(outbound_id, item_allocations, cur):
+    """
+    Write the normalized allocation rows for an outbound's items.
+    sku_outbound_item_allocations mirrors allocation_data so traces and
+    dependency checks can use indexes on traceable code and production.
+    
+    Args:
+        outbound_id: Parent outbound ID
+        item_allocations: List of (item_id, sku_id, allocation dict) tuples
+        cur: Database cursor
+    """
+    if not item_allocations:
+        return
+    
+    execute_values(cur, """
+        INSERT INTO sku_outbound_item_allocations (
+            item_id, outbound_id, sku_id, tracking_id, production_id,
+            production_code, sku_traceable_code, quantity, expiry_date,
+            mrp, production_cost
+        ) VALUES %s
+    """, [
+        (
+            item_id,
+            outbound_id,
+            sku_id,
+            allocation.get('tracking_id'),
+            allocation.get('production_id'),
+            allocation.get('production_code'),
+            allocation.get('sku_traceable_code'),
+            safe_decimal(allocation.get('quantity')),
+            parse_date(allocation['expiry_date']) if allocation.get('expiry_date') else None,
+            safe_decimal(allocation['mrp']) if allocation.get('mrp') is not None else None,
+            safe_decimal(allocation['production_cost']) if allocation.get('production_cost') is not None else None
+        )
+        for item_id, sku_id, allocation in item_allocations
+    ])
+
+
+def post_sales_fact_deltas(outbound_ids, sign, cur):
+    """
+    Add or reverse the daily sales facts of sales outbounds
+    (see migrations/012). Reversals must be posted before the outbound
+    or its items are marked cancelled.
+    
+    Args:
+        outbound_ids: List of outbound IDs (non-sales outbounds are ignored)
+        sign: 1 to add, -1 to reverse
+        cur: Database cursor
+    
+    Returns:
+        int: Number of fact rows touched
+    """
+    if not outbound_ids:
+        return 0
+    
+    cur.execute("SELECT post_sales_fact_deltas(%s::int[], %s)", (list(outbound_ids), sign))
+    return cur.fetchone()[0]
+
+
+def build_outbound_filters(filters, alias='o'):
+    """
+    WHERE conditions for outbound lists, newest first, keyed on
+    (outbound_date, outbound_id) so every filter combination can use the
+    composite indexes from migrations/013.
+    
+    Args:
+        filters: Dict with any of transaction_type, customer_id,
+                 location_id (from or to), from_location_id, status,
+                 sku_id, start_date, end_date, cursor
+        alias: Alias of sku_outbound in the query
+    
+    Returns:
+        tuple: (list of SQL conditions, list of params)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    conditions = []
+    params = []
+    
+    if filters.get('transaction_type'):
+        conditions.append(f"{alias}.transaction_type = %s")
+        params.append(filters['transaction_type'])
+    
+    if filters.get('customer_id'):
+        conditions.append(f"{alias}.customer_id = %s")
+        params.append(int(filters['customer_id']))
+    
+    if filters.get('from_location_id'):
+        conditions.append(f"{alias}.from_location_id = %s")
+        params.append(int(filters['from_location_id']))
+    
+    if filters.get('location_id'):
+        conditions.append(f"({alias}.from_location_id = %s OR {alias}.to_location_id = %s)")
+        params.extend([int(filters['location_id'])] * 2)
+    
+    if filters.get('status'):
+        conditions.append(f"{alias}.status = %s")
+        params.append(filters['status'])
+    
+    if filters.get('sku_id'):
+        conditions.append(f"""EXISTS (
+            SELECT 1 FROM sku_outbound_items fi
+            WHERE fi.outbound_id = {alias}.outbound_id AND fi.sku_id = %s
+        )""")
+        params.append(int(filters['sku_id']))
+    
+    if filters.get('start_date'):
+        conditions.append(f"{alias}.outbound_date >= %s")
+        params.append(parse_date(filters['start_date']))
+    
+    if filters.get('end_date'):
+        conditions.append(f"{alias}.outbound_date <= %s")
+        params.append(parse_date(filters['end_date']))
+    
+    cursor_condition, cursor_params = keyset_condition(
+        filters, f'{alias}.outbound_date', f'{alias}.outbound_id'
+    )
+    if cursor_condition:
+        conditions.append(cursor_condition)
+        params.extend(cursor_params)
+    
+    return conditions, params
+
+
 # ============================================
 # CUSTOM EXCEPTIONS
 # ============================================
@@ -692,6 +1057,16 @@ def create_outbound():
                     'error': f'Missing required fields: {", ".join(missing_fields)}'
                 }), 400
             
+            # Quantities are whole bottles; reject fractions instead of truncating them
+            for item in data['items']:
+                quantity = safe_decimal(item.get('quantity_ordered'))
+                if quantity <= 0 or quantity != quantity.to_integral_value():
+                    return jsonify({
+                        'success': False,
+                        'error': f"quantity_ordered must be a positive whole number (SKU {item.get('sku_id')})"
+                    }), 400
+                item['quantity_ordered'] = int(quantity)
+            
             transaction_type = data['transaction_type']
             from_location_id = data['from_location_id']
             
@@ -754,26 +1129,26 @@ def create_outbound():
                 data['items'], transport_cost, handling_cost, cur
             )
             
-            # Build cost allocation lookup
-            cost_allocation_map = {item['sku_id']: item for item in cost_allocations}
-            
             # Calculate totals for sales transactions
             subtotal = Decimal('0')
             total_gst = Decimal('0')
             
             if transaction_type == 'sales':
+                # Get GST rates for all priced SKUs at once
+                try:
+                    gst_rates = get_gst_rates_for_skus(
+                        [item['sku_id'] for item in data['items'] if item.get('unit_price')], cur
+                    )
+                except ValueError as e:
+                    conn.rollback()
+                    return jsonify({'success': False, 'error': str(e)}), 400
+                
                 for item in data['items']:
                     if item.get('unit_price'):
                         # Unit price is inclusive of GST
                         inclusive_price = safe_decimal(item['unit_price'])
                         quantity = safe_decimal(item['quantity_ordered'])
-                        
-                        # Get GST rate for this SKU
-                        try:
-                            sku_gst_rate = get_gst_rate_for_sku(item['sku_id'], cur)
-                        except ValueError as e:
-                            conn.rollback()
-                            return jsonify({'success': False, 'error': str(e)}), 400
+                        sku_gst_rate = gst_rates[int(item['sku_id'])]
                         
                         # Calculate base price from inclusive price
                         base_price = calculate_base_from_inclusive(inclusive_price, sku_gst_rate)
@@ -847,47 +1222,51 @@ def create_outbound():
             ))
             
             outbound_id = cur.fetchone()[0]
+            set_stock_movement_context(outbound_date, 'sku_outbound', outbound_id, cur)
             
-            # Process each item
-            for item in data['items']:
-                sku_id = item['sku_id']
-                quantity_ordered = int(item['quantity_ordered'])
+            # Auto-allocate all items without explicit allocations using FEFO
+            # in one query, reserving the chosen lots for this transaction
+            auto_items = [item for item in data['items'] if not item.get('allocations')]
+            fefo_results = get_fefo_allocation_batch(
+                conn,
+                [(item['sku_id'], from_location_id, item['quantity_ordered']) for item in auto_items],
+                reserve=True
+            )
+            fefo_by_item = {id(item): result for item, result in zip(auto_items, fefo_results)}
+            
+            # Build all line items and allocations in memory
+            item_rows = []
+            allocations_per_item = []
+            depletion_by_sku = {}
+            consumption_by_tracking = {}
+            additions_by_sku = {}
+            
+            for item, cost_alloc in zip(data['items'], cost_allocations):
+                sku_id = int(item['sku_id'])
+                quantity_ordered = item['quantity_ordered']
                 allocations = item.get('allocations', [])
                 
-                # Get cost allocation for this item
-                cost_alloc = cost_allocation_map.get(sku_id, {})
-                
                 if not allocations:
-                    # Auto-allocate using FEFO if not provided
-                    availability = check_sku_availability(
-                        sku_id, quantity_ordered, from_location_id, cur
-                    )
+                    fefo = fefo_by_item[id(item)]
                     
-                    if not availability['success']:
+                    if not fefo['success']:
                         raise InsufficientInventoryError(
                             f"Insufficient inventory for SKU {sku_id}"
                         )
                     
-                    # Create allocations from available batches
+                    # Create allocations from the FEFO lots
                     allocations = []
-                    remaining = quantity_ordered
-                    
-                    for batch in availability['available_batches']:
-                        if remaining <= 0:
-                            break
-                        
-                        alloc_qty = min(remaining, batch['quantity_remaining'])
+                    for lot in fefo['allocations']:
                         allocations.append({
-                            'tracking_id': batch['tracking_id'],
-                            'production_id': batch['production_id'],
-                            'production_code': batch['production_code'],
-                            'sku_traceable_code': batch['sku_traceable_code'],
-                            'quantity': alloc_qty,
-                            'expiry_date': batch['expiry_date'],
-                            'mrp': batch['mrp'],
-                            'production_cost': batch['production_cost']
+                            'tracking_id': lot['tracking_id'],
+                            'production_id': lot['production_id'],
+                            'production_code': lot['production_code'],
+                            'sku_traceable_code': lot['traceable_code'],
+                            'quantity': lot['quantity_allocated'],
+                            'expiry_date': integer_to_date(lot['expiry_date'], '%d-%m-%Y') if lot['expiry_date'] else None,
+                            'mrp': lot['mrp'] or 0,
+                            'production_cost': lot['cost_per_bottle']
                         })
-                        remaining -= alloc_qty
                 
                 # Prepare allocation data for JSONB
                 allocation_data = {
@@ -909,21 +1288,7 @@ def create_outbound():
                     gst_amount = None
                     line_total = None
                 
-                # Insert outbound item
-                cur.execute("""
-                    INSERT INTO sku_outbound_items (
-                        outbound_id, sku_id,
-                        quantity_ordered, quantity_shipped,
-                        allocation_data,
-                        item_weight_kg,
-                        transport_cost_per_unit, transport_cost_per_kg,
-                        handling_cost_per_unit, handling_cost_per_kg,
-                        unit_price, base_price, gst_rate, gst_amount, line_total,
-                        notes
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING item_id
-                """, (
-                    outbound_id,
+                item_rows.append((
                     sku_id,
                     quantity_ordered,
                     quantity_ordered,  # Initially shipped = ordered
@@ -941,44 +1306,72 @@ def create_outbound():
                     item.get('notes')
                 ))
                 
-                item_id = cur.fetchone()[0]
+                allocations_per_item.append((sku_id, allocations))
                 
-                # Process inventory changes based on allocations
+                # Accumulate inventory changes based on allocations
                 for allocation in allocations:
-                    tracking_id = allocation['tracking_id']
-                    quantity = allocation['quantity']
+                    tracking_id = int(allocation['tracking_id'])
+                    quantity = safe_decimal(allocation['quantity'])
                     
-                    # Deplete from source location
-                    deplete_inventory_atomic(sku_id, from_location_id, quantity, cur)
-                    
-                    # Update expiry tracking quantity
-                    update_expiry_tracking_quantity(tracking_id, quantity, cur)
+                    depletion_by_sku[sku_id] = depletion_by_sku.get(sku_id, Decimal('0')) + quantity
+                    consumption_by_tracking[tracking_id] = (
+                        consumption_by_tracking.get(tracking_id, Decimal('0')) + quantity
+                    )
                     
                     # For internal transfers to own warehouse, add to destination
                     if transaction_type == 'transfer' and to_location[0] == 'own':
-                        add_inventory_atomic(
-                            sku_id,
-                            data['to_location_id'],
-                            quantity,
-                            allocation['production_id'],
-                            allocation['mrp'],
-                            parse_date(allocation['expiry_date']) if allocation['expiry_date'] else None,
-                            cur
-                        )
-                        
-                        # Update expiry tracking location
-                        update_expiry_tracking_location(
-                            [tracking_id],
-                            data['to_location_id'],
-                            cur
-                        )
+                        if sku_id in additions_by_sku:
+                            additions_by_sku[sku_id]['quantity'] += quantity
+                        else:
+                            additions_by_sku[sku_id] = {
+                                'quantity': quantity,
+                                'production_id': allocation['production_id'],
+                                'mrp': allocation['mrp'],
+                                'expiry_date': parse_date(allocation['expiry_date']) if allocation['expiry_date'] else None
+                            }
                     
-                    # For sales to warehouse locations (third-party), also update tracking
-                    elif transaction_type == 'sales' and to_location_id:
-                        # Record delivery to third-party warehouse
-                        # Note: We don't add to inventory as it's not our location
-                        # But we can track where the batch went
-                        pass
+                    # Sales to third-party warehouses are not added to our inventory;
+                    # the allocation data records where the batch went
+            
+            # Post everything as a handful of set-based statements
+            item_ids = insert_outbound_items_bulk(outbound_id, item_rows, cur)
+            insert_outbound_allocations_bulk(outbound_id, [
+                (item_id, sku_id, allocation)
+                for item_id, (sku_id, allocations) in zip(item_ids, allocations_per_item)
+                for allocation in allocations
+            ], cur)
+            
+            # Link the outbound to the productions it shipped for genealogy traces
+            shipped_by_production = {}
+            for _, allocations in allocations_per_item:
+                for allocation in allocations:
+                    if allocation.get('production_id'):
+                        production_id = int(allocation['production_id'])
+                        shipped_by_production[production_id] = (
+                            shipped_by_production.get(production_id, Decimal('0'))
+                            + safe_decimal(allocation['quantity'])
+                        )
+            record_lineage_edges([
+                ('sku_production', production_id, 'outbound', outbound_id, quantity)
+                for production_id, quantity in shipped_by_production.items()
+            ], cur)
+            
+            # Deplete from source location
+            deplete_inventory_bulk(from_location_id, depletion_by_sku, cur)
+            
+            # Update expiry tracking quantity (and location for internal transfers)
+            moves_to_own_location = transaction_type == 'transfer' and to_location[0] == 'own'
+            update_expiry_tracking_bulk(
+                consumption_by_tracking,
+                data['to_location_id'] if moves_to_own_location else None,
+                cur
+            )
+            
+            if moves_to_own_location:
+                add_inventory_bulk(data['to_location_id'], additions_by_sku, cur)
+            
+            if transaction_type == 'sales':
+                post_sales_fact_deltas([outbound_id], 1, cur)
             
             # Commit transaction
             conn.commit()
@@ -1044,96 +1437,93 @@ def create_outbound():
     }), 503
 
 
+# Outbound history columns, shared by the paged list and the export
+OUTBOUND_HISTORY_SQL = """
+    WITH page AS (
+        SELECT o.*
+        FROM sku_outbound o
+        WHERE {conditions}
+        ORDER BY o.outbound_date DESC, o.outbound_id DESC
+        {limit}
+    )
+    SELECT 
+        o.outbound_id,
+        o.outbound_code,
+        o.transaction_type,
+        o.outbound_date,
+        o.dispatch_date,
+        fl.location_name as from_location,
+        COALESCE(tl.location_name, stl.location_name) as to_location,
+        c.customer_name,
+        stl.location_name as ship_to_location,
+        o.status,
+        o.transport_cost,
+        o.handling_cost,
+        o.total_shipment_weight_kg,
+        o.subtotal,
+        o.total_gst_amount,
+        o.grand_total,
+        o.created_at,
+        items.sku_count,
+        items.total_units,
+        o.invoice_number
+    FROM page o
+    JOIN locations_master fl ON o.from_location_id = fl.location_id
+    LEFT JOIN locations_master tl ON o.to_location_id = tl.location_id
+    LEFT JOIN customers c ON o.customer_id = c.customer_id
+    LEFT JOIN customer_ship_to_locations stl ON o.ship_to_location_id = stl.ship_to_id
+    LEFT JOIN LATERAL (
+        SELECT COUNT(DISTINCT oi.sku_id) as sku_count,
+               SUM(oi.quantity_shipped) as total_units
+        FROM sku_outbound_items oi
+        WHERE oi.outbound_id = o.outbound_id
+    ) items ON true
+    ORDER BY o.outbound_date DESC, o.outbound_id DESC
+"""
+
+OUTBOUND_EXPORT_COLUMNS = [
+    'outbound_code', 'transaction_type', 'outbound_date', 'dispatch_date',
+    'from_location', 'to_location', 'customer_name', 'ship_to_location',
+    'status', 'invoice_number', 'sku_count', 'total_units',
+    'total_shipment_weight_kg', 'transport_cost', 'handling_cost',
+    'subtotal', 'total_gst_amount', 'grand_total'
+]
+
+
 @sku_outbound_bp.route('/api/sku/outbound/history', methods=['GET'])
 def get_outbound_history():
-    """Get outbound transaction history with GST details"""
+    """
+    Get outbound transaction history with GST details, newest first.
+    Pass next_cursor from a response as ?cursor= to get the next page;
+    offset is still honoured when no cursor is given.
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        # Get filter parameters
-        transaction_type = request.args.get('transaction_type')
-        from_location_id = request.args.get('from_location_id')
-        customer_id = request.args.get('customer_id')
-        start_date = request.args.get('start_date')  # Expected in DD-MM-YYYY
-        end_date = request.args.get('end_date')      # Expected in DD-MM-YYYY
-        status = request.args.get('status')
-        limit = int(request.args.get('limit', 50))
+        limit = min(int(request.args.get('limit', 50)), 500)
         offset = int(request.args.get('offset', 0))
         
-        # Build query
-        query = """
-            SELECT 
-                o.outbound_id,
-                o.outbound_code,
-                o.transaction_type,
-                o.outbound_date,
-                o.dispatch_date,
-                fl.location_name as from_location,
-                COALESCE(tl.location_name, stl.location_name) as to_location,
-                c.customer_name,
-                stl.location_name as ship_to_location,
-                o.status,
-                o.transport_cost,
-                o.handling_cost,
-                o.total_shipment_weight_kg,
-                o.subtotal,
-                o.total_gst_amount,
-                o.grand_total,
-                o.created_at,
-                COUNT(DISTINCT oi.sku_id) as sku_count,
-                SUM(oi.quantity_shipped) as total_units
-            FROM sku_outbound o
-            JOIN locations_master fl ON o.from_location_id = fl.location_id
-            LEFT JOIN locations_master tl ON o.to_location_id = tl.location_id
-            LEFT JOIN customers c ON o.customer_id = c.customer_id
-            LEFT JOIN customer_ship_to_locations stl ON o.ship_to_location_id = stl.ship_to_id
-            LEFT JOIN sku_outbound_items oi ON o.outbound_id = oi.outbound_id
-            WHERE 1=1
-        """
-        
-        params = []
-        
-        if transaction_type:
-            query += " AND o.transaction_type = %s"
-            params.append(transaction_type)
-        
-        if from_location_id:
-            query += " AND o.from_location_id = %s"
-            params.append(from_location_id)
-        
-        if customer_id:
-            query += " AND o.customer_id = %s"
-            params.append(customer_id)
+        try:
+            conditions, params = build_outbound_filters(request.args)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
         
-        if start_date:
-            query += " AND o.outbound_date >= %s"
-            params.append(parse_date(start_date))  # Parse DD-MM-YYYY
+        limit_sql = "LIMIT %s"
+        params.append(limit + 1)
+        if offset and not request.args.get('cursor'):
+            limit_sql += " OFFSET %s"
+            params.append(offset)
         
-        if end_date:
-            query += " AND o.outbound_date <= %s"
-            params.append(parse_date(end_date))    # Parse DD-MM-YYYY
-        
-        if status:
-            query += " AND o.status = %s"
-            params.append(status)
-        
-        query += """
-            GROUP BY o.outbound_id, o.outbound_code, o.transaction_type,
-                     o.outbound_date, o.dispatch_date, fl.location_name,
-                     tl.location_name, c.customer_name, stl.location_name,
-                     o.status, o.transport_cost, o.handling_cost,
-                     o.total_shipment_weight_kg, o.subtotal, o.total_gst_amount,
-                     o.grand_total, o.created_at
-            ORDER BY o.outbound_date DESC, o.outbound_id DESC
-            LIMIT %s OFFSET %s
-        """
-        params.extend([limit, offset])
+        cur.execute(OUTBOUND_HISTORY_SQL.format(
+            conditions=' AND '.join(conditions) or 'true',
+            limit=limit_sql
+        ), params)
         
-        cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 3, 0)
         
         outbounds = []
-        for row in cur.fetchall():
+        for row in rows:
             outbound_data = {
                 'outbound_id': row[0],
                 'outbound_code': row[1],
@@ -1171,7 +1561,9 @@ def get_outbound_history():
         return jsonify({
             'success': True,
             'outbounds': outbounds,
-            'count': len(outbounds)
+            'count': len(outbounds),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -1180,6 +1572,95 @@ def get_outbound_history():
         close_connection(conn, cur)
 
 
+@sku_outbound_bp.route('/api/sku/outbound/history/export', methods=['GET'])
+def export_outbound_history():
+    """
+    Stream the filtered outbound history as CSV (default) or NDJSON.
+    Rows are read through a server-side cursor, so memory stays flat
+    for any date range.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    
+    try:
+        conditions, params = build_outbound_filters(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    query = OUTBOUND_HISTORY_SQL.format(
+        conditions=' AND '.join(conditions) or 'true',
+        limit=''
+    )
+    
+    def export_value(value):
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+    
+    def generate():
+        conn = get_db_connection()
+        cur = conn.cursor(name='outbound_history_export')
+        cur.itersize = 2000
+        
+        try:
+            cur.execute(query, params)
+            
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(OUTBOUND_EXPORT_COLUMNS)
+            
+            for row in cur:
+                record = {
+                    'outbound_code': row[1],
+                    'transaction_type': row[2],
+                    'outbound_date': integer_to_date(row[3], '%d-%m-%Y'),
+                    'dispatch_date': integer_to_date(row[4], '%d-%m-%Y') if row[4] else None,
+                    'from_location': row[5],
+                    'to_location': row[6],
+                    'customer_name': row[7],
+                    'ship_to_location': row[8],
+                    'status': row[9],
+                    'invoice_number': row[19],
+                    'sku_count': row[17] or 0,
+                    'total_units': int(row[18]) if row[18] else 0,
+                    'total_shipment_weight_kg': export_value(row[12]),
+                    'transport_cost': export_value(row[10]),
+                    'handling_cost': export_value(row[11]),
+                    'subtotal': export_value(row[13]),
+                    'total_gst_amount': export_value(row[14]),
+                    'grand_total': export_value(row[15])
+                }
+                
+                if export_format == 'csv':
+                    writer.writerow(
+                        '' if record[column] is None else record[column]
+                        for column in OUTBOUND_EXPORT_COLUMNS
+                    )
+                    if buffer.tell() > 65536:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                else:
+                    yield json.dumps(record) + '\n'
+            
+            if export_format == 'csv':
+                yield buffer.getvalue()
+        finally:
+            close_connection(conn, cur)
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={
+            'Content-Disposition': f'attachment; filename=outbound_history_{timestamp}.{extension}'
+        }
+    )
+
+
 @sku_outbound_bp.route('/api/sku/outbound/<int:outbound_id>', methods=['GET'])
 def get_outbound_details(outbound_id):
     """Get detailed information for a specific outbound transaction with GST breakdown"""
@@ -1393,7 +1874,7 @@ def trace_batch(traceable_code):
     cur = conn.cursor()
     
     try:
-        # Search in allocation data for the traceable code
+        # Look up allocations of this traceable code through the normalized index
         cur.execute("""
             SELECT 
                 o.outbound_id,
@@ -1405,8 +1886,8 @@ def trace_batch(traceable_code):
                 stl.location_name as ship_to_location,
                 s.sku_code,
                 s.product_name,
-                oi.quantity_shipped,
-                oi.allocation_data,
+                a.quantity,
+                a.expiry_date,
                 oi.unit_price,
                 oi.base_price,
                 oi.gst_rate,
@@ -1417,51 +1898,42 @@ def trace_batch(traceable_code):
                 END as delivery_type,
                 tl.location_code as warehouse_code,
                 stl.location_code as ship_to_code
-            FROM sku_outbound o
-            JOIN sku_outbound_items oi ON o.outbound_id = oi.outbound_id
+            FROM sku_outbound_item_allocations a
+            JOIN sku_outbound_items oi ON a.item_id = oi.item_id
+            JOIN sku_outbound o ON a.outbound_id = o.outbound_id
             JOIN sku_master s ON oi.sku_id = s.sku_id
             JOIN locations_master fl ON o.from_location_id = fl.location_id
             LEFT JOIN locations_master tl ON o.to_location_id = tl.location_id
             LEFT JOIN customers c ON o.customer_id = c.customer_id
             LEFT JOIN customer_ship_to_locations stl ON o.ship_to_location_id = stl.ship_to_id
-            WHERE oi.allocation_data::text LIKE %s
+            WHERE a.sku_traceable_code = %s
             ORDER BY o.outbound_date DESC
-        """, (f'%{traceable_code}%',))
+        """, (traceable_code,))
         
         movements = []
         for row in cur.fetchall():
-            # Extract specific allocation for this traceable code
-            allocations = row[10].get('allocations', []) if row[10] else []
-            specific_allocation = None
+            movement = {
+                'outbound_code': row[1],
+                'outbound_date': integer_to_date(row[2], '%d-%m-%Y'),
+                'transaction_type': row[3],
+                'from_location': row[4],
+                'destination': row[5],
+                'ship_to_location': row[6],
+                'sku_code': row[7],
+                'product_name': row[8],
+                'quantity': float(row[9]),
+                'expiry_date': integer_to_date(row[10], '%d-%m-%Y') if row[10] else None,
+                'delivery_type': row[14],
+                'location_code': row[15] or row[16]  # Warehouse code or ship-to code
+            }
             
-            for alloc in allocations:
-                if alloc.get('sku_traceable_code') == traceable_code:
-                    specific_allocation = alloc
-                    break
+            # Add sales information if applicable
+            if row[3] == 'sales':
+                movement['unit_price_inclusive'] = float(row[11]) if row[11] else None
+                movement['base_price'] = float(row[12]) if row[12] else None
+                movement['gst_rate'] = float(row[13]) if row[13] else None
             
-            if specific_allocation:
-                movement = {
-                    'outbound_code': row[1],
-                    'outbound_date': integer_to_date(row[2], '%d-%m-%Y'),
-                    'transaction_type': row[3],
-                    'from_location': row[4],
-                    'destination': row[5],
-                    'ship_to_location': row[6],
-                    'sku_code': row[7],
-                    'product_name': row[8],
-                    'quantity': specific_allocation['quantity'],
-                    'expiry_date': specific_allocation.get('expiry_date'),
-                    'delivery_type': row[14],
-                    'location_code': row[15] or row[16]  # Warehouse code or ship-to code
-                }
-                
-                # Add sales information if applicable
-                if row[3] == 'sales':
-                    movement['unit_price_inclusive'] = float(row[11]) if row[11] else None
-                    movement['base_price'] = float(row[12]) if row[12] else None
-                    movement['gst_rate'] = float(row[13]) if row[13] else None
-                
-                movements.append(movement)
+            movements.append(movement)
         
         # Also get production details for this traceable code
         cur.execute("""
@@ -1521,11 +1993,14 @@ def update_outbound_status(outbound_id):
                 'error': 'Invalid status'
             }), 400
         
-        # Check current status
+        # Check current status; the row lock makes concurrent updates
+        # (e.g. two cancels) see each other's result, so the sales fact
+        # delta is posted once
         cur.execute("""
             SELECT status, transaction_type 
             FROM sku_outbound 
             WHERE outbound_id = %s
+            FOR UPDATE
         """, (outbound_id,))
         
         result = cur.fetchone()
@@ -1547,6 +2022,10 @@ def update_outbound_status(outbound_id):
                 'error': 'Cannot cancel dispatched/delivered transaction'
             }), 400
         
+        # Cancelled sales drop out of the sales facts
+        if new_status == 'cancelled':
+            post_sales_fact_deltas([outbound_id], -1, cur)
+        
         # Update status
         cur.execute("""
             UPDATE sku_outbound
@@ -1740,26 +2219,22 @@ def get_outbound_stats():
         
         cur.execute("""
             SELECT 
-                COALESCE(SUM(o.subtotal), 0) as monthly_revenue,
-                COALESCE(SUM(o.total_gst_amount), 0) as monthly_gst,
-                COALESCE(SUM(oi.quantity_shipped), 0) as monthly_units_sold
-            FROM sku_outbound o
-            LEFT JOIN sku_outbound_items oi ON o.outbound_id = oi.outbound_id
-            WHERE o.transaction_type = 'sales'
-            AND o.status != 'cancelled'
-            AND o.outbound_date >= %s
-            AND o.outbound_date <= %s
+                COALESCE(SUM(revenue), 0) as monthly_revenue,
+                COALESCE(SUM(gst_amount), 0) as monthly_gst,
+                COALESCE(SUM(units), 0) as monthly_units_sold
+            FROM sales_daily_facts
+            WHERE sale_date >= %s
+            AND sale_date <= %s
         """, (first_day_integer, today_integer))
         monthly_stats = cur.fetchone()
         
-        # Active customers (customers with transactions in last 30 days)
+        # Active customers (customers with sales in last 30 days)
         thirty_days_ago = today_integer - 30  # Simple arithmetic since it's days
         cur.execute("""
             SELECT COUNT(DISTINCT customer_id)
-            FROM sku_outbound
-            WHERE customer_id IS NOT NULL
-            AND status != 'cancelled'
-            AND outbound_date >= %s
+            FROM sales_daily_facts
+            WHERE sale_date >= %s
+            AND line_count > 0
         """, (thirty_days_ago,))
         active_customers = cur.fetchone()[0] or 0
         
@@ -1804,7 +2279,7 @@ def get_outbound_stats():
 
 @sku_outbound_bp.route('/api/sku/outbound/sales-summary', methods=['GET'])
 def get_sales_summary():
-    """Get sales summary with GST and margin analysis"""
+    """Get sales summary with GST and margin analysis from the daily sales facts"""
     conn = get_db_connection()
     cur = conn.cursor()
     
@@ -1813,59 +2288,78 @@ def get_sales_summary():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         customer_id = request.args.get('customer_id')
+        sku_id = request.args.get('sku_id')
+        location_id = request.args.get('location_id')
         
-        query = """
+        # Under a SKU filter each outbound counts on that SKU's rows
+        count_column = 'sku_outbound_count' if sku_id else 'outbound_count'
+        
+        query = f"""
             SELECT 
                 c.customer_name,
-                COUNT(DISTINCT o.outbound_id) as transaction_count,
-                SUM(oi.quantity_shipped) as total_units,
-                SUM(oi.item_weight_kg) as total_weight_kg,
-                SUM(oi.transport_cost_per_unit * oi.quantity_shipped) as total_transport_allocated,
-                SUM(oi.handling_cost_per_unit * oi.quantity_shipped) as total_handling_allocated,
-                SUM(oi.base_price * oi.quantity_shipped) as total_revenue,
-                SUM(oi.gst_amount * oi.quantity_shipped) as total_gst,
-                SUM(oi.line_total) as total_sales_value
-            FROM sku_outbound o
-            JOIN customers c ON o.customer_id = c.customer_id
-            JOIN sku_outbound_items oi ON o.outbound_id = oi.outbound_id
-            WHERE o.transaction_type = 'sales'
-                AND o.status != 'cancelled'
+                SUM(f.{count_column}) as transaction_count,
+                SUM(f.units) as total_units,
+                SUM(f.weight_kg) as total_weight_kg,
+                SUM(f.transport_cost) as total_transport_allocated,
+                SUM(f.handling_cost) as total_handling_allocated,
+                SUM(f.revenue) as total_revenue,
+                SUM(f.gst_amount) as total_gst,
+                SUM(f.sales_value) as total_sales_value,
+                SUM(f.production_cost) as total_production_cost
+            FROM sales_daily_facts f
+            JOIN customers c ON f.customer_id = c.customer_id
+            WHERE f.line_count > 0
         """
         
         params = []
         
         if start_date:
-            query += " AND o.outbound_date >= %s"
+            query += " AND f.sale_date >= %s"
             params.append(parse_date(start_date))
         
         if end_date:
-            query += " AND o.outbound_date <= %s"
+            query += " AND f.sale_date <= %s"
             params.append(parse_date(end_date))
         
         if customer_id:
-            query += " AND o.customer_id = %s"
+            query += " AND f.customer_id = %s"
             params.append(customer_id)
         
-        query += " GROUP BY c.customer_name ORDER BY total_revenue DESC"
+        if sku_id:
+            query += " AND f.sku_id = %s"
+            params.append(sku_id)
+        
+        if location_id:
+            query += " AND f.location_id = %s"
+            params.append(location_id)
+        
+        query += " GROUP BY c.customer_id, c.customer_name ORDER BY total_revenue DESC"
         
         cur.execute(query, params)
         
         sales_summary = []
         for row in cur.fetchall():
+            logistics_total = float(row[4] or 0) + float(row[5] or 0)
+            revenue = float(row[6]) if row[6] else 0
+            production_cost = float(row[9]) if row[9] else 0
+            gross_margin = revenue - production_cost - logistics_total
             sales_summary.append({
                 'customer_name': row[0],
-                'transaction_count': row[1],
+                'transaction_count': int(row[1]) if row[1] else 0,
                 'total_units': int(row[2]) if row[2] else 0,
                 'total_weight_kg': float(row[3]) if row[3] else 0,
                 'logistics_costs': {
                     'transport': float(row[4]) if row[4] else 0,
                     'handling': float(row[5]) if row[5] else 0,
-                    'total': (float(row[4] or 0) + float(row[5] or 0))
+                    'total': logistics_total
                 },
-                'revenue': float(row[6]) if row[6] else 0,  # Excluding GST
+                'revenue': revenue,  # Excluding GST
                 'gst_collected': float(row[7]) if row[7] else 0,
                 'total_sales_value': float(row[8]) if row[8] else 0,  # Including GST
-                'cost_per_kg': ((float(row[4] or 0) + float(row[5] or 0)) / float(row[3])) if row[3] else 0
+                'cost_per_kg': (logistics_total / float(row[3])) if row[3] else 0,
+                'production_cost': production_cost,
+                'gross_margin': gross_margin,
+                'margin_percent': (gross_margin / revenue * 100) if revenue else 0
             })
         
         return jsonify({
@@ -1878,3 +2372,111 @@ def get_sales_summary():
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         close_connection(conn, cur)
+
+
+# Margin analysis dimensions -> (group expression, label expression)
+MARGIN_DIMENSIONS = {
+    'customer': ('f.customer_id', 'MAX(c.customer_name)'),
+    'sku': ('f.sku_id', 'MAX(sm.sku_code)'),
+    'location': ('f.location_id', 'MAX(l.location_name)'),
+    'month': (
+        "to_char(DATE '1970-01-01' + f.sale_date, 'YYYY-MM')",
+        "to_char(DATE '1970-01-01' + MIN(f.sale_date), 'Mon YYYY')"
+    )
+}
+
+
+@sku_outbound_bp.route('/api/sku/outbound/margin-analysis', methods=['GET'])
+def get_margin_analysis():
+    """
+    Sales margin by any combination of customer, SKU, location and month,
+    read from the daily sales facts.
+    
+    Query params:
+        dimensions: Comma list of customer, sku, location, month (default customer)
+        start_date, end_date, customer_id, sku_id, location_id: Filters
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        dimensions = [
+            d.strip() for d in request.args.get('dimensions', 'customer').split(',') if d.strip()
+        ]
+        invalid = [d for d in dimensions if d not in MARGIN_DIMENSIONS]
+        if invalid or not dimensions:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid dimensions: {', '.join(invalid) or 'none selected'}"
+            }), 400
+        
+        conditions = ["f.line_count > 0"]
+        params = []
+        
+        if request.args.get('start_date'):
+            conditions.append("f.sale_date >= %s")
+            params.append(parse_date(request.args.get('start_date')))
+        
+        if request.args.get('end_date'):
+            conditions.append("f.sale_date <= %s")
+            params.append(parse_date(request.args.get('end_date')))
+        
+        for filter_name in ('customer_id', 'sku_id', 'location_id'):
+            if request.args.get(filter_name):
+                conditions.append(f"f.{filter_name} = %s")
+                params.append(request.args.get(filter_name))
+        
+        group_columns = [MARGIN_DIMENSIONS[d][0] for d in dimensions]
+        label_columns = [MARGIN_DIMENSIONS[d][1] for d in dimensions]
+        
+        cur.execute(f"""
+            SELECT
+                {', '.join(group_columns)},
+                {', '.join(label_columns)},
+                SUM(f.units), SUM(f.weight_kg), SUM(f.revenue), SUM(f.gst_amount),
+                SUM(f.transport_cost), SUM(f.handling_cost), SUM(f.production_cost)
+            FROM sales_daily_facts f
+            JOIN customers c ON f.customer_id = c.customer_id
+            JOIN sku_master sm ON f.sku_id = sm.sku_id
+            LEFT JOIN locations_master l ON f.location_id = l.location_id
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {', '.join(group_columns)}
+            ORDER BY SUM(f.revenue) DESC
+        """, params)
+        
+        rows = []
+        for row in cur.fetchall():
+            keys = row[:len(dimensions)]
+            labels = row[len(dimensions):2 * len(dimensions)]
+            units, weight, revenue, gst, transport, handling, production = [
+                float(value or 0) for value in row[2 * len(dimensions):]
+            ]
+            gross_margin = revenue - production - transport - handling
+            entry = {}
+            for dimension, key, label in zip(dimensions, keys, labels):
+                entry[dimension] = key
+                entry[f'{dimension}_label'] = label
+            entry.update({
+                'units': int(units),
+                'weight_kg': weight,
+                'revenue': revenue,
+                'gst_collected': gst,
+                'transport_cost': transport,
+                'handling_cost': handling,
+                'production_cost': production,
+                'gross_margin': gross_margin,
+                'margin_percent': (gross_margin / revenue * 100) if revenue else 0
+            })
+            rows.append(entry)
+        
+        return jsonify({
+            'success': True,
+            'dimensions': dimensions,
+            'rows': rows,
+            'count': len(rows)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
@@ -18,9 +18,13 @@ from utils.expiry_utils import (
     validate_shelf_life,
     check_near_expiry_items,
     update_expiry_tracking,
-    get_fefo_allocation,
-    get_expiry_alert_summary
+    get_fefo_allocation_batch,
+    get_expiry_alert_summary,
+    run_expiry_sweep,
+    get_expiry_sweep_status
 )
+from utils.lineage import record_lineage_edges
+from utils.stock_ledger import set_stock_movement_context
 
 # Create Blueprint
 sku_production_bp = Blueprint('sku_production', __name__)
@@ -468,6 +472,7 @@ def create_sku_production():
         result = cur.fetchone()
         production_id = result[0]
         saved_expiry_date = result[1]
+        set_stock_movement_context(production_date, 'sku_production', production_id, cur)
         
         print(f"DEBUG: Production saved with ID={production_id}, expiry_date={saved_expiry_date}")
         
@@ -542,6 +547,14 @@ def create_sku_production():
                 allocation.get('allocation_cost', 0)
             ))
         
+        # Link the production to its oil sources for genealogy traces
+        record_lineage_edges([
+            (allocation['source_type'], allocation['source_id'],
+             'sku_production', production_id, allocation['quantity_allocated'])
+            for allocation in oil_allocations
+            if allocation['source_type'] in ('batch', 'blend')
+        ], cur)
+        
         # Insert material consumption
         for consumption in material_consumptions:
             cur.execute("""
@@ -755,16 +768,16 @@ def get_expiry_alerts():
         
         items = check_near_expiry_items(conn, days_threshold, location_id)
         
-        # Format dates for display
+        # Format dates for display; expiry_status comes from the swept bucket
         for item in items:
             item['expiry_date'] = integer_to_date(item['expiry_date'])
-            item['expiry_status'] = get_expiry_status(item['days_to_expiry'])
         
         return jsonify({
             'success': True,
             'items': items,
             'count': len(items),
-            'days_threshold': days_threshold
+            'days_threshold': days_threshold,
+            'sweep': get_expiry_sweep_status(conn)
         })
         
     except Exception as e:
@@ -786,6 +799,7 @@ def get_expiry_summary():
         return jsonify({
             'success': True,
             'summary': summary,
+            'sweep': get_expiry_sweep_status(conn),
             'categories': {
                 'expired': 'Items past expiry date',
                 'critical': 'Expiring within 30 days',
@@ -801,6 +815,26 @@ def get_expiry_summary():
         close_connection(conn, cur)
 
 
+@sku_production_bp.route('/api/sku/expiry-sweep', methods=['POST'])
+def trigger_expiry_sweep():
+    """Manually re-bucket expiry tracking lots (normally runs once per day)"""
+    conn = get_db_connection()
+    
+    try:
+        data = request.json or {}
+        result = run_expiry_sweep(conn, force=bool(data.get('force', False)))
+        
+        if not result['success']:
+            return jsonify(result), 500
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, None)
+
+
 @sku_production_bp.route('/api/sku/fefo-allocation/<int:sku_id>', methods=['POST'])
 def get_fefo_allocation_for_sku(sku_id):
     """Get FEFO (First Expiry First Out) allocation for SKU sales"""
@@ -818,13 +852,62 @@ def get_fefo_allocation_for_sku(sku_id):
                 'error': 'quantity_needed is required'
             }), 400
         
-        result = get_fefo_allocation(conn, sku_id, quantity_needed, location_id)
+        result = get_fefo_allocation_batch(conn, [(sku_id, location_id, quantity_needed)])[0]
         
         # Format dates in allocations
         for allocation in result.get('allocations', []):
             allocation['expiry_date'] = integer_to_date(allocation['expiry_date'])
         
-        return jsonify(result)
+        return jsonify({
+            'success': result['success'],
+            'allocations': result['allocations'],
+            'shortage': result['shortage'],
+            'message': result['message']
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+@sku_production_bp.route('/api/sku/fefo-allocation/batch', methods=['POST'])
+def get_fefo_allocation_for_lines():
+    """Get FEFO allocation for many SKU/location lines in one call"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        data = request.json
+        lines = data.get('lines', [])
+        
+        if not lines:
+            return jsonify({
+                'success': False,
+                'error': 'lines is required'
+            }), 400
+        
+        for line in lines:
+            if not line.get('sku_id') or not line.get('quantity_needed'):
+                return jsonify({
+                    'success': False,
+                    'error': 'Each line needs sku_id and quantity_needed'
+                }), 400
+        
+        results = get_fefo_allocation_batch(conn, [
+            (line['sku_id'], line.get('location_id'), line['quantity_needed'])
+            for line in lines
+        ])
+        
+        for result in results:
+            for allocation in result['allocations']:
+                allocation['expiry_date'] = integer_to_date(allocation['expiry_date'])
+        
+        return jsonify({
+            'success': all(result['success'] for result in results),
+            'lines': results,
+            'count': len(results)
+        })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,171 @@
+"""
+Stock Module for PUVI Oil Manufacturing System
+Point-in-time stock balances from the stock_movements ledger and its
+month-end snapshots (see migrations/018)
+File Path: puvi-backend/puvi-backend-main/modules/stock.py
+"""
+
+from flask import Blueprint, request, jsonify
+from db_utils import get_db_connection, close_connection
+from utils.date_utils import parse_date, integer_to_date
+from utils.stock_ledger import STOCK_ITEM_TYPES, get_stock_as_of, build_stock_snapshots
+
+# Create Blueprint
+stock_bp = Blueprint('stock', __name__)
+
+
+def get_stock_labels(rows, cur):
+    """
+    Names for the items in a balance listing, one query per item type.
+
+    Returns:
+        Dictionary of (item_type, item_key) / ('location', id) -> label dict
+    """
+    keys = {item_type: set() for item_type in STOCK_ITEM_TYPES}
+    location_ids = set()
+    for item_type, item_key, location_id, _ in rows:
+        keys[item_type].add(item_key)
+        if location_id:
+            location_ids.add(location_id)
+
+    labels = {}
+    if keys['material']:
+        cur.execute("""
+            SELECT material_id, material_name, unit, category
+            FROM materials
+            WHERE material_id = ANY(%s)
+        """, (list(keys['material']),))
+        for material_id, name, unit, category in cur.fetchall():
+            labels[('material', material_id)] = {
+                'item_name': name, 'unit': unit, 'category': category
+            }
+
+    if keys['oil']:
+        cur.execute("""
+            SELECT inventory_id, oil_type, source_type, source_reference_id
+            FROM inventory
+            WHERE inventory_id = ANY(%s)
+        """, (list(keys['oil']),))
+        for inventory_id, oil_type, source_type, source_reference_id in cur.fetchall():
+            labels[('oil', inventory_id)] = {
+                'item_name': oil_type, 'unit': 'kg', 'source_type': source_type,
+                'source_reference_id': source_reference_id
+            }
+
+    if keys['sku']:
+        cur.execute("""
+            SELECT sku_id, sku_code, product_name, oil_type
+            FROM sku_master
+            WHERE sku_id = ANY(%s)
+        """, (list(keys['sku']),))
+        for sku_id, sku_code, product_name, oil_type in cur.fetchall():
+            labels[('sku', sku_id)] = {
+                'item_name': product_name, 'sku_code': sku_code,
+                'oil_type': oil_type, 'unit': 'units'
+            }
+
+    if location_ids:
+        cur.execute("""
+            SELECT location_id, location_name
+            FROM locations_master
+            WHERE location_id = ANY(%s)
+        """, (list(location_ids),))
+        for location_id, location_name in cur.fetchall():
+            labels[('location', location_id)] = location_name
+
+    return labels
+
+
+# ============================================
+# POINT-IN-TIME BALANCES
+# ============================================
+
+@stock_bp.route('/api/stock/as_of', methods=['GET'])
+def get_stock_as_of_date():
+    """
+    Stock balances at the end of a date.
+
+    Query params:
+        date: As-of date (required)
+        item_type: material, oil or sku
+        material_id, inventory_id (oil), sku_id: Item filter (needs item_type)
+        location_id: Location filter (SKU stock)
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        as_of_day = parse_date(request.args.get('date'))
+        if as_of_day is None:
+            return jsonify({'success': False, 'error': 'date is required'}), 400
+
+        item_type = request.args.get('item_type')
+        if item_type and item_type not in STOCK_ITEM_TYPES:
+            return jsonify({
+                'success': False,
+                'error': f"item_type must be one of: {', '.join(STOCK_ITEM_TYPES)}"
+            }), 400
+
+        item_key = None
+        key_arg = {'material': 'material_id', 'oil': 'inventory_id', 'sku': 'sku_id'}.get(item_type)
+        if key_arg and request.args.get(key_arg):
+            item_key = int(request.args.get(key_arg))
+
+        location_id = request.args.get('location_id', type=int)
+
+        snapshot_day, rows = get_stock_as_of(
+            as_of_day, cur, item_type=item_type, item_key=item_key, location_id=location_id
+        )
+        labels = get_stock_labels(rows, cur)
+
+        balances = []
+        for row_type, row_key, row_location, quantity in rows:
+            balance = {
+                'item_type': row_type,
+                'item_key': row_key,
+                'location_id': row_location or None,
+                'location_name': labels.get(('location', row_location)),
+                'quantity': float(quantity)
+            }
+            balance.update(labels.get((row_type, row_key), {}))
+            balances.append(balance)
+
+        return jsonify({
+            'success': True,
+            'as_of_date': integer_to_date(as_of_day, '%Y-%m-%d'),
+            'snapshot_date': integer_to_date(snapshot_day, '%Y-%m-%d') if snapshot_day is not None else None,
+            'balances': balances,
+            'count': len(balances)
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, cur)
+
+
+@stock_bp.route('/api/stock/snapshots/build', methods=['POST'])
+def build_snapshots():
+    """
+    Build missing or invalidated month-end snapshots.
+
+    Body:
+        through_date: Last date to snapshot (default yesterday)
+    """
+    conn = get_db_connection()
+
+    try:
+        data = request.get_json(silent=True) or {}
+        result = build_stock_snapshots(conn, parse_date(data.get('through_date')))
+        if not result.get('success'):
+            return jsonify(result), 500
+
+        result['snapshots_built'] = [
+            integer_to_date(day, '%Y-%m-%d') for day in result.get('snapshots_built', [])
+        ]
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        close_connection(conn, None)
@@ -5,9 +5,10 @@ File Path: puvi-backend/puvi-backend-main/modules/writeoff_analytics.py
 Version: 1.0 - Information-only metrics (never modifies batch costs)
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import integer_to_date, get_current_day_number
+from utils.writeoff_metrics import reconcile_writeoff_metrics, get_dashboard_snapshot
 from decimal import Decimal
 
 # Create Blueprint
@@ -49,24 +50,7 @@ def get_writeoff_impact():
         
         latest_record = cur.fetchone()
         
-        # If no record exists, calculate fresh metrics
-        if not latest_record:
-            cur.execute("SELECT * FROM calculate_writeoff_impact()")
-            fresh_metrics = cur.fetchone()
-            
-            if fresh_metrics:
-                # Insert new tracking record
-                current_day = get_current_day_number()
-                cur.execute("SELECT update_writeoff_impact_tracking()")
-                conn.commit()
-                
-                # Fetch the newly created record
-                cur.execute("""
-                    SELECT * FROM writeoff_impact_tracking 
-                    ORDER BY tracking_id DESC LIMIT 1
-                """)
-                latest_record = cur.fetchone()
-        
+        # Reads never recompute; without a record the defaults below are returned
         if latest_record:
             # Format the response
             impact_data = {
@@ -240,268 +224,299 @@ def get_writeoff_trends():
         close_connection(conn, cur)
 
 
+def build_writeoff_dashboard(cur):
+    """
+    Assemble the analytics dashboard in one query over the latest impact
+    row, the monthly summary, the writeoff metric buckets and the ten
+    most recent writeoffs.
+    
+    Args:
+        cur: Database cursor
+    
+    Returns:
+        dict: Response body for /api/writeoff_dashboard
+    """
+    current_month = int(integer_to_date(get_current_day_number(), '%Y%m'))
+    
+    # Calculate previous month
+    year = current_month // 100
+    month = current_month % 100
+    if month == 1:
+        previous_month = (year - 1) * 100 + 12
+    else:
+        previous_month = year * 100 + (month - 1)
+    
+    cur.execute("""
+        SELECT json_build_object(
+            'impact', (
+                SELECT json_build_object(
+                    'total_writeoffs', total_writeoffs_value,
+                    'total_production', total_oil_produced_kg,
+                    'impact_per_kg', impact_per_kg,
+                    'percentage', writeoff_percentage
+                )
+                FROM writeoff_impact_tracking
+                ORDER BY tracking_id DESC
+                LIMIT 1
+            ),
+            'recent_writeoffs', COALESCE((
+                SELECT json_agg(r ORDER BY r.writeoff_date DESC, r.writeoff_id DESC)
+                FROM (
+                    SELECT 
+                        w.writeoff_id,
+                        w.writeoff_date,
+                        COALESCE(m.material_name, 
+                            CASE 
+                                WHEN w.reference_type = 'oil_cake' THEN 'Oil Cake'
+                                WHEN w.reference_type = 'sludge' THEN 'Sludge'
+                                ELSE 'Unknown'
+                            END
+                        ) as item_name,
+                        w.quantity,
+                        COALESCE(m.unit, 'kg') as unit,
+                        w.net_loss,
+                        w.reason_code,
+                        wr.reason_description
+                    FROM material_writeoffs w
+                    LEFT JOIN materials m ON w.material_id = m.material_id
+                    LEFT JOIN writeoff_reasons wr ON w.reason_code = wr.reason_code
+                    ORDER BY w.writeoff_date DESC, w.writeoff_id DESC
+                    LIMIT 10
+                ) r
+            ), '[]'),
+            'top_reasons', COALESCE((
+                SELECT json_agg(t ORDER BY t.total_loss DESC)
+                FROM (
+                    SELECT 
+                        NULLIF(b.reason_code, '') as reason_code,
+                        wr.reason_description,
+                        wr.category,
+                        SUM(b.writeoff_count) as occurrence_count,
+                        SUM(b.net_loss) as total_loss
+                    FROM writeoff_metric_buckets b
+                    LEFT JOIN writeoff_reasons wr ON b.reason_code = wr.reason_code
+                    GROUP BY b.reason_code, wr.reason_description, wr.category
+                    HAVING SUM(b.writeoff_count) > 0
+                    ORDER BY total_loss DESC
+                    LIMIT 5
+                ) t
+            ), '[]'),
+            'monthly', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'month_year', month_year,
+                    'writeoffs', month_writeoffs,
+                    'count', month_writeoff_count,
+                    'impact_per_kg', month_impact_per_kg
+                ))
+                FROM writeoff_monthly_summary
+                WHERE month_year IN (%(current_month)s, %(previous_month)s)
+            ), '[]'),
+            'type_distribution', COALESCE((
+                SELECT json_agg(d)
+                FROM (
+                    SELECT 
+                        CASE 
+                            WHEN item_type = 'oil_cake' THEN 'Oil Cake'
+                            WHEN item_type = 'sludge' THEN 'Sludge'
+                            ELSE 'Materials'
+                        END as type,
+                        SUM(writeoff_count) as count,
+                        SUM(net_loss) as total_loss
+                    FROM writeoff_metric_buckets
+                    GROUP BY 1
+                    HAVING SUM(writeoff_count) > 0
+                ) d
+            ), '[]'),
+            'statistics', (
+                SELECT json_build_object(
+                    'materials_affected', (
+                        SELECT COUNT(DISTINCT material_id) FROM material_writeoffs
+                    ),
+                    'unique_reasons', COUNT(DISTINCT reason_code) FILTER (WHERE writeoff_count > 0),
+                    'total_events', COALESCE(SUM(writeoff_count), 0),
+                    'first_writeoff_date', (
+                        SELECT writeoff_date FROM material_writeoffs
+                        ORDER BY writeoff_date, writeoff_id LIMIT 1
+                    ),
+                    'last_writeoff_date', (
+                        SELECT writeoff_date FROM material_writeoffs
+                        ORDER BY writeoff_date DESC, writeoff_id DESC LIMIT 1
+                    )
+                )
+                FROM writeoff_metric_buckets
+            )
+        )
+    """, {'current_month': current_month, 'previous_month': previous_month})
+    data = cur.fetchone()[0]
+    
+    dashboard_data = {}
+    
+    # 1. Current Impact Metrics
+    impact = data['impact'] or {}
+    dashboard_data['current_impact'] = {
+        'total_writeoffs': float(impact.get('total_writeoffs') or 0),
+        'total_production': float(impact.get('total_production') or 0),
+        'impact_per_kg': float(impact.get('impact_per_kg') or 0),
+        'percentage': float(impact.get('percentage') or 0)
+    }
+    
+    # 2. Recent Writeoffs (last 10)
+    dashboard_data['recent_writeoffs'] = [
+        {
+            'writeoff_id': row['writeoff_id'],
+            'date': integer_to_date(row['writeoff_date']),
+            'item_name': row['item_name'],
+            'quantity': float(row['quantity']),
+            'unit': row['unit'],
+            'net_loss': float(row['net_loss']),
+            'reason_code': row['reason_code'],
+            'reason': row['reason_description'] or row['reason_code']
+        }
+        for row in data['recent_writeoffs']
+    ]
+    
+    # 3. Top Writeoff Reasons (all time)
+    dashboard_data['top_reasons'] = [
+        {
+            'reason_code': row['reason_code'],
+            'reason': row['reason_description'] or row['reason_code'],
+            'category': row['category'],
+            'count': row['occurrence_count'],
+            'total_loss': float(row['total_loss'])
+        }
+        for row in data['top_reasons']
+    ]
+    
+    # 4. Monthly Comparison (current vs previous month)
+    monthly_comparison = {}
+    for row in data['monthly']:
+        month_data = {
+            'writeoffs': float(row['writeoffs']),
+            'count': row['count'],
+            'impact_per_kg': float(row['impact_per_kg'])
+        }
+        if row['month_year'] == current_month:
+            monthly_comparison['current_month'] = month_data
+        else:
+            monthly_comparison['previous_month'] = month_data
+    
+    # Calculate change percentages
+    if 'current_month' in monthly_comparison and 'previous_month' in monthly_comparison:
+        prev_value = monthly_comparison['previous_month']['writeoffs']
+        curr_value = monthly_comparison['current_month']['writeoffs']
+        
+        if prev_value > 0:
+            change_percent = ((curr_value - prev_value) / prev_value) * 100
+        else:
+            change_percent = 100 if curr_value > 0 else 0
+        
+        monthly_comparison['change_percent'] = round(change_percent, 2)
+    else:
+        monthly_comparison['change_percent'] = 0
+    
+    dashboard_data['monthly_comparison'] = monthly_comparison
+    
+    # 5. Writeoff by Type Distribution
+    dashboard_data['type_distribution'] = [
+        {
+            'type': row['type'],
+            'count': row['count'],
+            'total_loss': float(row['total_loss'])
+        }
+        for row in data['type_distribution']
+    ]
+    
+    # 6. Alert Thresholds
+    impact_per_kg = dashboard_data['current_impact']['impact_per_kg']
+    
+    alerts = []
+    if impact_per_kg > 2.0:
+        alerts.append({
+            'level': 'critical',
+            'message': f'Critical: Writeoff impact exceeds ₹2/kg (current: ₹{impact_per_kg:.2f}/kg)'
+        })
+    elif impact_per_kg > 1.0:
+        alerts.append({
+            'level': 'warning',
+            'message': f'Warning: Writeoff impact exceeds ₹1/kg (current: ₹{impact_per_kg:.2f}/kg)'
+        })
+    
+    # Check for increasing trend
+    if monthly_comparison.get('change_percent', 0) > 50:
+        alerts.append({
+            'level': 'warning',
+            'message': f'Writeoffs increased by {monthly_comparison["change_percent"]}% this month'
+        })
+    
+    dashboard_data['alerts'] = alerts
+    
+    # 7. Summary Statistics
+    stats = data['statistics']
+    dashboard_data['statistics'] = {
+        'materials_affected': stats['materials_affected'] or 0,
+        'unique_reasons_used': stats['unique_reasons'],
+        'total_events': stats['total_events'],
+        'first_writeoff': integer_to_date(stats['first_writeoff_date']) if stats['first_writeoff_date'] else None,
+        'last_writeoff': integer_to_date(stats['last_writeoff_date']) if stats['last_writeoff_date'] else None
+    }
+    
+    return {
+        'success': True,
+        'dashboard': dashboard_data,
+        'generated_at': integer_to_date(get_current_day_number()),
+        'note': 'All metrics are informational only and do not affect actual batch costs'
+    }
+
+
 @writeoff_analytics_bp.route('/api/writeoff_dashboard', methods=['GET'])
 def get_writeoff_dashboard():
-    """Get combined dashboard data for writeoff analytics"""
+    """Get combined dashboard data for writeoff analytics from the cached snapshot (ETag aware)"""
     conn = get_db_connection()
-    cur = conn.cursor()
     
     try:
-        dashboard_data = {}
-        
-        # 1. Current Impact Metrics
-        cur.execute("""
-            SELECT 
-                total_writeoffs_value,
-                total_oil_produced_kg,
-                impact_per_kg,
-                writeoff_percentage
-            FROM writeoff_impact_tracking
-            ORDER BY tracking_id DESC
-            LIMIT 1
-        """)
-        
-        impact = cur.fetchone()
-        if impact:
-            dashboard_data['current_impact'] = {
-                'total_writeoffs': float(impact[0]),
-                'total_production': float(impact[1]),
-                'impact_per_kg': float(impact[2]),
-                'percentage': float(impact[3])
-            }
-        else:
-            dashboard_data['current_impact'] = {
-                'total_writeoffs': 0,
-                'total_production': 0,
-                'impact_per_kg': 0,
-                'percentage': 0
-            }
-        
-        # 2. Recent Writeoffs (last 10)
-        cur.execute("""
-            SELECT 
-                w.writeoff_id,
-                w.writeoff_date,
-                COALESCE(m.material_name, 
-                    CASE 
-                        WHEN w.reference_type = 'oil_cake' THEN 'Oil Cake'
-                        WHEN w.reference_type = 'sludge' THEN 'Sludge'
-                        ELSE 'Unknown'
-                    END
-                ) as item_name,
-                w.quantity,
-                COALESCE(m.unit, 'kg') as unit,
-                w.net_loss,
-                w.reason_code,
-                wr.reason_description
-            FROM material_writeoffs w
-            LEFT JOIN materials m ON w.material_id = m.material_id
-            LEFT JOIN writeoff_reasons wr ON w.reason_code = wr.reason_code
-            ORDER BY w.writeoff_date DESC, w.writeoff_id DESC
-            LIMIT 10
-        """)
-        
-        recent_writeoffs = []
-        for row in cur.fetchall():
-            recent_writeoffs.append({
-                'writeoff_id': row[0],
-                'date': integer_to_date(row[1]),
-                'item_name': row[2],
-                'quantity': float(row[3]),
-                'unit': row[4],
-                'net_loss': float(row[5]),
-                'reason_code': row[6],
-                'reason': row[7] or row[6]
-            })
-        
-        dashboard_data['recent_writeoffs'] = recent_writeoffs
-        
-        # 3. Top Writeoff Reasons (all time)
-        cur.execute("""
-            SELECT 
-                w.reason_code,
-                wr.reason_description,
-                wr.category,
-                COUNT(*) as occurrence_count,
-                COALESCE(SUM(w.net_loss), 0) as total_loss
-            FROM material_writeoffs w
-            LEFT JOIN writeoff_reasons wr ON w.reason_code = wr.reason_code
-            GROUP BY w.reason_code, wr.reason_description, wr.category
-            ORDER BY total_loss DESC
-            LIMIT 5
-        """)
-        
-        top_reasons = []
-        for row in cur.fetchall():
-            top_reasons.append({
-                'reason_code': row[0],
-                'reason': row[1] or row[0],
-                'category': row[2],
-                'count': row[3],
-                'total_loss': float(row[4])
-            })
-        
-        dashboard_data['top_reasons'] = top_reasons
-        
-        # 4. Monthly Comparison (current vs previous month)
+        # Monthly comparison is relative to today, so snapshots are per month
         current_month = int(integer_to_date(get_current_day_number(), '%Y%m'))
+        version, payload = get_dashboard_snapshot(
+            f'writeoff_analytics_{current_month}', build_writeoff_dashboard, conn
+        )
+        etag = f'writeoff-analytics-{current_month}-{version}'
         
-        # Calculate previous month
-        year = current_month // 100
-        month = current_month % 100
-        if month == 1:
-            previous_month = (year - 1) * 100 + 12
-        else:
-            previous_month = year * 100 + (month - 1)
-        
-        cur.execute("""
-            SELECT 
-                month_year,
-                month_writeoffs,
-                month_writeoff_count,
-                month_impact_per_kg
-            FROM writeoff_monthly_summary
-            WHERE month_year IN (%s, %s)
-            ORDER BY month_year DESC
-        """, (current_month, previous_month))
-        
-        monthly_comparison = {}
-        for row in cur.fetchall():
-            month_data = {
-                'writeoffs': float(row[1]),
-                'count': row[2],
-                'impact_per_kg': float(row[3])
-            }
-            if row[0] == current_month:
-                monthly_comparison['current_month'] = month_data
-            else:
-                monthly_comparison['previous_month'] = month_data
-        
-        # Calculate change percentages
-        if 'current_month' in monthly_comparison and 'previous_month' in monthly_comparison:
-            prev_value = monthly_comparison['previous_month']['writeoffs']
-            curr_value = monthly_comparison['current_month']['writeoffs']
-            
-            if prev_value > 0:
-                change_percent = ((curr_value - prev_value) / prev_value) * 100
-            else:
-                change_percent = 100 if curr_value > 0 else 0
-            
-            monthly_comparison['change_percent'] = round(change_percent, 2)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
         else:
-            monthly_comparison['change_percent'] = 0
+            response = jsonify(payload)
         
-        dashboard_data['monthly_comparison'] = monthly_comparison
-        
-        # 5. Writeoff by Type Distribution
-        cur.execute("""
-            SELECT 
-                CASE 
-                    WHEN reference_type = 'oil_cake' THEN 'Oil Cake'
-                    WHEN reference_type = 'sludge' THEN 'Sludge'
-                    ELSE 'Materials'
-                END as type,
-                COUNT(*) as count,
-                COALESCE(SUM(net_loss), 0) as total_loss
-            FROM material_writeoffs
-            GROUP BY reference_type
-        """)
-        
-        type_distribution = []
-        for row in cur.fetchall():
-            type_distribution.append({
-                'type': row[0],
-                'count': row[1],
-                'total_loss': float(row[2])
-            })
-        
-        dashboard_data['type_distribution'] = type_distribution
-        
-        # 6. Alert Thresholds
-        impact_per_kg = dashboard_data['current_impact']['impact_per_kg']
-        
-        alerts = []
-        if impact_per_kg > 2.0:
-            alerts.append({
-                'level': 'critical',
-                'message': f'Critical: Writeoff impact exceeds ₹2/kg (current: ₹{impact_per_kg:.2f}/kg)'
-            })
-        elif impact_per_kg > 1.0:
-            alerts.append({
-                'level': 'warning',
-                'message': f'Warning: Writeoff impact exceeds ₹1/kg (current: ₹{impact_per_kg:.2f}/kg)'
-            })
-        
-        # Check for increasing trend
-        if monthly_comparison.get('change_percent', 0) > 50:
-            alerts.append({
-                'level': 'warning',
-                'message': f'Writeoffs increased by {monthly_comparison["change_percent"]}% this month'
-            })
-        
-        dashboard_data['alerts'] = alerts
-        
-        # 7. Summary Statistics
-        cur.execute("""
-            SELECT 
-                COUNT(DISTINCT material_id) as materials_affected,
-                COUNT(DISTINCT reason_code) as unique_reasons,
-                COUNT(*) as total_writeoff_events,
-                MIN(writeoff_date) as first_writeoff_date,
-                MAX(writeoff_date) as last_writeoff_date
-            FROM material_writeoffs
-        """)
-        
-        stats = cur.fetchone()
-        if stats:
-            dashboard_data['statistics'] = {
-                'materials_affected': stats[0] or 0,
-                'unique_reasons_used': stats[1],
-                'total_events': stats[2],
-                'first_writeoff': integer_to_date(stats[3]) if stats[3] else None,
-                'last_writeoff': integer_to_date(stats[4]) if stats[4] else None
-            }
-        
-        return jsonify({
-            'success': True,
-            'dashboard': dashboard_data,
-            'generated_at': integer_to_date(get_current_day_number()),
-            'note': 'All metrics are informational only and do not affect actual batch costs'
-        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        close_connection(conn, cur)
+        close_connection(conn, None)
 
 
 @writeoff_analytics_bp.route('/api/refresh_writeoff_metrics', methods=['POST'])
 def refresh_writeoff_metrics():
-    """Manually refresh writeoff impact metrics"""
+    """Reconcile writeoff impact metrics now instead of waiting for the scheduled run"""
     conn = get_db_connection()
-    cur = conn.cursor()
     
     try:
-        # Update impact tracking
-        cur.execute("SELECT update_writeoff_impact_tracking()")
-        
-        # Update current month summary
-        current_month = int(integer_to_date(get_current_day_number(), '%Y%m'))
-        cur.execute("SELECT update_writeoff_monthly_summary(%s)", (current_month,))
-        
-        conn.commit()
+        result = reconcile_writeoff_metrics(conn)
+        if not result.get('success'):
+            return jsonify(result), 500
         
         return jsonify({
             'success': True,
             'message': 'Writeoff metrics refreshed successfully',
-            'updated_month': current_month
+            'drifted_months': result.get('drifted_months', []),
+            'updated_month': int(integer_to_date(get_current_day_number(), '%Y%m'))
         })
         
     except Exception as e:
-        conn.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        close_connection(conn, cur)
+        close_connection(conn, None)
 
 
 @writeoff_analytics_bp.route('/api/writeoff_report/<int:writeoff_id>', methods=['GET'])
@@ -16,6 +16,11 @@ from datetime import datetime, date
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number
 from utils.validation import safe_decimal, safe_float
+from utils.pagination import get_page_limit, keyset_condition, keyset_order_by, split_keyset_page
+from utils.material_valuation import revalue_materials
+from utils.stock_ledger import set_stock_movement_context
+from utils.traceability import generate_purchase_traceable_code
+from .tm_registry import get_table_field_rules
 import json
 
 # ============================================
@@ -23,71 +28,90 @@ import json
 # ============================================
 
 def get_field_classification(table_name, field_name, cur):
-    """Get field classification from database rules"""
-    cur.execute("""
-        SELECT classification, dependency_check_sql, edit_condition,
-               reason_template, affects_calculation, affects_inventory,
-               affects_traceability
-        FROM field_edit_rules
-        WHERE table_name = %s AND field_name = %s AND is_active = true
-    """, (table_name, field_name))
-    
-    row = cur.fetchone()
-    if row:
-        return {
-            'classification': row[0],
-            'dependency_check_sql': row[1],
-            'edit_condition': row[2],
-            'reason_template': row[3],
-            'affects_calculation': row[4],
-            'affects_inventory': row[5],
-            'affects_traceability': row[6]
-        }
-    return None
+    """Get field classification from the cached field_edit_rules"""
+    return get_table_field_rules(table_name, cur).get(field_name)
 
-def check_field_editability(table_name, record_id, field_name, cur):
-    """Check if a specific field can be edited"""
-    field_rule = get_field_classification(table_name, field_name, cur)
-    
-    if not field_rule:
-        return {'can_edit': True, 'reason': 'No rules defined'}
-    
-    # IMMUTABLE fields can never be edited
-    if field_rule['classification'] == 'IMMUTABLE':
-        return {
-            'can_edit': False,
-            'reason': field_rule['reason_template'] or 'System field - cannot be modified',
-            'classification': 'IMMUTABLE'
-        }
-    
-    # SAFE fields can always be edited
-    if field_rule['classification'] == 'SAFE':
-        return {
-            'can_edit': True,
-            'reason': 'Safe field - always editable',
-            'classification': 'SAFE'
-        }
+def check_fields_editability(table_name, record_id, field_names, cur):
+    """
+    Check which fields of one record can be edited.
+
+    Rules come from the registry; the dependency checks of all
+    CONDITIONAL fields run together as one query.
+
+    Returns:
+        dict: field -> editability (same shape as check_field_editability)
+    """
+    rules = get_table_field_rules(table_name, cur)
+    results = {}
     
-    # CONDITIONAL fields need dependency check
-    if field_rule['classification'] == 'CONDITIONAL':
-        if field_rule['dependency_check_sql']:
-            cur.execute(field_rule['dependency_check_sql'], (record_id,))
-            count = cur.fetchone()[0]
-            if count > 0:
-                return {
-                    'can_edit': False,
-                    'reason': field_rule['reason_template'] or f'Field has {count} dependencies',
-                    'classification': 'CONDITIONAL',
-                    'dependency_count': count
+    # Distinct dependency queries -> fields waiting on them
+    pending = {}
+    for field_name in field_names:
+        field_rule = rules.get(field_name)
+        
+        if not field_rule:
+            results[field_name] = {'can_edit': True, 'reason': 'No rules defined'}
+        
+        # IMMUTABLE fields can never be edited
+        elif field_rule['classification'] == 'IMMUTABLE':
+            results[field_name] = {
+                'can_edit': False,
+                'reason': field_rule['reason_template'] or 'System field - cannot be modified',
+                'classification': 'IMMUTABLE'
+            }
+        
+        # SAFE fields can always be edited
+        elif field_rule['classification'] == 'SAFE':
+            results[field_name] = {
+                'can_edit': True,
+                'reason': 'Safe field - always editable',
+                'classification': 'SAFE'
+            }
+        
+        # CONDITIONAL fields need dependency check
+        elif field_rule['classification'] == 'CONDITIONAL':
+            if field_rule['dependency_check_sql']:
+                sql = field_rule['dependency_check_sql'].strip().rstrip(';')
+                pending.setdefault(sql, []).append(field_name)
+            else:
+                results[field_name] = {
+                    'can_edit': True,
+                    'reason': 'No active dependencies',
+                    'classification': 'CONDITIONAL'
                 }
         
-        return {
-            'can_edit': True,
-            'reason': 'No active dependencies',
-            'classification': 'CONDITIONAL'
-        }
+        else:
+            results[field_name] = {'can_edit': True, 'reason': 'Unknown classification'}
+    
+    if pending:
+        queries = list(pending)
+        cur.execute(
+            f"SELECT {', '.join(f'({sql})' for sql in queries)}",
+            [record_id] * len(queries)
+        )
+        counts = cur.fetchone()
+        for sql, count in zip(queries, counts):
+            count = count or 0
+            for field_name in pending[sql]:
+                if count > 0:
+                    results[field_name] = {
+                        'can_edit': False,
+                        'reason': rules[field_name]['reason_template'] or f'Field has {count} dependencies',
+                        'classification': 'CONDITIONAL',
+                        'dependency_count': count
+                    }
+                else:
+                    results[field_name] = {
+                        'can_edit': True,
+                        'reason': 'No active dependencies',
+                        'classification': 'CONDITIONAL'
+                    }
     
-    return {'can_edit': True, 'reason': 'Unknown classification'}
+    return results
+
+def check_field_editability(table_name, record_id, field_name, cur):
+    """Check if a specific field can be edited"""
+    return check_fields_editability(table_name, record_id, [field_name], cur)[field_name]
 
 # ============================================
 # AUDIT LOGGING
@@ -323,6 +347,9 @@ def create_purchase_return(purchase_id, return_data, user='System'):
         ))
         
         return_id = cur.fetchone()[0]
+        set_stock_movement_context(
+            parse_date(return_data['return_date']), 'purchase_returns', return_id, cur
+        )
         
         # Process each return item
         for item in return_data['items']:
@@ -371,18 +398,29 @@ def create_purchase_return(purchase_id, return_data, user='System'):
                 SET closing_stock = closing_stock - %s,
                     purchases = purchases - %s,
                     last_updated = %s
-                WHERE material_id = %s
-                ORDER BY inventory_id DESC
-                LIMIT 1
+                WHERE inventory_id = (
+                    SELECT inventory_id FROM inventory
+                    WHERE material_id = %s
+                    ORDER BY inventory_id DESC
+                    LIMIT 1
+                )
             """, (
                 float(quantity_returned),
                 float(quantity_returned),
                 get_current_day_number(),
                 orig_item[0]
             ))
-            
-            # Recalculate weighted average cost
-            # (This would need the actual recalculation logic)
+        
+        # Re-value the returned materials from the return date
+        cur.execute("""
+            SELECT DISTINCT material_id
+            FROM purchase_return_items
+            WHERE return_id = %s
+        """, (return_id,))
+        return_date = parse_date(return_data['return_date'])
+        revaluation = revalue_materials(
+            {row[0]: return_date for row in cur.fetchall()}, cur
+        )
         
         # Generate debit note number if not provided
         if not return_data.get('debit_note_number'):
@@ -409,6 +447,7 @@ def create_purchase_return(purchase_id, return_data, user='System'):
             'return_code': return_code,
             'debit_note_number': debit_note_number if not return_data.get('debit_note_number') else return_data['debit_note_number'],
             'total_return_value': float(total_return_value),
+            'revaluation': revaluation,
             'message': f'Purchase return {return_code} created successfully'
         }
         
@@ -516,6 +555,8 @@ def reverse_and_correct_purchase(purchase_id, corrections, user='System', reason
         reversal_data['status'] = 'active'
         reversal_data['edited_by'] = user
         reversal_data['edited_at'] = datetime.now()
+        # traceable_code is UNIQUE and stays with the original purchase
+        reversal_data['traceable_code'] = None
         
         # Negate financial values
         for field in ['subtotal', 'total_gst_amount', 'total_cost', 'transport_cost', 'loading_charges']:
@@ -570,6 +611,24 @@ def reverse_and_correct_purchase(purchase_id, corrections, user='System', reason
         correction_data['edited_by'] = user
         correction_data['edited_at'] = datetime.now()
         
+        # The correction is a new purchase record and gets its own traceable code
+        correction_data['traceable_code'] = None
+        if correction_data.get('purchase_date') is not None:
+            cur.execute("""
+                SELECT material_id FROM purchase_items
+                WHERE purchase_id = %s
+                ORDER BY item_id
+                LIMIT 1
+            """, (purchase_id,))
+            first_item = cur.fetchone()
+            if first_item:
+                correction_data['traceable_code'] = generate_purchase_traceable_code(
+                    first_item[0],
+                    correction_data['supplier_id'],
+                    correction_data['purchase_date'],
+                    cur
+                )
+        
         # Insert correction entry
         correction_fields = [k for k in correction_data.keys() if k != 'created_at']
         correction_values = [correction_data[k] for k in correction_fields]
@@ -653,15 +712,25 @@ def reverse_and_correct_purchase(purchase_id, corrections, user='System', reason
             original, correction_data, user, f'Correction for {original["invoice_ref"]}'
         )
         
-        conn.commit()
+        # Net quantity effect is zero (negative + positive) but cost can
+        # differ - re-value the materials from the earliest entry date
+        cur.execute("""
+            SELECT pi.material_id, MIN(p.purchase_date)
+            FROM purchase_items pi
+            JOIN purchases p ON pi.purchase_id = p.purchase_id
+            WHERE p.purchase_id = ANY(%s)
+            GROUP BY pi.material_id
+        """, ([purchase_id, reversal_id, correction_id],))
+        revaluation = revalue_materials(dict(cur.fetchall()), cur)
         
-        # Net inventory effect is zero (negative + positive)
+        conn.commit()
         
         return {
             'success': True,
             'original_id': purchase_id,
             'reversal_id': reversal_id,
             'correction_id': correction_id,
+            'revaluation': revaluation,
             'message': 'Purchase reversed and corrected successfully'
         }
         
@@ -779,9 +848,10 @@ def adjust_writeoff(writeoff_id, adjustment_data, user='System'):
         # Only allow safe field updates
         safe_fields = ['reason_code', 'reason_description', 'notes', 'scrap_value']
         allowed_updates = {}
+        field_rules = get_table_field_rules('material_writeoffs', cur)
         
         for field, value in adjustment_data.items():
-            field_rule = get_field_classification('material_writeoffs', field, cur)
+            field_rule = field_rules.get(field)
             if field_rule and field_rule['classification'] == 'SAFE':
                 allowed_updates[field] = value
             elif field in safe_fields:  # Fallback for known safe fields
@@ -840,9 +910,19 @@ def adjust_writeoff(writeoff_id, adjustment_data, user='System'):
 # ============================================
 
 def list_purchases_with_correction_status(filters=None):
-    """List purchases with return/reversal status"""
+    """
+    List purchases with return/reversal status.
+
+    Seed batch and return counts come from transaction_dependency_counts
+    (migration 015). Pages newest first; pass the returned next_cursor as
+    filters['cursor'] for the next page.
+
+    Filters: supplier_id, start_date, end_date, show_reversed, search
+             (invoice/traceable code), correction_status, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -860,44 +940,58 @@ def list_purchases_with_correction_status(filters=None):
                     WHEN p.reversal_status = 'reversed' THEN 'reversed'
                     WHEN p.reversal_status IN ('reversal_entry', 'correction_entry') THEN 'system_entry'
                     WHEN p.boundary_crossed = true THEN 'locked'
-                    WHEN EXISTS (
-                        SELECT 1 FROM batch 
-                        WHERE seed_purchase_code = p.traceable_code
-                    ) THEN 'has_dependencies'
+                    WHEN COALESCE(d.seed_batches, 0) > 0 THEN 'has_dependencies'
                     ELSE 'normal'
                 END as correction_status,
-                (SELECT COUNT(*) FROM purchase_returns 
-                 WHERE original_purchase_id = p.purchase_id 
-                 AND status NOT IN ('cancelled')) as return_count,
-                (SELECT COALESCE(SUM(total_return_value), 0) 
-                 FROM purchase_returns 
-                 WHERE original_purchase_id = p.purchase_id 
-                 AND status NOT IN ('cancelled')) as total_returned
+                COALESCE(d.return_count, 0) as return_count,
+                COALESCE(d.return_value, 0) as total_returned
             FROM purchases p
             JOIN suppliers s ON p.supplier_id = s.supplier_id
+            LEFT JOIN transaction_dependency_counts d
+                ON d.record_type = 'purchase' AND d.record_id = p.purchase_id
             WHERE p.status != 'deleted'
         """
         
         params = []
-        if filters:
-            if filters.get('supplier_id'):
-                query += " AND p.supplier_id = %s"
-                params.append(filters['supplier_id'])
-            if filters.get('start_date'):
-                query += " AND p.purchase_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND p.purchase_date <= %s"
-                params.append(parse_date(filters['end_date']))
-            if filters.get('show_reversed') == False:
-                query += " AND p.reversal_status IS NULL"
-        
-        query += " ORDER BY p.purchase_date DESC, p.purchase_id DESC LIMIT 100"
+        if filters.get('supplier_id'):
+            query += " AND p.supplier_id = %s"
+            params.append(filters['supplier_id'])
+        if filters.get('start_date'):
+            query += " AND p.purchase_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND p.purchase_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('show_reversed') in (False, 'false'):
+            query += " AND p.reversal_status IS NULL"
+        if filters.get('search'):
+            query += " AND (p.invoice_ref ILIKE %s OR p.traceable_code ILIKE %s)"
+            params.extend([f"%{filters['search']}%"] * 2)
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'p.purchase_date', 'p.purchase_id', nullable=True
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
+        
+        if filters.get('correction_status'):
+            # Filter on the computed status without repeating the CASE
+            query = f"SELECT * FROM ({query}) listed WHERE listed.correction_status = %s"
+            params.append(filters['correction_status'])
+            order_by = keyset_order_by('listed.purchase_date', 'listed.purchase_id', nullable=True)
+        else:
+            order_by = keyset_order_by('p.purchase_date', 'p.purchase_id', nullable=True)
+        
+        limit = get_page_limit(filters)
+        query += f" ORDER BY {order_by} LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 2, 0)
         
         purchases = []
-        for row in cur.fetchall():
+        for row in rows:
             purchases.append({
                 'purchase_id': row[0],
                 'invoice_ref': row[1],
@@ -919,7 +1013,9 @@ def list_purchases_with_correction_status(filters=None):
         return {
             'success': True,
             'purchases': purchases,
-            'count': len(purchases)
+            'count': len(purchases),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -928,9 +1024,15 @@ def list_purchases_with_correction_status(filters=None):
         close_connection(conn, cur)
 
 def list_purchase_returns(filters=None):
-    """List purchase returns with details"""
+    """
+    List purchase returns with details, newest first.
+
+    Filters: supplier_id, original_purchase_id, start_date, end_date,
+             status, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -956,33 +1058,45 @@ def list_purchase_returns(filters=None):
         """
         
         params = []
-        if filters:
-            if filters.get('supplier_id'):
-                query += " AND pr.supplier_id = %s"
-                params.append(filters['supplier_id'])
-            if filters.get('start_date'):
-                query += " AND pr.return_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND pr.return_date <= %s"
-                params.append(parse_date(filters['end_date']))
-            if filters.get('status'):
-                query += " AND pr.status = %s"
-                params.append(filters['status'])
+        if filters.get('supplier_id'):
+            query += " AND pr.supplier_id = %s"
+            params.append(filters['supplier_id'])
+        if filters.get('original_purchase_id'):
+            query += " AND pr.original_purchase_id = %s"
+            params.append(filters['original_purchase_id'])
+        if filters.get('start_date'):
+            query += " AND pr.return_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND pr.return_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('status'):
+            query += " AND pr.status = %s"
+            params.append(filters['status'])
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'pr.return_date', 'pr.return_id'
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
         
+        limit = get_page_limit(filters)
         query += """
             GROUP BY pr.return_id, pr.return_code, pr.original_purchase_id,
                      p.invoice_ref, pr.return_date, s.supplier_name,
                      pr.return_type, pr.debit_note_number, pr.total_return_value,
                      pr.status, pr.created_at, pr.created_by
             ORDER BY pr.return_date DESC, pr.return_id DESC
-            LIMIT 100
+            LIMIT %s
         """
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 4, 0)
         
         returns = []
-        for row in cur.fetchall():
+        for row in rows:
             returns.append({
                 'return_id': row[0],
                 'return_code': row[1],
@@ -1002,7 +1116,9 @@ def list_purchase_returns(filters=None):
         return {
             'success': True,
             'returns': returns,
-            'count': len(returns)
+            'count': len(returns),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -1011,9 +1127,15 @@ def list_purchase_returns(filters=None):
         close_connection(conn, cur)
 
 def list_writeoffs_with_status(filters=None):
-    """List writeoffs with adjustment capability status"""
+    """
+    List writeoffs with adjustment capability status, newest first.
+
+    Filters: material_id, reason_code, reference_type, start_date,
+             end_date, boundary_crossed, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -1041,26 +1163,41 @@ def list_writeoffs_with_status(filters=None):
         """
         
         params = []
-        if filters:
-            if filters.get('material_id'):
-                query += " AND w.material_id = %s"
-                params.append(filters['material_id'])
-            if filters.get('reason_code'):
-                query += " AND w.reason_code = %s"
-                params.append(filters['reason_code'])
-            if filters.get('start_date'):
-                query += " AND w.writeoff_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND w.writeoff_date <= %s"
-                params.append(parse_date(filters['end_date']))
-        
-        query += " ORDER BY w.writeoff_date DESC, w.writeoff_id DESC LIMIT 100"
+        if filters.get('material_id'):
+            query += " AND w.material_id = %s"
+            params.append(filters['material_id'])
+        if filters.get('reason_code'):
+            query += " AND w.reason_code = %s"
+            params.append(filters['reason_code'])
+        if filters.get('reference_type'):
+            query += " AND w.reference_type = %s"
+            params.append(filters['reference_type'])
+        if filters.get('start_date'):
+            query += " AND w.writeoff_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND w.writeoff_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('boundary_crossed') is not None:
+            query += " AND COALESCE(w.boundary_crossed, false) = %s"
+            params.append(str(filters['boundary_crossed']).lower() == 'true')
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'w.writeoff_date', 'w.writeoff_id'
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
+        
+        limit = get_page_limit(filters)
+        query += " ORDER BY w.writeoff_date DESC, w.writeoff_id DESC LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 1, 0)
         
         writeoffs = []
-        for row in cur.fetchall():
+        for row in rows:
             writeoffs.append({
                 'writeoff_id': row[0],
                 'writeoff_date': integer_to_date(row[1]),
@@ -1081,7 +1218,9 @@ def list_writeoffs_with_status(filters=None):
         return {
             'success': True,
             'writeoffs': writeoffs,
-            'count': len(writeoffs)
+            'count': len(writeoffs),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -1147,12 +1286,12 @@ def get_purchase_for_correction(purchase_id):
         for item_row in cur.fetchall():
             item = dict(zip(item_columns, item_row))
             
-            # Check field editability for each item field
-            item['field_editability'] = {}
-            for field in item.keys():
-                if field not in ['material_name', 'unit']:  # Skip joined fields
-                    editability = check_field_editability('purchase_items', item['item_id'], field, cur)
-                    item['field_editability'][field] = editability
+            # Check field editability for each item field (one batch per item)
+            item['field_editability'] = check_fields_editability(
+                'purchase_items', item['item_id'],
+                [field for field in item.keys() if field not in ['material_name', 'unit']],  # Skip joined fields
+                cur
+            )
             
             items.append(item)
         
@@ -1242,10 +1381,10 @@ def get_writeoff_for_adjustment(writeoff_id):
             writeoff['writeoff_date_display'] = integer_to_date(writeoff['writeoff_date'])
         
         # Check field editability
-        writeoff['field_editability'] = {}
-        for field in ['reason_code', 'reason_description', 'notes', 'scrap_value']:
-            editability = check_field_editability('material_writeoffs', writeoff_id, field, cur)
-            writeoff['field_editability'][field] = editability
+        writeoff['field_editability'] = check_fields_editability(
+            'material_writeoffs', writeoff_id,
+            ['reason_code', 'reason_description', 'notes', 'scrap_value'], cur
+        )
         
         # Writeoffs can only be adjusted, not reversed
         adjustment_options = {
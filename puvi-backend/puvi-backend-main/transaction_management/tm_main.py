@@ -11,6 +11,8 @@ unified transaction management with return documents and reversal entries.
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from db_utils import get_db_connection, close_connection
+from utils.date_utils import parse_date
+from utils.material_valuation import revalue_materials
 
 # Import configurations
 from .tm_configs import (
@@ -22,6 +24,13 @@ from .tm_configs import (
     get_modules_by_category
 )
 
+from .tm_registry import (
+    get_table_columns,
+    refresh_registry,
+    notify_registry_refresh,
+    get_registry_status
+)
+
 # Import NEW operation modules with return/reversal functions
 from .tm_input_operations import (
     # NEW: Return and reversal functions
@@ -73,7 +82,8 @@ from .tm_output_operations import (
     list_sku_productions_with_status,
     list_outbounds_with_status,
     list_oil_cake_sales_with_status,
-    trigger_invoice_boundary
+    trigger_invoice_boundary,
+    trigger_invoice_boundaries
 )
 
 # Create Blueprint
@@ -419,6 +429,55 @@ def get_corrections_summary():
             'error': str(e)
         }), 500
 
+@tm_bp.route('/api/tm/valuation/revalue', methods=['POST'])
+def revalue_materials_endpoint():
+    """
+    Re-value materials from a date and list batch adjustment candidates.
+
+    Body: {"materials": [{"material_id": 5, "from_date": "2025-04-01"}, ...],
+           "dry_run": false}
+    dry_run replays and reports, then rolls back.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        data = request.get_json() or {}
+        materials = data.get('materials') or []
+        
+        if not materials:
+            return jsonify({'success': False, 'error': 'materials is required'}), 400
+        
+        material_dates = {}
+        for entry in materials:
+            if not entry.get('material_id'):
+                return jsonify({'success': False, 'error': 'material_id is required for each entry'}), 400
+            from_date = parse_date(entry['from_date']) if entry.get('from_date') else 0
+            material_id = int(entry['material_id'])
+            material_dates[material_id] = min(from_date, material_dates.get(material_id, from_date))
+        
+        result = revalue_materials(material_dates, cur)
+        
+        if data.get('dry_run'):
+            conn.rollback()
+        else:
+            conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'dry_run': bool(data.get('dry_run')),
+            **result
+        })
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        close_connection(conn, cur)
+
 # ============================================
 # ENHANCED STATUS ENDPOINTS
 # ============================================
@@ -756,6 +815,39 @@ def trigger_boundary_crossing(module, record_id):
             'error': str(e)
         }), 500
 
+@tm_bp.route('/api/transaction-manager/trigger-boundary/<module>/bulk', methods=['POST'])
+def trigger_boundary_crossing_bulk(module):
+    """
+    Record invoices for many outbounds and lock their upstream chain
+    in one transaction.
+    Body: {"invoices": [{"outbound_id": 1, "invoice_number": "INV-001"}, ...]}
+    """
+    try:
+        if module not in ['sku_outbound']:
+            return jsonify({
+                'success': False,
+                'error': 'Boundary crossing not supported for this module'
+            }), 400
+        
+        data = request.get_json() or {}
+        invoices = data.get('invoices')
+        if not isinstance(invoices, list) or not invoices:
+            return jsonify({'success': False, 'error': 'invoices list required'}), 400
+        
+        user = get_user_from_request()
+        result = trigger_invoice_boundaries(invoices, user)
+        
+        if result.get('success'):
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ============================================
 # MODULE CONFIGURATION ENDPOINTS
 # ============================================
@@ -857,85 +949,67 @@ def get_module_config_endpoint(module):
 
 @tm_bp.route('/api/transaction-manager/stats', methods=['GET'])
 def get_transaction_stats():
-    """Get statistics about transactions and corrections"""
+    """
+    Get statistics about transactions and corrections.
+
+    Column existence comes from the cached registry; all modules and
+    purchase returns are counted in one UNION ALL query.
+    """
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         
-        stats = {}
+        # Output columns of every branch; None where a table lacks the column
+        stat_columns = ['total', 'active', 'deleted', 'created_today', 'locked',
+                        'reversed', 'corrections', 'pending', 'approved']
         
-        # Get stats for each module
+        branches = []
+        params = []
         for module_name, config in TRANSACTION_MODULES.items():
             table = config['table']
+            existing_columns = get_table_columns(table, cur)
+            if not existing_columns:
+                continue
             
-            # Check which columns exist
-            cur.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = %s 
-                AND column_name IN ('status', 'boundary_crossed', 'created_at', 'reversal_status')
-            """, (table,))
-            
-            existing_columns = [row[0] for row in cur.fetchall()]
-            
-            # Build dynamic query
-            select_parts = ["COUNT(*) as total"]
-            
+            parts = {'total': "COUNT(*)"}
             if 'status' in existing_columns:
-                select_parts.append("COUNT(CASE WHEN status = 'active' THEN 1 END) as active")
-                select_parts.append("COUNT(CASE WHEN status = 'deleted' THEN 1 END) as deleted")
+                parts['active'] = "COUNT(CASE WHEN status = 'active' THEN 1 END)"
+                parts['deleted'] = "COUNT(CASE WHEN status = 'deleted' THEN 1 END)"
             else:
-                select_parts.append("COUNT(*) as active")
-                select_parts.append("0 as deleted")
-            
+                parts['active'] = "COUNT(*)"
+                parts['deleted'] = "0"
             if 'created_at' in existing_columns:
-                select_parts.append("COUNT(CASE WHEN created_at::date = CURRENT_DATE THEN 1 END) as today")
+                parts['created_today'] = "COUNT(CASE WHEN created_at::date = CURRENT_DATE THEN 1 END)"
             else:
-                select_parts.append("0 as today")
-            
+                parts['created_today'] = "0"
             if 'boundary_crossed' in existing_columns:
-                select_parts.append("COUNT(CASE WHEN boundary_crossed = true THEN 1 END) as locked")
-            
-            # NEW: Add reversal status counts
+                parts['locked'] = "COUNT(CASE WHEN boundary_crossed = true THEN 1 END)"
             if 'reversal_status' in existing_columns:
-                select_parts.append("COUNT(CASE WHEN reversal_status = 'reversed' THEN 1 END) as reversed")
-                select_parts.append("COUNT(CASE WHEN reversal_status IN ('reversal_entry', 'correction_entry') THEN 1 END) as corrections")
+                parts['reversed'] = "COUNT(CASE WHEN reversal_status = 'reversed' THEN 1 END)"
+                parts['corrections'] = "COUNT(CASE WHEN reversal_status IN ('reversal_entry', 'correction_entry') THEN 1 END)"
             
-            query = f"SELECT {', '.join(select_parts)} FROM {table}"
-            cur.execute(query)
-            
-            row = cur.fetchone()
-            if row:
-                stats[module_name] = {
-                    'total': row[0],
-                    'active': row[1],
-                    'deleted': row[2],
-                    'created_today': row[3]
-                }
-                
-                col_index = 4
-                if 'boundary_crossed' in existing_columns:
-                    stats[module_name]['locked'] = row[col_index]
-                    col_index += 1
-                
-                if 'reversal_status' in existing_columns:
-                    stats[module_name]['reversed'] = row[col_index]
-                    stats[module_name]['corrections'] = row[col_index + 1]
-        
-        # Get return statistics
-        cur.execute("""
-            SELECT COUNT(*) as total_returns,
-                   COUNT(CASE WHEN status = 'draft' THEN 1 END) as pending,
-                   COUNT(CASE WHEN status = 'approved' THEN 1 END) as approved
+            branches.append(
+                f"SELECT %s, {', '.join(parts.get(column, 'NULL::bigint') for column in stat_columns)} FROM {table}"
+            )
+            params.append(module_name)
+        
+        # Return statistics
+        branches.append("""
+            SELECT 'purchase_returns', COUNT(*), NULL, NULL, NULL, NULL, NULL, NULL,
+                   COUNT(CASE WHEN status = 'draft' THEN 1 END),
+                   COUNT(CASE WHEN status = 'approved' THEN 1 END)
             FROM purchase_returns
         """)
-        returns_row = cur.fetchone()
-        if returns_row:
-            stats['purchase_returns'] = {
-                'total': returns_row[0],
-                'pending': returns_row[1],
-                'approved': returns_row[2]
+        
+        cur.execute(" UNION ALL ".join(branches), params)
+        
+        stats = {}
+        for row in cur.fetchall():
+            stats[row[0]] = {
+                column: value
+                for column, value in zip(stat_columns, row[1:])
+                if value is not None
             }
         
         close_connection(conn, cur)
@@ -954,6 +1028,31 @@ def get_transaction_stats():
             'error': str(e)
         }), 500
 
+@tm_bp.route('/api/transaction-manager/registry/refresh', methods=['POST'])
+def refresh_transaction_registry():
+    """Reload cached columns / field rules in every worker"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        refresh_registry(cur)
+        notify_registry_refresh(cur)
+        conn.commit()
+        
+        return jsonify({
+            'success': True,
+            'registry': get_registry_status()
+        })
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        close_connection(conn, cur)
+
 # ============================================
 # HEALTH CHECK
 # ============================================
@@ -980,6 +1079,7 @@ def health_check():
                 'boundary_crossing': 'enabled',
                 'field_classification': 'enabled'
             },
+            'registry': get_registry_status(),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -20,21 +20,149 @@ FIXED ISSUES:
 from flask import jsonify
 from decimal import Decimal
 from datetime import datetime, date
+from psycopg2.extras import execute_values
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number
 from utils.validation import safe_decimal, safe_float
+from utils.pagination import get_page_limit, keyset_condition, split_keyset_page
+from modules.sku_outbound import (
+    post_sales_fact_deltas, build_outbound_filters
+)
 import json
 
 # ============================================
 # CRITICAL: BOUNDARY CROSSING IMPLEMENTATION
 # ============================================
 
+# Lineage node type -> (table, key column) carrying boundary_crossed
+BOUNDARY_TABLES = {
+    'outbound': ('sku_outbound', 'outbound_id'),
+    'sku_production': ('sku_production', 'production_id'),
+    'blend': ('blend_batches', 'blend_id'),
+    'batch': ('batch', 'batch_id'),
+    'purchase': ('purchases', 'purchase_id')
+}
+
+# Upstream closure of outbounds in one recursive query:
+# outbound -> SKU production -> batch / blend -> (blend components) -> purchase
+UPSTREAM_CLOSURE_SQL = """
+    WITH RECURSIVE edges (child_type, child_id, parent_type, parent_id) AS (
+        SELECT 'outbound', a.outbound_id, 'sku_production', a.production_id
+        FROM sku_outbound_item_allocations a
+        WHERE a.production_id IS NOT NULL
+        UNION ALL
+        SELECT 'sku_production', oa.production_id,
+               CASE WHEN oa.source_type = 'batch' THEN 'batch' ELSE 'blend' END,
+               oa.source_id
+        FROM sku_oil_allocation oa
+        WHERE oa.source_type IN ('batch', 'blend')
+        UNION ALL
+        SELECT 'blend', bc.blend_id,
+               CASE WHEN bc.source_type = 'extraction' THEN 'batch' ELSE 'blend' END,
+               bc.source_batch_id
+        FROM blend_batch_components bc
+        WHERE bc.source_type IN ('extraction', 'blended')
+        UNION ALL
+        -- Outsourced oil points at its purchase's inventory row
+        SELECT 'blend', bc.blend_id, 'purchase', i.source_reference_id
+        FROM blend_batch_components bc
+        JOIN inventory i ON i.inventory_id = bc.source_batch_id
+        WHERE bc.source_type = 'outsourced'
+            AND i.source_type = 'purchase'
+        UNION ALL
+        SELECT 'batch', b.batch_id, 'purchase', p.purchase_id
+        FROM batch b
+        JOIN purchases p ON p.traceable_code = b.seed_purchase_code
+    ),
+    upstream (node_type, node_id) AS (
+        SELECT 'outbound', outbound_id
+        FROM unnest(%s::int[]) AS t(outbound_id)
+        UNION
+        SELECT e.parent_type, e.parent_id
+        FROM upstream u
+        JOIN edges e ON e.child_type = u.node_type AND e.child_id = u.node_id
+    )
+    SELECT node_type, array_agg(node_id ORDER BY node_id)
+    FROM upstream
+    WHERE node_id IS NOT NULL
+    GROUP BY node_type
+"""
+
+
+def resolve_upstream_closure(outbound_ids, cur):
+    """
+    Resolve every upstream record of a set of outbounds.
+    
+    Returns:
+        dict: node_type -> list of IDs (outbound, sku_production, blend,
+              batch, purchase)
+    """
+    cur.execute(UPSTREAM_CLOSURE_SQL, (list(outbound_ids),))
+    return {node_type: node_ids for node_type, node_ids in cur.fetchall()}
+
+
+def mark_boundary_crossed_bulk(outbound_ids, user, reason, cur):
+    """
+    Mark the outbounds and their whole upstream chain as boundary_crossed,
+    one UPDATE per table and one batched audit insert, in the caller's
+    transaction. Rows already crossed are left (and audited) as they were.
+    
+    Args:
+        outbound_ids: List of outbound IDs
+        user: User who triggered the boundary crossing
+        reason: Audit reason
+        cur: Database cursor
+    
+    Returns:
+        dict: Counts of newly locked records per node type
+    """
+    closure = resolve_upstream_closure(outbound_ids, cur)
+    
+    locked = {}
+    audit_rows = []
+    for node_type, (table, key_column) in BOUNDARY_TABLES.items():
+        node_ids = closure.get(node_type, [])
+        if not node_ids:
+            locked[node_type] = 0
+            continue
+        
+        cur.execute(f"""
+            UPDATE {table}
+            SET boundary_crossed = true,
+                edited_by = %s,
+                edited_at = CURRENT_TIMESTAMP
+            WHERE {key_column} = ANY(%s)
+                AND COALESCE(boundary_crossed, false) = false
+            RETURNING {key_column}
+        """, (user, node_ids))
+        
+        changed_ids = [row[0] for row in cur.fetchall()]
+        locked[node_type] = len(changed_ids)
+        audit_rows.extend(
+            (table, record_id, 'BOUNDARY_CROSSED', 'output',
+             json.dumps({'boundary_crossed': False}),
+             json.dumps({'boundary_crossed': True}),
+             user, reason)
+            for record_id in changed_ids
+        )
+    
+    if audit_rows:
+        execute_values(cur, """
+            INSERT INTO transaction_audit_log (
+                table_name, record_id, action, module,
+                old_values, new_values, changed_by, reason
+            ) VALUES %s
+        """, audit_rows)
+    
+    return locked
+
+
 def mark_upstream_boundary_crossed(outbound_id, user='System'):
     """
     CRITICAL FUNCTION: Mark entire upstream chain as boundary_crossed
     when invoice is sent. This prevents editing of the entire production chain.
     
-    Flow: SKU Outbound → SKU Production → Batch → Purchase
+    Flow: SKU Outbound → SKU Production → Blend / Batch → Purchase
     
     Args:
         outbound_id: The outbound transaction that triggered boundary
@@ -46,102 +174,18 @@ def mark_upstream_boundary_crossed(outbound_id, user='System'):
     try:
         cur.execute("BEGIN")
         
-        # Step 1: Mark the outbound itself
-        cur.execute("""
-            UPDATE sku_outbound 
-            SET boundary_crossed = true,
-                edited_by = %s,
-                edited_at = CURRENT_TIMESTAMP
-            WHERE outbound_id = %s
-        """, (user, outbound_id))
-        
-        # Step 2: Get all SKU productions used in this outbound
-        cur.execute("""
-            SELECT DISTINCT production_id
-            FROM sku_outbound_items oi
-            WHERE oi.outbound_id = %s
-        """, (outbound_id,))
-        
-        production_ids = [row[0] for row in cur.fetchall()]
-        
-        if production_ids:
-            # Step 3: Mark all SKU productions
-            cur.execute("""
-                UPDATE sku_production 
-                SET boundary_crossed = true,
-                    edited_by = %s,
-                    edited_at = CURRENT_TIMESTAMP
-                WHERE production_id = ANY(%s)
-            """, (user, production_ids))
-            
-            # Step 4: Get all batches used in these productions
-            cur.execute("""
-                SELECT DISTINCT source_id
-                FROM sku_oil_allocation
-                WHERE production_id = ANY(%s)
-                    AND source_type = 'batch'
-            """, (production_ids,))
-            
-            batch_ids = [row[0] for row in cur.fetchall()]
-            
-            if batch_ids:
-                # Step 5: Mark all batches
-                cur.execute("""
-                    UPDATE batch 
-                    SET boundary_crossed = true,
-                        edited_by = %s,
-                        edited_at = CURRENT_TIMESTAMP
-                    WHERE batch_id = ANY(%s)
-                """, (user, batch_ids))
-                
-                # Step 6: Get all purchases used for these batches
-                cur.execute("""
-                    SELECT DISTINCT p.purchase_id
-                    FROM purchases p
-                    JOIN batch b ON p.traceable_code = b.seed_purchase_code
-                    WHERE b.batch_id = ANY(%s)
-                """, (batch_ids,))
-                
-                purchase_ids = [row[0] for row in cur.fetchall()]
-                
-                if purchase_ids:
-                    # Step 7: Mark all purchases
-                    cur.execute("""
-                        UPDATE purchases 
-                        SET boundary_crossed = true,
-                            edited_by = %s,
-                            edited_at = CURRENT_TIMESTAMP
-                        WHERE purchase_id = ANY(%s)
-                    """, (user, purchase_ids))
-            
-            # Step 8: Get all blends used in these productions
-            cur.execute("""
-                SELECT DISTINCT source_id
-                FROM sku_oil_allocation
-                WHERE production_id = ANY(%s)
-                    AND source_type = 'blend'
-            """, (production_ids,))
-            
-            blend_ids = [row[0] for row in cur.fetchall()]
-            
-            if blend_ids:
-                # Step 9: Mark all blends
-                cur.execute("""
-                    UPDATE blend_batches 
-                    SET boundary_crossed = true,
-                        edited_by = %s,
-                        edited_at = CURRENT_TIMESTAMP
-                    WHERE blend_id = ANY(%s)
-                """, (user, blend_ids))
+        locked = mark_boundary_crossed_bulk(
+            [outbound_id], user, f'Boundary crossed by outbound {outbound_id}', cur
+        )
         
         conn.commit()
         
         return {
             'success': True,
-            'productions_locked': len(production_ids),
-            'batches_locked': len(batch_ids) if 'batch_ids' in locals() else 0,
-            'purchases_locked': len(purchase_ids) if 'purchase_ids' in locals() else 0,
-            'blends_locked': len(blend_ids) if 'blend_ids' in locals() else 0
+            'productions_locked': locked['sku_production'],
+            'batches_locked': locked['batch'],
+            'purchases_locked': locked['purchase'],
+            'blends_locked': locked['blend']
         }
         
     except Exception as e:
@@ -186,9 +230,9 @@ def check_sku_production_dependencies(production_id, cur):
     
     # Check if used in any outbound
     cur.execute("""
-        SELECT COUNT(*) FROM sku_outbound_items 
-        WHERE allocation_data::text LIKE %s
-    """, (f'%"production_id":{production_id}%',))
+        SELECT COUNT(DISTINCT item_id) FROM sku_outbound_item_allocations 
+        WHERE production_id = %s
+    """, (production_id,))
     dependencies['outbound_items'] = cur.fetchone()[0]
     
     dependencies['has_dependencies'] = dependencies['outbound_items'] > 0
@@ -707,34 +751,47 @@ def delete_outbound(outbound_id, reason='', user='System'):
     cur = conn.cursor()
     
     try:
-        # Get outbound details
+        # Begin transaction
+        cur.execute("BEGIN")
+        
+        # Get outbound details; the row lock makes a concurrent cancel
+        # through update_outbound_status finish first, so the status
+        # check below sees it and the sale is reversed once
         cur.execute("""
             SELECT * FROM sku_outbound 
-            WHERE outbound_id = %s AND status != 'cancelled'
+            WHERE outbound_id = %s
+            FOR UPDATE
         """, (outbound_id,))
         
         columns = [desc[0] for desc in cur.description]
         outbound_data = cur.fetchone()
         
         if not outbound_data:
+            conn.rollback()
             return {'success': False, 'error': 'Outbound not found'}
         
         outbound = dict(zip(columns, outbound_data))
         
+        if outbound['status'] == 'cancelled':
+            conn.rollback()
+            return {'success': False, 'error': 'Outbound not found'}
+        
         # Check if invoice sent or boundary crossed
         if outbound.get('invoice_number') or outbound.get('boundary_crossed'):
+            conn.rollback()
             return {'success': False, 'error': 'Cannot delete - invoice sent'}
         
         # Check dependencies
         dependencies = check_outbound_dependencies(outbound_id, cur)
         if dependencies['has_dependencies']:
+            conn.rollback()
             return {
                 'success': False,
                 'error': 'Cannot delete - invoice exists or boundary crossed'
             }
         
-        # Begin transaction
-        cur.execute("BEGIN")
+        # Reverse the sales facts while the lines still count
+        post_sales_fact_deltas([outbound_id], -1, cur)
         
         # Soft delete outbound
         cur.execute("""
@@ -776,36 +833,93 @@ def trigger_invoice_boundary(outbound_id, invoice_number, user='System'):
     Trigger boundary crossing when invoice is sent
     This is the critical function that locks the entire chain
     """
+    result = trigger_invoice_boundaries(
+        [{'outbound_id': outbound_id, 'invoice_number': invoice_number}], user
+    )
+    if not result['success']:
+        return result
+    
+    return {
+        'success': True,
+        'message': f'Invoice {invoice_number} recorded and chain locked',
+        'chain_locked': {
+            'success': True,
+            'productions_locked': result['locked']['sku_production'],
+            'batches_locked': result['locked']['batch'],
+            'purchases_locked': result['locked']['purchase'],
+            'blends_locked': result['locked']['blend']
+        }
+    }
+
+def trigger_invoice_boundaries(invoices, user='System'):
+    """
+    Record invoice numbers for many outbounds and lock their combined
+    upstream chain in a single transaction.
+    
+    Args:
+        invoices: List of {'outbound_id', 'invoice_number'} dicts
+        user: User who triggered the boundary crossing
+    
+    Returns:
+        dict: Invoiced outbound count and newly locked records per node type
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
+        invoice_rows = []
+        for invoice in invoices:
+            if not invoice.get('outbound_id') or not invoice.get('invoice_number'):
+                return {'success': False, 'error': 'Each invoice needs outbound_id and invoice_number'}
+            invoice_rows.append((int(invoice['outbound_id']), str(invoice['invoice_number'])))
+        
+        if not invoice_rows:
+            return {'success': False, 'error': 'No invoices provided'}
+        
+        outbound_ids = list({outbound_id for outbound_id, _ in invoice_rows})
+        if len(outbound_ids) != len(invoice_rows):
+            return {'success': False, 'error': 'Duplicate outbound_id in request'}
+        
         cur.execute("BEGIN")
         
-        # Update outbound with invoice number
+        # Record invoice numbers in one statement
         cur.execute("""
-            UPDATE sku_outbound 
-            SET invoice_number = %s,
-                boundary_crossed = true,
+            UPDATE sku_outbound o
+            SET invoice_number = d.invoice_number,
                 edited_by = %s,
                 edited_at = CURRENT_TIMESTAMP
-            WHERE outbound_id = %s
-        """, (invoice_number, user, outbound_id))
-        
-        # Mark entire upstream chain
-        result = mark_upstream_boundary_crossed(outbound_id, user)
+            FROM unnest(%s::int[], %s::varchar[]) AS d(outbound_id, invoice_number)
+            WHERE o.outbound_id = d.outbound_id
+                AND o.status != 'cancelled'
+            RETURNING o.outbound_id
+        """, (
+            user,
+            [outbound_id for outbound_id, _ in invoice_rows],
+            [invoice_number for _, invoice_number in invoice_rows]
+        ))
         
-        if result['success']:
-            conn.commit()
+        invoiced_ids = {row[0] for row in cur.fetchall()}
+        missing = sorted(set(outbound_ids) - invoiced_ids)
+        if missing:
+            conn.rollback()
             return {
-                'success': True,
-                'message': f'Invoice {invoice_number} recorded and chain locked',
-                'chain_locked': result
+                'success': False,
+                'error': f"Outbounds not found or cancelled: {', '.join(map(str, missing))}"
             }
-        else:
-            conn.rollback()
-            return result
-            
+        
+        locked = mark_boundary_crossed_bulk(
+            outbound_ids, user, f'Invoice boundary for {len(outbound_ids)} outbound(s)', cur
+        )
+        
+        conn.commit()
+        
+        return {
+            'success': True,
+            'message': f'{len(outbound_ids)} invoice(s) recorded and chain locked',
+            'invoiced': len(outbound_ids),
+            'locked': locked
+        }
+        
     except Exception as e:
         conn.rollback()
         return {'success': False, 'error': str(e)}
@@ -1060,9 +1174,19 @@ def soft_delete_oil_cake_sale(sale_id, reason='', user='System'):
 # ============================================
 
 def list_sku_productions_with_status(filters=None):
-    """List SKU productions with edit/delete status - Handle NULLs"""
+    """
+    List SKU productions with edit/delete status - Handle NULLs.
+
+    Outbound allocations come from transaction_dependency_counts
+    (migration 015). Pages newest first; pass the returned next_cursor
+    as filters['cursor'] for the next page.
+
+    Filters: sku_id, start_date, end_date, search (production/traceable
+             code), boundary_crossed, has_dependencies, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -1079,36 +1203,53 @@ def list_sku_productions_with_status(filters=None):
                 p.created_at,
                 CASE 
                     WHEN p.boundary_crossed = true THEN 'locked'
-                    WHEN EXISTS (
-                        SELECT 1 FROM sku_outbound_items oi
-                        WHERE oi.allocation_data::text LIKE '%' || p.production_id || '%'
-                    ) THEN 'partial'
-                    WHEN p.created_at::date = CURRENT_DATE THEN 'editable'
+                    WHEN COALESCE(d.outbound_allocations, 0) > 0 THEN 'partial'
                     ELSE 'editable'
-                END as edit_status
+                END as edit_status,
+                COALESCE(d.outbound_allocations, 0)
             FROM sku_production p
             JOIN sku_master s ON p.sku_id = s.sku_id
+            LEFT JOIN transaction_dependency_counts d
+                ON d.record_type = 'sku_production' AND d.record_id = p.production_id
             WHERE p.status = 'active'
         """
         
         params = []
-        if filters:
-            if filters.get('sku_id'):
-                query += " AND p.sku_id = %s"
-                params.append(filters['sku_id'])
-            if filters.get('start_date'):
-                query += " AND p.production_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND p.production_date <= %s"
-                params.append(parse_date(filters['end_date']))
-        
-        query += " ORDER BY p.production_date DESC, p.production_id DESC LIMIT 100"
+        if filters.get('sku_id'):
+            query += " AND p.sku_id = %s"
+            params.append(filters['sku_id'])
+        if filters.get('start_date'):
+            query += " AND p.production_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND p.production_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('search'):
+            query += " AND (p.production_code ILIKE %s OR p.traceable_code ILIKE %s)"
+            params.extend([f"%{filters['search']}%"] * 2)
+        if filters.get('boundary_crossed') is not None:
+            query += " AND COALESCE(p.boundary_crossed, false) = %s"
+            params.append(str(filters['boundary_crossed']).lower() == 'true')
+        if filters.get('has_dependencies') is not None:
+            query += " AND COALESCE(d.has_dependencies, false) = %s"
+            params.append(str(filters['has_dependencies']).lower() == 'true')
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'p.production_date', 'p.production_id'
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
+        
+        limit = get_page_limit(filters)
+        query += " ORDER BY p.production_date DESC, p.production_id DESC LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 3, 0)
         
         productions = []
-        for row in cur.fetchall():
+        for row in rows:
             productions.append({
                 'production_id': row[0],
                 'production_code': row[1] or '',  # Handle NULL
@@ -1119,13 +1260,16 @@ def list_sku_productions_with_status(filters=None):
                 'bottles_produced': row[6],
                 'status': row[7],
                 'boundary_crossed': row[8],
-                'edit_status': row[10]
+                'edit_status': row[10],
+                'outbound_allocations': row[11]
             })
         
         return {
             'success': True,
             'productions': productions,
-            'count': len(productions)
+            'count': len(productions),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -1134,12 +1278,26 @@ def list_sku_productions_with_status(filters=None):
         close_connection(conn, cur)
 
 def list_outbounds_with_status(filters=None):
-    """List outbounds with edit/delete status - Handle NULLs"""
+    """
+    List outbounds with edit/delete status, newest first. Pages by
+    cursor: pass next_cursor back as filters['cursor'].
+    """
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        query = """
+        filters = filters or {}
+        limit = get_page_limit(filters)
+        
+        try:
+            conditions, params = build_outbound_filters(filters)
+        except ValueError:
+            return {'success': False, 'error': 'Invalid cursor'}
+        
+        if not filters.get('status'):
+            conditions.append("o.status != 'cancelled'")
+        
+        query = f"""
             SELECT 
                 o.outbound_id,
                 COALESCE(o.outbound_code, ''),  -- FIX: Handle NULL
@@ -1160,27 +1318,18 @@ def list_outbounds_with_status(filters=None):
             JOIN locations_master fl ON o.from_location_id = fl.location_id
             LEFT JOIN locations_master tl ON o.to_location_id = tl.location_id
             LEFT JOIN customers c ON o.customer_id = c.customer_id
-            WHERE o.status != 'cancelled'
+            WHERE {' AND '.join(conditions)}
+            ORDER BY o.outbound_date DESC, o.outbound_id DESC
+            LIMIT %s
         """
-        
-        params = []
-        if filters:
-            if filters.get('transaction_type'):
-                query += " AND o.transaction_type = %s"
-                params.append(filters['transaction_type'])
-            if filters.get('start_date'):
-                query += " AND o.outbound_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND o.outbound_date <= %s"
-                params.append(parse_date(filters['end_date']))
-        
-        query += " ORDER BY o.outbound_date DESC, o.outbound_id DESC LIMIT 100"
+        params.append(limit + 1)
         
         cur.execute(query, params)
         
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 3, 0)
+        
         outbounds = []
-        for row in cur.fetchall():
+        for row in rows:
             outbounds.append({
                 'outbound_id': row[0],
                 'outbound_code': row[1] or f'OUT-{row[0]}',  # Generate if NULL
@@ -1197,7 +1346,9 @@ def list_outbounds_with_status(filters=None):
         return {
             'success': True,
             'outbounds': outbounds,
-            'count': len(outbounds)
+            'count': len(outbounds),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -1206,9 +1357,15 @@ def list_outbounds_with_status(filters=None):
         close_connection(conn, cur)
 
 def list_oil_cake_sales_with_status(filters=None):
-    """List oil cake sales with edit/delete status - FIXED SQL"""
+    """
+    List oil cake sales with edit/delete status - FIXED SQL.
+
+    Filters: oil_type, start_date, end_date, search (invoice/buyer),
+             boundary_crossed, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         # FIX: Use invoice_number instead of non-existent sale_code
@@ -1234,20 +1391,38 @@ def list_oil_cake_sales_with_status(filters=None):
         """
         
         params = []
-        if filters:
-            if filters.get('start_date'):
-                query += " AND ocs.sale_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND ocs.sale_date <= %s"
-                params.append(parse_date(filters['end_date']))
+        if filters.get('oil_type'):
+            query += " AND ocs.oil_type = %s"
+            params.append(filters['oil_type'])
+        if filters.get('start_date'):
+            query += " AND ocs.sale_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND ocs.sale_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('search'):
+            query += " AND (ocs.invoice_number ILIKE %s OR ocs.buyer_name ILIKE %s)"
+            params.extend([f"%{filters['search']}%"] * 2)
+        if filters.get('boundary_crossed') is not None:
+            query += " AND COALESCE(ocs.boundary_crossed, false) = %s"
+            params.append(str(filters['boundary_crossed']).lower() == 'true')
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'ocs.sale_date', 'ocs.sale_id'
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
         
-        query += " ORDER BY ocs.sale_date DESC, ocs.sale_id DESC LIMIT 100"
+        limit = get_page_limit(filters)
+        query += " ORDER BY ocs.sale_date DESC, ocs.sale_id DESC LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 2, 0)
         
         sales = []
-        for row in cur.fetchall():
+        for row in rows:
             sales.append({
                 'sale_id': row[0],
                 'sale_code': row[1] or f'SALE-{row[0]}',  # Use invoice or generate code
@@ -1264,7 +1439,9 @@ def list_oil_cake_sales_with_status(filters=None):
         return {
             'success': True,
             'sales': sales,
-            'count': len(sales)
+            'count': len(sales),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -1289,6 +1466,7 @@ __all__ = [
     # Critical boundary function
     'mark_upstream_boundary_crossed',
     'trigger_invoice_boundary',
+    'trigger_invoice_boundaries',
     # SKU Production operations
     'get_sku_production_for_edit',
     'update_sku_production',
@@ -21,6 +21,7 @@ from datetime import datetime, date
 from db_utils import get_db_connection, close_connection
 from utils.date_utils import parse_date, integer_to_date, get_current_day_number
 from utils.validation import safe_decimal, safe_float
+from utils.pagination import get_page_limit, keyset_condition, keyset_order_by, split_keyset_page
 import json
 
 # ============================================
@@ -528,9 +529,19 @@ def soft_delete_batch(batch_id, reason='', user='System'):
         close_connection(conn, cur)
 
 def list_batches_with_status(filters=None):
-    """List batches with edit/delete status - Handle NULLs"""
+    """
+    List batches with edit/delete status - Handle NULLs.
+
+    Dependencies come from transaction_dependency_counts (migration 015),
+    so each page is one indexed scan. Pages newest first; pass the
+    returned next_cursor as filters['cursor'] for the next page.
+
+    Filters: oil_type, start_date, end_date, search (batch/traceable code),
+             boundary_crossed, has_dependencies, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -548,39 +559,56 @@ def list_batches_with_status(filters=None):
                 COALESCE(b.traceable_code, ''),
                 CASE 
                     WHEN b.boundary_crossed = true THEN 'locked'
-                    WHEN EXISTS (
-                        SELECT 1 FROM sku_oil_allocation 
-                        WHERE source_type = 'batch' AND source_id = b.batch_id
-                    ) OR EXISTS (
-                        SELECT 1 FROM blend_batch_components 
-                        WHERE source_batch_id = b.batch_id AND status = 'active'
-                    ) THEN 'partial'
-                    WHEN b.created_at::date = CURRENT_DATE THEN 'editable'
+                    WHEN COALESCE(d.sku_allocations, 0) > 0
+                        OR COALESCE(d.blend_components, 0) > 0 THEN 'partial'
                     ELSE 'editable'
-                END as edit_status
+                END as edit_status,
+                COALESCE(d.sku_allocations, 0),
+                COALESCE(d.blend_components, 0),
+                COALESCE(d.cake_sales, 0)
             FROM batch b
             LEFT JOIN materials m ON b.seed_material_id = m.material_id
+            LEFT JOIN transaction_dependency_counts d
+                ON d.record_type = 'batch' AND d.record_id = b.batch_id
             WHERE b.status = 'active'
         """
         
         params = []
-        if filters:
-            if filters.get('oil_type'):
-                query += " AND b.oil_type = %s"
-                params.append(filters['oil_type'])
-            if filters.get('start_date'):
-                query += " AND b.production_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND b.production_date <= %s"
-                params.append(parse_date(filters['end_date']))
-        
-        query += " ORDER BY b.production_date DESC, b.batch_id DESC LIMIT 100"
+        if filters.get('oil_type'):
+            query += " AND b.oil_type = %s"
+            params.append(filters['oil_type'])
+        if filters.get('start_date'):
+            query += " AND b.production_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND b.production_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('search'):
+            query += " AND (b.batch_code ILIKE %s OR b.traceable_code ILIKE %s)"
+            params.extend([f"%{filters['search']}%"] * 2)
+        if filters.get('boundary_crossed') is not None:
+            query += " AND COALESCE(b.boundary_crossed, false) = %s"
+            params.append(str(filters['boundary_crossed']).lower() == 'true')
+        if filters.get('has_dependencies') is not None:
+            query += " AND COALESCE(d.has_dependencies, false) = %s"
+            params.append(str(filters['has_dependencies']).lower() == 'true')
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'b.production_date', 'b.batch_id', nullable=True
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
+        
+        limit = get_page_limit(filters)
+        query += f" ORDER BY {keyset_order_by('b.production_date', 'b.batch_id', nullable=True)} LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 3, 0)
         
         batches = []
-        for row in cur.fetchall():
+        for row in rows:
             batches.append({
                 'batch_id': row[0],
                 'batch_code': row[1] or f'BATCH-{row[0]}',  # Generate if NULL
@@ -592,13 +620,20 @@ def list_batches_with_status(filters=None):
                 'boundary_crossed': row[7],
                 'seed_material': row[9] or '',
                 'traceable_code': row[10] or '',
-                'edit_status': row[11]
+                'edit_status': row[11],
+                'dependencies': {
+                    'sku_allocations': row[12],
+                    'blend_components': row[13],
+                    'cake_sales': row[14]
+                }
             })
         
         return {
             'success': True,
             'batches': batches,
-            'count': len(batches)
+            'count': len(batches),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
@@ -888,9 +923,17 @@ def soft_delete_blend(blend_id, reason='', user='System'):
         close_connection(conn, cur)
 
 def list_blends_with_status(filters=None):
-    """List blends with edit/delete status - Handle NULLs"""
+    """
+    List blends with edit/delete status - Handle NULLs.
+
+    Same dependency source and cursor paging as list_batches_with_status.
+
+    Filters: oil_type, start_date, end_date, search (blend/traceable code),
+             boundary_crossed, has_dependencies, limit, cursor
+    """
     conn = get_db_connection()
     cur = conn.cursor()
+    filters = filters or {}
     
     try:
         query = """
@@ -907,35 +950,53 @@ def list_blends_with_status(filters=None):
                 COALESCE(bb.traceable_code, ''),
                 CASE 
                     WHEN bb.boundary_crossed = true THEN 'locked'
-                    WHEN EXISTS (
-                        SELECT 1 FROM sku_oil_allocation 
-                        WHERE source_type = 'blend' AND source_id = bb.blend_id
-                    ) THEN 'partial'
-                    WHEN bb.created_at::date = CURRENT_DATE THEN 'editable'
+                    WHEN COALESCE(d.sku_allocations, 0) > 0 THEN 'partial'
                     ELSE 'editable'
-                END as edit_status
+                END as edit_status,
+                COALESCE(d.sku_allocations, 0),
+                COALESCE(d.blend_components, 0)
             FROM blend_batches bb
+            LEFT JOIN transaction_dependency_counts d
+                ON d.record_type = 'blend' AND d.record_id = bb.blend_id
             WHERE bb.status = 'active'
         """
         
         params = []
-        if filters:
-            if filters.get('oil_type'):
-                query += " AND bb.result_oil_type = %s"
-                params.append(filters['oil_type'])
-            if filters.get('start_date'):
-                query += " AND bb.blend_date >= %s"
-                params.append(parse_date(filters['start_date']))
-            if filters.get('end_date'):
-                query += " AND bb.blend_date <= %s"
-                params.append(parse_date(filters['end_date']))
-        
-        query += " ORDER BY bb.blend_date DESC, bb.blend_id DESC LIMIT 100"
+        if filters.get('oil_type'):
+            query += " AND bb.result_oil_type = %s"
+            params.append(filters['oil_type'])
+        if filters.get('start_date'):
+            query += " AND bb.blend_date >= %s"
+            params.append(parse_date(filters['start_date']))
+        if filters.get('end_date'):
+            query += " AND bb.blend_date <= %s"
+            params.append(parse_date(filters['end_date']))
+        if filters.get('search'):
+            query += " AND (bb.blend_code ILIKE %s OR bb.traceable_code ILIKE %s)"
+            params.extend([f"%{filters['search']}%"] * 2)
+        if filters.get('boundary_crossed') is not None:
+            query += " AND COALESCE(bb.boundary_crossed, false) = %s"
+            params.append(str(filters['boundary_crossed']).lower() == 'true')
+        if filters.get('has_dependencies') is not None:
+            query += " AND COALESCE(d.has_dependencies, false) = %s"
+            params.append(str(filters['has_dependencies']).lower() == 'true')
+        
+        cursor_condition, cursor_params = keyset_condition(
+            filters, 'bb.blend_date', 'bb.blend_id'
+        )
+        if cursor_condition:
+            query += f" AND {cursor_condition}"
+            params.extend(cursor_params)
+        
+        limit = get_page_limit(filters)
+        query += " ORDER BY bb.blend_date DESC, bb.blend_id DESC LIMIT %s"
+        params.append(limit + 1)
         
         cur.execute(query, params)
+        rows, has_more, next_cursor = split_keyset_page(cur.fetchall(), limit, 3, 0)
         
         blends = []
-        for row in cur.fetchall():
+        for row in rows:
             blends.append({
                 'blend_id': row[0],
                 'blend_code': row[1] or f'BLEND-{row[0]}',  # Generate if NULL
@@ -946,13 +1007,19 @@ def list_blends_with_status(filters=None):
                 'status': row[6],
                 'boundary_crossed': row[7],
                 'traceable_code': row[9] or '',
-                'edit_status': row[10]
+                'edit_status': row[10],
+                'dependencies': {
+                    'sku_allocations': row[11],
+                    'blend_components': row[12]
+                }
             })
         
         return {
             'success': True,
             'blends': blends,
-            'count': len(blends)
+            'count': len(blends),
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }
         
     except Exception as e:
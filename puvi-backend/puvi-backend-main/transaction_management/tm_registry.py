@@ -0,0 +1,145 @@
+"""
+Transaction Manager - Schema & Rules Registry
+File Path: puvi-backend/puvi-backend-main/transaction_management/tm_registry.py
+Purpose: Per-worker cache of table columns (information_schema) and active
+         field_edit_rules, so stats and editability checks read them from
+         memory instead of querying the catalog on every request
+
+The registry loads on first use in each worker process. A daemon thread
+LISTENs on the 'tm_registry_refresh' channel and marks it stale when a
+migration or a field_edit_rules change sends NOTIFY (see migrations/016);
+the next access reloads. REGISTRY_MAX_AGE bounds staleness if the
+listener cannot connect.
+"""
+
+import os
+import select
+import threading
+import time
+from db_utils import get_db_connection, close_connection
+
+REGISTRY_CHANNEL = 'tm_registry_refresh'
+REGISTRY_MAX_AGE = 600  # seconds
+
+_lock = threading.Lock()
+_registry = {
+    'columns': {},       # table -> frozenset of column names
+    'rules': {},         # table -> {field: rule}
+    'loaded_at': None,
+    'stale': True
+}
+_listener = {'pid': None}
+
+
+def _load(cur):
+    """Read all columns and active field rules in two queries"""
+    cur.execute("""
+        SELECT table_name, array_agg(column_name::text)
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+        GROUP BY table_name
+    """)
+    columns = {row[0]: frozenset(row[1]) for row in cur.fetchall()}
+
+    cur.execute("""
+        SELECT table_name, field_name, classification, dependency_check_sql,
+               edit_condition, reason_template, affects_calculation,
+               affects_inventory, affects_traceability
+        FROM field_edit_rules
+        WHERE is_active = true
+        ORDER BY table_name, display_order, field_name
+    """)
+    rules = {}
+    for row in cur.fetchall():
+        rules.setdefault(row[0], {})[row[1]] = {
+            'classification': row[2],
+            'dependency_check_sql': row[3],
+            'edit_condition': row[4],
+            'reason_template': row[5],
+            'affects_calculation': row[6],
+            'affects_inventory': row[7],
+            'affects_traceability': row[8]
+        }
+
+    _registry['columns'] = columns
+    _registry['rules'] = rules
+    _registry['loaded_at'] = time.time()
+    _registry['stale'] = False
+
+
+def _listen():
+    """Mark the registry stale on every NOTIFY; reconnect on failure"""
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {REGISTRY_CHANNEL}")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    _registry['stale'] = True
+        except Exception as e:
+            print(f"TM registry listener error: {str(e)}")
+            _registry['stale'] = True
+            time.sleep(30)
+        finally:
+            close_connection(conn, None)
+
+
+def _ensure_listener():
+    """Start one listener per worker process (after any fork)"""
+    if _listener['pid'] == os.getpid():
+        return
+    _listener['pid'] = os.getpid()
+    threading.Thread(target=_listen, name='tm-registry-listener', daemon=True).start()
+
+
+def _ensure_loaded(cur):
+    expired = (
+        _registry['loaded_at'] is None
+        or time.time() - _registry['loaded_at'] > REGISTRY_MAX_AGE
+    )
+    if not (_registry['stale'] or expired):
+        return
+    with _lock:
+        _ensure_listener()
+        if _registry['stale'] or expired:
+            _load(cur)
+
+
+def get_table_columns(table_name, cur):
+    """Column names of a table (empty if the table does not exist)"""
+    _ensure_loaded(cur)
+    return _registry['columns'].get(table_name, frozenset())
+
+
+def get_table_field_rules(table_name, cur):
+    """Active field_edit_rules of a table as {field: rule}"""
+    _ensure_loaded(cur)
+    return _registry['rules'].get(table_name, {})
+
+
+def refresh_registry(cur):
+    """Reload now in this worker (other workers reload on NOTIFY)"""
+    with _lock:
+        _load(cur)
+
+
+def notify_registry_refresh(cur):
+    """Ask every worker to reload; delivered when the transaction commits"""
+    cur.execute("SELECT pg_notify(%s, 'manual')", (REGISTRY_CHANNEL,))
+
+
+def get_registry_status():
+    """Load time and size of this worker's registry"""
+    return {
+        'loaded_at': _registry['loaded_at'],
+        'stale': _registry['stale'],
+        'tables': len(_registry['columns']),
+        'rule_tables': len(_registry['rules']),
+        'listener_pid': _listener['pid']
+    }
@@ -0,0 +1,97 @@
+# =====================================================
+# PUVI System - Analytics Rollups
+# File: puvi-backend/utils/analytics_rollups.py
+# Purpose: Backfill / rebuild the time-bucketed rollups (migration 011)
+#          that row triggers keep current on every posting path
+# =====================================================
+
+import sys
+
+# Streams and the posting table each one is derived from
+ANALYTICS_STREAMS = {
+    'purchase': 'purchase_items',
+    'batch': 'batch',
+    'blend': 'blend_batches',
+    'sku_production': 'sku_production',
+    'outbound': 'sku_outbound_items'
+}
+
+ANALYTICS_GRAINS = ('day', 'week', 'month')
+
+# Dimension column -> (lookup table, key column, label column)
+ANALYTICS_DIMENSIONS = {
+    'oil_type': None,
+    'material_id': ('materials', 'material_id', 'material_name'),
+    'sku_id': ('sku_master', 'sku_id', 'sku_code'),
+    'location_id': ('locations_master', 'location_id', 'location_name'),
+    'customer_id': ('customers', 'customer_id', 'customer_name')
+}
+
+ANALYTICS_MEASURES = ('txn_count', 'quantity', 'weight_kg', 'amount')
+
+
+def backfill_analytics_rollups(connection, streams=None):
+    """
+    Rebuild the rollups of each stream from its posting table, one
+    transaction per stream. Concurrent runs skip.
+
+    Args:
+        connection: Database connection
+        streams: Optional list of streams (default: all)
+
+    Returns:
+        Dictionary with fact row counts per stream
+    """
+    streams = streams or list(ANALYTICS_STREAMS)
+    unknown = [stream for stream in streams if stream not in ANALYTICS_STREAMS]
+    if unknown:
+        return {'success': False, 'error': f"Unknown streams: {', '.join(unknown)}"}
+
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('analytics_rollups_backfill'))")
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return {'success': True, 'skipped': True, 'message': 'Backfill already running'}
+        connection.commit()
+
+        fact_rows = {}
+        try:
+            for stream in streams:
+                # Block posting to the source table so no delta lands mid-rebuild
+                cursor.execute(
+                    f"LOCK TABLE {ANALYTICS_STREAMS[stream]} IN SHARE ROW EXCLUSIVE MODE"
+                )
+                cursor.execute("SELECT rebuild_analytics_rollups(%s)", (stream,))
+                fact_rows[stream] = cursor.fetchone()[0]
+                connection.commit()
+        finally:
+            # Leave an aborted stream transaction first, or the unlock fails too
+            connection.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext('analytics_rollups_backfill'))")
+            connection.commit()
+
+        return {
+            'success': True,
+            'fact_rows': fact_rows,
+            'message': f'Rebuilt {len(fact_rows)} analytics streams'
+        }
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error backfilling analytics rollups: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    # Backfill: python -m utils.analytics_rollups [stream ...]
+    from db_utils import get_db_connection, close_connection
+
+    conn = get_db_connection()
+    try:
+        print(backfill_analytics_rollups(conn, sys.argv[1:] or None))
+    finally:
+        close_connection(conn, None)
@@ -0,0 +1,148 @@
+"""
+Code allocator for PUVI Oil Manufacturing System
+Allocates unique customer, ship-to and location codes: every existing
+code sharing the candidates' prefixes is read in one indexed query
+(migration 022), free candidates are picked in memory, and the insert
+runs under the UNIQUE constraint with a retry when a concurrent request
+took the same code
+File Path: puvi-backend/puvi-backend-main/utils/code_allocator.py
+"""
+
+import psycopg2
+from psycopg2 import errorcodes
+
+MAX_INSERT_ATTEMPTS = 5
+
+
+def escape_like(value):
+    """Escape LIKE wildcards so a prefix matches literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def fetch_existing_codes(table, column, prefixes, cur):
+    """
+    Existing codes starting with any of the prefixes, in one query.
+
+    Args:
+        table: Table holding the codes
+        column: Code column (indexed with varchar_pattern_ops)
+        prefixes: Iterable of code prefixes
+        cur: Database cursor
+
+    Returns:
+        set: Codes already in use
+    """
+    prefixes = sorted(set(prefixes))
+    if not prefixes:
+        return set()
+
+    # OR'd constant patterns so each prefix is its own index range scan
+    conditions = ' OR '.join(f'{column} LIKE %s' for _ in prefixes)
+    cur.execute(
+        f"SELECT {column} FROM {table} WHERE {conditions}",
+        [escape_like(prefix) + '%' for prefix in prefixes]
+    )
+    return {row[0] for row in cur.fetchall()}
+
+
+def first_free(candidates, taken):
+    """
+    First candidate not in taken; it is added to taken so later calls in
+    the same batch skip it.
+
+    Returns:
+        str or None if every candidate is in use
+    """
+    for candidate in candidates:
+        if candidate not in taken:
+            taken.add(candidate)
+            return candidate
+    return None
+
+
+def next_sequence_codes(prefix, count, taken, width=3):
+    """
+    The first count free codes of a numbered sequence
+    (e.g. FAC-001, FAC-002 ...), filling gaps left by deleted records.
+
+    Args:
+        prefix: Code prefix including the separator (e.g. 'FAC-')
+        count: Number of codes wanted
+        taken: Set of codes in use; allocated codes are added to it
+        width: Zero padding of the number
+
+    Returns:
+        list: Allocated codes
+    """
+    codes = []
+    number = 1
+    while len(codes) < count:
+        code = f"{prefix}{number:0{width}d}"
+        if code not in taken:
+            taken.add(code)
+            codes.append(code)
+        number += 1
+    return codes
+
+
+def allocate_sequence_codes(counts_by_prefix, table, column, cur, width=3):
+    """
+    Numbered codes for any number of prefixes with one query.
+
+    Args:
+        counts_by_prefix: dict prefix -> number of codes wanted
+        table: Table holding the codes
+        column: Code column
+        cur: Database cursor
+        width: Zero padding of the number
+
+    Returns:
+        dict: prefix -> list of allocated codes
+    """
+    taken = fetch_existing_codes(table, column, counts_by_prefix.keys(), cur)
+    return {
+        prefix: next_sequence_codes(prefix, count, taken, width)
+        for prefix, count in counts_by_prefix.items()
+    }
+
+
+def is_code_conflict(error, constraint_name):
+    """True if error is a unique violation of the given constraint"""
+    return (
+        isinstance(error, psycopg2.IntegrityError)
+        and error.pgcode == errorcodes.UNIQUE_VIOLATION
+        and error.diag.constraint_name == constraint_name
+    )
+
+
+def insert_with_code(allocate, insert, constraint_name, cur,
+                     max_attempts=MAX_INSERT_ATTEMPTS):
+    """
+    Allocate code(s) and insert under the UNIQUE constraint, allocating
+    again when a concurrent transaction committed the same code first.
+    Each attempt runs in a savepoint so the caller's transaction survives
+    a conflict.
+
+    Args:
+        allocate: Callable returning the code (or list of codes); called
+                  again after a conflict and sees the committed codes
+        insert: Callable taking the allocated value and running the insert
+        constraint_name: UNIQUE constraint on the code column
+        cur: Database cursor
+        max_attempts: Attempts before the conflict is raised
+
+    Returns:
+        tuple: (allocated value, return value of insert)
+    """
+    for attempt in range(1, max_attempts + 1):
+        allocated = allocate()
+        cur.execute("SAVEPOINT code_allocation")
+        try:
+            result = insert(allocated)
+        except psycopg2.IntegrityError as e:
+            cur.execute("ROLLBACK TO SAVEPOINT code_allocation")
+            if not is_code_conflict(e, constraint_name) or attempt == max_attempts:
+                raise
+            continue
+        cur.execute("RELEASE SAVEPOINT code_allocation")
+        return allocated, result
@@ -0,0 +1,195 @@
+"""
+Dependency checks for PUVI Oil Manufacturing System
+Answers "what references these records" for any number of records in one
+query: each record is expanded with a LATERAL UNION ALL of one COUNT per
+dependent table. Records found free of dependencies are cached per worker
+until a write to one of the checked tables (NOTIFY from migration 021)
+File Path: puvi-backend/puvi-backend-main/utils/dependency_checks.py
+
+A dependency spec is a dict:
+    name: Identifier reported back
+    table: Dependent table, aliased d
+    condition: SQL matching d against the record key k.key (or the
+               record's own row r when a reference table is given)
+    quantity: Optional aggregate reported alongside the count
+"""
+
+import os
+import select
+import threading
+import time
+from db_utils import get_db_connection, close_connection
+
+DEPENDENCY_CHANNEL = 'dependency_cache_invalidate'
+DEPENDENCY_CACHE_MAX_AGE = 300  # seconds
+
+_lock = threading.Lock()
+_cache = {}          # entity -> {key: cached_at} of records with no dependencies
+_entity_tables = {}  # entity -> set of tables whose writes invalidate it
+_generations = {}    # entity -> invalidation count
+_listener = {'pid': None, 'connected': False}
+
+
+def _invalidate_table(table_name):
+    with _lock:
+        for entity, tables in _entity_tables.items():
+            if table_name in tables:
+                _cache.pop(entity, None)
+                _generations[entity] = _generations.get(entity, 0) + 1
+
+
+def _listen():
+    """Drop cached entries on every NOTIFY; reconnect on failure"""
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {DEPENDENCY_CHANNEL}")
+            _listener['connected'] = True
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _invalidate_table(conn.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"Dependency cache listener error: {str(e)}")
+            _listener['connected'] = False
+            with _lock:
+                _cache.clear()
+            time.sleep(30)
+        finally:
+            close_connection(conn, None)
+
+
+def _ensure_listener():
+    """Start one listener per worker process (after any fork)"""
+    if _listener['pid'] == os.getpid():
+        return
+    _listener['pid'] = os.getpid()
+    _listener['connected'] = False
+    threading.Thread(target=_listen, name='dependency-cache-listener', daemon=True).start()
+
+
+def _cached_free_keys(entity, keys):
+    now = time.time()
+    with _lock:
+        entries = _cache.get(entity, {})
+        return {
+            key for key in keys
+            if key in entries and now - entries[key] <= DEPENDENCY_CACHE_MAX_AGE
+        }
+
+
+def build_dependency_query(specs, key_type='integer', reference=None):
+    """
+    One query over unnest(keys) returning (key, spec index, count,
+    quantity) for every dependency that has rows.
+
+    Args:
+        specs: List of dependency specs
+        key_type: SQL type of the record keys
+        reference: Optional (table, key column) joined as r
+    """
+    branches = [
+        f"""
+            SELECT {index} as spec_index, COUNT(*) as dependent_count,
+                   {spec.get('quantity') or 'NULL::numeric'} as quantity
+            FROM {spec['table']} d
+            WHERE {spec['condition']}"""
+        for index, spec in enumerate(specs)
+    ]
+
+    reference_join = ''
+    if reference:
+        reference_join = f"JOIN {reference[0]} r ON r.{reference[1]} = k.key"
+
+    return f"""
+        SELECT k.key, dep.spec_index, dep.dependent_count, dep.quantity
+        FROM unnest(%s::{key_type}[]) AS k(key)
+        {reference_join}
+        CROSS JOIN LATERAL ({' UNION ALL'.join(branches)}
+        ) dep
+        WHERE dep.dependent_count > 0
+    """
+
+
+def find_dependencies(entity, specs, keys, cur, key_type='integer',
+                      reference=None, use_cache=True):
+    """
+    Dependencies of many records in one query.
+
+    Args:
+        entity: Cache namespace (e.g. 'locations')
+        specs: List of dependency specs
+        keys: Record keys
+        cur: Database cursor
+        key_type: SQL type of the keys
+        reference: Optional (table, key column) joined as r
+        use_cache: Skip records cached as dependency-free; pass False
+                   when the answer decides a hard delete
+
+    Returns:
+        dict: key -> list of {name, table, count, quantity}; empty list
+              when the record has no dependencies
+    """
+    keys = list(dict.fromkeys(keys))
+    results = {key: [] for key in keys}
+    if not keys or not specs:
+        return results
+
+    with _lock:
+        _ensure_listener()
+        _entity_tables[entity] = {spec['table'] for spec in specs} | (
+            {reference[0]} if reference else set()
+        )
+
+    generation = _generations.get(entity, 0)
+    pending = keys
+    if use_cache:
+        cached = _cached_free_keys(entity, keys)
+        pending = [key for key in keys if key not in cached]
+
+    if pending:
+        cur.execute(build_dependency_query(specs, key_type, reference), (pending,))
+        for key, spec_index, count, quantity in cur.fetchall():
+            spec = specs[spec_index]
+            results[key].append({
+                'name': spec['name'],
+                'table': spec['table'],
+                'count': count,
+                'quantity': float(quantity) if quantity is not None else None
+            })
+
+        # Only cache while invalidations can be received, and not if a
+        # write was announced while the query ran
+        if _listener['connected']:
+            now = time.time()
+            with _lock:
+                if _generations.get(entity, 0) != generation:
+                    return results
+                entries = _cache.setdefault(entity, {})
+                for key in pending:
+                    if not results[key]:
+                        entries[key] = now
+
+    return results
+
+
+def clear_dependency_cache(entity=None):
+    """Forget cached results (all entities by default) in this worker"""
+    with _lock:
+        if entity:
+            _cache.pop(entity, None)
+        else:
+            _cache.clear()
+
+
+def get_dependency_cache_status():
+    """Cached record counts per entity in this worker"""
+    return {
+        'entities': {entity: len(entries) for entity, entries in _cache.items()},
+        'listener_pid': _listener['pid'],
+        'listener_connected': _listener['connected']
+    }
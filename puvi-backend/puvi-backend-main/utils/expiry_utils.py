@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import psycopg2
 from decimal import Decimal
-from utils.date_utils import integer_to_date, parse_date
+from utils.date_utils import integer_to_date, parse_date, get_current_day_number
 
 def calculate_expiry_date(production_date_int, shelf_life_months):
     """
@@ -170,6 +170,8 @@ def check_near_expiry_items(connection, days_threshold=30, location_id=None):
     """
     Get list of items nearing expiry within specified days.
     FIXED: Added location_id filter support
+    Reads the expiry_bucket precomputed by run_expiry_sweep; expired lots
+    with stock remaining are included so they can be written off.
     
     Args:
         connection: Database connection
@@ -181,6 +183,7 @@ def check_near_expiry_items(connection, days_threshold=30, location_id=None):
     """
     try:
         cursor = connection.cursor()
+        today_int = get_current_day_number()
         
         query = """
             SELECT 
@@ -192,7 +195,8 @@ def check_near_expiry_items(connection, days_threshold=30, location_id=None):
                 s.product_name,
                 et.expiry_date,
                 et.quantity_remaining,
-                et.expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) as days_to_expiry,
+                et.expiry_date - %s as days_to_expiry,
+                et.expiry_bucket as expiry_status,
                 et.location_id,
                 l.location_name
             FROM sku_expiry_tracking et
@@ -200,11 +204,10 @@ def check_near_expiry_items(connection, days_threshold=30, location_id=None):
             JOIN sku_master s ON et.sku_id = s.sku_id
             LEFT JOIN locations_master l ON et.location_id = l.location_id
             WHERE et.quantity_remaining > 0
-            AND et.status != 'expired'
-            AND et.expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) <= %s
+            AND et.expiry_date <= %s
         """
         
-        params = [days_threshold]
+        params = [today_int, today_int + int(days_threshold)]
         
         # Add location filter if provided
         if location_id:
@@ -259,6 +262,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
         
         # Use database-compatible status
         status = get_database_status(expiry_date_int)
+        expiry_bucket = get_expiry_status(expiry_date_int)
         
         if existing:
             tracking_id = existing[0]
@@ -273,6 +277,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
                         quantity_produced = %s,
                         quantity_remaining = %s,
                         status = %s,
+                        expiry_bucket = %s,
                         location_id = %s,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE production_id = %s
@@ -283,6 +288,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
                     quantity_produced,
                     quantity_produced,  # Initially, remaining = produced
                     status,
+                    expiry_bucket,
                     location_id,
                     production_id
                 ))
@@ -295,6 +301,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
                         quantity_produced = %s,
                         quantity_remaining = %s,
                         status = %s,
+                        expiry_bucket = %s,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE production_id = %s
                     RETURNING tracking_id
@@ -304,6 +311,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
                     quantity_produced,
                     quantity_produced,
                     status,
+                    expiry_bucket,
                     production_id
                 ))
         else:
@@ -311,8 +319,8 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
             insert_query = """
                 INSERT INTO sku_expiry_tracking (
                     production_id, sku_id, production_date, expiry_date,
-                    quantity_produced, quantity_remaining, status, location_id
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    quantity_produced, quantity_remaining, status, expiry_bucket, location_id
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING tracking_id
             """
             cursor.execute(insert_query, (
@@ -323,6 +331,7 @@ def update_expiry_tracking(connection, production_id, sku_id, production_date_in
                 quantity_produced,
                 quantity_produced,  # Initially, remaining = produced
                 status,
+                expiry_bucket,
                 location_id  # FIXED: Now included
             ))
             print(f"Created new expiry tracking with location {location_id}")
@@ -346,6 +355,7 @@ def get_fefo_allocation(connection, sku_id, quantity_needed, location_id=None):
     """
     Get FEFO (First Expiry First Out) allocation for SKU sales.
     FIXED: Added location_id filter support
+    Single-SKU wrapper around get_fefo_allocation_batch.
     
     Args:
         connection: Database connection
@@ -357,50 +367,93 @@ def get_fefo_allocation(connection, sku_id, quantity_needed, location_id=None):
         Dictionary with allocation details
     """
     try:
-        cursor = connection.cursor()
-        
-        # Get available inventory ordered by expiry date (FEFO)
-        query = """
-            SELECT 
-                et.tracking_id,
-                et.production_id,
-                et.expiry_date,
-                et.quantity_remaining,
-                p.production_code,
-                p.traceable_code,
-                p.mrp_at_production,
-                et.location_id,
-                l.location_name
-            FROM sku_expiry_tracking et
-            JOIN sku_production p ON et.production_id = p.production_id
-            LEFT JOIN locations_master l ON et.location_id = l.location_id
-            WHERE et.sku_id = %s
-            AND et.quantity_remaining > 0
-            AND et.status != 'expired'
-        """
-        
-        params = [sku_id]
-        
-        # Add location filter if provided
-        if location_id:
-            query += " AND et.location_id = %s"
-            params.append(location_id)
-        
-        query += " ORDER BY et.expiry_date ASC, et.production_id ASC"
-        
-        cursor.execute(query, params)
-        
-        allocations = []
+        results = get_fefo_allocation_batch(
+            connection, [(sku_id, location_id, quantity_needed)]
+        )
+        result = results[0]
+        return {
+            'success': result['success'],
+            'allocations': result['allocations'],
+            'shortage': result['shortage'],
+            'message': result['message']
+        }
+            
+    except Exception as e:
+        print(f"Error in FEFO allocation: {str(e)}")
+        return {
+            'success': False,
+            'allocations': [],
+            'shortage': quantity_needed,
+            'message': f"Error: {str(e)}"
+        }
+
+
+FEFO_SKIP_LOCKED_ROUNDS = 3
+
+
+def _fetch_fefo_candidates(cursor, located_skus, located_locations, any_location_skus,
+                           excluded_ids):
+    """Open lots for the requested SKUs in FEFO order, without locking"""
+    cursor.execute("""
+        SELECT 
+            et.tracking_id,
+            et.sku_id,
+            et.production_id,
+            et.expiry_date,
+            et.quantity_remaining,
+            p.production_code,
+            p.traceable_code,
+            p.mrp_at_production,
+            p.cost_per_bottle,
+            et.location_id,
+            l.location_name
+        FROM sku_expiry_tracking et
+        JOIN sku_production p ON et.production_id = p.production_id
+        LEFT JOIN locations_master l ON et.location_id = l.location_id
+        WHERE et.quantity_remaining > 0
+        AND et.status != 'expired'
+        AND (
+            (et.sku_id, et.location_id) IN (
+                SELECT * FROM unnest(%s::int[], %s::int[])
+            )
+            OR et.sku_id = ANY(%s::int[])
+        )
+        AND NOT (et.tracking_id = ANY(%s::int[]))
+        ORDER BY et.sku_id, et.expiry_date ASC, et.production_id ASC, et.tracking_id ASC
+    """, (located_skus, located_locations, any_location_skus, excluded_ids))
+    return cursor.fetchall()
+
+
+def _allocate_fefo(lines, rows):
+    """Allocate each line from the candidate rows in a single FEFO pass"""
+    # Candidate lots per (sku, location) key; location None collects every lot of the SKU
+    candidates = {}
+    remaining_by_tracking = {}
+    for row in rows:
+        tracking_id, sku_id, _, _, qty_remaining, _, _, _, _, loc_id, _ = row
+        remaining_by_tracking[tracking_id] = qty_remaining
+        candidates.setdefault((sku_id, loc_id), []).append(row)
+        candidates.setdefault((sku_id, None), []).append(row)
+    
+    results = []
+    for sku_id, location_id, quantity_needed in lines:
+        key = (int(sku_id), int(location_id) if location_id else None)
         remaining_needed = Decimal(str(quantity_needed))
+        allocations = []
         
-        for row in cursor.fetchall():
+        for row in candidates.get(key, []):
             if remaining_needed <= 0:
                 break
-                
-            tracking_id, production_id, expiry_date, qty_available, prod_code, trace_code, mrp, loc_id, loc_name = row
             
-            # Calculate allocation from this batch
-            allocation_qty = min(remaining_needed, Decimal(str(qty_available)))
+            (tracking_id, _, production_id, expiry_date, qty_available, prod_code,
+             trace_code, mrp, cost_per_bottle, loc_id, loc_name) = row
+            
+            lot_remaining = remaining_by_tracking[tracking_id]
+            if lot_remaining <= 0:
+                continue
+            
+            allocation_qty = min(remaining_needed, lot_remaining)
+            remaining_by_tracking[tracking_id] = lot_remaining - allocation_qty
             
             allocations.append({
                 'tracking_id': tracking_id,
@@ -411,39 +464,131 @@ def get_fefo_allocation(connection, sku_id, quantity_needed, location_id=None):
                 'quantity_allocated': float(allocation_qty),
                 'quantity_available': float(qty_available),
                 'mrp': float(mrp) if mrp else None,
+                'cost_per_bottle': float(cost_per_bottle) if cost_per_bottle else 0,
                 'location_id': loc_id,
                 'location_name': loc_name
             })
             
             remaining_needed -= allocation_qty
         
-        cursor.close()
+        result = {
+            'sku_id': sku_id,
+            'location_id': location_id,
+            'quantity_needed': quantity_needed,
+            'allocations': allocations
+        }
         
         # Check if we could fulfill the entire quantity
         if remaining_needed > 0:
             location_msg = f" at location {location_id}" if location_id else ""
-            return {
+            result.update({
                 'success': False,
-                'allocations': allocations,
                 'shortage': float(remaining_needed),
                 'message': f"Insufficient stock{location_msg}. Short by {remaining_needed} units"
-            }
+            })
         else:
-            return {
+            result.update({
                 'success': True,
-                'allocations': allocations,
                 'shortage': 0,
                 'message': "Full quantity allocated"
+            })
+        
+        results.append(result)
+    
+    return results
+
+
+def _lock_tracking_rows(cursor, tracking_ids, skip_locked):
+    """Lock tracking rows; returns {tracking_id: quantity_remaining} of the rows locked"""
+    cursor.execute(f"""
+        SELECT tracking_id, quantity_remaining
+        FROM sku_expiry_tracking
+        WHERE tracking_id = ANY(%s::int[])
+        ORDER BY tracking_id
+        FOR UPDATE{' SKIP LOCKED' if skip_locked else ''}
+    """, (tracking_ids,))
+    return dict(cursor.fetchall())
+
+
+def get_fefo_allocation_batch(connection, lines, reserve=False):
+    """
+    FEFO allocation for many SKU/location lines in one query.
+    All candidate sku_expiry_tracking rows for the requested SKUs are
+    fetched once, ordered by SKU and expiry, and allocated in a single
+    pass. Lines for the same SKU/location consume the same lots in order.
+    
+    In reserve mode only the lots FEFO picks are locked, with
+    FOR UPDATE SKIP LOCKED, so the caller must hold the transaction open
+    until the allocation is posted. Lots locked by a concurrent outbound
+    are left out and the allocation is recomputed from the next lots; if
+    the stock is then short, the skipped lots are waited for instead.
+    
+    Args:
+        connection: Database connection (not committed here)
+        lines: List of (sku_id, location_id, quantity_needed) tuples;
+               location_id may be None to allocate from any location
+        reserve: Lock the chosen tracking rows for the current transaction
+        
+    Returns:
+        List of allocation results, one per line, in input order
+    """
+    if not lines:
+        return []
+    
+    located_skus = []
+    located_locations = []
+    any_location_skus = []
+    for sku_id, location_id, _ in lines:
+        if location_id:
+            located_skus.append(int(sku_id))
+            located_locations.append(int(location_id))
+        else:
+            any_location_skus.append(int(sku_id))
+    
+    cursor = connection.cursor()
+    try:
+        skipped = set()
+        locked = {}
+        skip_rounds = 0
+        
+        while True:
+            rows = _fetch_fefo_candidates(
+                cursor, located_skus, located_locations, any_location_skus, sorted(skipped)
+            )
+            results = _allocate_fefo(lines, rows)
+            if not reserve:
+                return results
+            
+            fetched = {row[0]: row[4] for row in rows}
+            chosen = {
+                allocation['tracking_id']
+                for result in results for allocation in result['allocations']
             }
             
-    except Exception as e:
-        print(f"Error in FEFO allocation: {str(e)}")
-        return {
-            'success': False,
-            'allocations': [],
-            'shortage': quantity_needed,
-            'message': f"Error: {str(e)}"
-        }
+            to_lock = sorted(chosen - locked.keys())
+            if to_lock:
+                newly_locked = _lock_tracking_rows(
+                    cursor, to_lock, skip_locked=skip_rounds < FEFO_SKIP_LOCKED_ROUNDS
+                )
+                skip_rounds += 1
+                locked.update(newly_locked)
+                skipped |= set(to_lock) - newly_locked.keys()
+                
+                # Reallocate if a chosen lot was skipped or changed before it was locked
+                if chosen & skipped or any(
+                    quantity != fetched[tracking_id]
+                    for tracking_id, quantity in newly_locked.items()
+                ):
+                    continue
+            
+            if not skipped or all(result['success'] for result in results):
+                return results
+            
+            # Short only because concurrent outbounds hold lots: wait for them
+            locked.update(_lock_tracking_rows(cursor, sorted(skipped), skip_locked=False))
+            skipped.clear()
+    finally:
+        cursor.close()
 
 
 def format_expiry_date_display(expiry_date_int):
@@ -472,6 +617,8 @@ def get_expiry_alert_summary(connection, location_id=None):
     """
     Get summary of items by expiry status for dashboard.
     FIXED: Added location filter support
+    Reads sku_expiry_summary, which is kept current by the
+    sku_expiry_tracking trigger and the daily expiry sweep.
     
     Args:
         connection: Database connection
@@ -483,20 +630,13 @@ def get_expiry_alert_summary(connection, location_id=None):
     try:
         cursor = connection.cursor()
         
-        # Use GROUP BY 1 to group by the first column (the CASE expression)
         query = """
             SELECT 
-                CASE 
-                    WHEN expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) <= 0 THEN 'expired'
-                    WHEN expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) <= 30 THEN 'critical'
-                    WHEN expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) <= 60 THEN 'warning'
-                    WHEN expiry_date - (EXTRACT(EPOCH FROM CURRENT_DATE)::INTEGER / 86400) <= 90 THEN 'caution'
-                    ELSE 'normal'
-                END as status,
-                COUNT(*) as count,
-                SUM(quantity_remaining) as total_quantity
-            FROM sku_expiry_tracking
-            WHERE quantity_remaining > 0
+                expiry_bucket,
+                SUM(lot_count) as count,
+                SUM(total_quantity) as total_quantity
+            FROM sku_expiry_summary
+            WHERE lot_count > 0
         """
         
         params = []
@@ -506,7 +646,7 @@ def get_expiry_alert_summary(connection, location_id=None):
             query += " AND location_id = %s"
             params.append(location_id)
         
-        query += " GROUP BY 1"
+        query += " GROUP BY expiry_bucket"
         
         cursor.execute(query, params)
         
@@ -521,7 +661,7 @@ def get_expiry_alert_summary(connection, location_id=None):
         for row in cursor.fetchall():
             status, count, quantity = row
             summary[status] = {
-                'count': count,
+                'count': int(count),
                 'quantity': float(quantity) if quantity else 0
             }
         
@@ -533,6 +673,117 @@ def get_expiry_alert_summary(connection, location_id=None):
         return {}
 
 
+def run_expiry_sweep(connection, force=False):
+    """
+    Re-bucket every lot with stock remaining in one set-based UPDATE.
+    Moves lots between expired/critical/warning/caution/normal as dates
+    pass and keeps sku_expiry_tracking.status in step ('consumed' lots are
+    left alone). sku_expiry_summary follows through its trigger.
+    Runs at most once per day unless forced; concurrent callers skip.
+    
+    Args:
+        connection: Database connection
+        force: Run even if today's sweep is already recorded
+        
+    Returns:
+        Dictionary with sweep results
+    """
+    try:
+        cursor = connection.cursor()
+        today_int = get_current_day_number()
+        
+        # Only one worker sweeps at a time; others return immediately
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('sku_expiry_sweep'))")
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            cursor.close()
+            return {'success': True, 'skipped': True, 'message': 'Sweep already running'}
+        
+        if not force:
+            cursor.execute("""
+                SELECT config_value FROM system_configuration
+                WHERE config_key = 'expiry_sweep_last_day'
+            """)
+            result = cursor.fetchone()
+            if result and result[0] and int(result[0]) >= today_int:
+                connection.rollback()
+                cursor.close()
+                return {'success': True, 'skipped': True, 'message': 'Sweep already done today'}
+        
+        cursor.execute("""
+            UPDATE sku_expiry_tracking
+            SET expiry_bucket = sku_expiry_bucket(expiry_date, %s),
+                status = CASE
+                    WHEN status = 'consumed' THEN status
+                    WHEN sku_expiry_bucket(expiry_date, %s) = 'expired' THEN 'expired'
+                    WHEN sku_expiry_bucket(expiry_date, %s) = 'normal' THEN 'active'
+                    ELSE 'near_expiry'
+                END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE quantity_remaining > 0
+            AND expiry_bucket IS DISTINCT FROM sku_expiry_bucket(expiry_date, %s)
+        """, (today_int, today_int, today_int, today_int))
+        
+        lots_updated = cursor.rowcount
+        
+        cursor.execute("""
+            INSERT INTO system_configuration (config_key, config_value, config_type, description)
+            VALUES ('expiry_sweep_last_day', %s, 'integer', 'Day number of the last SKU expiry sweep')
+            ON CONFLICT (config_key) DO UPDATE
+            SET config_value = EXCLUDED.config_value,
+                updated_at = CURRENT_TIMESTAMP
+        """, (str(today_int),))
+        
+        connection.commit()
+        cursor.close()
+        
+        print(f"Expiry sweep complete: {lots_updated} lots re-bucketed")
+        return {
+            'success': True,
+            'skipped': False,
+            'swept_day': today_int,
+            'lots_updated': lots_updated
+        }
+        
+    except Exception as e:
+        if connection:
+            connection.rollback()
+        print(f"Error running expiry sweep: {str(e)}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def get_expiry_sweep_status(connection):
+    """
+    Day of the last expiry sweep and whether the buckets are behind today.
+    Read-only: the sweep runs from the nightly job or the
+    /api/sku/expiry-sweep endpoint, never from a read.
+    
+    Args:
+        connection: Database connection
+        
+    Returns:
+        Dictionary with last_swept_day and stale
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT config_value FROM system_configuration
+            WHERE config_key = 'expiry_sweep_last_day'
+        """)
+        result = cursor.fetchone()
+    finally:
+        cursor.close()
+    
+    last_swept_day = int(result[0]) if result and result[0] else None
+    return {
+        'last_swept_day': last_swept_day,
+        'stale': last_swept_day is None or last_swept_day < get_current_day_number()
+    }
+
+
 def update_expiry_tracking_on_transfer(connection, tracking_ids, new_location_id):
     """
     Update location for expiry tracking records during transfers.
@@ -668,3 +919,15 @@ def repair_missing_locations(connection, default_location_id=None):
             'success': False,
             'error': str(e)
         }
+
+
+if __name__ == '__main__':
+    # Nightly job: python -m utils.expiry_utils [--force]
+    import sys
+    from db_utils import get_db_connection, close_connection
+    
+    conn = get_db_connection()
+    try:
+        print(run_expiry_sweep(conn, force='--force' in sys.argv))
+    finally:
+        close_connection(conn, None)
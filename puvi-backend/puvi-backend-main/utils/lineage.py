@@ -0,0 +1,135 @@
+"""
+Lineage (genealogy) utilities for PUVI Oil Manufacturing System
+Maintains lineage_edges and the lineage_closure table on every posting so
+forward/backward traces and recalls are single indexed lookups
+File Path: puvi-backend/puvi-backend-main/utils/lineage.py
+
+Node types: 'purchase', 'batch', 'blend', 'sku_production', 'outbound'
+"""
+
+from psycopg2.extras import execute_values
+
+
+def record_lineage_edges(edges, cur):
+    """
+    Record parent -> child lineage edges and extend the closure table.
+    Runs in the caller's transaction as two set-based statements,
+    whatever the number of edges.
+    
+    Args:
+        edges: List of (parent_type, parent_id, child_type, child_id, quantity)
+        cur: Database cursor
+    
+    Returns:
+        int: Number of edges passed in
+    """
+    edges = [edge for edge in edges if edge[1] is not None and edge[3] is not None]
+    if not edges:
+        return 0
+    
+    execute_values(cur, """
+        INSERT INTO lineage_edges (parent_type, parent_id, child_type, child_id, quantity)
+        VALUES %s
+        ON CONFLICT (parent_type, parent_id, child_type, child_id) DO NOTHING
+    """, [
+        (parent_type, int(parent_id), child_type, int(child_id), quantity)
+        for parent_type, parent_id, child_type, child_id, quantity in edges
+    ])
+    
+    # Every ancestor of a parent (and the parent) reaches every
+    # descendant of the child (and the child)
+    cur.execute("""
+        WITH e AS (
+            SELECT * FROM unnest(%s::varchar[], %s::int[], %s::varchar[], %s::int[])
+                AS t(parent_type, parent_id, child_type, child_id)
+        ),
+        up AS (
+            SELECT e.child_type, e.child_id,
+                   e.parent_type AS ancestor_type, e.parent_id AS ancestor_id, 1 AS depth
+            FROM e
+            UNION ALL
+            SELECT e.child_type, e.child_id, c.ancestor_type, c.ancestor_id, c.depth + 1
+            FROM e
+            JOIN lineage_closure c
+                ON c.descendant_type = e.parent_type AND c.descendant_id = e.parent_id
+        ),
+        down AS (
+            SELECT DISTINCT e.child_type AS root_type, e.child_id AS root_id,
+                   e.child_type AS descendant_type, e.child_id AS descendant_id, 0 AS depth
+            FROM e
+            UNION ALL
+            SELECT e.child_type, e.child_id, c.descendant_type, c.descendant_id, c.depth
+            FROM e
+            JOIN lineage_closure c
+                ON c.ancestor_type = e.child_type AND c.ancestor_id = e.child_id
+        )
+        INSERT INTO lineage_closure (ancestor_type, ancestor_id, descendant_type, descendant_id, depth)
+        SELECT up.ancestor_type, up.ancestor_id, down.descendant_type, down.descendant_id,
+               MIN(up.depth + down.depth)
+        FROM up
+        JOIN down ON down.root_type = up.child_type AND down.root_id = up.child_id
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (ancestor_type, ancestor_id, descendant_type, descendant_id)
+        DO UPDATE SET depth = LEAST(lineage_closure.depth, EXCLUDED.depth)
+    """, (
+        [edge[0] for edge in edges],
+        [int(edge[1]) for edge in edges],
+        [edge[2] for edge in edges],
+        [int(edge[3]) for edge in edges]
+    ))
+    
+    return len(edges)
+
+
+def record_batch_lineage(batch_id, seed_purchase_code, seed_quantity, cur):
+    """
+    Link a new extraction batch to the seed purchase it consumed.
+    
+    Args:
+        batch_id: New batch ID
+        seed_purchase_code: Traceable code of the seed purchase
+        seed_quantity: Seed quantity used
+        cur: Database cursor
+    """
+    if not seed_purchase_code:
+        return 0
+    
+    cur.execute("""
+        SELECT purchase_id FROM purchases WHERE traceable_code = %s
+    """, (seed_purchase_code,))
+    
+    return record_lineage_edges(
+        [('purchase', row[0], 'batch', batch_id, seed_quantity) for row in cur.fetchall()],
+        cur
+    )
+
+
+def resolve_lineage_nodes(code, cur):
+    """
+    Resolve a traceable code (or document code) to lineage nodes.
+    Blend traceable codes are not unique, so several nodes may match.
+    
+    Args:
+        code: Purchase/batch/blend/SKU traceable code, batch/blend/production
+              code, or outbound code
+        cur: Database cursor
+    
+    Returns:
+        list: (node_type, node_id) tuples
+    """
+    cur.execute("""
+        SELECT 'purchase', purchase_id FROM purchases WHERE traceable_code = %(code)s
+        UNION ALL
+        SELECT 'batch', batch_id FROM batch
+        WHERE traceable_code = %(code)s OR batch_code = %(code)s
+        UNION ALL
+        SELECT 'blend', blend_id FROM blend_batches
+        WHERE traceable_code = %(code)s OR blend_code = %(code)s
+        UNION ALL
+        SELECT 'sku_production', production_id FROM sku_production
+        WHERE traceable_code = %(code)s OR production_code = %(code)s
+        UNION ALL
+        SELECT 'outbound', outbound_id FROM sku_outbound WHERE outbound_code = %(code)s
+    """, {'code': code})
+    
+    return [(row[0], row[1]) for row in cur.fetchall()]
@@ -0,0 +1,331 @@
+"""
+Material valuation engine for PUVI Oil Manufacturing System
+Replays the material_movements ledger (migration 017) with a moving
+weighted average from the affected date onward, writes checkpoints every
+CHECKPOINT_INTERVAL movements, refreshes inventory / materials cost and
+reports batches whose seed cost no longer matches the replayed average
+File Path: puvi-backend/puvi-backend-main/utils/material_valuation.py
+"""
+
+import sys
+from decimal import Decimal
+from psycopg2.extras import execute_values
+
+CHECKPOINT_INTERVAL = 100
+
+# Ignore differences below this when reporting adjustment candidates
+COST_TOLERANCE = Decimal('0.01')
+
+ZERO = Decimal('0')
+
+
+def _to_decimal(value):
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+def _replay_material(material_id, from_date, checkpoint_interval, cur):
+    """
+    Re-value one material's movements on or after from_date.
+
+    Starts from the last checkpoint before from_date (or the beginning),
+    so at most checkpoint_interval - 1 earlier movements are replayed.
+
+    Returns:
+        dict: Replay summary with the final running quantity / average
+    """
+    cur.execute("""
+        DELETE FROM material_valuation_checkpoints
+        WHERE material_id = %s AND movement_date >= %s
+    """, (material_id, from_date))
+
+    cur.execute("""
+        SELECT movement_date, movement_id, movement_count,
+               running_quantity, running_avg_cost
+        FROM material_valuation_checkpoints
+        WHERE material_id = %s
+        ORDER BY movement_date DESC, movement_id DESC
+        LIMIT 1
+    """, (material_id,))
+    checkpoint = cur.fetchone()
+
+    if checkpoint:
+        start_key = (checkpoint[0], checkpoint[1])
+        movement_count = checkpoint[2]
+        quantity = _to_decimal(checkpoint[3])
+        avg_cost = _to_decimal(checkpoint[4])
+    else:
+        start_key = None
+        movement_count = 0
+        quantity = ZERO
+        avg_cost = ZERO
+
+    query = """
+        SELECT movement_id, movement_date, quantity, priced, unit_cost
+        FROM material_movements
+        WHERE material_id = %s
+    """
+    params = [material_id]
+    if start_key:
+        query += " AND (movement_date, movement_id) > (%s, %s)"
+        params.extend(start_key)
+    query += " ORDER BY movement_date, movement_id"
+    cur.execute(query, params)
+
+    replayed = []
+    checkpoints = []
+    for movement_id, movement_date, movement_qty, priced, unit_cost in cur.fetchall():
+        movement_qty = _to_decimal(movement_qty)
+
+        if priced:
+            valued_cost = _to_decimal(unit_cost)
+            new_quantity = quantity + movement_qty
+            if new_quantity > 0:
+                avg_cost = (quantity * avg_cost + movement_qty * valued_cost) / new_quantity
+            elif quantity <= 0:
+                avg_cost = valued_cost
+            quantity = new_quantity
+        else:
+            # Issues and their reversals move at the running average
+            valued_cost = avg_cost
+            quantity += movement_qty
+
+        movement_count += 1
+        replayed.append((movement_id, valued_cost, quantity, avg_cost))
+
+        if movement_count % checkpoint_interval == 0:
+            checkpoints.append((
+                material_id, movement_date, movement_id, movement_count, quantity, avg_cost
+            ))
+
+    if replayed:
+        execute_values(cur, """
+            UPDATE material_movements m
+            SET valued_cost = v.valued_cost,
+                running_quantity = v.running_quantity,
+                running_avg_cost = v.running_avg_cost,
+                replayed_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(movement_id, valued_cost, running_quantity, running_avg_cost)
+            WHERE m.movement_id = v.movement_id
+        """, replayed, template="(%s::bigint, %s::numeric, %s::numeric, %s::numeric)")
+
+    if checkpoints:
+        execute_values(cur, """
+            INSERT INTO material_valuation_checkpoints (
+                material_id, movement_date, movement_id, movement_count,
+                running_quantity, running_avg_cost
+            ) VALUES %s
+            ON CONFLICT (material_id, movement_date, movement_id) DO NOTHING
+        """, checkpoints)
+
+    return {
+        'material_id': material_id,
+        'from_date': from_date,
+        'movements_replayed': len(replayed),
+        'checkpoints_written': len(checkpoints),
+        'ledger_quantity': float(quantity),
+        'weighted_avg_cost': float(round(avg_cost, 2))
+    }
+
+
+def find_batch_cost_candidates(material_dates, cur):
+    """
+    Batches whose seed consumption, valued at the replayed average,
+    differs from the average in force when the batch was posted.
+
+    Args:
+        material_dates: Dict of material_id -> first affected date
+        cur: Database cursor
+
+    Returns:
+        list: One dict per batch with the suggested oil_cost_per_kg
+    """
+    if not material_dates:
+        return []
+
+    cur.execute("""
+        WITH affected AS (
+            SELECT * FROM unnest(%s::int[], %s::int[]) AS a(material_id, from_date)
+        )
+        SELECT
+            b.batch_id,
+            b.batch_code,
+            b.oil_type,
+            b.production_date,
+            m.material_id,
+            -m.quantity as seed_quantity,
+            m.unit_cost as posted_seed_cost,
+            m.valued_cost as replayed_seed_cost,
+            b.oil_yield,
+            b.oil_cost_per_kg,
+            COALESCE(b.boundary_crossed, false)
+        FROM affected a
+        JOIN material_movements m
+            ON m.material_id = a.material_id
+            AND m.movement_date >= a.from_date
+            AND m.source_table = 'batch'
+            AND m.quantity < 0
+        JOIN batch b ON b.batch_id = m.source_id AND b.status = 'active'
+        WHERE m.unit_cost IS NOT NULL
+            AND m.valued_cost IS NOT NULL
+            AND ABS(m.valued_cost - m.unit_cost) >= %s
+        ORDER BY b.production_date, b.batch_id
+    """, (
+        list(material_dates.keys()),
+        list(material_dates.values()),
+        COST_TOLERANCE
+    ))
+
+    candidates = []
+    for row in cur.fetchall():
+        seed_quantity = _to_decimal(row[5])
+        seed_cost_delta = (_to_decimal(row[7]) - _to_decimal(row[6])) * seed_quantity
+        oil_yield = _to_decimal(row[8])
+        oil_cost_per_kg = _to_decimal(row[9])
+        per_kg_delta = seed_cost_delta / oil_yield if oil_yield > 0 else ZERO
+
+        candidates.append({
+            'batch_id': row[0],
+            'batch_code': row[1],
+            'oil_type': row[2],
+            'production_date': row[3],
+            'seed_material_id': row[4],
+            'seed_quantity': float(seed_quantity),
+            'posted_seed_cost': float(row[6]),
+            'replayed_seed_cost': float(round(_to_decimal(row[7]), 2)),
+            'seed_cost_delta': float(round(seed_cost_delta, 2)),
+            'oil_cost_per_kg': float(oil_cost_per_kg),
+            'suggested_oil_cost_per_kg': float(round(oil_cost_per_kg + per_kg_delta, 2)),
+            'oil_cost_per_kg_delta': float(round(per_kg_delta, 4)),
+            'boundary_crossed': row[10]
+        })
+
+    return candidates
+
+
+def revalue_materials(material_dates, cur, checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Re-value materials from their first affected date and push the
+    replayed average into inventory and materials.current_cost. Runs in
+    the caller's transaction; materials are locked in id order.
+
+    Args:
+        material_dates: Dict of material_id -> first affected date
+        cur: Database cursor
+        checkpoint_interval: Movements between checkpoints
+
+    Returns:
+        dict: Per-material replay summaries and batch adjustment candidates
+    """
+    material_dates = {
+        int(material_id): int(from_date or 0)
+        for material_id, from_date in material_dates.items()
+        if material_id is not None
+    }
+    if not material_dates:
+        return {'materials': [], 'batch_adjustment_candidates': []}
+
+    material_ids = sorted(material_dates)
+
+    # Serialize replays per material (concurrent corrections of one seed)
+    for material_id in material_ids:
+        cur.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('material_valuation'), %s)",
+            (material_id,)
+        )
+
+    summaries = [
+        _replay_material(material_id, material_dates[material_id], checkpoint_interval, cur)
+        for material_id in material_ids
+    ]
+
+    execute_values(cur, """
+        UPDATE inventory i
+        SET weighted_avg_cost = v.avg_cost
+        FROM (VALUES %s) AS v(material_id, avg_cost)
+        WHERE i.material_id = v.material_id
+    """, [(s['material_id'], s['weighted_avg_cost']) for s in summaries],
+        template="(%s::int, %s::numeric)")
+
+    execute_values(cur, """
+        UPDATE materials m
+        SET current_cost = v.avg_cost
+        FROM (VALUES %s) AS v(material_id, avg_cost)
+        WHERE m.material_id = v.material_id
+    """, [(s['material_id'], s['weighted_avg_cost']) for s in summaries],
+        template="(%s::int, %s::numeric)")
+
+    # Flag where posted stock and the ledger disagree (e.g. manual fixes)
+    cur.execute("""
+        SELECT material_id, SUM(closing_stock)
+        FROM inventory
+        WHERE material_id = ANY(%s)
+        GROUP BY material_id
+    """, (material_ids,))
+    inventory_quantities = dict(cur.fetchall())
+    for summary in summaries:
+        inventory_quantity = inventory_quantities.get(summary['material_id'])
+        summary['inventory_quantity'] = float(inventory_quantity) if inventory_quantity is not None else None
+        summary['quantity_mismatch'] = (
+            inventory_quantity is not None
+            and abs(_to_decimal(inventory_quantity) - _to_decimal(summary['ledger_quantity'])) >= COST_TOLERANCE
+        )
+
+    return {
+        'materials': summaries,
+        'batch_adjustment_candidates': find_batch_cost_candidates(material_dates, cur)
+    }
+
+
+def revalue_all_materials(connection, checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Full replay of every material in the ledger, one transaction per
+    material (after migration 017 or to audit drift).
+
+    Returns:
+        Dictionary with counts and batch adjustment candidates
+    """
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("SELECT DISTINCT material_id FROM material_movements ORDER BY material_id")
+        material_ids = [row[0] for row in cursor.fetchall()]
+
+        movements = 0
+        candidates = []
+        for material_id in material_ids:
+            result = revalue_materials({material_id: 0}, cursor, checkpoint_interval)
+            movements += result['materials'][0]['movements_replayed']
+            candidates.extend(result['batch_adjustment_candidates'])
+            connection.commit()
+
+        return {
+            'success': True,
+            'materials_revalued': len(material_ids),
+            'movements_replayed': movements,
+            'batch_adjustment_candidates': candidates
+        }
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error revaluing materials: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    # Full replay: python -m utils.material_valuation [checkpoint_interval]
+    from db_utils import get_db_connection, close_connection
+
+    conn = get_db_connection()
+    try:
+        interval = int(sys.argv[1]) if len(sys.argv) > 1 else CHECKPOINT_INTERVAL
+        result = revalue_all_materials(conn, interval)
+        if result.get('success'):
+            print(f"Revalued {result['materials_revalued']} materials, "
+                  f"{result['movements_replayed']} movements, "
+                  f"{len(result['batch_adjustment_candidates'])} batch adjustment candidates")
+        else:
+            print(result)
+    finally:
+        close_connection(conn, None)
@@ -0,0 +1,161 @@
+"""
+Oil cost propagation utilities for PUVI Oil Manufacturing System
+Pushes a change in a batch's oil_cost_per_kg down to the blends and SKU
+productions that consumed its oil, using the lineage closure table
+File Path: puvi-backend/puvi-backend-main/utils/oil_cost_propagation.py
+"""
+
+from decimal import Decimal
+from itertools import groupby
+
+# Oil inventory rows are keyed by these source types
+INVENTORY_SOURCE_TYPES = {'batch': 'extraction', 'blend': 'blended'}
+
+
+def propagate_oil_cost_deltas(batch_deltas, cur):
+    """
+    Apply per-kg oil cost changes of batches to everything downstream.
+    Blends are revalued in blend_id order (a blend can only consume
+    earlier blends), then SKU oil allocations and production costs are
+    shifted in one statement. Runs in the caller's transaction.
+
+    Args:
+        batch_deltas: Dict of batch_id -> change in oil_cost_per_kg
+        cur: Database cursor
+
+    Returns:
+        dict: Counts of blends and SKU productions revalued
+    """
+    node_deltas = {
+        ('batch', int(batch_id)): Decimal(str(delta))
+        for batch_id, delta in batch_deltas.items()
+        if delta
+    }
+    if not node_deltas:
+        return {'blends_updated': 0, 'productions_updated': 0}
+
+    batch_ids = [node_id for _, node_id in node_deltas]
+
+    # Blends downstream of the changed batches
+    cur.execute("""
+        SELECT DISTINCT descendant_id
+        FROM lineage_closure
+        WHERE ancestor_type = 'batch'
+            AND ancestor_id = ANY(%s)
+            AND descendant_type = 'blend'
+    """, (batch_ids,))
+    blend_ids = [row[0] for row in cur.fetchall()]
+
+    component_updates = []
+    if blend_ids:
+        cur.execute("""
+            SELECT
+                bc.blend_id,
+                bc.source_type,
+                bc.source_batch_id,
+                bc.quantity_used,
+                bl.total_quantity
+            FROM blend_batch_components bc
+            JOIN blend_batches bl ON bc.blend_id = bl.blend_id
+            WHERE bc.blend_id = ANY(%s)
+                AND bc.source_type IN ('extraction', 'blended')
+            ORDER BY bc.blend_id
+        """, (blend_ids,))
+
+        for blend_id, components in groupby(cur.fetchall(), key=lambda row: row[0]):
+            blend_cost_delta = Decimal('0')
+            total_quantity = Decimal('0')
+
+            for _, source_type, source_id, quantity_used, blend_quantity in components:
+                total_quantity = Decimal(blend_quantity or 0)
+                parent = ('batch' if source_type == 'extraction' else 'blend', source_id)
+                delta = node_deltas.get(parent)
+                if not delta:
+                    continue
+                component_updates.append((blend_id, source_type, source_id, delta))
+                blend_cost_delta += Decimal(quantity_used or 0) * delta
+
+            if blend_cost_delta and total_quantity > 0:
+                node_deltas[('blend', blend_id)] = blend_cost_delta / total_quantity
+
+    if component_updates:
+        cur.execute("""
+            UPDATE blend_batch_components bc
+            SET cost_per_unit = bc.cost_per_unit + d.delta
+            FROM unnest(%s::int[], %s::varchar[], %s::int[], %s::numeric[])
+                AS d(blend_id, source_type, source_id, delta)
+            WHERE bc.blend_id = d.blend_id
+                AND bc.source_type = d.source_type
+                AND bc.source_batch_id = d.source_id
+        """, tuple(map(list, zip(*component_updates))))
+
+    changed_blends = [
+        (node_id, delta) for (node_type, node_id), delta in node_deltas.items()
+        if node_type == 'blend'
+    ]
+    if changed_blends:
+        cur.execute("""
+            UPDATE blend_batches bl
+            SET weighted_avg_cost = bl.weighted_avg_cost + d.delta
+            FROM unnest(%s::int[], %s::numeric[]) AS d(blend_id, delta)
+            WHERE bl.blend_id = d.blend_id
+        """, (
+            [blend_id for blend_id, _ in changed_blends],
+            [delta for _, delta in changed_blends]
+        ))
+
+    node_types = [node_type for node_type, _ in node_deltas]
+    node_ids = [node_id for _, node_id in node_deltas]
+    deltas = list(node_deltas.values())
+
+    # Bulk oil stock carries the source's cost per kg
+    cur.execute("""
+        UPDATE inventory i
+        SET weighted_avg_cost = i.weighted_avg_cost + d.delta
+        FROM unnest(%s::varchar[], %s::int[], %s::numeric[]) AS d(source_type, source_id, delta)
+        WHERE i.source_type = d.source_type
+            AND i.source_reference_id = d.source_id
+    """, (
+        [INVENTORY_SOURCE_TYPES[node_type] for node_type in node_types],
+        node_ids,
+        deltas
+    ))
+
+    # SKU productions: allocation cost, oil cost and cost per bottle
+    cur.execute("""
+        WITH d AS (
+            SELECT * FROM unnest(%s::varchar[], %s::int[], %s::numeric[])
+                AS t(source_type, source_id, delta)
+        ),
+        changed AS (
+            UPDATE sku_oil_allocation oa
+            SET oil_cost_per_kg = oa.oil_cost_per_kg + d.delta,
+                allocation_cost = oa.allocation_cost + oa.quantity_allocated * d.delta
+            FROM d
+            WHERE oa.source_type = d.source_type
+                AND oa.source_id = d.source_id
+            RETURNING oa.production_id, oa.quantity_allocated * d.delta as cost_delta
+        ),
+        per_production AS (
+            SELECT production_id, SUM(cost_delta) as cost_delta
+            FROM changed
+            GROUP BY production_id
+        )
+        UPDATE sku_production p
+        SET oil_cost_total = p.oil_cost_total + pp.cost_delta,
+            weighted_oil_cost = CASE WHEN p.total_oil_quantity > 0
+                THEN (p.oil_cost_total + pp.cost_delta) / p.total_oil_quantity
+                ELSE p.weighted_oil_cost END,
+            total_production_cost = p.total_production_cost + pp.cost_delta,
+            cost_per_bottle = CASE WHEN p.bottles_produced > 0
+                THEN (p.total_production_cost + pp.cost_delta) / p.bottles_produced
+                ELSE p.cost_per_bottle END
+        FROM per_production pp
+        WHERE p.production_id = pp.production_id
+    """, (node_types, node_ids, deltas))
+    productions_updated = cur.rowcount
+
+    return {
+        'blends_updated': len(changed_blends),
+        'productions_updated': productions_updated
+    }
@@ -0,0 +1,347 @@
+"""
+Opening balance import for PUVI Oil Manufacturing System
+Stages CSV uploads and JSON entries with COPY into a temp table,
+validates every row in set-based SQL, records rejected rows for a
+downloadable error report and merges the rest in one statement
+File Path: puvi-backend/puvi-backend-main/utils/opening_balance_import.py
+"""
+
+import csv
+import io
+
+# Template header -> staging column
+CSV_COLUMNS = {
+    'Material ID': 'material_id',
+    'Unit': 'unit',
+    'Opening Quantity': 'quantity',
+    'Opening Rate': 'rate_per_unit',
+    'Notes': 'notes'
+}
+
+REQUIRED_CSV_COLUMNS = ('Material ID', 'Opening Quantity', 'Opening Rate')
+
+STAGING_COLUMNS = ('row_num', 'material_id', 'unit', 'quantity', 'rate_per_unit', 'notes')
+
+# opening_balances quantity / rate are NUMERIC(10,2)
+MAX_VALUE = 100000000
+
+# ...and the generated total_value (quantity * rate) is NUMERIC(12,2)
+MAX_TOTAL_VALUE = 10000000000
+
+ERROR_PREVIEW_LIMIT = 10
+
+
+def create_staging_table(cur):
+    """Temp table every import path stages into; dropped at commit"""
+    cur.execute("""
+        CREATE TEMP TABLE opening_balance_staging (
+            row_num INTEGER NOT NULL,
+            material_id TEXT,
+            unit TEXT,
+            quantity TEXT,
+            rate_per_unit TEXT,
+            notes TEXT
+        ) ON COMMIT DROP
+    """)
+
+
+class CsvRowStream:
+    """
+    File-like view of rows as CSV text for COPY FROM STDIN, rendered a
+    chunk at a time so the upload is never held in memory whole
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ''
+        self.row_count = 0
+
+    def read(self, size=8192):
+        while size < 0 or len(self.pending) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.row_count += 1
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        if size < 0:
+            size = len(self.pending)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+def stage_csv(stream, cur):
+    """
+    COPY an uploaded CSV into the staging table without decoding it into
+    memory; columns are matched by template header name. Rows with fewer
+    or more fields than the header are padded or trimmed, so they reach
+    validation and the error report instead of failing the COPY.
+
+    Args:
+        stream: Binary file stream (werkzeug FileStorage.stream)
+        cur: Database cursor
+
+    Returns:
+        int: Rows staged
+
+    Raises:
+        ValueError: If required headers are missing
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    header = [name.strip() for name in next(reader, [])]
+
+    missing = [name for name in REQUIRED_CSV_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f'Missing CSV columns: {", ".join(missing)}')
+
+    # Staging column -> field index in the file, None when absent
+    field_indexes = []
+    for name in STAGING_COLUMNS[1:]:
+        header_name = next((h for h, column in CSV_COLUMNS.items() if column == name), None)
+        field_indexes.append(header.index(header_name) if header_name in header else None)
+
+    def staged_rows():
+        for row in reader:
+            if not row:
+                continue
+            # Row numbers are file lines; the header is line 1
+            yield [reader.line_num] + [
+                row[index] if index is not None and index < len(row) else None
+                for index in field_indexes
+            ]
+
+    rows = CsvRowStream(staged_rows())
+    cur.copy_expert(
+        f"COPY opening_balance_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        rows
+    )
+    return rows.row_count
+
+
+def stage_entries(entries, cur):
+    """
+    COPY JSON entries ({material_id, quantity, rate_per_unit, unit?,
+    notes?}) into the staging table; rows are numbered from 1.
+
+    Returns:
+        int: Rows staged
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_num, entry in enumerate(entries, start=1):
+        writer.writerow([
+            row_num,
+            entry.get('material_id'),
+            entry.get('unit'),
+            entry.get('quantity', 0),
+            entry.get('rate_per_unit', 0),
+            entry.get('notes')
+        ])
+    buffer.seek(0)
+
+    cur.copy_expert(
+        f"COPY opening_balance_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+    return len(entries)
+
+
+def merge_staged_balances(cutoff_date, financial_year, source, entered_by,
+                          default_notes, cur, file_name=None):
+    """
+    Validate the staged rows and merge the valid ones into the initial
+    opening balances. Rows with zero quantity are skipped; rejected rows
+    are kept in opening_balance_import_errors under the returned import_id.
+
+    Checks: material id numeric, active material, quantity / rate numeric,
+    rate not negative, quantity, rate and their product within the
+    column limits, unit (when given) matching the material, and one
+    row per material.
+
+    Returns:
+        dict: import_id, counts, total value and the first rejected rows
+    """
+    cur.execute("""
+        INSERT INTO opening_balance_imports (
+            source, file_name, cutoff_date, financial_year, total_rows, entered_by
+        )
+        SELECT %s, %s, %s, %s, COUNT(*), %s
+        FROM opening_balance_staging
+        RETURNING import_id, total_rows
+    """, (source, file_name, cutoff_date, financial_year, entered_by))
+    import_id, total_rows = cur.fetchone()
+
+    cur.execute("""
+        CREATE TEMP TABLE opening_balance_checked ON COMMIT DROP AS
+        WITH parsed AS (
+            SELECT
+                s.row_num,
+                s.material_id as material_raw,
+                NULLIF(btrim(s.unit), '') as unit,
+                s.quantity as quantity_raw,
+                s.rate_per_unit as rate_raw,
+                NULLIF(btrim(s.notes), '') as notes,
+                CASE WHEN btrim(s.material_id) ~ '^[0-9]+$'
+                     THEN btrim(s.material_id)::INTEGER END as material_id,
+                CASE WHEN COALESCE(btrim(s.quantity), '') = '' THEN 0
+                     WHEN btrim(s.quantity) ~ '^-?[0-9]+(\\.[0-9]+)?$'
+                     THEN btrim(s.quantity)::NUMERIC END as quantity,
+                CASE WHEN COALESCE(btrim(s.rate_per_unit), '') = '' THEN 0
+                     WHEN btrim(s.rate_per_unit) ~ '^-?[0-9]+(\\.[0-9]+)?$'
+                     THEN btrim(s.rate_per_unit)::NUMERIC END as rate_per_unit
+            FROM opening_balance_staging s
+        ),
+        matched AS (
+            SELECT
+                p.*,
+                m.material_id IS NOT NULL as material_found,
+                m.unit as material_unit,
+                COUNT(*) FILTER (WHERE p.quantity > 0)
+                    OVER (PARTITION BY p.material_id) as occurrences
+            FROM parsed p
+            LEFT JOIN materials m ON m.material_id = p.material_id AND m.is_active = true
+        )
+        SELECT
+            matched.*,
+            CASE
+                WHEN quantity IS NULL THEN 'Opening quantity is not a number'
+                WHEN quantity <= 0 THEN NULL
+                WHEN material_id IS NULL THEN 'Material ID is missing or not a number'
+                WHEN NOT material_found THEN CONCAT('Material ID ', material_id, ' not found')
+                WHEN rate_per_unit IS NULL THEN 'Opening rate is not a number'
+                WHEN rate_per_unit < 0 THEN 'Opening rate cannot be negative'
+                WHEN quantity >= %(max_value)s OR rate_per_unit >= %(max_value)s
+                    THEN 'Opening quantity or rate is too large'
+                WHEN quantity * rate_per_unit >= %(max_total_value)s
+                    THEN 'Opening value (quantity x rate) is too large'
+                WHEN unit IS NOT NULL AND lower(unit) <> lower(material_unit)
+                    THEN CONCAT('Unit ', unit, ' does not match material unit ', material_unit)
+                WHEN occurrences > 1
+                    THEN CONCAT('Material ID ', material_id, ' appears in ', occurrences, ' rows')
+            END as error
+        FROM matched
+    """, {'max_value': MAX_VALUE, 'max_total_value': MAX_TOTAL_VALUE})
+
+    cur.execute("""
+        INSERT INTO opening_balance_import_errors (
+            import_id, row_num, material_id, unit, quantity, rate_per_unit, error
+        )
+        SELECT %s, row_num, material_raw, unit, quantity_raw, rate_raw, error
+        FROM opening_balance_checked
+        WHERE error IS NOT NULL
+    """, (import_id,))
+
+    # Replace existing initial balances, insert the rest
+    cur.execute("""
+        WITH valid AS (
+            SELECT material_id, quantity, rate_per_unit, notes
+            FROM opening_balance_checked
+            WHERE error IS NULL AND quantity > 0
+        ),
+        updated AS (
+            UPDATE opening_balances ob
+            SET quantity = v.quantity,
+                rate_per_unit = v.rate_per_unit,
+                balance_date = %(cutoff_date)s,
+                financial_year = %(financial_year)s,
+                notes = COALESCE(v.notes, ob.notes),
+                entered_by = %(entered_by)s,
+                entered_at = CURRENT_TIMESTAMP
+            FROM valid v
+            WHERE ob.material_id = v.material_id AND ob.entry_type = 'initial'
+            RETURNING ob.material_id
+        ),
+        inserted AS (
+            INSERT INTO opening_balances (
+                material_id, balance_date, quantity, rate_per_unit,
+                entry_type, financial_year, notes, entered_by
+            )
+            SELECT v.material_id, %(cutoff_date)s, v.quantity, v.rate_per_unit,
+                   'initial', %(financial_year)s, COALESCE(v.notes, %(default_notes)s),
+                   %(entered_by)s
+            FROM valid v
+            WHERE NOT EXISTS (
+                SELECT 1 FROM opening_balances ob
+                WHERE ob.material_id = v.material_id AND ob.entry_type = 'initial'
+            )
+            RETURNING material_id
+        ),
+        counts AS (
+            SELECT
+                (SELECT COUNT(*) FROM inserted) as inserted_count,
+                (SELECT COUNT(*) FROM updated) as updated_count,
+                (SELECT COUNT(*) FROM opening_balance_checked
+                 WHERE error IS NULL AND quantity <= 0) as skipped_count,
+                (SELECT COUNT(*) FROM opening_balance_checked
+                 WHERE error IS NOT NULL) as error_count,
+                (SELECT COALESCE(SUM(quantity * rate_per_unit), 0) FROM valid) as total_value
+        )
+        UPDATE opening_balance_imports i
+        SET inserted_count = c.inserted_count,
+            updated_count = c.updated_count,
+            skipped_count = c.skipped_count,
+            error_count = c.error_count,
+            total_value = c.total_value
+        FROM counts c
+        WHERE i.import_id = %(import_id)s
+        RETURNING c.inserted_count, c.updated_count, c.skipped_count,
+                  c.error_count, c.total_value
+    """, {
+        'cutoff_date': cutoff_date,
+        'financial_year': financial_year,
+        'entered_by': entered_by,
+        'default_notes': default_notes,
+        'import_id': import_id
+    })
+    inserted_count, updated_count, skipped_count, error_count, total_value = cur.fetchone()
+
+    cur.execute("""
+        SELECT row_num, error
+        FROM opening_balance_checked
+        WHERE error IS NOT NULL
+        ORDER BY row_num
+        LIMIT %s
+    """, (ERROR_PREVIEW_LIMIT,))
+    error_details = [f'Row {row_num}: {error}' for row_num, error in cur.fetchall()]
+
+    return {
+        'import_id': import_id,
+        'total_rows': total_rows,
+        'inserted_count': inserted_count,
+        'updated_count': updated_count,
+        'skipped_count': skipped_count,
+        'error_count': error_count,
+        'total_value': float(total_value),
+        'error_details': error_details
+    }
+
+
+def write_error_report(import_id, cur):
+    """
+    CSV of the rows an import rejected.
+
+    Returns:
+        io.BytesIO or None if the import does not exist
+    """
+    cur.execute("SELECT 1 FROM opening_balance_imports WHERE import_id = %s", (import_id,))
+    if not cur.fetchone():
+        return None
+
+    output = io.StringIO()
+    cur.copy_expert(f"""
+        COPY (
+            SELECT row_num as "Row", material_id as "Material ID", unit as "Unit",
+                   quantity as "Opening Quantity", rate_per_unit as "Opening Rate",
+                   error as "Error"
+            FROM opening_balance_import_errors
+            WHERE import_id = {int(import_id)}
+            ORDER BY row_num
+        ) TO STDOUT WITH (FORMAT csv, HEADER true)
+    """, output)
+
+    return io.BytesIO(output.getvalue().encode('utf-8'))
@@ -0,0 +1,90 @@
+"""
+Keyset pagination utilities for PUVI Oil Manufacturing System
+Lists ordered newest first by (date, id) page with an opaque cursor
+'<date>_<id>' instead of OFFSET, so deep pages cost the same as the first
+File Path: puvi-backend/puvi-backend-main/utils/pagination.py
+"""
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+
+
+def parse_keyset_cursor(cursor_value):
+    """
+    Parse a cursor of the form '<date>_<id>'.
+
+    Returns:
+        tuple: (date, id) as integers
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    date_value, record_id = str(cursor_value).split('_', 1)
+    return int(date_value), int(record_id)
+
+
+def make_keyset_cursor(date_value, record_id):
+    """
+    Cursor pointing just after the given row in (date, id) DESC order.
+    A NULL date is encoded as 0; lists over a nullable date column sort
+    and compare on keyset_date(..., nullable=True) to match.
+    """
+    return f'{date_value or 0}_{record_id}'
+
+
+def keyset_date(date_column, nullable=False):
+    """Date sort expression; NULL dates of a nullable column sort as 0"""
+    return f"COALESCE({date_column}, 0)" if nullable else date_column
+
+
+def keyset_order_by(date_column, id_column, nullable=False):
+    """ORDER BY clause (without the keyword) matching keyset_condition"""
+    return f"{keyset_date(date_column, nullable)} DESC, {id_column} DESC"
+
+
+def get_page_limit(filters, default=DEFAULT_PAGE_LIMIT):
+    """Page size from filters['limit'], capped at MAX_PAGE_LIMIT"""
+    try:
+        limit = int(filters.get('limit') or default)
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_LIMIT))
+
+
+def keyset_condition(filters, date_column, id_column, nullable=False):
+    """
+    WHERE condition continuing after filters['cursor'], if any.
+
+    Args:
+        filters: Dict that may hold 'cursor'
+        date_column: SQL expression of the date sort column
+        id_column: SQL expression of the id sort column
+        nullable: The date column allows NULL (sorted as 0)
+
+    Returns:
+        tuple: (SQL condition or None, list of params)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if not filters.get('cursor'):
+        return None, []
+    return (
+        f"({keyset_date(date_column, nullable)}, {id_column}) < (%s, %s)",
+        list(parse_keyset_cursor(filters['cursor']))
+    )
+
+
+def split_keyset_page(rows, limit, date_index, id_index):
+    """
+    Trim a result fetched with LIMIT limit + 1 to one page.
+
+    Returns:
+        tuple: (page rows, has_more, next_cursor or None)
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = (
+        make_keyset_cursor(rows[-1][date_index], rows[-1][id_index]) if has_more else None
+    )
+    return rows, has_more, next_cursor
@@ -0,0 +1,178 @@
+"""
+Stock ledger for PUVI Oil Manufacturing System
+Tags stock movements (migration 018) with their business date and source,
+builds month-end balance snapshots and answers point-in-time balances as
+one snapshot plus the movements after it
+File Path: puvi-backend/puvi-backend-main/utils/stock_ledger.py
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+
+STOCK_ITEM_TYPES = ('material', 'oil', 'sku')
+
+EPOCH = date(1970, 1, 1)
+
+
+def set_stock_movement_context(movement_date, source_table, source_id, cur):
+    """
+    Date and source for the stock movements the rest of this transaction
+    posts. Call before touching inventory / sku_inventory; calling again
+    re-tags what follows.
+
+    Args:
+        movement_date: Business date as day number
+        source_table: Posting table (e.g. 'purchases', 'sku_outbound')
+        source_id: Posting record id
+        cur: Database cursor
+    """
+    cur.execute("""
+        SELECT set_config('puvi.movement_date', %s, true),
+               set_config('puvi.movement_source_table', %s, true),
+               set_config('puvi.movement_source_id', %s, true)
+    """, (
+        str(int(movement_date)) if movement_date is not None else '',
+        source_table or '',
+        str(int(source_id)) if source_id is not None else ''
+    ))
+
+
+def month_end_days(from_day, to_day):
+    """Day numbers of the month ends in [from_day, to_day]; snapshots are
+    taken at each month end, so an as-of query scans at most a month"""
+    days = []
+    current = EPOCH + timedelta(days=from_day)
+    current = date(current.year, current.month, 1)
+    while True:
+        next_month = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        month_end = (next_month - timedelta(days=1) - EPOCH).days
+        if month_end > to_day:
+            return days
+        if month_end >= from_day:
+            days.append(month_end)
+        current = next_month
+
+
+def build_stock_snapshots(connection, through_day=None):
+    """
+    Build missing or invalidated month-end snapshots up to through_day
+    (default: the last completed month end), oldest first, one
+    transaction per snapshot. Concurrent runs skip.
+
+    Returns:
+        Dictionary with the snapshot days built
+    """
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('stock_snapshots'))")
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return {'success': True, 'skipped': True, 'message': 'Snapshot build already running'}
+        connection.commit()
+
+        built = []
+        try:
+            if through_day is None:
+                through_day = (datetime.now().date() - EPOCH).days - 1
+
+            cursor.execute("SELECT MIN(movement_date) FROM stock_movements")
+            first_day = cursor.fetchone()[0]
+            if first_day is None:
+                return {'success': True, 'snapshots_built': [], 'message': 'No stock movements'}
+
+            cursor.execute("""
+                SELECT snapshot_date FROM stock_snapshot_runs
+                WHERE is_valid AND snapshot_date <= %s
+            """, (through_day,))
+            valid = {row[0] for row in cursor.fetchall()}
+
+            for snapshot_day in month_end_days(first_day, through_day):
+                if snapshot_day in valid:
+                    continue
+                cursor.execute("SELECT build_stock_snapshot(%s)", (snapshot_day,))
+                connection.commit()
+                built.append(snapshot_day)
+        finally:
+            # Leave an aborted snapshot transaction first, or the unlock fails too
+            connection.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext('stock_snapshots'))")
+            connection.commit()
+
+        return {
+            'success': True,
+            'snapshots_built': built,
+            'message': f'Built {len(built)} stock snapshots'
+        }
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error building stock snapshots: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        cursor.close()
+
+
+def get_stock_as_of(as_of_day, cur, item_type=None, item_key=None, location_id=None):
+    """
+    Stock balances at the end of as_of_day: the nearest valid snapshot
+    on or before that day plus the movements after it.
+
+    Args:
+        as_of_day: Day number
+        cur: Database cursor
+        item_type, item_key, location_id: Optional filters
+
+    Returns:
+        tuple: (snapshot day used or None, rows of
+                (item_type, item_key, location_id, quantity))
+    """
+    cur.execute("""
+        SELECT MAX(snapshot_date)
+        FROM stock_snapshot_runs
+        WHERE is_valid AND snapshot_date <= %s
+    """, (as_of_day,))
+    snapshot_day = cur.fetchone()[0]
+
+    conditions = []
+    params = []
+    if item_type:
+        conditions.append("item_type = %s")
+        params.append(item_type)
+    if item_key is not None:
+        conditions.append("item_key = %s")
+        params.append(item_key)
+    if location_id is not None:
+        conditions.append("location_id = %s")
+        params.append(location_id)
+    scope = ''.join(f" AND {condition}" for condition in conditions)
+
+    cur.execute(f"""
+        SELECT item_type, item_key, location_id, SUM(quantity)
+        FROM (
+            SELECT item_type, item_key, location_id, quantity
+            FROM stock_balance_snapshots
+            WHERE snapshot_date = %s{scope}
+            UNION ALL
+            SELECT item_type, item_key, location_id, quantity
+            FROM stock_movements
+            WHERE movement_date <= %s
+                AND movement_date > %s{scope}
+        ) s
+        GROUP BY item_type, item_key, location_id
+        HAVING SUM(quantity) <> 0
+        ORDER BY item_type, item_key, location_id
+    """, [snapshot_day] + params + [as_of_day, snapshot_day if snapshot_day is not None else -2147483648] + params)
+
+    return snapshot_day, cur.fetchall()
+
+
+if __name__ == '__main__':
+    # Month-end snapshots: python -m utils.stock_ledger [through_day]
+    from db_utils import get_db_connection, close_connection
+
+    conn = get_db_connection()
+    try:
+        print(build_stock_snapshots(conn, int(sys.argv[1]) if len(sys.argv) > 1 else None))
+    finally:
+        close_connection(conn, None)
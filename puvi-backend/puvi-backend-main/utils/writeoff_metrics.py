@@ -0,0 +1,189 @@
+# =====================================================
+# PUVI System - Writeoff Metrics Reconciler
+# File: puvi-backend/utils/writeoff_metrics.py
+# Purpose: Verify the incrementally maintained writeoff buckets
+#          (migration 008) against material_writeoffs and repair drift;
+#          refresh production-dependent figures of the summaries; serve
+#          versioned dashboard snapshots (migration 009)
+# =====================================================
+
+from psycopg2.extras import Json
+from utils.date_utils import integer_to_date, get_current_day_number
+
+
+def find_writeoff_bucket_drift(connection):
+    """
+    Compare writeoff_metric_buckets with a fresh aggregate of counted writeoffs.
+
+    Args:
+        connection: Database connection
+
+    Returns:
+        List of month_year values whose buckets disagree with the source
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        WITH source AS (
+            SELECT writeoff_month_year(writeoff_date) as month_year,
+                   writeoff_item_type(reference_type) as item_type,
+                   COALESCE(reason_code, '') as reason_code,
+                   COUNT(*) as writeoff_count,
+                   SUM(quantity) as total_quantity,
+                   SUM(total_cost) as total_cost,
+                   SUM(net_loss) as net_loss
+            FROM material_writeoffs
+            WHERE COALESCE(status, 'active') = 'active'
+            GROUP BY 1, 2, 3
+        ),
+        buckets AS (
+            SELECT * FROM writeoff_metric_buckets
+            WHERE writeoff_count <> 0 OR net_loss <> 0
+        )
+        SELECT DISTINCT COALESCE(s.month_year, b.month_year)
+        FROM source s
+        FULL OUTER JOIN buckets b
+            ON b.month_year = s.month_year
+            AND b.item_type = s.item_type
+            AND b.reason_code = s.reason_code
+        WHERE s.writeoff_count IS DISTINCT FROM b.writeoff_count
+            OR s.total_quantity IS DISTINCT FROM b.total_quantity
+            OR s.total_cost IS DISTINCT FROM b.total_cost
+            OR s.net_loss IS DISTINCT FROM b.net_loss
+        ORDER BY 1
+    """)
+    months = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return months
+
+
+def reconcile_writeoff_metrics(connection):
+    """
+    Verify writeoff buckets, rebuild any month that drifted, and refresh
+    the current month summary and impact snapshot so production totals
+    (which writeoff deltas do not move) stay current. Concurrent runs skip.
+
+    Args:
+        connection: Database connection
+
+    Returns:
+        Dictionary with reconciliation results
+    """
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('writeoff_metrics_reconcile'))")
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return {'success': True, 'skipped': True, 'message': 'Reconciliation already running'}
+
+        drifted_months = find_writeoff_bucket_drift(connection)
+
+        if drifted_months:
+            cursor.execute("""
+                DELETE FROM writeoff_metric_buckets WHERE month_year = ANY(%s)
+            """, (drifted_months,))
+            cursor.execute("""
+                INSERT INTO writeoff_metric_buckets (
+                    month_year, item_type, reason_code,
+                    writeoff_count, total_quantity, total_cost, net_loss
+                )
+                SELECT writeoff_month_year(writeoff_date),
+                       writeoff_item_type(reference_type),
+                       COALESCE(reason_code, ''),
+                       COUNT(*), SUM(quantity), SUM(total_cost), SUM(net_loss)
+                FROM material_writeoffs
+                WHERE COALESCE(status, 'active') = 'active'
+                    AND writeoff_month_year(writeoff_date) = ANY(%s)
+                GROUP BY 1, 2, 3
+            """, (drifted_months,))
+
+        current_month = int(integer_to_date(get_current_day_number(), '%Y%m'))
+        for month_year in sorted(set(drifted_months) | {current_month}):
+            cursor.execute("SELECT update_writeoff_monthly_summary(%s)", (month_year,))
+
+        cursor.execute("SELECT update_writeoff_impact_tracking()")
+
+        cursor.execute("""
+            INSERT INTO system_configuration (config_key, config_value, config_type, description)
+            VALUES ('writeoff_metrics_last_reconciled', %s, 'integer',
+                    'Day number of the last writeoff metrics reconciliation')
+            ON CONFLICT (config_key) DO UPDATE
+            SET config_value = EXCLUDED.config_value,
+                updated_at = CURRENT_TIMESTAMP
+        """, (str(get_current_day_number()),))
+
+        connection.commit()
+
+        return {
+            'success': True,
+            'drifted_months': drifted_months,
+            'message': f'Writeoff metrics reconciled ({len(drifted_months)} months repaired)'
+        }
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error reconciling writeoff metrics: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        cursor.close()
+
+
+def get_dashboard_snapshot(snapshot_key, build_payload, connection):
+    """
+    Return the cached dashboard payload for the current writeoff version,
+    building and storing it first if writeoffs changed since the last build.
+
+    Args:
+        snapshot_key: Snapshot name (one per dashboard endpoint)
+        build_payload: Callable(cursor) -> JSON-serialisable payload
+        connection: Database connection
+
+    Returns:
+        Tuple of (version, payload)
+    """
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT v.version, s.version, s.payload
+            FROM writeoff_dashboard_version v
+            LEFT JOIN writeoff_dashboard_snapshots s ON s.snapshot_key = %s
+        """, (snapshot_key,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+
+        if row and row[1] == version:
+            return version, row[2]
+
+        # Tagged with the version read before building, so a writeoff
+        # posted meanwhile leaves the snapshot stale for the next read
+        payload = build_payload(cursor)
+        cursor.execute("""
+            INSERT INTO writeoff_dashboard_snapshots (snapshot_key, version, payload)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (snapshot_key) DO UPDATE
+            SET version = EXCLUDED.version,
+                payload = EXCLUDED.payload,
+                built_at = CURRENT_TIMESTAMP
+            WHERE writeoff_dashboard_snapshots.version < EXCLUDED.version
+        """, (snapshot_key, version, Json(payload)))
+        connection.commit()
+
+        return version, payload
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    # Scheduled job: python -m utils.writeoff_metrics
+    from db_utils import get_db_connection, close_connection
+
+    conn = get_db_connection()
+    try:
+        print(reconcile_writeoff_metrics(conn))
+    finally:
+        close_connection(conn, None)
@@ -0,0 +1,218 @@
+# =====================================================
+# PUVI System - Expiry Writeoff Proposals
+# File: puvi-backend/utils/writeoff_proposals.py
+# Purpose: Build writeoff proposals for expired or unsellable SKU lots,
+#          grouped by location and SKU and valued at production cost per
+#          bottle
+# =====================================================
+
+from psycopg2.extras import execute_values
+from utils.expiry_utils import run_expiry_sweep, get_expiry_sweep_status
+
+# Expiry buckets proposed for writeoff: expired lots, and lots within 30
+# days of expiry ('critical'), which are below the shelf life customers
+# accept and so can no longer be sold
+PROPOSAL_EXPIRY_BUCKETS = ['expired', 'critical']
+
+
+def get_locations_with_expired_stock(connection):
+    """
+    List locations holding expired or unsellable SKU stock, from the
+    expiry summary.
+
+    Args:
+        connection: Database connection
+
+    Returns:
+        List of location IDs (None for lots without a location)
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT DISTINCT location_id
+        FROM sku_expiry_summary
+        WHERE expiry_bucket = ANY(%s)
+            AND total_quantity > 0
+        ORDER BY location_id
+    """, (PROPOSAL_EXPIRY_BUCKETS,))
+    location_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return location_ids
+
+
+def build_location_proposals(connection, location_id):
+    """
+    Replace the pending proposals of one location with fresh ones.
+    Reads lots without row locks and commits on its own, so a location
+    is one short transaction. Lots the operator already rejected are
+    not proposed again.
+
+    Args:
+        connection: Database connection
+        location_id: Location ID (None for lots without a location)
+
+    Returns:
+        Number of proposals created
+    """
+    cursor = connection.cursor()
+
+    try:
+        # Back off instead of queueing behind an approval in progress
+        cursor.execute("SET LOCAL lock_timeout = '2s'")
+
+        cursor.execute("""
+            SELECT
+                et.sku_id,
+                et.tracking_id,
+                et.production_id,
+                et.expiry_date,
+                et.quantity_remaining,
+                COALESCE(p.cost_per_bottle, 0)
+            FROM sku_expiry_tracking et
+            LEFT JOIN sku_production p ON et.production_id = p.production_id
+            WHERE et.expiry_bucket = ANY(%s)
+                AND et.quantity_remaining > 0
+                AND et.location_id IS NOT DISTINCT FROM %s
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM writeoff_proposal_lots pl
+                    JOIN writeoff_proposals wp ON pl.proposal_id = wp.proposal_id
+                    WHERE pl.tracking_id = et.tracking_id
+                        AND wp.status = 'rejected'
+                )
+            ORDER BY et.sku_id, et.expiry_date, et.tracking_id
+        """, (PROPOSAL_EXPIRY_BUCKETS, location_id))
+
+        lots_by_sku = {}
+        for sku_id, tracking_id, production_id, expiry_date, quantity, cost in cursor.fetchall():
+            lots_by_sku.setdefault(sku_id, []).append(
+                (tracking_id, production_id, expiry_date, quantity, cost)
+            )
+
+        cursor.execute("""
+            DELETE FROM writeoff_proposals
+            WHERE status = 'pending'
+                AND location_id IS NOT DISTINCT FROM %s
+        """, (location_id,))
+
+        if lots_by_sku:
+            sku_ids = list(lots_by_sku.keys())
+            proposal_rows = []
+            for sku_id in sku_ids:
+                lots = lots_by_sku[sku_id]
+                total_quantity = sum(lot[3] for lot in lots)
+                total_value = sum(lot[3] * lot[4] for lot in lots)
+                proposal_rows.append((
+                    location_id,
+                    sku_id,
+                    len(lots),
+                    total_quantity,
+                    total_value / total_quantity if total_quantity else 0,
+                    total_value,
+                    min(lot[2] for lot in lots)
+                ))
+
+            proposal_ids = execute_values(cursor, """
+                INSERT INTO writeoff_proposals (
+                    location_id, sku_id, lot_count, total_quantity,
+                    cost_per_unit, total_value, oldest_expiry_date
+                ) VALUES %s
+                RETURNING proposal_id
+            """, proposal_rows, fetch=True)
+
+            execute_values(cursor, """
+                INSERT INTO writeoff_proposal_lots (
+                    proposal_id, tracking_id, production_id,
+                    expiry_date, quantity, cost_per_bottle
+                ) VALUES %s
+            """, [
+                (proposal_id, tracking_id, production_id, expiry_date, quantity, cost)
+                for sku_id, (proposal_id,) in zip(sku_ids, proposal_ids)
+                for tracking_id, production_id, expiry_date, quantity, cost in lots_by_sku[sku_id]
+            ])
+
+        connection.commit()
+        return len(lots_by_sku)
+
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def generate_expiry_writeoff_proposals(connection, location_ids=None):
+    """
+    Rebuild pending writeoff proposals for expired or unsellable SKU lots,
+    one location at a time so memory stays bounded and no transaction
+    holds locks for long. Concurrent runs skip.
+
+    Args:
+        connection: Database connection
+        location_ids: Optional list of locations to rebuild (default: all
+                      locations holding expired or unsellable
+                      stock)
+
+    Returns:
+        Dictionary with generation results
+    """
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('writeoff_proposals'))")
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return {'success': True, 'skipped': True, 'message': 'Proposal run already in progress'}
+        connection.commit()
+
+        try:
+            if location_ids is None:
+                location_ids = get_locations_with_expired_stock(connection)
+                connection.commit()
+
+                # Locations whose proposable stock is gone keep no stale proposals
+                cursor.execute("""
+                    SELECT DISTINCT location_id FROM writeoff_proposals WHERE status = 'pending'
+                """)
+                location_ids = sorted(
+                    set(location_ids) | {row[0] for row in cursor.fetchall()},
+                    key=lambda location_id: location_id or 0
+                )
+                connection.commit()
+
+            proposals_created = 0
+            for location_id in location_ids:
+                proposals_created += build_location_proposals(connection, location_id)
+        finally:
+            # Leave an aborted location transaction first, or the unlock fails too
+            connection.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext('writeoff_proposals'))")
+            connection.commit()
+
+        return {
+            'success': True,
+            'locations_scanned': len(location_ids),
+            'proposals_created': proposals_created,
+            # Lots that expired since the last sweep are not proposed yet
+            'sweep_stale': get_expiry_sweep_status(connection)['stale'],
+            'message': f'{proposals_created} writeoff proposals across {len(location_ids)} locations'
+        }
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error generating writeoff proposals: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        cursor.close()
+
+
+if __name__ == '__main__':
+    # Scheduled job: python -m utils.writeoff_proposals
+    from db_utils import get_db_connection, close_connection
+
+    conn = get_db_connection()
+    try:
+        # Bucket lots that expired since the last sweep first
+        print(run_expiry_sweep(conn))
+        print(generate_expiry_writeoff_proposals(conn))
+    finally:
+        close_connection(conn, None)
@@ -0,0 +1,349 @@
+"""
+Year-end close for PUVI Oil Manufacturing System
+Closes a financial year in a fixed number of set-based steps over
+v_year_end_closing_stock (migration 019). Each step commits with its
+progress in year_end_close_runs and is idempotent, so a failed or
+interrupted run resumes at the step it stopped at
+File Path: puvi-backend/puvi-backend-main/utils/year_end_close.py
+"""
+
+import json
+import sys
+import threading
+from db_utils import get_db_connection, close_connection
+
+CLOSING_ITEM_TYPES = ('material', 'oil', 'sku', 'oilcake', 'sludge')
+
+CLOSE_STEPS = tuple(f'close_{item_type}' for item_type in CLOSING_ITEM_TYPES) + (
+    'carry_forward', 'reset_serials', 'finalize'
+)
+
+
+def preview_year_end_close(cur):
+    """
+    Dry run: what a close would write, per item type, without writing.
+
+    Returns:
+        dict: Per-type item count, quantity and value, plus totals
+    """
+    cur.execute("""
+        SELECT item_type, COUNT(*), SUM(quantity), SUM(quantity * COALESCE(unit_cost, 0))
+        FROM v_year_end_closing_stock
+        GROUP BY item_type
+    """)
+    by_type = {
+        row[0]: {'items': row[1], 'quantity': float(row[2]), 'value': float(round(row[3], 2))}
+        for row in cur.fetchall()
+    }
+
+    return {
+        'item_types': {
+            item_type: by_type.get(item_type, {'items': 0, 'quantity': 0.0, 'value': 0.0})
+            for item_type in CLOSING_ITEM_TYPES
+        },
+        'total_items': sum(t['items'] for t in by_type.values()),
+        'total_closing_value': round(sum(t['value'] for t in by_type.values()), 2)
+    }
+
+
+def get_close_run(run_id, cur):
+    """Progress and results of a close run, or None"""
+    cur.execute("""
+        SELECT run_id, financial_year, year_end_date, new_financial_year,
+               status, steps_total, steps_done, current_step, summary,
+               error, closed_by, created_at, started_at, finished_at
+        FROM year_end_close_runs
+        WHERE run_id = %s
+    """, (run_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+
+    return {
+        'run_id': row[0],
+        'financial_year': row[1],
+        'year_end_date': row[2],
+        'new_financial_year': row[3],
+        'status': row[4],
+        'steps_total': row[5],
+        'steps_done': row[6],
+        'progress_percent': round(row[6] * 100 / row[5], 1) if row[5] else 0,
+        'current_step': row[7],
+        'summary': row[8],
+        'error': row[9],
+        'closed_by': row[10],
+        'created_at': row[11].isoformat() if row[11] else None,
+        'started_at': row[12].isoformat() if row[12] else None,
+        'finished_at': row[13].isoformat() if row[13] else None
+    }
+
+
+def queue_year_end_close(financial_year, year_end_date, new_financial_year,
+                         closed_by, notes, cur):
+    """
+    Create the run for a year, or pick up its unfinished run.
+
+    Returns:
+        tuple: (run_id, resumed) or (None, False) if the year is closed
+    """
+    cur.execute("""
+        SELECT
+            EXISTS (SELECT 1 FROM year_end_close_runs
+                    WHERE financial_year = %s AND status = 'completed'),
+            -- Closes from before the run table
+            EXISTS (SELECT 1 FROM year_end_closing y
+                    WHERE y.financial_year = %s AND y.status = 'closed'
+                        AND y.run_id IS NULL)
+    """, (financial_year, financial_year))
+    completed, legacy_closed = cur.fetchone()
+    if completed or legacy_closed:
+        return None, False
+
+    cur.execute("""
+        SELECT run_id FROM year_end_close_runs
+        WHERE financial_year = %s AND status <> 'completed'
+        FOR UPDATE
+    """, (financial_year,))
+    row = cur.fetchone()
+    if row:
+        cur.execute("""
+            UPDATE year_end_close_runs
+            SET status = CASE WHEN status = 'failed' THEN 'queued' ELSE status END,
+                error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE run_id = %s
+        """, (row[0],))
+        return row[0], True
+
+    cur.execute("""
+        INSERT INTO year_end_close_runs (
+            financial_year, year_end_date, new_financial_year,
+            steps_total, closed_by, notes
+        ) VALUES (%s, %s, %s, %s, %s, %s)
+        RETURNING run_id
+    """, (financial_year, year_end_date, new_financial_year, len(CLOSE_STEPS), closed_by, notes))
+    return cur.fetchone()[0], False
+
+
+def _run_step(step, run, cur):
+    """Execute one close step; returns its result for the run summary"""
+    if step.startswith('close_'):
+        cur.execute("""
+            WITH closed AS (
+                INSERT INTO year_end_closing (
+                    financial_year, closing_date, material_id,
+                    material_name, category, unit,
+                    closing_quantity, weighted_avg_cost, closing_value,
+                    closed_by, notes, item_type, item_key, location_id, run_id
+                )
+                SELECT %(financial_year)s, %(year_end_date)s, s.material_id,
+                       s.item_name, s.category, s.unit,
+                       s.quantity, s.unit_cost, s.quantity * COALESCE(s.unit_cost, 0),
+                       %(closed_by)s, %(notes)s, s.item_type, s.item_key, s.location_id, %(run_id)s
+                FROM v_year_end_closing_stock s
+                WHERE s.item_type = %(item_type)s
+                ON CONFLICT (financial_year, item_type, item_key, (COALESCE(location_id, 0)))
+                    WHERE status = 'closed'
+                    DO NOTHING
+                RETURNING closing_value
+            )
+            SELECT COUNT(*), COALESCE(SUM(closing_value), 0) FROM closed
+        """, dict(run, item_type=step[len('close_'):]))
+        items, value = cur.fetchone()
+        return {'items_closed': items, 'closing_value': float(value)}
+
+    if step == 'carry_forward':
+        # Materials open the new year through opening_balances; other
+        # stock carries forward in place
+        cur.execute("""
+            WITH carried AS (
+                INSERT INTO opening_balances (
+                    material_id, balance_date, quantity, rate_per_unit,
+                    entry_type, financial_year, notes, entered_by, is_processed
+                )
+                SELECT y.material_id, %(new_year_date)s, y.closing_quantity, y.weighted_avg_cost,
+                       'yearend_carryforward', %(new_financial_year)s,
+                       CONCAT('Carried forward from ', %(financial_year)s), %(closed_by)s, true
+                FROM year_end_closing y
+                WHERE y.financial_year = %(financial_year)s
+                    AND y.status = 'closed'
+                    AND y.item_type = 'material'
+                    AND y.new_year_opening_id IS NULL
+                ON CONFLICT (material_id, balance_date) DO NOTHING
+                RETURNING balance_id, material_id
+            )
+            UPDATE year_end_closing y
+            SET carried_forward = true,
+                new_year_opening_id = c.balance_id
+            FROM carried c
+            WHERE y.financial_year = %(financial_year)s
+                AND y.status = 'closed'
+                AND y.item_type = 'material'
+                AND y.material_id = c.material_id
+        """, dict(run, new_year_date=run['year_end_date'] + 1))
+        materials_carried = cur.rowcount
+
+        cur.execute("""
+            UPDATE year_end_closing
+            SET carried_forward = true
+            WHERE financial_year = %s
+                AND status = 'closed'
+                AND item_type <> 'material'
+                AND NOT carried_forward
+        """, (run['financial_year'],))
+        return {'materials_carried': materials_carried, 'other_items_carried': cur.rowcount}
+
+    if step == 'reset_serials':
+        cur.execute("""
+            INSERT INTO serial_number_tracking (
+                material_id, supplier_id, financial_year, current_serial
+            )
+            SELECT DISTINCT material_id, supplier_id, %s, 0
+            FROM serial_number_tracking
+            WHERE financial_year = %s
+            ON CONFLICT (material_id, supplier_id, financial_year) DO NOTHING
+        """, (run['new_financial_year'], run['financial_year']))
+        return {'serials_reset': cur.rowcount}
+
+    # finalize
+    cur.execute("""
+        UPDATE system_configuration
+        SET config_value = %s,
+            updated_at = CURRENT_TIMESTAMP,
+            updated_by = %s
+        WHERE config_key = 'current_financial_year'
+    """, (run['new_financial_year'], run['closed_by']))
+
+    cur.execute("""
+        SELECT item_type, COUNT(*), COALESCE(SUM(closing_value), 0)
+        FROM year_end_closing
+        WHERE financial_year = %s AND status = 'closed'
+        GROUP BY item_type
+    """, (run['financial_year'],))
+    by_type = {row[0]: {'items': row[1], 'value': float(row[2])} for row in cur.fetchall()}
+    totals = {
+        'materials_closed': by_type.get('material', {}).get('items', 0),
+        'items_closed': sum(t['items'] for t in by_type.values()),
+        'total_closing_value': round(sum(t['value'] for t in by_type.values()), 2),
+        'by_item_type': by_type
+    }
+
+    cur.execute("""
+        INSERT INTO masters_audit_log (
+            table_name, record_id, action, new_values,
+            changed_by, reason
+        ) VALUES (
+            'year_end_closing', %s, 'YEAR_END_CLOSE',
+            %s, %s, %s
+        )
+    """, (
+        run['run_id'],
+        json.dumps(dict(totals, financial_year=run['financial_year'],
+                        new_financial_year=run['new_financial_year'])),
+        run['closed_by'],
+        f"Year-end closing for {run['financial_year']}"
+    ))
+    return totals
+
+
+def run_year_end_close(run_id):
+    """
+    Execute (or resume) a close run on its own connection. Holds a session
+    advisory lock on the run, so a second worker picking it up just exits.
+
+    Returns:
+        dict: Final run state
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    locked = False
+
+    try:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext('year_end_close'), %s)", (run_id,))
+        locked = cur.fetchone()[0]
+        conn.commit()
+        if not locked:
+            return get_close_run(run_id, cur)
+
+        cur.execute("""
+            UPDATE year_end_close_runs
+            SET status = 'running',
+                started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE run_id = %s AND status <> 'completed'
+            RETURNING run_id, financial_year, year_end_date, new_financial_year,
+                      steps_done, closed_by, notes
+        """, (run_id,))
+        row = cur.fetchone()
+        conn.commit()
+        if not row:
+            return get_close_run(run_id, cur)
+
+        run = {
+            'run_id': row[0],
+            'financial_year': row[1],
+            'year_end_date': row[2],
+            'new_financial_year': row[3],
+            'closed_by': row[5] or 'System',
+            'notes': row[6] or f'Year-end closing for {row[1]}'
+        }
+
+        for index in range(row[4], len(CLOSE_STEPS)):
+            step = CLOSE_STEPS[index]
+            try:
+                result = _run_step(step, run, cur)
+                cur.execute("""
+                    UPDATE year_end_close_runs
+                    SET steps_done = %s,
+                        current_step = %s,
+                        summary = summary || jsonb_build_object(%s::text, %s::jsonb),
+                        status = CASE WHEN %s THEN 'completed' ELSE status END,
+                        finished_at = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE finished_at END,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE run_id = %s
+                """, (
+                    index + 1, step, step, json.dumps(result),
+                    index + 1 == len(CLOSE_STEPS), index + 1 == len(CLOSE_STEPS), run_id
+                ))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                cur.execute("""
+                    UPDATE year_end_close_runs
+                    SET status = 'failed',
+                        current_step = %s,
+                        error = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE run_id = %s
+                """, (step, str(e), run_id))
+                conn.commit()
+                print(f"Year-end close run {run_id} failed at {step}: {str(e)}")
+                break
+
+        return get_close_run(run_id, cur)
+
+    finally:
+        if locked:
+            # Leave an aborted transaction first, or the unlock fails too
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(hashtext('year_end_close'), %s)", (run_id,))
+            conn.commit()
+        close_connection(conn, cur)
+
+
+def start_year_end_close(run_id):
+    """Run a close in a background thread"""
+    thread = threading.Thread(
+        target=run_year_end_close, args=(run_id,),
+        name=f'year-end-close-{run_id}', daemon=True
+    )
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    # Resume a run in the foreground: python -m utils.year_end_close <run_id>
+    if len(sys.argv) < 2:
+        print('Usage: python -m utils.year_end_close <run_id>')
+        sys.exit(1)
+    print(run_year_end_close(int(sys.argv[1])))